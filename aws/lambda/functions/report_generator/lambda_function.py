@@ -11,8 +11,10 @@ import os
 import json
 import logging
 import uuid
+import time
 import boto3
 from datetime import datetime
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # 配置日志
@@ -63,12 +65,23 @@ logger.info(f"DynamoDB Files Table: {DYNAMODB_FILES_TABLE}")
 logger.info(f"DynamoDB Reports Table: {DYNAMODB_REPORTS_TABLE}")
 logger.info("=== Lambda函数初始化完成 ===")
 
+# 所有客户端共享的botocore配置：超时、连接池，以及adaptive重试模式
+# （客户端令牌桶按限流响应自动降低发送速率，限流和瞬时错误带抖动退避重试）
+AWS_CLIENT_CONFIG = Config(
+    connect_timeout=int(os.environ.get('AWS_CONNECT_TIMEOUT', '10')),
+    read_timeout=int(os.environ.get('AWS_READ_TIMEOUT', '300')),
+    max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '10')),
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', '8'))}
+)
+
 # 创建AWS客户端
 def create_aws_client(service_name):
     """创建AWS客户端"""
     return boto3.client(
         service_name,
-        region_name=AWS_REGION
+        region_name=AWS_REGION,
+        config=AWS_CLIENT_CONFIG
     )
 
 # 初始化AWS客户端
@@ -90,17 +103,60 @@ def get_file_content(file_id):
             return None
         
         file_info = response['Item']
-        s3_key = file_info['s3_key']['S']
+        # 优先使用上传时抽取的规范化文本（旁路对象）
+        if 'extracted_s3_key' in file_info:
+            s3_key = file_info['extracted_s3_key']['S']
+            encoding = 'utf-8'
+        else:
+            s3_key = file_info['s3_key']['S']
+            # 上传时检测并缓存的文本编码（Shift-JIS、GBK、UTF-16等）
+            encoding = file_info.get('encoding', {}).get('S', 'utf-8')
         
         # 从S3获取文件内容
         response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
-        file_content = response['Body'].read().decode('utf-8')
+        file_content = response['Body'].read().decode(encoding, errors='replace')
         
         return file_content
     except Exception as e:
         logger.error(f"获取文件内容时出错: {e}")
         return None
 
+def generate_report_with_converse(file_content, model_id, prompt_template):
+    """使用Bedrock ConverseStream生成报告（所有模型使用同一种请求格式）"""
+    try:
+        started = time.perf_counter()
+        first_token_ms = None
+        parts = []
+        usage, latency_ms, stop_reason = {}, None, None
+        
+        response = bedrock_client.converse_stream(
+            modelId=model_id,
+            messages=[{'role': 'user', 'content': [{'text': prompt_template.replace("{content}", file_content)}]}],
+            inferenceConfig={'maxTokens': 4096, 'temperature': 0.7}
+        )
+        
+        # 逐段读取流式响应
+        for event in response['stream']:
+            if 'contentBlockDelta' in event:
+                text = event['contentBlockDelta'].get('delta', {}).get('text')
+                if text:
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(text)
+            elif 'messageStop' in event:
+                stop_reason = event['messageStop'].get('stopReason')
+            elif 'metadata' in event:
+                usage = event['metadata'].get('usage', {})
+                latency_ms = event['metadata'].get('metrics', {}).get('latencyMs')
+        
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Converse调用完成 | 首个token {first_token_ms} ms | 总耗时 {total_ms} ms | "
+                    f"服务端延迟 {latency_ms} ms | 用量 {usage} | 停止原因 {stop_reason}")
+        return ''.join(parts)
+    except Exception as e:
+        logger.error(f"使用Converse生成报告时出错: {e}")
+        return None
+
 def generate_report_with_langchain(file_content, model_id, prompt_template):
     """使用LangChain生成报告"""
     try:
@@ -159,7 +215,7 @@ def generate_report_with_haystack(file_content, model_id, prompt_template):
         logger.error(f"使用Haystack生成报告时出错: {e}")
         return None
 
-def generate_report_from_text(text_content, model_id="anthropic.claude-v2", framework="langchain"):
+def generate_report_from_text(text_content, model_id="anthropic.claude-v2", framework="converse"):
     """直接从文本内容生成报告"""
     try:
         # 根据内容类型选择合适的提示模板
@@ -171,7 +227,9 @@ def generate_report_from_text(text_content, model_id="anthropic.claude-v2", fram
             prompt_template = "请根据以下内容生成一份详细的报告:\n\n{content}\n\n报告:"
         
         # 根据框架选择生成方法
-        if framework.lower() == 'langchain':
+        if framework.lower() == 'converse':
+            report_content = generate_report_with_converse(text_content, model_id, prompt_template)
+        elif framework.lower() == 'langchain':
             report_content = generate_report_with_langchain(text_content, model_id, prompt_template)
         elif framework.lower() == 'haystack':
             report_content = generate_report_with_haystack(text_content, model_id, prompt_template)
@@ -291,7 +349,7 @@ def lambda_handler(event, context):
         
         file_id = body.get('file_id')
         model_id = body.get('model_id', 'anthropic.claude-v2')
-        framework = body.get('framework', 'langchain')
+        framework = body.get('framework', 'converse')
         prompt_template = body.get('prompt_template', "请根据以下内容生成一份详细的会议报告:\n\n{content}\n\n报告:")
         
         logger.info(f"处理参数 - File ID: {file_id}")
@@ -321,7 +379,9 @@ def lambda_handler(event, context):
         
         # 生成报告
         logger.info(f"=== 开始生成报告 - Framework: {framework} ===")
-        if framework.lower() == 'langchain':
+        if framework.lower() == 'converse':
+            report_content = generate_report_with_converse(file_content, model_id, prompt_template)
+        elif framework.lower() == 'langchain':
             report_content = generate_report_with_langchain(file_content, model_id, prompt_template)
         elif framework.lower() == 'haystack':
             report_content = generate_report_with_haystack(file_content, model_id, prompt_template)
@@ -418,7 +478,7 @@ def handle_bedrock_agent_request(event, context):
             
             # 生成报告
             model_id = "anthropic.claude-v2"
-            framework = "langchain"
+            framework = "converse"
             report_content = generate_report_from_text(text_content, model_id, framework)
             
             if not report_content:
@@ -38,11 +38,12 @@ def create_app(test_config=None):
         pass
     
     # 注册蓝图
-    from app.api import upload_bp, report_bp, model_bp, files_bp
+    from app.api import upload_bp, report_bp, model_bp, files_bp, search_bp
     app.register_blueprint(upload_bp)
     app.register_blueprint(report_bp)
     app.register_blueprint(model_bp)
     app.register_blueprint(files_bp)
+    app.register_blueprint(search_bp)
     
     # 简单的健康检查路由
     @app.route('/health')
@@ -2,5 +2,6 @@ from app.api.upload import upload_bp
 from app.api.report import report_bp
 from app.api.model import model_bp
 from app.api.files import files_bp
+from app.api.search import search_bp
 
-__all__ = ['upload_bp', 'report_bp', 'model_bp', 'files_bp'] 
\ No newline at end of file
+__all__ = ['upload_bp', 'report_bp', 'model_bp', 'files_bp', 'search_bp'] 
\ No newline at end of file
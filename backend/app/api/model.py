@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from app.services.model_service import get_available_models, compare_models
 from app.services.haystack_service import haystack_service
+from app.services.modules.rate_limiter import bedrock_limiter
 
 # ブループリントを作成
 model_bp = Blueprint('model', __name__, url_prefix='/api/model')
@@ -26,6 +27,11 @@ def list_models():
         current_app.logger.error(f"Error listing models: {str(e)}")
         return jsonify({'error': 'Failed to list models'}), 500
 
+@model_bp.route('/limits', methods=['GET'])
+def get_model_limits():
+    """モデルごとの同時実行上限、待ち行列、待機時間を取得"""
+    return jsonify({'limits': bedrock_limiter.stats()}), 200
+
 @model_bp.route('/compare', methods=['POST'])
 def compare_model_outputs():
     """複数のモデルの出力結果を比較"""
@@ -51,25 +57,51 @@ def compare_model_outputs():
 
 @model_bp.route('/semantic/keywords', methods=['POST'])
 def extract_document_keywords():
-    """Haystackを使用して文書からキーワードを抽出"""
+    """Haystackを使用して文書からキーワードを抽出（texts / file_ids を渡すとまとめて抽出）"""
     data = request.json
     
-    if not data or ('file_id' not in data and 'text' not in data):
+    if not data or not any(key in data for key in ('file_id', 'text', 'file_ids', 'texts')):
         return jsonify({'error': 'Missing file_id or text'}), 400
     
     try:
+        # オプションパラメータを設定
+        top_n = data.get('top_n', 10)  # デフォルトで上位10個のキーワードを抽出
+        
+        if 'file_ids' in data or 'texts' in data:
+            # 複数の文書を一括で処理
+            contents = data.get('file_ids', data.get('texts'))
+            if not isinstance(contents, list):
+                return jsonify({'error': 'file_ids or texts must be a list'}), 400
+            if 'file_ids' not in data:
+                results = haystack_service.extract_keywords_batch(contents, top_n=top_n)
+                return jsonify({
+                    'results': [{'keywords': keywords} for keywords in results]
+                }), 200
+            
+            # 見つからないファイルは項目ごとのエラーとして返す
+            from app.services.storage import get_file_content_by_id
+            contents = [get_file_content_by_id(file_id) for file_id in contents]
+            found = [content for content in contents if content]
+            keywords_iter = iter(haystack_service.extract_keywords_batch(found, top_n=top_n) if found else [])
+            results = []
+            for file_id, content in zip(data['file_ids'], contents):
+                if content:
+                    results.append({'file_id': file_id, 'keywords': next(keywords_iter)})
+                else:
+                    results.append({'file_id': file_id, 'error': f'File with ID {file_id} not found'})
+            return jsonify({'results': results}), 200
+        
         if 'file_id' in data:
             # ファイルIDから内容を取得
             from app.services.storage import get_file_content_by_id
             file_id = data['file_id']
             content = get_file_content_by_id(file_id)
+            if not content:
+                return jsonify({'error': f'File with ID {file_id} not found'}), 404
         else:
             # 直接提供されたテキストを使用
             content = data['text']
         
-        # オプションパラメータを設定
-        top_n = data.get('top_n', 10)  # デフォルトで上位10個のキーワードを抽出
-        
         # Haystackを使用してキーワードを抽出
         keywords = haystack_service.extract_keywords(content, top_n=top_n)
         
@@ -2,23 +2,53 @@ import os
 import uuid
 import logging
 from datetime import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 import boto3
 import json
+import io
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.utils import secure_filename
 
 from app.services.model_service import get_model_by_id
 from app.services.storage import (
     get_metadata_from_dynamodb,
     get_file_content_by_id,
+    iter_file_text,
+    read_text_prefix,
     save_report,
     get_report_from_dynamodb,
     update_report_in_dynamodb,
     delete_report_from_dynamodb,
     update_metadata_in_dynamodb,
+    find_near_duplicate_files,
+    upload_file_to_s3,
+    save_metadata_to_dynamodb,
+    save_lsh_index_entries,
+    save_extracted_text,
+    build_content_with_header,
+    split_content_header,
+    get_s3_url,
     S3_BUCKET_NAME,
     DYNAMODB_TABLE
 )
-from app.services.agent_service import generate_report
+from app.services.agent_service import (
+    generate_report,
+    generate_report_with_session,
+    generate_report_for_file,
+    uses_streamed_input,
+    stream_report,
+    refine_report,
+    regenerate_report_sections,
+    get_session_expiry,
+    is_session_alive
+)
+from app.services.langchain_service import langchain_service
+from app.services.search_service import index_document_async, alias_document_async
+from app.services.modules.chat_sessions import chat_session_store
+from app.utils.markdown_utils import parse_section_index, resolve_sections
+from app.utils.text_utils import summarize_text
+from app.services.text_extraction import extract_text, detect_file_encoding, get_extracted_text_key
+from app.api.upload import allowed_file, compute_text_fingerprint, ALLOWED_EXTENSIONS
 
 # 配置日志
 def setup_logging():
@@ -51,6 +81,132 @@ logger = setup_logging()
 # 创建蓝图 - 修改url_prefix以匹配API文档
 report_bp = Blueprint('report', __name__, url_prefix='/api/report')
 
+# 与报告生成并发执行S3上传和元数据保存的线程池
+persist_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('REPORT_PERSIST_WORKERS', '4')))
+
+# 复用近似重复文件已有报告的相似度阈值
+REPORT_REUSE_THRESHOLD = float(os.environ.get('REPORT_REUSE_THRESHOLD', '0.95'))
+
+# 生成期间先保存的抽取式摘要的句子数和最大长度
+EXTRACTIVE_SUMMARY_SENTENCES = 3
+EXTRACTIVE_SUMMARY_MAX_CHARS = 500
+
+# 流式生成的长文档只读取开头的这么多字符用于抽取式摘要
+EXTRACTIVE_SUMMARY_INPUT_CHARS = 50000
+
+def extract_summary(report_content):
+    """提取摘要（取第一段非空内容作为摘要）"""
+    content_lines = report_content.split('\n')
+    summary = ''
+    
+    # 查找第一段非空内容作为摘要
+    for line in content_lines:
+        if line.strip() and not line.startswith(('#', '-', '•', '1.', '2.', '3.', '4.', '5.')):
+            summary = line.strip()
+            break
+    
+    # 如果没有找到合适的摘要，使用前100个字符
+    if not summary:
+        summary = report_content[:100] + '...' if len(report_content) > 100 else report_content
+    
+    return summary
+
+def build_extractive_summary(file_content):
+    """用TextRank从文件内容中抽取摘要，不调用模型，报告生成完成前即可返回"""
+    try:
+        _, body = split_content_header(file_content)
+        summary = summarize_text(body, max_sentences=EXTRACTIVE_SUMMARY_SENTENCES)
+    except Exception as e:
+        logger.warning(f"抽取式摘要生成失败: {str(e)}")
+        return ''
+    if len(summary) > EXTRACTIVE_SUMMARY_MAX_CHARS:
+        summary = summary[:EXTRACTIVE_SUMMARY_MAX_CHARS] + '...'
+    return summary
+
+def store_report_content(report_id, report_content):
+    """保存报告内容到S3（保持原始Markdown格式），返回S3键"""
+    s3_client = boto3.client('s3', region_name=os.environ.get('AWS_DEFAULT_REGION', 'ap-northeast-1'))
+    s3_key = f"reports/{report_id}.txt"
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=s3_key,
+        Body=report_content.encode('utf-8'),
+        ContentType='text/markdown; charset=utf-8'
+    )
+    logger.info(f"报告内容已保存到S3，键: {s3_key}")
+    return s3_key
+
+def build_session_fields(session_id):
+    """构建报告记录中的Agent会话字段，报告不是由Agent生成时为空"""
+    if not session_id:
+        return {}
+    return {
+        'agent_session_id': session_id,
+        'agent_session_expires_at': get_session_expiry()
+    }
+
+def reuse_similar_report(file_id, file_metadata, similar_files, prompt, model_id):
+    """复用近似重复文件使用相同提示词和模型生成的已完成报告
+
+    找到可复用的报告时，复制其S3内容和检索索引中的向量、词频并创建新的报告记录，返回新报告数据；否则返回None
+    """
+    for similar in similar_files:
+        if similar['similarity'] < REPORT_REUSE_THRESHOLD or not similar.get('report_id'):
+            continue
+
+        response = get_report_from_dynamodb(similar['report_id'])
+        previous = response.get('Item') if response else None
+        if not previous or previous.get('status') != 'completed' or not previous.get('report_s3_key'):
+            continue
+        if previous.get('prompt') != prompt or previous.get('model_id') != model_id:
+            continue
+
+        report_id = str(uuid.uuid4())
+        s3_key = f"reports/{report_id}.txt"
+
+        # 在S3内复制报告内容，避免重新下载和重新生成
+        s3_client = boto3.client('s3', region_name=os.environ.get('AWS_DEFAULT_REGION', 'ap-northeast-1'))
+        s3_client.copy_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=s3_key,
+            CopySource={'Bucket': S3_BUCKET_NAME, 'Key': previous['report_s3_key']}
+        )
+
+        now = datetime.now().isoformat()
+        report_data = {
+            'report_id': report_id,
+            'file_id': file_id,
+            'prompt': prompt,
+            'model_id': model_id,
+            'title': previous.get('title'),
+            'status': 'completed',
+            'report_s3_key': s3_key,
+            'summary': previous.get('summary', ''),
+            'sections': previous.get('sections', []),
+            'reused_from_report_id': previous['report_id'],
+            'reused_from_file_id': similar['file_id'],
+            'created_at': now,
+            'updated_at': now
+        }
+        dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'ap-northeast-1'))
+        table = dynamodb.Table(f"{DYNAMODB_TABLE}_reports")
+        table.put_item(Item=report_data)
+
+        file_metadata.update({
+            'report_id': report_id,
+            'status': 'processed',
+            'updated_at': now
+        })
+        update_metadata_in_dynamodb(file_metadata)
+
+        # 报告内容相同，直接复制原报告在检索索引中的向量和词频，不重新向量化
+        alias_document_async('report', previous['report_id'], report_id, file_metadata.get('category'), now)
+
+        logger.info(f"复用近似重复文件 {similar['file_id']} 的报告 {previous['report_id']}，相似度: {similar['similarity']}")
+        return report_data
+
+    return None
+
 @report_bp.route('/generate', methods=['POST'])
 def create_report():
     """创建报告"""
@@ -58,6 +214,8 @@ def create_report():
     file_id = data.get('file_id')
     prompt = data.get('prompt')
     model_id = data.get('model_id')
+    generation_mode = data.get('mode')
+    reuse_similar = data.get('reuse_similar', True)
     
     if not file_id:
         return jsonify({'error': 'Missing file_id'}), 400
@@ -67,10 +225,37 @@ def create_report():
     if not file_metadata:
         return jsonify({'error': f'File with ID {file_id} not found'}), 404
     
-    # 获取文件内容
-    file_content = get_file_content_by_id(file_id)
-    if not file_content:
-        return jsonify({'error': f'Content for file with ID {file_id} not found'}), 404
+    # 查找近似重复的文件
+    similar_files = []
+    try:
+        similar_files = find_near_duplicate_files(file_metadata)
+    except Exception as e:
+        logger.warning(f"查找近似重复文件失败: {str(e)}")
+    
+    # 如果存在可复用的报告，直接复用，跳过下载和生成
+    if reuse_similar and similar_files:
+        try:
+            reused_report = reuse_similar_report(file_id, file_metadata, similar_files, prompt, model_id)
+            if reused_report:
+                return jsonify({
+                    'message': 'Report reused from near-duplicate file',
+                    'report_id': reused_report['report_id'],
+                    'status': 'completed',
+                    'reused_from_report_id': reused_report['reused_from_report_id'],
+                    'similar_files': similar_files
+                }), 201
+        except Exception as e:
+            logger.warning(f"复用近似重复报告失败，继续生成新报告: {str(e)}")
+    
+    # 获取文件内容；长文档在生成时流式读取，这里只读取开头用于抽取式摘要
+    if uses_streamed_input(file_metadata, generation_mode):
+        file_content = None
+        summary_source = read_text_prefix(file_metadata, EXTRACTIVE_SUMMARY_INPUT_CHARS)
+    else:
+        file_content = get_file_content_by_id(file_id)
+        if not file_content:
+            return jsonify({'error': f'Content for file with ID {file_id} not found'}), 404
+        summary_source = file_content
     
     # 生成报告ID
     report_id = str(uuid.uuid4())
@@ -83,6 +268,7 @@ def create_report():
         'model_id': model_id,
         'title': f"AIエージェントのモデルIDはanthropic.claude-3-5-sonnet-20240620-v1:0",
         'status': 'processing',
+        'summary': build_extractive_summary(summary_source),  # 生成完成前先提供抽取式摘要
         'created_at': datetime.now().isoformat(),
         'updated_at': datetime.now().isoformat()
     }
@@ -96,42 +282,29 @@ def create_report():
         
         # 调用Bedrock Agent生成报告
         logger.info(f"调用Bedrock Agent生成报告，文件ID: {file_id}")
-        report_content = generate_report(file_content, prompt, model_id)
-        
-        # 提取摘要（取第一段非空内容作为摘要）
-        content_lines = report_content.split('\n')
-        summary = ''
-        
-        # 查找第一段非空内容作为摘要
-        for line in content_lines:
-            if line.strip() and not line.startswith(('#', '-', '•', '1.', '2.', '3.', '4.', '5.')):
-                summary = line.strip()
-                break
+        if file_content is None:
+            report_content, session_id = generate_report_for_file(file_metadata, prompt, model_id, mode=generation_mode)
+        else:
+            report_content, session_id = generate_report_with_session(file_content, prompt, model_id, mode=generation_mode)
         
-        # 如果没有找到合适的摘要，使用前100个字符
-        if not summary:
-            summary = report_content[:100] + '...' if len(report_content) > 100 else report_content
+        # 提取摘要
+        summary = extract_summary(report_content)
         
         # 保存报告内容到S3（保持原始Markdown格式）
-        s3_client = boto3.client('s3', region_name=os.environ.get('AWS_DEFAULT_REGION', 'ap-northeast-1'))
-        s3_key = f"reports/{report_id}.txt"
-        s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=s3_key,
-            Body=report_content.encode('utf-8'),
-            ContentType='text/markdown; charset=utf-8'
-        )
-        logger.info(f"报告内容已保存到S3，键: {s3_key}")
+        s3_key = store_report_content(report_id, report_content)
         
         # 更新DynamoDB中的报告状态
         report_data.update({
             'status': 'completed',
             'report_s3_key': s3_key,
             'summary': summary,  # 添加摘要字段
+            'sections': parse_section_index(report_content),  # 章节索引，用于按章节重新生成
             'updated_at': datetime.now().isoformat()
         })
+        report_data.update(build_session_fields(session_id))
         table.put_item(Item=report_data)
         logger.info(f"报告状态已更新到DynamoDB，状态: completed")
+        index_document_async('report', report_id, report_content, file_metadata.get('category'), report_data['created_at'])
         
         # 更新文件元数据中的report_id字段
         file_metadata.update({
@@ -146,7 +319,8 @@ def create_report():
         return jsonify({
             'message': 'Report generated successfully',
             'report_id': report_id,
-            'status': 'completed'
+            'status': 'completed',
+            'similar_files': similar_files
         }), 201
         
     except Exception as e:
@@ -163,6 +337,285 @@ def create_report():
             'error': f'Failed to generate report: {str(e)}'
         }), 500
 
+def format_sse(event, data):
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_report_events(report_data, file_metadata, file_content, before_save=None):
+    """流式生成报告的SSE事件：收到的文本立即推送给客户端，生成结束后保存报告并更新文件元数据
+
+    before_save在最后一个token之后、保存报告之前调用（例如等待文件持久化完成），不影响首个token的时间。
+    报告保存成功后report_data的status才变为completed
+    """
+    report_id = report_data['report_id']
+    try:
+        # 收到的文本立即推送给客户端
+        stream = stream_report(file_content, report_data.get('prompt'), report_data.get('model_id'))
+        for token in stream:
+            yield format_sse('token', {'text': token})
+        report_content = stream.text
+        if before_save:
+            before_save()
+        
+        # 保存报告内容和状态
+        now = datetime.now().isoformat()
+        completed = dict(report_data)
+        completed.setdefault('created_at', now)
+        completed.update({
+            'status': 'completed',
+            'report_s3_key': store_report_content(report_id, report_content),
+            'summary': extract_summary(report_content),
+            'sections': parse_section_index(report_content),
+            'updated_at': now
+        })
+        dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'ap-northeast-1'))
+        dynamodb.Table(f"{DYNAMODB_TABLE}_reports").put_item(Item=completed)
+        report_data.update(completed)
+        index_document_async('report', report_id, report_content, file_metadata.get('category'), report_data['created_at'])
+        
+        file_metadata.update({'report_id': report_id, 'status': 'processed', 'updated_at': now})
+        update_metadata_in_dynamodb(file_metadata)
+        logger.info(f"流式报告生成成功，报告ID: {report_id}")
+        
+        yield format_sse('done', {
+            'report_id': report_id,
+            'file_id': file_metadata['file_id'],
+            'stop_reason': stream.stop_reason,
+            'usage': stream.usage,
+            'metrics': stream.metrics
+        })
+    except Exception as e:
+        logger.error(f"流式报告生成失败: {str(e)}")
+        yield format_sse('error', {'error': f'Failed to generate report: {str(e)}'})
+
+def sse_response(events):
+    """把SSE事件生成器包装为流式响应"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@report_bp.route('/generate/stream', methods=['POST'])
+def create_report_stream():
+    """直接调用模型流式生成报告（Server-Sent Events），生成结束后保存报告"""
+    data = request.json or {}
+    file_id = data.get('file_id')
+    prompt = data.get('prompt')
+    model_id = data.get('model_id')
+    
+    if not file_id:
+        return jsonify({'error': 'Missing file_id'}), 400
+    
+    file_metadata = get_metadata_from_dynamodb(file_id)
+    if not file_metadata:
+        return jsonify({'error': f'File with ID {file_id} not found'}), 404
+    
+    file_content = get_file_content_by_id(file_id)
+    if not file_content:
+        return jsonify({'error': f'Content for file with ID {file_id} not found'}), 404
+    
+    report_data = {
+        'report_id': str(uuid.uuid4()),
+        'file_id': file_id,
+        'prompt': prompt,
+        'model_id': model_id
+    }
+    return sse_response(stream_report_events(report_data, file_metadata, file_content))
+
+def start_upload_and_generate():
+    """校验上传的文件并在内存中抽取文本，启动与报告生成并发执行的持久化任务
+
+    返回 (上传上下文, None)，请求无效时返回 (None, 错误响应)
+    """
+    if 'file' not in request.files:
+        return None, (jsonify({'error': 'No file part'}), 400)
+    
+    file = request.files['file']
+    if file.filename == '':
+        return None, (jsonify({'error': 'No selected file'}), 400)
+    if not allowed_file(file.filename):
+        return None, (jsonify({'error': f'File type not allowed. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'}), 400)
+    
+    prompt = request.form.get('prompt')
+    model_id = request.form.get('model_id')
+    category = request.form.get('category', 'general')
+    
+    # 在内存中读取文件并抽取文本
+    filename = secure_filename(file.filename)
+    file_bytes = file.read()
+    encoding = detect_file_encoding(file_bytes, filename)
+    try:
+        file_text = extract_text(file_bytes, filename, encoding=encoding)
+    except Exception as e:
+        logger.error(f"文件文本抽取失败: {str(e)}")
+        return None, (jsonify({'error': f'File content could not be extracted: {str(e)}'}), 400)
+    
+    file_id = str(uuid.uuid4())
+    s3_key = f"uploads/{file_id}_{filename}"
+    now = datetime.now()
+    fingerprint = compute_text_fingerprint(file_text)
+    
+    file_metadata = {
+        'file_id': file_id,
+        'original_filename': filename,
+        'category': category,
+        's3_key': s3_key,
+        's3_url': get_s3_url(s3_key),
+        'extracted_s3_key': get_extracted_text_key(file_id),
+        'text_length': len(file_text),
+        'status': 'uploaded',
+        'upload_time': str(now)
+    }
+    if encoding:
+        file_metadata['encoding'] = encoding
+    file_metadata.update(fingerprint)
+    
+    report_data = {
+        'report_id': str(uuid.uuid4()),
+        'file_id': file_id,
+        'prompt': prompt,
+        'model_id': model_id,
+        'title': f"AIエージェントのモデルIDはanthropic.claude-3-5-sonnet-20240620-v1:0",
+        'status': 'processing',
+        'created_at': now.isoformat(),
+        'updated_at': now.isoformat()
+    }
+    
+    dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_DEFAULT_REGION', 'ap-northeast-1'))
+    table = dynamodb.Table(f"{DYNAMODB_TABLE}_reports")
+    
+    # 与报告生成并发执行的持久化任务，LSH索引排在最后，失败时不影响报告
+    persist_futures = [
+        persist_executor.submit(upload_file_to_s3, io.BytesIO(file_bytes), s3_key),
+        persist_executor.submit(save_extracted_text, file_id, file_text),
+        persist_executor.submit(save_metadata_to_dynamodb, dict(file_metadata)),
+        persist_executor.submit(table.put_item, Item=dict(report_data))
+    ]
+    if fingerprint.get('lsh_bands'):
+        persist_futures.append(persist_executor.submit(save_lsh_index_entries, file_id, fingerprint['lsh_bands']))
+    
+    return {
+        'file_metadata': file_metadata,
+        'file_content': build_content_with_header(file_id, file_metadata, file_text),
+        'report_data': report_data,
+        'table': table,
+        'persist_futures': persist_futures
+    }, None
+
+def finish_upload(upload):
+    """等待文件持久化完成（报告必须关联到已保存的文件），之后在后台索引上传的文件"""
+    persist_futures = upload['persist_futures']
+    for future in persist_futures[:4]:
+        future.result()
+    for future in persist_futures[4:]:
+        if future.exception():
+            logger.warning(f"保存LSH索引失败: {str(future.exception())}")
+    file_metadata = upload['file_metadata']
+    index_document_async('file', file_metadata['file_id'], iter_file_text(file_metadata),
+                         file_metadata['category'], file_metadata['upload_time'])
+
+def mark_upload_report_failed(upload, error):
+    """把上传并生成的报告记录标记为失败"""
+    # 先等待写入processing状态的持久化任务完成，避免它覆盖失败状态（忽略其异常）
+    upload['persist_futures'][3].exception()
+    report_data = upload['report_data']
+    report_data.update({
+        'status': 'failed',
+        'error': str(error),
+        'updated_at': datetime.now().isoformat()
+    })
+    try:
+        upload['table'].put_item(Item=report_data)
+    except Exception as update_error:
+        logger.error(f"更新报告失败状态时出错: {str(update_error)}")
+
+@report_bp.route('/upload-and-generate', methods=['POST'])
+def upload_and_generate_report():
+    """上传文件并立即生成报告
+
+    在内存中解码上传的文件并直接开始生成报告，
+    S3上传和元数据保存与LLM调用并发执行，省去先写入再从S3重新读取的往返。
+    该接口在报告生成完成后才返回；需要尽早显示报告内容时使用 /upload-and-generate/stream
+    """
+    upload, error_response = start_upload_and_generate()
+    if error_response:
+        return error_response
+    file_metadata = upload['file_metadata']
+    report_data = upload['report_data']
+    file_id = file_metadata['file_id']
+    report_id = report_data['report_id']
+    
+    try:
+        # 直接使用内存中的内容生成报告
+        logger.info(f"调用Bedrock Agent生成报告，文件ID: {file_id}（上传与生成并行）")
+        report_content, session_id = generate_report_with_session(
+            upload['file_content'], report_data['prompt'], report_data['model_id'], mode=request.form.get('mode')
+        )
+        finish_upload(upload)
+        
+        s3_report_key = store_report_content(report_id, report_content)
+        report_data.update({
+            'status': 'completed',
+            'report_s3_key': s3_report_key,
+            'summary': extract_summary(report_content),
+            'sections': parse_section_index(report_content),
+            'updated_at': datetime.now().isoformat()
+        })
+        report_data.update(build_session_fields(session_id))
+        upload['table'].put_item(Item=report_data)
+        index_document_async('report', report_id, report_content, file_metadata['category'], report_data['created_at'])
+        
+        file_metadata.update({
+            'report_id': report_id,
+            'status': 'processed',
+            'updated_at': datetime.now().isoformat()
+        })
+        update_metadata_in_dynamodb(file_metadata)
+        
+        logger.info(f"上传并生成报告成功，文件ID: {file_id}，报告ID: {report_id}")
+        return jsonify({
+            'message': 'File uploaded and report generated successfully',
+            'file_id': file_id,
+            'report_id': report_id,
+            's3_url': file_metadata['s3_url'],
+            'status': 'completed'
+        }), 201
+        
+    except Exception as e:
+        logger.error(f"上传并生成报告失败: {str(e)}")
+        mark_upload_report_failed(upload, e)
+        return jsonify({
+            'error': f'Failed to upload and generate report: {str(e)}'
+        }), 500
+
+@report_bp.route('/upload-and-generate/stream', methods=['POST'])
+def upload_and_generate_report_stream():
+    """上传文件并流式生成报告（Server-Sent Events）
+
+    文本抽取后立即开始调用模型，收到的文本立即推送给客户端，首个token不等待S3上传和元数据保存；
+    最后一个token之后才等待持久化完成并保存报告。首先推送start事件，告知文件ID和报告ID；
+    生成失败或客户端在报告保存前断开连接时，报告记录标记为失败
+    """
+    upload, error_response = start_upload_and_generate()
+    if error_response:
+        return error_response
+    file_metadata = upload['file_metadata']
+    report_data = upload['report_data']
+    
+    def events():
+        try:
+            yield format_sse('start', {'file_id': file_metadata['file_id'], 'report_id': report_data['report_id']})
+            yield from stream_report_events(
+                report_data, file_metadata, upload['file_content'], before_save=lambda: finish_upload(upload)
+            )
+        finally:
+            # 客户端断开时在yield处抛出GeneratorExit，同样需要更新报告状态
+            if report_data['status'] != 'completed':
+                mark_upload_report_failed(upload, 'Streaming report generation failed')
+    
+    return sse_response(events())
+
 @report_bp.route('/<report_id>', methods=['GET'])
 def get_report(report_id):
     """获取报告"""
@@ -203,7 +656,11 @@ def get_report(report_id):
                 'created_at': report_metadata.get('created_at'),
                 'updated_at': report_metadata.get('updated_at'),
                 'model_id': report_metadata.get('model_id'),
-                'prompt': report_metadata.get('prompt')
+                'prompt': report_metadata.get('prompt'),
+                'sections': [
+                    {'index': section['index'], 'title': section['title'], 'level': section['level']}
+                    for section in parse_section_index(report_content)
+                ]
             }
             
             logger.info(f"[REPORT_GET] 报告获取成功 | 报告ID: {report_id}")
@@ -249,35 +706,65 @@ def update_report(report_id):
 
 @report_bp.route('/<report_id>/regenerate', methods=['POST'])
 def regenerate_report(report_id):
-    """重新生成报告"""
-    data = request.json
+    """重新生成报告
+
+    报告的Agent会话仍有效且模型未变更时，只把新的修改要求作为追加轮次发送到同一会话；
+    会话已过期或追加失败时，回退到新会话并重新发送完整文档
+    """
+    data = request.json or {}
     prompt = data.get('prompt')
     model_id = data.get('model_id')
+    generation_mode = data.get('mode')
     
     # 获取现有报告
-    report = get_report_from_dynamodb(report_id)
+    response = get_report_from_dynamodb(report_id)
+    report = response.get('Item') if response else None
     if not report:
         return jsonify({'error': f'Report with ID {report_id} not found'}), 404
-        
+    
     try:
-        # 获取文件内容
-        file_content = get_file_content_by_id(report['file_id'])
-        if not file_content:
-            return jsonify({'error': f'Content for file with ID {report["file_id"]} not found'}), 404
+        report_content = None
+        session_id = report.get('agent_session_id')
+        same_model = not model_id or model_id == report.get('model_id')
+        if prompt and session_id and same_model and not generation_mode and is_session_alive(report.get('agent_session_expires_at')):
+            try:
+                logger.info(f"在原Agent会话中追加修改要求，报告ID: {report_id}，会话ID: {session_id}")
+                report_content = refine_report(session_id, prompt)
+            except Exception as e:
+                logger.warning(f"在原Agent会话中追加修改要求失败，回退到新会话: {str(e)}")
+                report_content = None
+        
+        if report_content is None:
+            # 获取文件内容
+            file_content = get_file_content_by_id(report['file_id'])
+            if not file_content:
+                return jsonify({'error': f'Content for file with ID {report["file_id"]} not found'}), 404
             
-        # 调用Bedrock Agent重新生成报告
-        logger.info(f"重新生成报告，报告ID: {report_id}")
-        report_content = generate_report(file_content, prompt, model_id)
-        
-        # 更新报告内容和状态
-        report['content'] = report_content
-        report['prompt'] = prompt
-        report['model_id'] = model_id
-        report['status'] = 'completed'
-        report['updated_at'] = datetime.now().isoformat()
+            # 调用Bedrock Agent重新生成报告
+            logger.info(f"重新生成报告，报告ID: {report_id}")
+            report_content, session_id = generate_report_with_session(
+                file_content, prompt, model_id or report.get('model_id'), mode=generation_mode
+            )
+        
+        # 保存报告内容到S3，并更新报告记录
+        s3_key = store_report_content(report_id, report_content)
+        report.pop('agent_session_id', None)
+        report.pop('agent_session_expires_at', None)
+        report.update({
+            'report_s3_key': s3_key,
+            'summary': extract_summary(report_content),
+            'sections': parse_section_index(report_content),
+            'prompt': prompt,
+            'model_id': model_id or report.get('model_id'),
+            'status': 'completed',
+            'updated_at': datetime.now().isoformat()
+        })
+        # 每次追加轮次都会刷新会话的空闲过期时间
+        report.update(build_session_fields(session_id))
         
         # 保存更新后的报告
         update_report_in_dynamodb(report)
+        index_document_async('report', report_id, report_content, None, report.get('created_at'), report['file_id'])
         
         return jsonify({
             'message': 'Report regenerated successfully',
@@ -295,6 +782,112 @@ def regenerate_report(report_id):
             'error': f'Failed to regenerate report: {str(e)}'
         }), 500
 
+@report_bp.route('/<report_id>/sections/regenerate', methods=['POST'])
+def regenerate_report_sections_api(report_id):
+    """只重新生成报告中选中的章节，其余章节原样复用"""
+    data = request.json or {}
+    sections = data.get('sections')
+    prompt = data.get('prompt')
+    
+    if not sections or not isinstance(sections, list):
+        return jsonify({'error': 'Missing sections (list of section indexes or titles)'}), 400
+    
+    response = get_report_from_dynamodb(report_id)
+    report = response.get('Item') if response else None
+    if not report or not report.get('report_s3_key'):
+        return jsonify({'error': f'Report with ID {report_id} not found'}), 404
+    model_id = data.get('model_id') or report.get('model_id')
+    
+    try:
+        s3_client = boto3.client('s3', region_name=os.environ.get('AWS_DEFAULT_REGION', 'ap-northeast-1'))
+        s3_response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=report['report_s3_key'])
+        report_content = s3_response['Body'].read().decode('utf-8')
+        
+        # 在调用模型前校验章节选择
+        try:
+            resolve_sections(parse_section_index(report_content), sections)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
+        
+        file_content = get_file_content_by_id(report['file_id'])
+        if not file_content:
+            return jsonify({'error': f'Content for file with ID {report["file_id"]} not found'}), 404
+        
+        logger.info(f"[REPORT_SECTIONS] 重新生成章节 | 报告ID: {report_id} | 章节: {sections}")
+        new_content, regenerated = regenerate_report_sections(file_content, report_content, sections, prompt, model_id)
+        
+        store_report_content(report_id, new_content)
+        report.update({
+            'summary': extract_summary(new_content),
+            'sections': parse_section_index(new_content),
+            'status': 'completed',
+            'updated_at': datetime.now().isoformat()
+        })
+        update_report_in_dynamodb(report)
+        index_document_async('report', report_id, new_content, None, report.get('created_at'), report['file_id'])
+        
+        return jsonify({
+            'message': 'Report sections regenerated successfully',
+            'report_id': report_id,
+            'regenerated_sections': [section['title'] for section in regenerated],
+            'content': new_content
+        }), 200
+    
+    except Exception as e:
+        logger.error(f"[REPORT_SECTIONS] 章节重新生成失败: {str(e)}")
+        return jsonify({'error': f'Failed to regenerate report sections: {str(e)}'}), 500
+
+@report_bp.route('/<report_id>/chat', methods=['POST'])
+def chat_with_report(report_id):
+    """基于报告的原始文档进行多轮问答
+
+    首次提问时为文档建立一次检索索引并创建会话；之后携带session_id的追问复用同一会话，
+    每个问题只需一次检索和一次模型调用。会话被淘汰后会自动重建，返回新的session_id
+    """
+    data = request.json or {}
+    question = (data.get('question') or '').strip()
+    session_id = data.get('session_id')
+    
+    if not question:
+        return jsonify({'error': 'Missing question'}), 400
+    
+    try:
+        session = chat_session_store.get(session_id, report_id)
+        if session is None:
+            response = get_report_from_dynamodb(report_id)
+            report = response.get('Item') if response else None
+            if not report:
+                return jsonify({'error': f'Report with ID {report_id} not found'}), 404
+            
+            file_content = get_file_content_by_id(report['file_id'])
+            if not file_content:
+                return jsonify({'error': f'Content for file with ID {report["file_id"]} not found'}), 404
+            
+            model_id = data.get('model_id') or report.get('model_id')
+            logger.info(f"[REPORT_CHAT] 创建问答会话 | 报告ID: {report_id} | 模型: {model_id}")
+            session = chat_session_store.add(langchain_service.create_chat_session(file_content, report_id, model_id))
+        
+        result = session.ask(question)
+        return jsonify({
+            'report_id': report_id,
+            'session_id': session.session_id,
+            'answer': result['answer'],
+            'sources': result['sources'],
+            'turn': session.turn_count
+        }), 200
+    
+    except Exception as e:
+        logger.error(f"[REPORT_CHAT] 问答失败: {str(e)}")
+        return jsonify({'error': f'Failed to answer question: {str(e)}'}), 500
+
+@report_bp.route('/<report_id>/chat/<session_id>', methods=['DELETE'])
+def end_report_chat(report_id, session_id):
+    """结束问答会话并释放其索引"""
+    if not chat_session_store.get(session_id, report_id):
+        return jsonify({'error': f'Chat session {session_id} not found'}), 404
+    chat_session_store.remove(session_id)
+    return jsonify({'message': 'Chat session ended', 'session_id': session_id}), 200
+
 @report_bp.route('/<report_id>/download', methods=['GET'])
 def download_report(report_id):
     """下载报告"""
@@ -454,6 +1047,7 @@ def compare_report():
     data = request.json
     report_id = data.get('report_id')
     model_id = data.get('model_id')
+    generation_mode = data.get('mode')
     
     if not report_id or not model_id:
         logger.error(f"[REPORT_COMPARE] 缺少必要参数: report_id={report_id}, model_id={model_id}")
@@ -491,7 +1085,7 @@ def compare_report():
             logger.info(f"[REPORT_COMPARE] 在提示词中添加了使用文件内容的明确指示: {prompt_to_use}")
             
         # 调用Bedrock Agent生成新报告
-        report_content = generate_report(file_content, prompt_to_use, model_id)
+        report_content = generate_report(file_content, prompt_to_use, model_id, mode=generation_mode)
         
         # 从原始报告的模型名称
         original_model_id = original_report.get('model_id', '未知模型')
@@ -512,19 +1106,8 @@ def compare_report():
             'generated_at': datetime.now().isoformat()
         }
         
-        # 提取摘要（取第一段非空内容作为摘要）
-        content_lines = report_content.split('\n')
-        summary = ''
-        for line in content_lines:
-            if line.strip() and not line.startswith(('#', '-', '•', '1.', '2.', '3.', '4.', '5.')):
-                summary = line.strip()
-                break
-        
-        # 如果没有找到合适的摘要，使用前100个字符
-        if not summary:
-            summary = report_content[:100] + '...' if len(report_content) > 100 else report_content
-        
-        response['summary'] = summary
+        # 提取摘要
+        response['summary'] = extract_summary(report_content)
         
         logger.info(f"[REPORT_COMPARE] 比较报告生成成功: {model_id}")
         return jsonify(response), 200
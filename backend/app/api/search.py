@@ -0,0 +1,45 @@
+from flask import Blueprint, request, jsonify, current_app
+import traceback
+from app.services.search_service import search_documents, DOCUMENT_TYPES, SEARCH_MODES
+
+# 创建蓝图
+search_bp = Blueprint('search', __name__, url_prefix='/api/search')
+
+# 单次检索最多返回的文档数
+MAX_SEARCH_LIMIT = 50
+
+@search_bp.route('', methods=['GET'])
+def search():
+    """跨所有上传文件和报告的语义检索或BM25关键词检索（mode=keyword），支持按类别、类型和日期过滤"""
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query parameter q'}), 400
+
+    doc_type = request.args.get('type')
+    if doc_type and doc_type not in DOCUMENT_TYPES:
+        return jsonify({'error': f'Invalid type. Allowed types: {", ".join(DOCUMENT_TYPES)}'}), 400
+
+    mode = request.args.get('mode', 'semantic')
+    if mode not in SEARCH_MODES:
+        return jsonify({'error': f'Invalid mode. Allowed modes: {", ".join(SEARCH_MODES)}'}), 400
+
+    try:
+        limit = max(1, min(MAX_SEARCH_LIMIT, int(request.args.get('limit', 10))))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    try:
+        results = search_documents(
+            query,
+            limit=limit,
+            category=request.args.get('category'),
+            doc_type=doc_type,
+            date_from=request.args.get('date_from'),
+            date_to=request.args.get('date_to'),
+            mode=mode
+        )
+        return jsonify({'query': query, 'mode': mode, 'items': results, 'count': len(results)}), 200
+    except Exception as e:
+        current_app.logger.error(f"Error searching documents: {str(e)}")
+        current_app.logger.error(traceback.format_exc())
+        return jsonify({'error': f'Failed to search documents: {str(e)}'}), 500
@@ -2,7 +2,16 @@ from flask import Blueprint, request, jsonify, current_app
 import os
 import uuid
 from werkzeug.utils import secure_filename
-from app.services.storage import upload_file_to_s3, save_metadata_to_dynamodb
+from app.services.storage import (
+    upload_file_to_s3,
+    save_metadata_to_dynamodb,
+    save_lsh_index_entries,
+    save_extracted_text,
+    iter_file_text
+)
+from app.services.search_service import index_document_async
+from app.services.text_extraction import submit_extraction, detect_file_encoding, EXTRACTION_TIMEOUT
+from app.utils.minhash_utils import compute_minhash, get_lsh_band_keys
 # ブループリントを作成
 from datetime import datetime
 import traceback
@@ -16,6 +25,35 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def compute_text_fingerprint(text):
+    """近似重複検出用のMinHash署名とLSHバンドキーを計算"""
+    try:
+        signature = compute_minhash(text)
+        if not signature:
+            return {}
+        return {
+            'minhash_signature': signature,
+            'lsh_bands': get_lsh_band_keys(signature)
+        }
+    except Exception as e:
+        # 署名の計算に失敗してもアップロード自体は続行する
+        current_app.logger.warning(f"Failed to compute MinHash signature: {str(e)}")
+        return {}
+
+def extract_upload_text(file_id, extraction):
+    """テキスト抽出の結果を待ち、サイドカーテキストとしてS3に保存
+
+    抽出結果のテキストとメタデータに追加するフィールドを返す（失敗時はテキストがNone）
+    """
+    try:
+        text = extraction.result(timeout=EXTRACTION_TIMEOUT)
+        extracted_s3_key = save_extracted_text(file_id, text)
+        return text, {'extracted_s3_key': extracted_s3_key, 'text_length': len(text)}
+    except Exception as e:
+        # 抽出に失敗しても読み取り時に再抽出されるため、アップロードは続行する
+        current_app.logger.warning(f"Failed to extract text for {file_id}: {str(e)}")
+        return None, {'extraction_status': 'failed'}
+
 @upload_bp.route('', methods=['POST'])
 def upload_file():
     """ファイルアップロードリクエストを処理"""
@@ -44,11 +82,20 @@ def upload_file():
         s3_key = f"uploads/{file_id}_{filename}"
 
         try:
+            # テキスト抽出をプロセスプールで開始（S3アップロードと並行）
+            file_bytes = file.read()
+            encoding = detect_file_encoding(file_bytes, filename)
+            extraction = submit_extraction(file_bytes, filename, encoding)
+
             # S3にアップロード
             current_app.logger.info(f"Uploading file to S3: {s3_key}")
             s3_url = upload_file_to_s3(file, s3_key)
             current_app.logger.info(f"File uploaded to S3: {s3_url}")
 
+            # 抽出テキストをサイドカーとして保存し、近似重複検出用の署名を計算
+            text, extraction_fields = extract_upload_text(file_id, extraction)
+            fingerprint = compute_text_fingerprint(text) if text else {}
+
             # メタデータをDynamoDBに保存
             metadata = {
                 'file_id': file_id,
@@ -59,10 +106,25 @@ def upload_file():
                 'status': 'uploaded',
                 'upload_time': str(datetime.now())
             }
-            current_app.logger.info(f"Saving metadata to DynamoDB: {metadata}")
+            if encoding:
+                metadata['encoding'] = encoding
+            metadata.update(extraction_fields)
+            metadata.update(fingerprint)
+            current_app.logger.info(f"Saving metadata to DynamoDB: {file_id} ({filename})")
             save_metadata_to_dynamodb(metadata)
             current_app.logger.info("Metadata saved to DynamoDB")
 
+            # 近似重複インデックスに登録
+            if fingerprint.get('lsh_bands'):
+                try:
+                    save_lsh_index_entries(file_id, fingerprint['lsh_bands'])
+                except Exception as e:
+                    current_app.logger.warning(f"Failed to index MinHash signature: {str(e)}")
+
+            # 横断検索インデックスにバックグラウンドで登録（サイドカーテキストをS3からストリーミングで読み込む）
+            if text:
+                index_document_async('file', file_id, iter_file_text(metadata), category, metadata['upload_time'])
+
             return jsonify({
                 'message': 'File uploaded successfully',
                 'file_id': file_id,
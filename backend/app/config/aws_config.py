@@ -0,0 +1,46 @@
+"""
+AWS客户端配置文件，所有Bedrock客户端共享同一份botocore配置（超时、连接池、重试）
+"""
+
+import os
+from functools import lru_cache
+from typing import Optional
+
+import boto3
+from botocore.config import Config
+
+# 建立连接和读取响应的超时（秒），长报告的流式响应需要较长的读取超时
+BEDROCK_CONNECT_TIMEOUT = int(os.environ.get('BEDROCK_CONNECT_TIMEOUT', '10'))
+BEDROCK_READ_TIMEOUT = int(os.environ.get('BEDROCK_READ_TIMEOUT', '300'))
+
+# 每个客户端的连接池大小，需要不小于并发调用数
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get('BEDROCK_MAX_POOL_CONNECTIONS', '50'))
+
+# 共享的botocore配置：限流重试由进程内的限流器负责（app.services.modules.rate_limiter），
+# botocore只发送一次，避免两层重试叠加
+BEDROCK_CLIENT_CONFIG = Config(
+    connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+    read_timeout=BEDROCK_READ_TIMEOUT,
+    max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+    tcp_keepalive=True,
+    retries={'mode': 'standard', 'total_max_attempts': 1}
+)
+
+
+@lru_cache(maxsize=None)
+def get_bedrock_client(service_name: str = 'bedrock-runtime', region_name: Optional[str] = None,
+                       endpoint_url: Optional[str] = None):
+    """
+    获取使用共享配置的Bedrock客户端，同一服务和区域在进程内复用同一个客户端（及其连接池）
+
+    Args:
+        service_name: 服务名（bedrock-runtime、bedrock-agent-runtime等）
+        region_name: 区域，为空时使用AWS_DEFAULT_REGION
+        endpoint_url: 可选的端点URL
+
+    Returns:
+        botocore客户端
+    """
+    region_name = region_name or os.environ.get('AWS_DEFAULT_REGION', 'ap-northeast-1')
+    kwargs = {'endpoint_url': endpoint_url} if endpoint_url else {}
+    return boto3.client(service_name, region_name=region_name, config=BEDROCK_CLIENT_CONFIG, **kwargs)
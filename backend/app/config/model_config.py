@@ -5,6 +5,7 @@
 # 默认模型参数
 DEFAULT_TEMPERATURE = 0.2  # 更低的温度使输出更确定性、更少创意性
 DEFAULT_MAX_TOKENS = 2000  # 控制生成文本的最大长度
+DEFAULT_CONTEXT_WINDOW = 8192  # 未知模型的上下文窗口（输入+输出的token总数）
 
 # 默认使用的模型ID（优先使用Titan模型，因为它不需要特殊的推理配置）
 DEFAULT_MODEL_ID = "amazon.titan-text-express-v1"
@@ -15,6 +16,7 @@ MODEL_CONFIGS = {
     "amazon.titan-text-express-v1": {
         "temperature": DEFAULT_TEMPERATURE,
         "max_tokens": DEFAULT_MAX_TOKENS,
+        "context_window": 8192,
         "provider": "amazon",
         "description": "Amazon的Titan Text Express模型，适合一般文本生成任务",
         "supports_tools": False
@@ -22,6 +24,7 @@ MODEL_CONFIGS = {
     "amazon.titan-text-express-v1:0:8k": {
         "temperature": DEFAULT_TEMPERATURE,
         "max_tokens": DEFAULT_MAX_TOKENS,
+        "context_window": 8192,
         "provider": "amazon",
         "description": "Amazon的Titan Text Express 8K上下文模型",
         "supports_tools": False
@@ -29,6 +32,7 @@ MODEL_CONFIGS = {
     "amazon.titan-embed-text-v1": {
         "temperature": DEFAULT_TEMPERATURE,
         "max_tokens": DEFAULT_MAX_TOKENS,
+        "context_window": 8192,
         "provider": "amazon",
         "description": "Amazon的Titan嵌入模型，适合向量化文本",
         "supports_tools": False
@@ -36,6 +40,7 @@ MODEL_CONFIGS = {
     "amazon.titan-embed-text-v2:0": {
         "temperature": DEFAULT_TEMPERATURE,
         "max_tokens": DEFAULT_MAX_TOKENS,
+        "context_window": 8192,
         "provider": "amazon",
         "description": "Amazon的Titan嵌入模型v2版本",
         "supports_tools": False
@@ -45,6 +50,7 @@ MODEL_CONFIGS = {
     "anthropic.claude-3-sonnet-20240229-v1:0": {
         "temperature": 0.3,  # Claude模型可以使用略高的温度
         "max_tokens": 4096,  # Claude支持较长的输出
+        "context_window": 200000,
         "anthropic_version": "bedrock-2023-05-31",  # Claude特有参数
         "provider": "anthropic",
         "description": "Anthropic的Claude 3 Sonnet模型，平衡了性能和速度",
@@ -53,6 +59,7 @@ MODEL_CONFIGS = {
     "anthropic.claude-3-haiku-20240307-v1:0": {
         "temperature": 0.3,
         "max_tokens": 4096,
+        "context_window": 200000,
         "anthropic_version": "bedrock-2023-05-31",
         "provider": "anthropic",
         "description": "Anthropic的Claude 3 Haiku模型，速度快、成本低",
@@ -63,6 +70,7 @@ MODEL_CONFIGS = {
     "meta.llama3-70b-instruct-v1:0": {
         "temperature": 0.2,
         "max_tokens": 2048,
+        "context_window": 8192,
         "provider": "meta",
         "description": "Meta的Llama 3 70B大型语言模型",
         "supports_tools": False
@@ -86,6 +94,7 @@ def get_model_config(model_id: str = None) -> dict:
     return MODEL_CONFIGS.get(model_id, {
         "temperature": DEFAULT_TEMPERATURE,
         "max_tokens": DEFAULT_MAX_TOKENS,
+        "context_window": DEFAULT_CONTEXT_WINDOW,
         "provider": "unknown",
         "description": "未知模型",
         "supports_tools": False
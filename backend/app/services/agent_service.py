@@ -1,10 +1,26 @@
 import os
-import boto3
 import json
+import itertools
 import time
 import logging
 import uuid
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, List, Optional, Tuple, Union
+
+from app.services.modules.map_reduce import map_reduce_generate, MAP_REDUCE_CHUNK_SIZE, MAP_REDUCE_MAX_WORKERS
+from app.services.modules.sectioned_report import generate_sectioned_report, regenerate_sections
+from app.services.storage import split_content_header, build_content_with_header, get_file_text, iter_file_text
+from app.services.modules.converse import ConverseStream, invoke_text, stream_text
+from app.services.modules.rate_limiter import bedrock_limiter
+from app.config.aws_config import get_bedrock_client
+from app.utils.text_utils import shrink_text
+from app.utils.token_utils import (
+    estimate_tokens,
+    get_input_budget,
+    get_output_allowance,
+    get_chunk_size_chars,
+    pack_prompt,
+    REPORT_MIN_OUTPUT_TOKENS
+)
 
 # 配置日志
 def setup_logging():
@@ -34,6 +50,42 @@ def setup_logging():
 # 获取logger实例
 logger = setup_logging()
 
+# Agent会话的空闲过期时间（秒），需与Agent的idleSessionTTLInSeconds一致（默认600秒）
+AGENT_SESSION_TTL = int(os.environ.get('AGENT_SESSION_TTL', '600'))
+
+# 判断会话是否仍然有效时预留的余量（秒），避免在过期边缘发送追加请求
+AGENT_SESSION_TTL_MARGIN = 60
+
+# Agent单次输入允许的最大字符数（InvokeAgent的inputText上限为25000字符），超过时使用Map-Reduce
+MAX_AGENT_INPUT_CHARS = int(os.environ.get('MAX_AGENT_INPUT_CHARS', '20000'))
+
+# InvokeAgent的inputText硬上限（字符）
+AGENT_INPUT_TEXT_LIMIT = 25000
+
+# Agent在输入之外自行加入的指令、编排提示和会话历史所预留的token数
+AGENT_PROMPT_OVERHEAD_TOKENS = int(os.environ.get('AGENT_PROMPT_OVERHEAD_TOKENS', '4000'))
+
+# auto模式下，文档长度不超过MAX_AGENT_INPUT_CHARS的该倍数时，先用TextRank抽取关键句缩短到Agent输入上限，
+# 直接交给Agent生成，不再走多次调用模型的Map-Reduce；默认为0（关闭），例如设为1.5时开启
+EXTRACTIVE_PREFILTER_RATIO = float(os.environ.get('EXTRACTIVE_PREFILTER_RATIO', '0'))
+
+# 支持的生成模式：auto根据文档长度自动选择agent或map_reduce
+GENERATION_MODES = ('auto', 'agent', 'map_reduce', 'sections')
+
+def new_agent_session_id() -> str:
+    """创建新的Agent会话ID"""
+    return f"report-session-{uuid.uuid4()}"
+
+def get_session_expiry(now: Optional[float] = None) -> int:
+    """获取从现在起算的会话过期时间（Unix时间戳，秒）"""
+    return int((now or time.time()) + AGENT_SESSION_TTL)
+
+def is_session_alive(expires_at: Optional[Any], now: Optional[float] = None) -> bool:
+    """判断会话是否仍在有效期内（预留AGENT_SESSION_TTL_MARGIN秒余量）"""
+    if not expires_at:
+        return False
+    return (now or time.time()) < int(expires_at) - AGENT_SESSION_TTL_MARGIN
+
 class BedrockAgentService:
     """Bedrock Agent服务，用于调用AWS Bedrock Agent生成报告"""
     
@@ -45,16 +97,13 @@ class BedrockAgentService:
         # 更新模型ID为有效的Bedrock模型
         self.model_id = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-3-sonnet-20240229-v1:0')
         
-        # 创建Bedrock Runtime客户端（用于直接调用模型）
-        self.bedrock_runtime = boto3.client('bedrock-runtime', region_name=self.region_name)
+        # 创建Bedrock Runtime客户端（用于直接调用模型），使用共享的超时、连接池和重试配置
+        self.bedrock_runtime = get_bedrock_client('bedrock-runtime', self.region_name)
         
         # 创建Bedrock Agent Runtime客户端
         # 注意：如果此服务不可用，将会抛出异常，需要确保AWS环境正确配置
         try:
-            # 使用正确的角色ARN配置会话
-            session = boto3.Session(region_name=self.region_name)
-            # 创建带有角色ARN的客户端
-            self.bedrock_agent_runtime = session.client('bedrock-agent-runtime', region_name=self.region_name)
+            self.bedrock_agent_runtime = get_bedrock_client('bedrock-agent-runtime', self.region_name)
             logger.info("成功创建Bedrock Agent Runtime客户端")
             logger.info(f"使用Agent ID: {self.agent_id}")
         except Exception as e:
@@ -66,97 +115,206 @@ class BedrockAgentService:
         
         logger.info(f"初始化Bedrock Agent服务，区域: {self.region_name}, 代理ID: {self.agent_id}, 别名ID: {self.agent_alias_id}, 模型ID: {self.model_id}")
     
-    def generate_report(self, file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None) -> str:
+    def generate_report(self, file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None,
+                        mode: Optional[str] = None) -> str:
         """调用Bedrock Agent生成报告"""
+        return self.generate_report_with_session(file_content, prompt, model_id, mode)[0]
+    
+    def generate_report_with_session(self, file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None,
+                                     mode: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """生成报告，返回 (报告, Agent会话ID)；最终报告不是由Agent生成时会话ID为None
+
+        mode为agent时整篇文档一次性交给Agent，最终输入超过Agent的输入预算时直接报错；
+        为map_reduce时先并发生成各块摘要再归约；为sections时先生成大纲再并发生成各章节；
+        为空或auto时，文档超过MAX_AGENT_INPUT_CHARS或最终输入超过预算时使用map_reduce
+        """
+        mode = mode or 'auto'
+        if mode not in GENERATION_MODES:
+            raise Exception(f"Unsupported generation mode: {mode}")
+        requested_mode = mode
+        if mode == 'auto':
+            file_content = self._prefilter_content(file_content)
+            mode = 'map_reduce' if len(file_content) > MAX_AGENT_INPUT_CHARS else 'agent'
+        if mode == 'agent':
+            # 按最终发送的输入文本（含自定义提示）估算，而不只是文档长度
+            problem = self._check_agent_input(self._build_agent_input(file_content, prompt))
+            if problem and requested_mode == 'agent':
+                raise Exception(f"{problem}，请使用map_reduce或sections模式")
+            if problem:
+                logger.info(f"[AGENT_BUDGET] {problem}，改用Map-Reduce")
+                mode = 'map_reduce'
+
         try:
+            if mode == 'sections':
+                return self._generate_report_with_sections(file_content, prompt, model_id), None
+            session_id = new_agent_session_id()
+            if mode == 'map_reduce':
+                return self._generate_report_with_map_reduce(file_content, prompt, model_id, session_id), session_id
             # 尝试使用Agent生成报告
-            return self._generate_report_with_agent(file_content, prompt, model_id)
+            return self._generate_report_with_agent(file_content, prompt, model_id, session_id), session_id
         except Exception as e:
             logger.error(f"使用Agent生成报告失败: {str(e)}")
             # 不再静默降级到模型调用，而是重新抛出异常
             raise Exception(f"Bedrock Agent调用失败，请检查AWS配置和服务可用性: {str(e)}")
     
-    def _generate_report_with_agent(self, file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None) -> str:
+    def generate_report_for_file(self, file_metadata: Dict[str, Any], prompt: Optional[str] = None,
+                                 model_id: Optional[str] = None, mode: Optional[str] = None,
+                                 file_content: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """按文件元数据生成报告，返回 (报告, Agent会话ID)
+
+        需要Map-Reduce的长文档不读入内存，而是边从S3读取旁路文本边切块；
+        Agent、分章节和抽取式预过滤需要完整文本（前者受Agent输入上限约束），仍读取整个文件
+        """
+        if self.uses_streamed_input(file_metadata, mode):
+            logger.info(f"[MAP_REDUCE_STREAM] 文件 {file_metadata['file_id']} 约 {file_metadata['text_length']} 字符，流式读取")
+            session_id = new_agent_session_id()
+            try:
+                # 元数据头之后接旁路文本的片段流
+                header = build_content_with_header(file_metadata['file_id'], file_metadata, '')
+                stream = itertools.chain([header], iter_file_text(file_metadata))
+                return self._generate_report_with_map_reduce(stream, prompt, model_id, session_id), session_id
+            except Exception as e:
+                logger.error(f"使用Agent生成报告失败: {str(e)}")
+                raise Exception(f"Bedrock Agent调用失败，请检查AWS配置和服务可用性: {str(e)}")
+        if file_content is None:
+            file_content = build_content_with_header(file_metadata['file_id'], file_metadata, get_file_text(file_metadata))
+        return self.generate_report_with_session(file_content, prompt, model_id, mode)
+
+    @staticmethod
+    def uses_streamed_input(file_metadata: Dict[str, Any], mode: Optional[str] = None) -> bool:
+        """判断是否可以不读入整个文件、直接流式Map-Reduce（需要上传时记录的旁路文本和文本长度）"""
+        text_length = file_metadata.get('text_length')
+        if not file_metadata.get('extracted_s3_key') or not text_length:
+            return False
+        if mode == 'map_reduce':
+            return True
+        return (mode or 'auto') == 'auto' and int(text_length) > MAX_AGENT_INPUT_CHARS * max(1, EXTRACTIVE_PREFILTER_RATIO)
+
+    def _prefilter_content(self, file_content: str) -> str:
+        """略超Agent输入上限的文档，用抽取式摘要保留关键句，缩短到上限以内"""
+        if not MAX_AGENT_INPUT_CHARS < len(file_content) <= MAX_AGENT_INPUT_CHARS * EXTRACTIVE_PREFILTER_RATIO:
+            return file_content
+        header, body = split_content_header(file_content)
+        shrunk = header + shrink_text(body, MAX_AGENT_INPUT_CHARS - len(header))
+        logger.info(f"[PREFILTER] 抽取关键句，文档长度 {len(file_content)} -> {len(shrunk)} 字符")
+        return shrunk
+
+    def _generate_report_with_agent(self, file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None,
+                                    session_id: Optional[str] = None) -> str:
         """使用Bedrock Agent生成报告"""
-        # 创建会话ID
-        session_id = f"report-session-{uuid.uuid4()}"
+        # 创建会话ID（调用方传入时沿用，之后可以在同一会话中追加修改要求）
+        session_id = session_id or new_agent_session_id()
         
         # 构建输入文本
-        input_text = f"请根据以下内容生成一份报告:\n\n{file_content}"
-        
-        # 如果有自定义提示，添加到输入文本中
-        if prompt:
-            input_text = f"{prompt}\n\n{input_text}"
+        input_text = self._build_agent_input(file_content, prompt)
         
         # 记录调用信息
         logger.info(f"[AGENT_START] 调用Bedrock Agent生成报告 | 会话ID: {session_id}")
         logger.debug(f"[AGENT_INPUT] 输入文本长度: {len(input_text)} | 前200个字符: {input_text[:200]}...")
-        
+        return self._invoke_agent(input_text, session_id)
+    
+    @staticmethod
+    def _build_agent_input(file_content: str, prompt: Optional[str] = None) -> str:
+        """构建发送给Agent的输入文本，有自定义提示时放在最前面"""
+        input_text = f"请根据以下内容生成一份报告:\n\n{file_content}"
+        if prompt:
+            input_text = f"{prompt}\n\n{input_text}"
+        return input_text
+    
+    def _check_agent_input(self, input_text: str) -> Optional[str]:
+        """检查Agent输入是否超过inputText上限或Agent模型的token预算，超过时返回原因，否则返回None"""
+        if len(input_text) > AGENT_INPUT_TEXT_LIMIT:
+            return f"Agent输入 {len(input_text)} 字符，超过inputText上限 {AGENT_INPUT_TEXT_LIMIT} 字符"
+        tokens = estimate_tokens(input_text, self.model_id)
+        budget = get_input_budget(self.model_id, REPORT_MIN_OUTPUT_TOKENS) - AGENT_PROMPT_OVERHEAD_TOKENS
+        if tokens > budget:
+            return f"Agent输入约 {tokens} tokens，超过模型 {self.model_id} 的输入预算 {budget} tokens"
+        return None
+    
+    def refine_report(self, session_id: str, instructions: str) -> str:
+        """在已有的Agent会话中追加修改要求，只发送修改要求而不重新发送文档；超过Agent输入预算时在调用前报错"""
+        input_text = f"请根据以下修改要求，修改你刚才生成的报告，并输出修改后的完整报告:\n\n{instructions}"
+        logger.info(f"[AGENT_FOLLOW_UP] 在会话中追加修改要求 | 会话ID: {session_id} | 输入长度: {len(input_text)}")
+        return self._invoke_agent(input_text, session_id)
+    
+    def _invoke_agent(self, input_text: str, session_id: str) -> str:
+        """调用Bedrock Agent并从事件流中提取报告文本，输入超过预算时在调用之前报错"""
+        problem = self._check_agent_input(input_text)
+        if problem:
+            logger.error(f"[AGENT_BUDGET] {problem} | 会话ID: {session_id}")
+            raise Exception(problem)
         try:
             # 调用Bedrock Agent
             logger.info("[AGENT_INVOKE] 开始调用Bedrock Agent")
-            response = self.bedrock_agent_runtime.invoke_agent(
+            # Agent与直接调用模型一样经过限流器，事件流读完之前占用并发槽
+            limiter_key = f"agent:{self.agent_id}"
+            response, queue_wait = bedrock_limiter.start(
+                limiter_key,
+                self.bedrock_agent_runtime.invoke_agent,
                 agentId=self.agent_id,
                 agentAliasId=self.agent_alias_id,
                 sessionId=session_id,
                 inputText=input_text,
                 enableTrace=True
             )
-            logger.info("[AGENT_INVOKE] Bedrock Agent调用成功")
+            logger.info(f"[AGENT_INVOKE] Bedrock Agent调用成功 | 排队 {queue_wait * 1000:.1f} ms")
             
-            # 处理响应
-            completion = ""
-            event_count = 0
+            try:
+                # 处理响应
+                completion = ""
+                event_count = 0
             
-            # 处理EventStream
-            if 'completion' in response:
-                logger.info("[AGENT_STREAM] 开始处理事件流")
+                # 处理EventStream
+                if 'completion' in response:
+                    logger.info("[AGENT_STREAM] 开始处理事件流")
                 
-                for event in response['completion']:
-                    event_count += 1
-                    logger.debug(f"[AGENT_EVENT_{event_count}] 处理事件")
+                    for event in response['completion']:
+                        event_count += 1
+                        logger.debug(f"[AGENT_EVENT_{event_count}] 处理事件")
                     
-                    try:
-                        # 如果事件是字典类型
-                        if isinstance(event, dict):
-                            if 'chunk' in event and 'bytes' in event['chunk']:
-                                chunk_data = event['chunk']['bytes'].decode('utf-8')
-                                logger.debug(f"[AGENT_CHUNK] 解码后的chunk数据: {chunk_data}")
+                        try:
+                            # 如果事件是字典类型
+                            if isinstance(event, dict):
+                                if 'chunk' in event and 'bytes' in event['chunk']:
+                                    chunk_data = event['chunk']['bytes'].decode('utf-8')
+                                    logger.debug(f"[AGENT_CHUNK] 解码后的chunk数据: {chunk_data}")
                                 
-                                # 尝试解析JSON
+                                    # 尝试解析JSON
+                                    try:
+                                        chunk_json = json.loads(chunk_data)
+                                        if 'content' in chunk_json:
+                                            for content_item in chunk_json['content']:
+                                                if content_item.get('type') == 'text':
+                                                    text_content = content_item.get('text', '')
+                                                    completion += text_content
+                                                    logger.debug(f"[AGENT_TEXT] 提取的文本: {text_content[:100]}...")
+                                    except json.JSONDecodeError as json_error:
+                                        logger.warning(f"[AGENT_JSON_ERROR] JSON解码错误: {json_error}")
+                                        logger.debug("[AGENT_FALLBACK] 作为原始文本添加: {chunk_data}")
+                                        completion += chunk_data
+                        
+                            # 如果事件是字符串类型
+                            elif isinstance(event, str):
                                 try:
-                                    chunk_json = json.loads(chunk_data)
-                                    if 'content' in chunk_json:
-                                        for content_item in chunk_json['content']:
+                                    event_json = json.loads(event)
+                                    if 'content' in event_json:
+                                        for content_item in event_json['content']:
                                             if content_item.get('type') == 'text':
                                                 text_content = content_item.get('text', '')
                                                 completion += text_content
                                                 logger.debug(f"[AGENT_TEXT] 提取的文本: {text_content[:100]}...")
                                 except json.JSONDecodeError as json_error:
                                     logger.warning(f"[AGENT_JSON_ERROR] JSON解码错误: {json_error}")
-                                    logger.debug("[AGENT_FALLBACK] 作为原始文本添加: {chunk_data}")
-                                    completion += chunk_data
-                        
-                        # 如果事件是字符串类型
-                        elif isinstance(event, str):
-                            try:
-                                event_json = json.loads(event)
-                                if 'content' in event_json:
-                                    for content_item in event_json['content']:
-                                        if content_item.get('type') == 'text':
-                                            text_content = content_item.get('text', '')
-                                            completion += text_content
-                                            logger.debug(f"[AGENT_TEXT] 提取的文本: {text_content[:100]}...")
-                            except json.JSONDecodeError as json_error:
-                                logger.warning(f"[AGENT_JSON_ERROR] JSON解码错误: {json_error}")
-                                logger.debug(f"[AGENT_FALLBACK] 作为原始文本添加: {event}")
-                                completion += event
+                                    logger.debug(f"[AGENT_FALLBACK] 作为原始文本添加: {event}")
+                                    completion += event
                     
-                    except Exception as event_error:
-                        logger.error(f"[AGENT_EVENT_ERROR] 处理事件时出错: {event_error}")
-                        continue
+                        except Exception as event_error:
+                            logger.error(f"[AGENT_EVENT_ERROR] 处理事件时出错: {event_error}")
+                            continue
                 
-                logger.info(f"[AGENT_STREAM] 事件流处理完成，共处理 {event_count} 个事件")
+                    logger.info(f"[AGENT_STREAM] 事件流处理完成，共处理 {event_count} 个事件")
+            finally:
+                bedrock_limiter.finish(limiter_key)
             
             # 显示最终的Agent响应
             if completion:
@@ -175,86 +333,123 @@ class BedrockAgentService:
             logger.error(f"[AGENT_ERROR] {error_msg}", exc_info=True)
             raise Exception(error_msg)
     
+    def _generate_report_with_map_reduce(self, file_content: Union[str, Iterable[str]], prompt: Optional[str] = None,
+                                         model_id: Optional[str] = None, session_id: Optional[str] = None) -> str:
+        """使用分层Map-Reduce生成报告：各块摘要并发直接调用模型，最终报告仍由Agent生成
+
+        file_content可以是文本片段的流，此时按需切块，内存不随文档长度增长
+        """
+        model_to_use = model_id or self.model_id
+        length = f"{len(file_content)} 字符" if isinstance(file_content, str) else "流式输入"
+        logger.info(f"[MAP_REDUCE_START] 文档长度 {length}，使用Map-Reduce生成报告 | 模型ID: {model_to_use}")
+
+        def summarize(text: str) -> str:
+            return self._invoke_model(text, model_to_use)[0]
+
+        def generate_final(combined: str) -> str:
+            content = f"（以下内容是一份长文档按顺序各部分的要点摘要）\n\n{combined}"
+            return self._generate_report_with_agent(content, prompt, model_id, session_id)
+
+        # 块大小同时受模型的token预算和Agent输入长度限制
+        chunk_size = min(MAP_REDUCE_CHUNK_SIZE, MAX_AGENT_INPUT_CHARS, get_chunk_size_chars(model_to_use))
+        return map_reduce_generate(
+            file_content,
+            summarize,
+            generate_final,
+            namespace=model_to_use,
+            chunk_size=chunk_size,
+            max_workers=MAP_REDUCE_MAX_WORKERS
+        )
+
+    def _generate_report_with_sections(self, file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None) -> str:
+        """先生成大纲，再并发直接调用模型生成各章节，章节共享同一份上下文"""
+        model_to_use = model_id or self.model_id
+        logger.info(f"[SECTIONS_START] 文档长度 {len(file_content)} 字符，分章节生成报告 | 模型ID: {model_to_use}")
+
+        context = self._prepare_shared_context(file_content, model_to_use)
+        return generate_sectioned_report(
+            context,
+            lambda text: self._invoke_model(text, model_to_use),
+            instruction=prompt or ""
+        )
+
+    def regenerate_sections(self, file_content: str, report_content: str, sections: List[Union[int, str]],
+                            prompt: Optional[str] = None, model_id: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """只重新生成报告中选中的章节，返回 (更新后的报告, 重新生成的章节)"""
+        model_to_use = model_id or self.model_id
+        logger.info(f"[SECTIONS_REGENERATE] 重新生成章节: {sections} | 模型ID: {model_to_use}")
+        context = self._prepare_shared_context(file_content, model_to_use)
+        return regenerate_sections(
+            report_content,
+            context,
+            lambda text: self._invoke_model(text, model_to_use),
+            sections,
+            instruction=prompt or ""
+        )
+
+    def _prepare_shared_context(self, file_content: str, model_to_use: str) -> str:
+        """准备各章节共享的上下文：放得下时为文件内容，超出单次调用预算时为Map-Reduce归约后的摘要"""
+        header, body = split_content_header(file_content)
+        chunk_size = get_chunk_size_chars(model_to_use)
+        if len(body) > chunk_size:
+            body = map_reduce_generate(
+                body,
+                lambda text: self._invoke_model(text, model_to_use)[0],
+                lambda combined: combined,
+                namespace=model_to_use,
+                chunk_size=min(MAP_REDUCE_CHUNK_SIZE, chunk_size),
+                max_workers=MAP_REDUCE_MAX_WORKERS
+            )
+        return pack_prompt("{context}", [body], model_to_use, header=header,
+                           min_output_tokens=REPORT_MIN_OUTPUT_TOKENS).context
+
+    def _invoke_model(self, input_text: str, model_id: Optional[str] = None, max_tokens: Optional[int] = None) -> Tuple[str, Optional[str]]:
+        """通过ConverseStream直接调用Bedrock模型，返回 (生成文本, 停止原因)
+
+        未指定max_tokens时根据估算的提示词大小动态设置；提示词超出上下文窗口时在发送前抛出异常
+        """
+        model_to_use = model_id or self.model_id
+        max_tokens = self._output_budget(input_text, model_to_use, max_tokens)
+        return invoke_text(self.bedrock_runtime, model_to_use, input_text, max_tokens)
+
+    def _output_budget(self, input_text: str, model_to_use: str, max_tokens: Optional[int] = None) -> int:
+        """根据提示词大小计算输出上限"""
+        prompt_tokens = estimate_tokens(input_text, model_to_use)
+        allowance = get_output_allowance(prompt_tokens, model_to_use)
+        max_tokens = min(max_tokens, allowance) if max_tokens else allowance
+        logger.debug(f"[MODEL_BUDGET] 模型 {model_to_use} 提示词约 {prompt_tokens} tokens，输出上限 {max_tokens} tokens")
+        return max_tokens
+
+    def _build_report_prompt(self, file_content: str, prompt: Optional[str], model_to_use: str):
+        """按模型的token预算打包元数据头和文件内容，超出部分在发送前截断"""
+        template = "请根据以下内容生成一份报告:\n\n{context}"
+        if prompt:
+            template = f"{prompt}\n\n{template}"
+        header, body = split_content_header(file_content)
+        return pack_prompt(template, [body], model_to_use, header=header, min_output_tokens=REPORT_MIN_OUTPUT_TOKENS)
+
+    def stream_report_with_model(self, file_content: str, prompt: Optional[str] = None,
+                                 model_id: Optional[str] = None) -> ConverseStream:
+        """直接调用模型流式生成报告，迭代返回值即可逐段得到报告文本"""
+        model_to_use = model_id or self.model_id
+        logger.info(f"流式调用Bedrock模型生成报告，模型ID: {model_to_use}")
+        packed = self._build_report_prompt(file_content, prompt, model_to_use)
+        max_tokens = self._output_budget(packed.text, model_to_use, packed.max_tokens)
+        return stream_text(self.bedrock_runtime, model_to_use, packed.text, max_tokens)
+
     def _generate_report_with_model(self, file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None) -> str:
         """直接使用Bedrock模型生成报告"""
         # 使用指定的模型ID或默认模型ID
         model_to_use = model_id or self.model_id
         
-        # 构建输入文本
-        input_text = f"请根据以下内容生成一份报告:\n\n{file_content}"
-        
-        # 如果有自定义提示，添加到输入文本中
-        if prompt:
-            input_text = f"{prompt}\n\n{input_text}"
-        
         # 记录调用信息
         logger.info(f"直接调用Bedrock模型生成报告，模型ID: {model_to_use}")
-        logger.debug(f"输入文本: {input_text[:200]}...")
         
         try:
-            # 根据模型ID选择不同的请求体格式
-            if model_to_use.startswith('anthropic.claude-3'):
-                # Claude 3模型的请求体
-                request_body = {
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 4000,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": input_text
-                        }
-                    ]
-                }
-            elif model_to_use.startswith('anthropic.claude-'):
-                # Claude模型的请求体
-                request_body = {
-                    "prompt": f"\n\nHuman: {input_text}\n\nAssistant:",
-                    "max_tokens_to_sample": 4000,
-                    "temperature": 0.7,
-                    "top_p": 0.9
-                }
-            elif model_to_use.startswith('amazon.titan'):
-                # Titan模型的请求体
-                request_body = {
-                    "inputText": input_text,
-                    "textGenerationConfig": {
-                        "maxTokenCount": 4000,
-                        "temperature": 0.7,
-                        "topP": 0.9
-                    }
-                }
-            else:
-                # 默认请求体格式
-                request_body = {
-                    "prompt": input_text,
-                    "max_tokens_to_sample": 4000,
-                    "temperature": 0.7,
-                    "top_p": 0.9
-                }
-            
-            # 调用Bedrock模型
-            response = self.bedrock_runtime.invoke_model(
-                modelId=model_to_use,
-                body=json.dumps(request_body)
-            )
-            
-            # 解析响应
-            response_body = json.loads(response['body'].read().decode('utf-8'))
-            
-            # 根据模型ID解析不同的响应格式
-            if model_to_use.startswith('anthropic.claude-3'):
-                # Claude 3模型的响应格式
-                full_response = response_body.get('content', [{}])[0].get('text', '')
-            elif model_to_use.startswith('anthropic.claude-'):
-                # Claude模型的响应格式
-                full_response = response_body.get('completion', '')
-            elif model_to_use.startswith('amazon.titan'):
-                # Titan模型的响应格式
-                full_response = response_body.get('results', [{}])[0].get('outputText', '')
-            else:
-                # 默认响应格式
-                full_response = response_body.get('completion', '')
-            
+            # 按模型的token预算打包元数据头和文件内容，超出部分在发送前截断
+            packed = self._build_report_prompt(file_content, prompt, model_to_use)
+            logger.debug(f"输入文本: {packed.text[:200]}...")
+            full_response, _ = self._invoke_model(packed.text, model_to_use, packed.max_tokens)
             logger.info(f"Bedrock模型报告生成成功，长度: {len(full_response)}")
             return full_response
             
@@ -266,6 +461,34 @@ class BedrockAgentService:
 bedrock_agent_service = BedrockAgentService()
 
 # 导出函数
-def generate_report(file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None) -> str:
+def generate_report(file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None,
+                    mode: Optional[str] = None) -> str:
     """调用Bedrock Agent生成报告"""
-    return bedrock_agent_service.generate_report(file_content, prompt, model_id) 
\ No newline at end of file
+    return bedrock_agent_service.generate_report(file_content, prompt, model_id, mode)
+
+def generate_report_for_file(file_metadata: Dict[str, Any], prompt: Optional[str] = None, model_id: Optional[str] = None,
+                             mode: Optional[str] = None, file_content: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """按文件元数据生成报告，长文档流式读取，返回 (报告, Agent会话ID)"""
+    return bedrock_agent_service.generate_report_for_file(file_metadata, prompt, model_id, mode, file_content)
+
+def uses_streamed_input(file_metadata: Dict[str, Any], mode: Optional[str] = None) -> bool:
+    """判断生成报告时是否流式读取文件"""
+    return bedrock_agent_service.uses_streamed_input(file_metadata, mode)
+
+def regenerate_report_sections(file_content: str, report_content: str, sections: List[Union[int, str]],
+                               prompt: Optional[str] = None, model_id: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """只重新生成报告中选中的章节"""
+    return bedrock_agent_service.regenerate_sections(file_content, report_content, sections, prompt, model_id)
+
+def generate_report_with_session(file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None,
+                                 mode: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """生成报告，返回 (报告, Agent会话ID)"""
+    return bedrock_agent_service.generate_report_with_session(file_content, prompt, model_id, mode)
+
+def stream_report(file_content: str, prompt: Optional[str] = None, model_id: Optional[str] = None) -> ConverseStream:
+    """直接调用模型流式生成报告"""
+    return bedrock_agent_service.stream_report_with_model(file_content, prompt, model_id)
+
+def refine_report(session_id: str, instructions: str) -> str:
+    """在已有的Agent会话中追加修改要求"""
+    return bedrock_agent_service.refine_report(session_id, instructions)
@@ -3,6 +3,11 @@ import sys
 import json
 from typing import List, Dict, Any, Optional
 
+from app.services.modules.keyword_engine import keyword_engine
+from app.services.search_service import search_service
+from app.services.modules.extraction import extraction_engine, build_structure, EXTRACTION_USE_LLM
+from app.services.storage import split_content_header
+
 
 # Define a simple document class
 class SimpleDocument:
@@ -11,35 +16,60 @@ class SimpleDocument:
         self.meta = meta or {}
 
 
-# Simple keyword extractor
-class SimpleKeywordExtractor:
-    def extract_keywords(self, text: str, top_n: int = 10) -> List[str]:
-        """Extract keywords from text"""
-        words = text.lower().split()
-        word_freq = {}
-        for word in words:
-            if len(word) > 3:  # Exclude short words
-                word_freq[word] = word_freq.get(word, 0) + 1
-
-        # Sort by frequency
-        sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        return [word for word, _ in sorted_words[:top_n]]
-
-
 # Simple Haystack service
 class SimpleHaystackService:
     """Simplified Haystack service providing semantic analysis"""
 
     def __init__(self):
         """Initialize the service"""
-        self.keyword_extractor = SimpleKeywordExtractor()
+        self.keyword_engine = keyword_engine
+        # Document frequencies come from the persisted keyword index, which every uploaded file and report is written to
+        self.keyword_engine.set_corpus(search_service.keyword_statistics)
 
     def extract_keywords(self, text: str, top_n: int = 10) -> List[str]:
-        """Extract keywords from text"""
-        return self.keyword_extractor.extract_keywords(text, top_n)
+        """Extract keywords from text, scored against corpus-wide document frequencies
+
+        The file metadata header is stripped first: the corpus is indexed without it,
+        so header terms would otherwise get a high IDF and outrank the real content.
+        """
+        _, body = split_content_header(text or '')
+        return [term for term, _ in self.keyword_engine.extract_keywords(body, top_n)]
+
+    def extract_keywords_batch(self, texts: List[str], top_n: int = 10) -> List[List[str]]:
+        """Extract keywords from many texts in one vectorized pass (metadata headers stripped)"""
+        bodies = [split_content_header(text or '')[1] for text in texts]
+        return [[term for term, _ in keywords] for keywords in self.keyword_engine.score_batch(bodies, top_n)]
+
+    def analyze_document(self, text: str, top_n: int = 10, use_llm: Optional[bool] = None,
+                         model_id: Optional[str] = None) -> Dict[str, Any]:
+        """Extract keywords, structure and entities in a single pass over the text
+
+        Rule-based extraction runs in one linear scan; with use_llm (default EXTRACTION_USE_LLM)
+        one forced tool call, whose input follows the extraction schema, refines the result, cached per content hash.
+        """
+        use_llm = EXTRACTION_USE_LLM if use_llm is None else use_llm
+        if use_llm:
+            analysis = extraction_engine.extract_with_llm(text, self._model_invoker(model_id), namespace=model_id or "")
+        else:
+            analysis = extraction_engine.extract(text)
+        analysis['keywords'] = self.extract_keywords(text, top_n)
+        return analysis
+
+    def _model_invoker(self, model_id: Optional[str]):
+        """Create a function that forces the model to call one tool and returns the tool input"""
+        from app.services.langchain_service import langchain_service
+        from app.services.modules.converse import invoke_tool
+        from app.utils.token_utils import fit_prompt
+
+        model = model_id or langchain_service.default_model_id
+
+        def invoke(prompt: str, tool: Dict[str, Any]) -> Dict[str, Any]:
+            packed = fit_prompt(prompt, model)
+            return invoke_tool(langchain_service.bedrock_client, model, packed.text, max_tokens=packed.max_tokens, **tool)
+        return invoke
 
     def process_structured_data(self, text: str, schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Process text and extract structured data (simulation)"""
+        """Process text and extract structured data for the fields in the schema"""
         # If no schema is provided, use default schema
         if not schema:
             schema = {
@@ -51,70 +81,25 @@ class SimpleHaystackService:
                 "action_items": "Action items with assignees and deadlines"
             }
 
-        # Return simulated structured data
-        result = {}
-        for key, description in schema.items():
-            if key == "title":
-                # Extract title (use first line)
-                lines = text.split('\n')
-                result[key] = lines[0] if lines else "No title"
-            elif key == "date":
-                # Extract date (simulation)
-                result[key] = "2025-03-07"
-            elif key == "participants":
-                # Extract participants (simulation)
-                result[key] = ["User1", "User2", "User3"]
-            elif key == "agenda":
-                # Extract agenda (simulation)
-                result[key] = ["Topic1", "Topic2", "Topic3"]
-            elif key == "decisions":
-                # Extract decisions (simulation)
-                result[key] = ["Decision1", "Decision2"]
-            elif key == "action_items":
-                # Extract action items (simulation)
-                result[key] = [
-                    {"item": "Task1", "assignee": "User1", "deadline": "2025-03-14"},
-                    {"item": "Task2", "assignee": "User2", "deadline": "2025-03-21"}
-                ]
-            else:
-                # Other fields
-                result[key] = f"Sample value for {key}"
-
-        return result
-
-    def analyze_document_structure(self, text: str) -> Dict[str, Any]:
-        """Analyze document structure (simulation)"""
-        # Return simulated document structure
+        analysis = extraction_engine.extract(text)
+        # Fields that are not extracted (e.g. custom schema keys) are returned as None
         return {
-            "title": text.split('\n')[0] if text.split('\n') else "No title",
-            "topics": ["Topic1", "Topic2", "Topic3"],
-            "key_points": {
-                "Topic1": ["Point1-1", "Point1-2"],
-                "Topic2": ["Point2-1", "Point2-2"],
-                "Topic3": ["Point3-1", "Point3-2"]
-            },
-            "decisions": ["Decision1", "Decision2"],
-            "action_items": [
-                {"item": "Task1", "assignee": "User1", "deadline": "2025-03-14"},
-                {"item": "Task2", "assignee": "User2", "deadline": "2025-03-21"}
-            ]
+            key: analysis.get(key, analysis['entities'].get(key))
+            for key in schema
         }
 
+    def analyze_document_structure(self, text: str) -> Dict[str, Any]:
+        """Analyze document structure"""
+        return build_structure(extraction_engine.extract(text))
+
     # Keep for backward compatibility
     def analyze_meeting_structure(self, text: str) -> Dict[str, Any]:
         """Analyze document structure (for backward compatibility)"""
         return self.analyze_document_structure(text)
 
     def extract_entities(self, text: str) -> Dict[str, List[str]]:
-        """Extract entities from text (simulation)"""
-        # Return simulated entities
-        return {
-            "people": ["Person1", "Person2", "Person3"],
-            "organizations": ["Org1", "Org2"],
-            "locations": ["Location1", "Location2"],
-            "dates": ["2025-03-07", "2025-03-14"],
-            "products": ["Product1", "Product2"]
-        }
+        """Extract people, organizations, locations, dates and products from text"""
+        return extraction_engine.extract(text)["entities"]
 
 
 # Create a singleton instance
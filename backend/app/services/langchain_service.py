@@ -15,14 +15,17 @@ from langchain.chains import LLMChain
 from langchain.chains import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferMemory
 from langchain.schema.messages import HumanMessage
-from langchain.retrievers.document_compressors import LLMChainExtractor
 from langchain.retrievers import ContextualCompressionRetriever
 
 # Import refactored modules
 # リファクタリングされたモジュールをインポート
 from app.services.modules.model_handlers import initialize_bedrock_client, create_model, get_model_for_generation
 from app.services.modules.report_generators import generate_report_with_rag as module_generate_report_with_rag
+from app.services.modules.report_generators import generate_report_with_map_reduce as module_generate_report_with_map_reduce
+from app.services.modules.report_generators import generate_report_with_sections as module_generate_report_with_sections
+from app.services.modules.report_generators import create_chat_session as module_create_chat_session
 from app.services.modules.vector_store import create_vector_store
+from app.services.modules.compression import create_document_compressor
 from app.services.tools.report_generator import generate_report_with_tools as tool_generate_report_with_tools
 
 # Initialize logging
@@ -94,9 +97,18 @@ class LangChainService:
             logger.error(f"Error generating text: {e}")
             return f"Error generating text: {e}. Please ensure your AWS account has Bedrock service enabled and has sufficient permissions."
     
-    def create_rag_chain(self, documents: List[str], query: str, model_id: Optional[str] = None) -> Dict[str, Any]:
+    def create_rag_chain(
+        self,
+        documents: List[str],
+        query: str,
+        model_id: Optional[str] = None,
+        compression: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Create RAG enhanced retrieval chain and generate answer
         
+        The default "embedding" compression filters retrieved chunks and sentences locally, so the answer
+        is the only LLM call; "llm" extracts with the model concurrently, "none" skips compression.
+        
         RAG強化検索チェーンを作成し、回答を生成する
         """
         # Get appropriate model
@@ -123,17 +135,18 @@ class LangChainService:
         
         # Create contextual compression retriever
         # コンテキスト圧縮検索機を作成
-        compressor = LLMChainExtractor.from_llm(llm)
-        compression_retriever = ContextualCompressionRetriever(
-            base_compressor=compressor,
-            base_retriever=retriever
-        )
+        compressor = create_document_compressor(compression, llm=llm, embeddings=self.embeddings)
+        if compressor is not None:
+            retriever = ContextualCompressionRetriever(
+                base_compressor=compressor,
+                base_retriever=retriever
+            )
         
         # Create RAG chain
         # RAGチェーンを作成
         qa_chain = ConversationalRetrievalChain.from_llm(
             llm=llm,
-            retriever=compression_retriever,
+            retriever=retriever,
             return_source_documents=True
         )
         
@@ -190,6 +203,13 @@ class LangChainService:
         
         return qa_chain
     
+    def create_chat_session(self, document: str, report_id: str, model_id: Optional[str] = None):
+        """Create a cached Q&A session over a document (indexed once per session)
+        
+        ドキュメントに対するQ&Aセッションを作成する（インデックスはセッションごとに一度だけ作成）
+        """
+        return module_create_chat_session(self, document, report_id, model_id)
+    
     def optimize_prompt(self, base_prompt: str, context: str, feedback: str) -> str:
         """Optimize prompt based on feedback
         
@@ -216,6 +236,20 @@ class LangChainService:
         """
         return module_generate_report_with_rag(self, document, prompt, model_id)
     
+    def generate_report_with_map_reduce(self, document: str, prompt: Optional[str] = None, model_id: Optional[str] = None) -> str:
+        """Generate report for long documents using hierarchical map-reduce
+        
+        階層的なMap-Reduceで長い文書のレポートを生成する
+        """
+        return module_generate_report_with_map_reduce(self, document, prompt, model_id)
+    
+    def generate_report_with_sections(self, document: str, prompt: Optional[str] = None, model_id: Optional[str] = None) -> str:
+        """Generate report by outlining first, then writing sections concurrently
+        
+        アウトラインを先に生成し、各セクションを並行して生成する
+        """
+        return module_generate_report_with_sections(self, document, prompt, model_id)
+    
     def generate_report_with_tools(self, document: str, prompt: Optional[str] = None, model_id: Optional[str] = None) -> str:
         """Generate report using tools
         
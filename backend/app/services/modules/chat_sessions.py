@@ -0,0 +1,234 @@
+"""
+文档问答会话模块 - 按会话缓存检索器和对话记忆
+
+文档只在创建会话时分块并建立一次向量索引；之后每个追问只需一次检索和一次模型调用。
+会话保存在有上限的LRU中，空闲超时后被淘汰；对话历史过长时，较早的轮次被压缩为摘要
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from app.utils.token_utils import estimate_tokens
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 同时保留的最大会话数
+CHAT_MAX_SESSIONS = int(os.environ.get('CHAT_MAX_SESSIONS', '32'))
+
+# 会话空闲多久（秒）后被淘汰
+CHAT_SESSION_IDLE_TTL = int(os.environ.get('CHAT_SESSION_IDLE_TTL', '1800'))
+
+# 对话历史超过该token数时压缩较早的轮次
+CHAT_HISTORY_MAX_TOKENS = int(os.environ.get('CHAT_HISTORY_MAX_TOKENS', '1500'))
+
+# 压缩时原样保留的最近轮次数
+CHAT_KEEP_RECENT_TURNS = int(os.environ.get('CHAT_KEEP_RECENT_TURNS', '2'))
+
+# 检索函数：输入查询，返回相关文本块
+RetrieveFn = Callable[[str], List[str]]
+
+# 模型调用函数：输入完整提示词，返回 (生成文本, 停止原因)
+GenerateFn = Callable[[str], Tuple[str, Optional[str]]]
+
+CHAT_PROMPT = """你是一个基于文档内容回答问题的助手。请只根据下面的文档片段和对话历史回答，文档中没有相关信息时请直接说明。
+
+之前对话的摘要：
+{summary}
+
+最近的对话：
+{history}
+
+文档片段：
+{context}
+
+问题：{question}
+回答："""
+
+SUMMARY_PROMPT = """请把以下对话压缩为一段简洁的摘要，保留提到的事实、数字和结论，不超过300字。
+
+已有摘要：
+{summary}
+
+新的对话：
+{history}
+
+摘要："""
+
+
+def format_turns(turns: List[Tuple[str, str]]) -> str:
+    """
+    把对话轮次格式化为文本
+
+    Args:
+        turns: (问题, 回答) 列表
+
+    Returns:
+        str: 对话文本
+    """
+    return "\n".join(f"用户: {question}\n助手: {answer}" for question, answer in turns)
+
+
+class ChatSession:
+    """单个文档问答会话，持有检索器和带摘要的对话记忆"""
+
+    def __init__(
+        self,
+        report_id: str,
+        retrieve: RetrieveFn,
+        generate: GenerateFn,
+        model_id: Optional[str] = None,
+        session_id: Optional[str] = None
+    ):
+        self.session_id = session_id or str(uuid.uuid4())
+        self.report_id = report_id
+        self.model_id = model_id
+        self.retrieve = retrieve
+        self.generate = generate
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = []
+        self.turn_count = 0
+        self.last_used = time.monotonic()
+        # 同一会话的追问按顺序处理，保证对话历史一致
+        self.lock = threading.Lock()
+
+    def build_query(self, question: str) -> str:
+        """把上一轮问题拼到检索查询中，使省略了主语的追问也能检索到相关内容"""
+        if not self.turns:
+            return question
+        return f"{self.turns[-1][0]}\n{question}"
+
+    def ask(self, question: str) -> dict:
+        """
+        回答一个问题
+
+        Args:
+            question: 用户问题
+
+        Returns:
+            dict: 包含answer和sources的字典
+        """
+        with self.lock:
+            sources = self.retrieve(self.build_query(question))
+            prompt = CHAT_PROMPT.format(
+                summary=self.summary or "（无）",
+                history=format_turns(self.turns) or "（无）",
+                context="\n\n".join(sources),
+                question=question
+            )
+            answer, _ = self.generate(prompt)
+            answer = answer.strip()
+
+            self.turns.append((question, answer))
+            self.turn_count += 1
+            self.compact_history()
+            self.last_used = time.monotonic()
+            return {'answer': answer, 'sources': sources}
+
+    def compact_history(self) -> None:
+        """对话历史超过CHAT_HISTORY_MAX_TOKENS时，把较早的轮次合并进摘要"""
+        if len(self.turns) <= CHAT_KEEP_RECENT_TURNS:
+            return
+        if estimate_tokens(format_turns(self.turns), self.model_id) <= CHAT_HISTORY_MAX_TOKENS:
+            return
+
+        older = self.turns[:-CHAT_KEEP_RECENT_TURNS]
+        try:
+            summary, _ = self.generate(SUMMARY_PROMPT.format(
+                summary=self.summary or "（无）",
+                history=format_turns(older)
+            ))
+        except Exception as e:
+            # 压缩失败时保留完整历史，下一轮再试
+            logger.warning(f"[CHAT] 对话历史压缩失败: {str(e)}")
+            return
+        self.summary = summary.strip()
+        self.turns = self.turns[-CHAT_KEEP_RECENT_TURNS:]
+        logger.info(f"[CHAT] 会话 {self.session_id} 的 {len(older)} 轮对话已压缩为摘要")
+
+
+class ChatSessionStore:
+    """有上限的LRU会话存储，空闲超时的会话在访问存储时被淘汰"""
+
+    def __init__(self, max_sessions: int = CHAT_MAX_SESSIONS, idle_ttl: int = CHAT_SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_idle(self) -> None:
+        """淘汰空闲超时的会话（调用方需持有锁）"""
+        now = time.monotonic()
+        # 最近使用的会话在末尾，从头部开始淘汰
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            logger.info(f"[CHAT] 会话 {session_id} 空闲超时，已淘汰")
+
+    def get(self, session_id: Optional[str], report_id: Optional[str] = None) -> Optional[ChatSession]:
+        """
+        获取会话并标记为最近使用
+
+        Args:
+            session_id: 会话ID
+            report_id: 可选，会话必须属于该报告
+
+        Returns:
+            Optional[ChatSession]: 会话，不存在、已淘汰或不属于该报告时为None
+        """
+        if not session_id:
+            return None
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is None or (report_id and session.report_id != report_id):
+                return None
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+
+    def add(self, session: ChatSession) -> ChatSession:
+        """
+        保存会话，超出上限时淘汰最久未使用的会话
+
+        Args:
+            session: 会话
+
+        Returns:
+            ChatSession: 保存的会话
+        """
+        with self._lock:
+            self._evict_idle()
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, _ = self._sessions.popitem(last=False)
+                logger.info(f"[CHAT] 会话数超过上限 {self.max_sessions}，淘汰会话 {evicted_id}")
+        return session
+
+    def remove(self, session_id: str) -> bool:
+        """
+        删除会话
+
+        Args:
+            session_id: 会话ID
+
+        Returns:
+            bool: 会话是否存在
+        """
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+# 创建全局会话存储
+chat_session_store = ChatSessionStore()
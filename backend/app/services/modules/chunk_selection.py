@@ -0,0 +1,185 @@
+"""
+上下文块选择模块 - 按整篇文档的覆盖度挑选代表性的块
+
+对块向量做k-means聚类并从每个簇中选出离质心最近的块，或用MMR在相关度和多样性之间取舍；
+两种策略都按token预算装填，并按原文顺序输出，避免只检索文档开头附近的内容
+"""
+
+import os
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.utils.token_utils import estimate_tokens
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 选择策略：kmeans（聚类代表块）、mmr（最大边际相关）、retrieval（以文档开头为查询检索）
+SELECTION_STRATEGIES = ("kmeans", "mmr", "retrieval")
+DEFAULT_SELECTION_STRATEGY = os.environ.get('CONTEXT_SELECTION_STRATEGY', 'kmeans')
+
+# k-means的最大迭代次数
+KMEANS_MAX_ITERATIONS = 25
+
+# MMR中相关度的权重，越小越偏向多样性
+MMR_LAMBDA = 0.5
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    把向量归一化为单位长度，零向量保持不变
+
+    Args:
+        vectors: 向量 (n, d)
+
+    Returns:
+        np.ndarray: 归一化后的向量
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def kmeans(vectors: np.ndarray, k: int, max_iterations: int = KMEANS_MAX_ITERATIONS, seed: int = 0):
+    """
+    向量化的k-means（k-means++初始化，余弦距离）
+
+    Args:
+        vectors: 归一化后的向量 (n, d)
+        k: 簇数
+        max_iterations: 最大迭代次数
+        seed: 随机种子，保证同一文档的选择结果稳定
+
+    Returns:
+        tuple: (每个向量的簇标签 (n,), 质心 (k, d))
+    """
+    n = len(vectors)
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+
+    # k-means++初始化：按到已选质心的距离平方加权抽样
+    centroids = [vectors[rng.integers(n)]]
+    distances = np.full(n, np.inf, dtype=np.float32)
+    for _ in range(1, k):
+        distances = np.minimum(distances, 1.0 - vectors @ centroids[-1])
+        weights = np.clip(distances, 0, None) ** 2
+        total = weights.sum()
+        index = rng.choice(n, p=weights / total) if total > 0 else rng.integers(n)
+        centroids.append(vectors[index])
+    centroids = np.vstack(centroids)
+
+    labels = np.zeros(n, dtype=np.int64)
+    for iteration in range(max_iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if iteration and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        # 按簇累加向量求新质心，空簇保留原质心
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        centroids[filled] = normalize_rows(sums[filled])
+    return labels, centroids
+
+
+def select_by_kmeans(vectors: np.ndarray, k: int) -> List[int]:
+    """
+    每个簇选出离质心最近的块，按簇大小从大到小排列
+
+    Args:
+        vectors: 归一化后的块向量 (n, d)
+        k: 簇数
+
+    Returns:
+        List[int]: 块序号（按优先级）
+    """
+    labels, centroids = kmeans(vectors, k)
+    similarities = vectors @ centroids.T
+    counts = np.bincount(labels, minlength=len(centroids))
+    selected = []
+    for cluster in np.argsort(-counts, kind='stable'):
+        members = np.flatnonzero(labels == cluster)
+        if len(members):
+            selected.append(int(members[np.argmax(similarities[members, cluster])]))
+    return selected
+
+
+def select_by_mmr(vectors: np.ndarray, k: int, query_vector: Optional[np.ndarray] = None, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """
+    最大边际相关选择
+
+    Args:
+        vectors: 归一化后的块向量 (n, d)
+        k: 最多选择的块数
+        query_vector: 查询向量，默认使用整篇文档的平均向量
+        lambda_mult: 相关度权重
+
+    Returns:
+        List[int]: 块序号（按选择顺序）
+    """
+    if query_vector is None:
+        query_vector = vectors.mean(axis=0)
+    query_vector = normalize_rows(query_vector[None, :])[0]
+    relevance = vectors @ query_vector
+
+    selected = [int(np.argmax(relevance))]
+    # 记录每个候选块与已选块的最大相似度，每轮只需增量更新
+    redundancy = vectors @ vectors[selected[0]]
+    while len(selected) < min(k, len(vectors)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        redundancy = np.maximum(redundancy, vectors @ vectors[chosen])
+    return selected
+
+
+def select_chunks(
+    chunks: Sequence[str],
+    vectors,
+    budget_tokens: int,
+    model_id: Optional[str] = None,
+    strategy: str = "kmeans"
+) -> List[str]:
+    """
+    挑选能放入token预算的代表性块，按原文顺序返回
+
+    Args:
+        chunks: 文档的所有块
+        vectors: 块向量 (n, d)
+        budget_tokens: 块可以使用的token预算
+        model_id: 用于估算token数的模型ID
+        strategy: kmeans或mmr
+
+    Returns:
+        List[str]: 选中的块（原文顺序）
+    """
+    if not chunks:
+        return []
+    tokens = [estimate_tokens(chunk, model_id) for chunk in chunks]
+    if sum(tokens) <= budget_tokens:
+        return list(chunks)
+
+    vectors = normalize_rows(vectors)
+    # 簇数按预算能容纳的平均块数估算
+    k = max(1, min(len(chunks), int(budget_tokens / max(1.0, float(np.mean(tokens))))))
+    if strategy == "mmr":
+        order = select_by_mmr(vectors, k)
+    else:
+        order = select_by_kmeans(vectors, k)
+
+    selected = []
+    remaining = budget_tokens
+    for index in order:
+        if tokens[index] <= remaining:
+            selected.append(index)
+            remaining -= tokens[index]
+    if not selected:
+        # 单个块超出预算时保留优先级最高的块，交给打包时截断
+        selected = order[:1]
+    logger.info(f"[SELECTION] {strategy}: 从 {len(chunks)} 个块中选出 {len(selected)} 个，约 {budget_tokens - remaining} tokens")
+    return [chunks[index] for index in sorted(selected)]
@@ -0,0 +1,236 @@
+"""
+上下文压缩模块 - 在不调用大模型的情况下压缩检索结果
+
+默认的embedding模式一次性对查询和候选句子做向量化，按余弦相似度丢弃无关的块，
+并在块内只保留与查询相关的句子；llm模式保留LLMChainExtractor的逐块抽取，但并发调用
+"""
+
+import os
+import re
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain.retrievers.document_compressors import LLMChainExtractor
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+from langchain_core.embeddings import Embeddings
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 压缩模式：embedding（本地，不调用大模型）、llm（并发逐块抽取）、none（不压缩）
+COMPRESSION_MODES = ("embedding", "llm", "none")
+DEFAULT_COMPRESSION_MODE = os.environ.get('RAG_COMPRESSION_MODE', 'embedding')
+
+# 句子与查询的最低相似度
+SENTENCE_SIMILARITY_THRESHOLD = float(os.environ.get('SENTENCE_SIMILARITY_THRESHOLD', '0.3'))
+
+# 相对于最相关句子的最低相似度比例
+SENTENCE_RELATIVE_THRESHOLD = 0.75
+
+# 每个块最多保留的句子数
+MAX_SENTENCES_PER_DOCUMENT = 6
+
+# llm模式的最大并发数
+LLM_COMPRESSION_MAX_WORKERS = int(os.environ.get('LLM_COMPRESSION_MAX_WORKERS', '5'))
+
+# 句子向量缓存的最大条目数，同一文档的追问不会重复向量化相同的句子
+SENTENCE_EMBEDDING_CACHE_SIZE = 4096
+
+_SENTENCE_PATTERN = re.compile(r'[^。！？!?；;\n]+(?:[。！？!?；;]+|\n+|$)|[。！？!?；;\n]+')
+_LATIN_SENTENCE_END = re.compile(r'(?<=[.])\s+(?=[A-Z0-9"\'(])')
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    把文本分割为句子，兼容中日文和英文标点
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        List[str]: 去掉首尾空白后的非空句子
+    """
+    sentences = []
+    for match in _SENTENCE_PATTERN.finditer(text):
+        for sentence in _LATIN_SENTENCE_END.split(match.group(0)):
+            sentence = sentence.strip()
+            if sentence:
+                sentences.append(sentence)
+    return sentences
+
+
+def cosine_similarity(query_vector: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """
+    计算查询向量与一组向量的余弦相似度
+
+    Args:
+        query_vector: 查询向量 (d,)
+        vectors: 候选向量 (n, d)
+
+    Returns:
+        np.ndarray: 相似度 (n,)
+    """
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+    norms[norms == 0] = 1.0
+    return vectors @ query_vector / norms
+
+
+class EmbeddingSentenceCompressor(BaseDocumentCompressor):
+    """基于向量相似度的本地压缩器，块级过滤和句子级抽取都不调用大模型"""
+
+    embeddings: Embeddings
+    similarity_threshold: float = SENTENCE_SIMILARITY_THRESHOLD
+    relative_threshold: float = SENTENCE_RELATIVE_THRESHOLD
+    max_sentences: int = MAX_SENTENCES_PER_DOCUMENT
+    cache_size: int = SENTENCE_EMBEDDING_CACHE_SIZE
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # pydantic模型不允许未声明的属性，缓存通过object.__setattr__挂载
+        object.__setattr__(self, '_cache', OrderedDict())
+        object.__setattr__(self, '_cache_lock', threading.Lock())
+
+    def embed_sentences(self, sentences: List[str]) -> np.ndarray:
+        """
+        向量化句子，已缓存的句子不再重复调用嵌入模型
+
+        Args:
+            sentences: 句子列表
+
+        Returns:
+            np.ndarray: 句子向量 (n, d)
+        """
+        keys = [hashlib.sha256(sentence.encode('utf-8')).hexdigest() for sentence in sentences]
+        with self._cache_lock:
+            missing = list(OrderedDict.fromkeys(
+                (key, sentence) for key, sentence in zip(keys, sentences) if key not in self._cache
+            ))
+        if missing:
+            # 所有未缓存的句子一次性批量向量化
+            vectors = self.embeddings.embed_documents([sentence for _, sentence in missing])
+            with self._cache_lock:
+                for (key, _), vector in zip(missing, vectors):
+                    self._cache[key] = np.asarray(vector, dtype=np.float32)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        with self._cache_lock:
+            result = []
+            for key, sentence in zip(keys, sentences):
+                vector = self._cache.get(key)
+                if vector is None:
+                    # 本批次中被挤出缓存的句子单独补算
+                    vector = np.asarray(self.embeddings.embed_query(sentence), dtype=np.float32)
+                else:
+                    self._cache.move_to_end(key)
+                result.append(vector)
+        return np.vstack(result)
+
+    def compress_documents(
+        self,
+        documents: Sequence[Document],
+        query: str,
+        callbacks: Optional[Callbacks] = None,
+    ) -> Sequence[Document]:
+        """
+        丢弃与查询无关的块，并只保留块中与查询相关的句子（保持原文顺序）
+
+        Args:
+            documents: 检索到的文档
+            query: 查询
+
+        Returns:
+            Sequence[Document]: 压缩后的文档，按相关度排序
+        """
+        if not documents:
+            return []
+
+        per_document = [split_sentences(doc.page_content) or [doc.page_content] for doc in documents]
+        all_sentences = [sentence for sentences in per_document for sentence in sentences]
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        scores = cosine_similarity(query_vector, self.embed_sentences(all_sentences))
+
+        best = float(scores.max())
+        cutoff = max(self.similarity_threshold, best * self.relative_threshold) if best > 0 else best
+        compressed = []
+        document_scores = []
+        offset = 0
+        for doc, sentences in zip(documents, per_document):
+            doc_scores = scores[offset:offset + len(sentences)]
+            offset += len(sentences)
+            document_scores.append(float(doc_scores.max()))
+            keep = [i for i in np.argsort(-doc_scores)[:self.max_sentences] if doc_scores[i] >= cutoff]
+            if not keep:
+                continue
+            content = " ".join(sentences[i] for i in sorted(keep))
+            metadata = dict(doc.metadata, relevance_score=document_scores[-1])
+            compressed.append(Document(page_content=content, metadata=metadata))
+
+        if not compressed:
+            # 没有句子超过阈值时至少保留最相关的一个块
+            top = int(np.argmax(document_scores))
+            compressed.append(Document(
+                page_content=documents[top].page_content,
+                metadata=dict(documents[top].metadata, relevance_score=document_scores[top])
+            ))
+
+        compressed.sort(key=lambda doc: doc.metadata.get('relevance_score', 0.0), reverse=True)
+        logger.info(f"[COMPRESSION] 本地压缩: {len(documents)} 个块 -> {len(compressed)} 个块")
+        return compressed
+
+
+class ConcurrentLLMChainExtractor(LLMChainExtractor):
+    """并发调用模型的LLMChainExtractor，墙钟时间约等于最慢的一次抽取"""
+
+    max_workers: int = LLM_COMPRESSION_MAX_WORKERS
+
+    def compress_documents(
+        self,
+        documents: Sequence[Document],
+        query: str,
+        callbacks: Optional[Callbacks] = None,
+    ) -> Sequence[Document]:
+        """并发地逐块抽取相关内容，保持检索顺序"""
+        if not documents:
+            return []
+        extract = super().compress_documents
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(documents)))) as executor:
+            results = list(executor.map(lambda doc: extract([doc], query, callbacks), documents))
+        return [doc for result in results for doc in result]
+
+
+def create_document_compressor(
+    mode: Optional[str],
+    llm=None,
+    embeddings: Optional[Embeddings] = None
+) -> Optional[BaseDocumentCompressor]:
+    """
+    按模式创建上下文压缩器
+
+    Args:
+        mode: 压缩模式，None时使用DEFAULT_COMPRESSION_MODE
+        llm: llm模式使用的模型
+        embeddings: embedding模式使用的嵌入模型
+
+    Returns:
+        Optional[BaseDocumentCompressor]: 压缩器，none模式时为None
+
+    Raises:
+        Exception: 如果模式未知
+    """
+    mode = mode or DEFAULT_COMPRESSION_MODE
+    if mode not in COMPRESSION_MODES:
+        raise Exception(f"未知的压缩模式: {mode}，可选: {', '.join(COMPRESSION_MODES)}")
+    if mode == "none":
+        return None
+    if mode == "llm":
+        return ConcurrentLLMChainExtractor.from_llm(llm)
+    return EmbeddingSentenceCompressor(embeddings=embeddings)
@@ -0,0 +1,317 @@
+"""
+模型调用模块 - 基于Bedrock Converse/ConverseStream的统一调用层
+
+所有模型使用同一种请求和响应格式，不再按模型家族手工构建请求体；
+响应以流的方式逐段产出文本，结束后记录停止原因、token用量、排队时间、首个token延迟和总耗时；
+调用经过按模型自适应并发的限流器，流读完之前一直占用并发槽
+"""
+
+import json
+import time
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.config.model_config import get_model_config
+from app.services.modules.rate_limiter import bedrock_limiter
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 流中表示错误的事件
+STREAM_ERROR_EVENTS = (
+    'internalServerException',
+    'modelStreamErrorException',
+    'validationException',
+    'throttlingException',
+    'serviceUnavailableException'
+)
+
+# LangChain消息类型到Converse角色的映射
+MESSAGE_ROLES = {'human': 'user', 'ai': 'assistant'}
+
+
+def user_message(text: str) -> Dict[str, Any]:
+    """构建一条Converse格式的用户消息"""
+    return {'role': 'user', 'content': [{'text': text}]}
+
+
+def build_request(
+    model_id: str,
+    messages: List[Dict[str, Any]],
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    system: Optional[str] = None,
+    tool_config: Optional[Dict[str, Any]] = None,
+    stop_sequences: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    构建Converse请求参数，未指定的推理参数使用模型配置
+
+    Args:
+        model_id: 模型ID
+        messages: Converse格式的消息列表
+        max_tokens: 输出的最大token数
+        temperature: 温度
+        system: 系统提示词
+        tool_config: Converse格式的工具配置
+        stop_sequences: 停止序列
+
+    Returns:
+        Dict[str, Any]: converse/converse_stream的参数
+    """
+    model_config = get_model_config(model_id)
+    inference_config = {
+        'maxTokens': max_tokens or model_config.get('max_tokens', 4096),
+        'temperature': model_config.get('temperature', 0.7) if temperature is None else temperature
+    }
+    if stop_sequences:
+        inference_config['stopSequences'] = stop_sequences
+    request = {'modelId': model_id, 'messages': messages, 'inferenceConfig': inference_config}
+    if system:
+        request['system'] = [{'text': system}]
+    if tool_config:
+        request['toolConfig'] = tool_config
+    return request
+
+
+class ConverseStream:
+    """
+    ConverseStream响应：迭代时逐段产出文本，迭代结束后可以读取完整内容块、
+    停止原因、token用量和延迟指标；不迭代时需要调用close释放并发槽
+    """
+
+    def __init__(self, client, request: Dict[str, Any]):
+        self.model_id = request['modelId']
+        self.content: List[Dict[str, Any]] = []
+        self.stop_reason: Optional[str] = None
+        self.usage: Dict[str, int] = {}
+        self.metrics: Dict[str, Optional[float]] = {
+            'queue_wait_ms': None, 'time_to_first_token_ms': None, 'total_ms': None, 'latency_ms': None
+        }
+        self._text_parts: List[str] = []
+        self._iterator: Optional[Iterator[str]] = None
+        # 请求成功后才占用并发槽
+        self._released = True
+        self._started = time.perf_counter()
+        self._response, queue_wait = bedrock_limiter.start(self.model_id, client.converse_stream, **request)
+        self._released = False
+        self.metrics['queue_wait_ms'] = round(queue_wait * 1000, 1)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._iterator is None:
+            self._iterator = self._read_events()
+        return self._iterator
+
+    @property
+    def text(self) -> str:
+        """已收到的全部文本"""
+        return ''.join(self._text_parts)
+
+    @property
+    def tool_uses(self) -> List[Dict[str, Any]]:
+        """模型请求的工具调用（toolUseId、name、input）"""
+        return [block['toolUse'] for block in self.content if 'toolUse' in block]
+
+    def read(self) -> str:
+        """读完整个流并返回全部文本"""
+        for _ in self:
+            pass
+        return self.text
+
+    def close(self, throttled: bool = False) -> None:
+        """释放并发槽（只释放一次）"""
+        if not self._released:
+            self._released = True
+            bedrock_limiter.finish(self.model_id, throttled)
+
+    def __del__(self):
+        self.close()
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._started) * 1000, 1)
+
+    def _read_events(self) -> Iterator[str]:
+        try:
+            yield from self._parse_events()
+        finally:
+            self.close()
+
+    def _parse_events(self) -> Iterator[str]:
+        blocks: Dict[int, Dict[str, Any]] = {}
+        for event in self._response.get('stream', []):
+            if 'contentBlockStart' in event:
+                start = event['contentBlockStart']
+                tool_use = start.get('start', {}).get('toolUse')
+                if tool_use:
+                    blocks[start.get('contentBlockIndex', 0)] = {'toolUse': {**tool_use, 'input': ''}}
+            elif 'contentBlockDelta' in event:
+                index = event['contentBlockDelta'].get('contentBlockIndex', 0)
+                delta = event['contentBlockDelta'].get('delta', {})
+                if 'text' in delta:
+                    if self.metrics['time_to_first_token_ms'] is None:
+                        self.metrics['time_to_first_token_ms'] = self._elapsed_ms()
+                    blocks.setdefault(index, {'text': ''})['text'] += delta['text']
+                    self._text_parts.append(delta['text'])
+                    yield delta['text']
+                elif 'toolUse' in delta:
+                    blocks[index]['toolUse']['input'] += delta['toolUse'].get('input', '')
+            elif 'messageStop' in event:
+                self.stop_reason = event['messageStop'].get('stopReason')
+            elif 'metadata' in event:
+                self.usage = event['metadata'].get('usage', {})
+                self.metrics['latency_ms'] = event['metadata'].get('metrics', {}).get('latencyMs')
+            else:
+                for name in STREAM_ERROR_EVENTS:
+                    if name in event:
+                        self.close(throttled=name == 'throttlingException')
+                        raise Exception(f"模型流式响应出错 ({name}): {event[name].get('message', '')}")
+
+        # 工具参数以JSON片段流式返回，结束后再解析
+        for block in blocks.values():
+            if 'toolUse' in block:
+                block['toolUse']['input'] = json.loads(block['toolUse']['input'] or '{}')
+        self.content = [blocks[index] for index in sorted(blocks)]
+        self.metrics['total_ms'] = self._elapsed_ms()
+        logger.info(
+            f"[CONVERSE] 模型 {self.model_id} | 排队 {self.metrics['queue_wait_ms']} ms | "
+            f"首个token {self.metrics['time_to_first_token_ms']} ms | 总耗时 {self.metrics['total_ms']} ms | "
+            f"输入 {self.usage.get('inputTokens')} / 输出 {self.usage.get('outputTokens')} tokens | "
+            f"停止原因 {self.stop_reason}"
+        )
+
+
+def stream_text(client, model_id: str, prompt: str, max_tokens: Optional[int] = None, **kwargs) -> ConverseStream:
+    """
+    以单条用户消息流式调用模型
+
+    Args:
+        client: bedrock-runtime客户端
+        model_id: 模型ID
+        prompt: 完整提示词
+        max_tokens: 输出的最大token数
+        **kwargs: 传给build_request的其他参数
+
+    Returns:
+        ConverseStream: 迭代时逐段产出文本
+    """
+    return ConverseStream(client, build_request(model_id, [user_message(prompt)], max_tokens, **kwargs))
+
+
+def invoke_text(client, model_id: str, prompt: str, max_tokens: Optional[int] = None,
+                on_token: Optional[Callable[[str], None]] = None) -> Tuple[str, Optional[str]]:
+    """
+    调用模型并读完整个流
+
+    Args:
+        client: bedrock-runtime客户端
+        model_id: 模型ID
+        prompt: 完整提示词
+        max_tokens: 输出的最大token数
+        on_token: 每收到一段文本时的回调
+
+    Returns:
+        Tuple[str, Optional[str]]: (生成文本, 停止原因)
+    """
+    stream = stream_text(client, model_id, prompt, max_tokens)
+    for token in stream:
+        if on_token:
+            on_token(token)
+    return stream.text, stream.stop_reason
+
+
+def invoke_tool(client, model_id: str, prompt: str, name: str, description: str, input_schema: Dict[str, Any],
+                max_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """
+    用toolChoice强制模型调用唯一的工具，把工具输入作为结构化输出返回（由模型按inputSchema生成，不需要从文本中解析JSON）
+
+    Args:
+        client: bedrock-runtime客户端
+        model_id: 模型ID（需要支持toolChoice指定工具，如Claude 3）
+        prompt: 完整提示词
+        name: 工具名
+        description: 工具说明
+        input_schema: 工具输入的JSON Schema
+        max_tokens: 输出的最大token数
+
+    Returns:
+        Dict[str, Any]: 模型给出的工具输入
+
+    Raises:
+        Exception: 模型没有调用该工具时
+    """
+    tool_config = {
+        'tools': [{'toolSpec': {'name': name, 'description': description, 'inputSchema': {'json': input_schema}}}],
+        'toolChoice': {'tool': {'name': name}}
+    }
+    stream = ConverseStream(client, build_request(model_id, [user_message(prompt)], max_tokens, tool_config=tool_config))
+    stream.read()
+    for tool_use in stream.tool_uses:
+        if tool_use.get('name') == name and isinstance(tool_use.get('input'), dict):
+            return tool_use['input']
+    raise Exception(f"模型没有调用工具 {name}（停止原因: {stream.stop_reason}）")
+
+
+def to_converse_messages(messages: List[BaseMessage]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """把LangChain消息转换为 (系统提示词, Converse消息列表)，相邻的同角色消息合并"""
+    system_parts, converse_messages = [], []
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            system_parts.append(str(message.content))
+            continue
+        role = MESSAGE_ROLES.get(message.type, 'user')
+        if converse_messages and converse_messages[-1]['role'] == role:
+            converse_messages[-1]['content'].append({'text': str(message.content)})
+        else:
+            converse_messages.append({'role': role, 'content': [{'text': str(message.content)}]})
+    return '\n\n'.join(system_parts) or None, converse_messages
+
+
+class ConverseChatModel(BaseChatModel):
+    """通过ConverseStream调用任意Bedrock文本模型的LangChain聊天模型"""
+
+    client: Any
+    model_id: str
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "bedrock-converse"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {'model_id': self.model_id, 'max_tokens': self.max_tokens, 'temperature': self.temperature}
+
+    def _open_stream(self, messages: List[BaseMessage], stop: Optional[List[str]]) -> ConverseStream:
+        system, converse_messages = to_converse_messages(messages)
+        request = build_request(self.model_id, converse_messages, self.max_tokens, self.temperature,
+                                system=system, stop_sequences=stop)
+        return ConverseStream(self.client, request)
+
+    @staticmethod
+    def _response_metadata(stream: ConverseStream) -> Dict[str, Any]:
+        return {'model_id': stream.model_id, 'stop_reason': stream.stop_reason,
+                'usage': stream.usage, 'metrics': stream.metrics}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        stream = self._open_stream(messages, stop)
+        for token in stream:
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+        message = AIMessage(content=stream.text, response_metadata=self._response_metadata(stream))
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={'usage': stream.usage})
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        stream = self._open_stream(messages, stop)
+        for token in stream:
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content='', response_metadata=self._response_metadata(stream)))
@@ -0,0 +1,190 @@
+"""
+嵌入模型模块 - 并发、批量调用Bedrock嵌入模型
+
+BedrockEmbeddings逐条串行请求；这里用有上限的线程池并发发送请求，支持批量接口的模型
+（Cohere Embed）按批发送，限流和退避重试由共享的bedrock_limiter处理，结果保持输入顺序
+"""
+
+import os
+import json
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+from botocore.exceptions import ClientError
+from langchain_core.embeddings import Embeddings
+
+from app.services.modules.map_reduce import bounded_map
+from app.services.modules.rate_limiter import bedrock_limiter
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL_ID = os.environ.get('EMBEDDING_MODEL_ID', 'amazon.titan-embed-text-v1')
+
+# 并发请求数
+EMBEDDING_MAX_WORKERS = int(os.environ.get('EMBEDDING_MAX_WORKERS', '8'))
+
+# 支持批量输入的模型前缀及单次请求的最大文本数
+BATCH_MODEL_PREFIXES = {
+    'cohere.embed': 96,
+}
+
+# 流式向量化时每次从输入中取出的文本数（非并发的嵌入模型）
+EMBEDDING_STREAM_BATCH = 64
+
+
+
+def get_batch_size(model_id: str) -> int:
+    """
+    获取模型单次请求可以包含的文本数
+
+    Args:
+        model_id: 嵌入模型ID
+
+    Returns:
+        int: 批量大小，不支持批量输入的模型为1
+    """
+    for prefix, size in BATCH_MODEL_PREFIXES.items():
+        if model_id.startswith(prefix):
+            return size
+    return 1
+
+
+class ConcurrentBedrockEmbeddings(Embeddings):
+    """并发批量调用Bedrock嵌入模型，结果与输入顺序一致"""
+
+    def __init__(
+        self,
+        client,
+        model_id: str = DEFAULT_EMBEDDING_MODEL_ID,
+        max_workers: int = EMBEDDING_MAX_WORKERS
+    ):
+        self.client = client
+        self.model_id = model_id
+        self.max_workers = max_workers
+        self.batch_size = get_batch_size(model_id)
+
+    def _build_body(self, texts: Sequence[str], input_type: str) -> dict:
+        """按模型构建请求体"""
+        if self.batch_size > 1:
+            return {"texts": list(texts), "input_type": input_type}
+        return {"inputText": texts[0]}
+
+    def _parse_response(self, response_body: dict) -> List[List[float]]:
+        """从响应中取出向量列表"""
+        if "embeddings" in response_body:
+            return response_body["embeddings"]
+        return [response_body["embedding"]]
+
+    def _invoke(self, texts: Sequence[str], input_type: str = "search_document") -> List[List[float]]:
+        """
+        发送一次嵌入请求，经过与文本生成共享的按模型限流器，限流时由限流器退避重试
+
+        Args:
+            texts: 一个批次的文本
+            input_type: 批量模型的输入类型（文档或查询）
+
+        Returns:
+            List[List[float]]: 向量列表
+        """
+        try:
+            response = bedrock_limiter.call(
+                self.model_id,
+                self.client.invoke_model,
+                modelId=self.model_id,
+                body=json.dumps(self._build_body(texts, input_type)),
+                contentType="application/json",
+                accept="application/json"
+            )
+        except ClientError as e:
+            raise Exception(f"嵌入请求失败: {str(e)}") from e
+        return self._parse_response(json.loads(response["body"].read()))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        并发向量化文档
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            List[List[float]]: 与输入顺序一致的向量列表
+        """
+        if not texts:
+            return []
+        # 嵌入模型不接受空字符串
+        texts = [text if text.strip() else " " for text in texts]
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        started = time.time()
+        if len(batches) == 1:
+            results = [self._invoke(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batches)))) as executor:
+                results = list(executor.map(self._invoke, batches))
+        vectors = [vector for batch in results for vector in batch]
+        logger.info(f"[EMBEDDINGS] {len(texts)} 条文本，{len(batches)} 个请求，耗时 {time.time() - started:.2f} 秒")
+        return vectors
+
+    def embed_stream(self, texts: Iterable[str]) -> Iterator[List[float]]:
+        """
+        流式向量化：按需从输入中取出文本，同时在途的请求数有上限，输入可以是惰性的块生成器
+
+        Args:
+            texts: 文本的可迭代对象
+
+        Yields:
+            List[float]: 与输入顺序一致的向量
+        """
+        iterator = iter(texts)
+        batches = iter(lambda: [text if text.strip() else " " for text in islice(iterator, self.batch_size)], [])
+        for batch in bounded_map(self._invoke, batches, max(1, self.max_workers)):
+            yield from batch
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        向量化查询
+
+        Args:
+            text: 查询文本
+
+        Returns:
+            List[float]: 查询向量
+        """
+        return self._invoke([text or " "], input_type="search_query")[0]
+
+
+def iter_embeddings(embeddings: Embeddings, texts: Iterable[str], batch_size: int = EMBEDDING_STREAM_BATCH) -> Iterator[Tuple[str, List[float]]]:
+    """
+    按需向量化文本流，支持任意Embeddings实现
+
+    Args:
+        embeddings: 嵌入模型
+        texts: 文本的可迭代对象（如惰性切块的生成器）
+        batch_size: 不支持流式的嵌入模型每次向量化的文本数
+
+    Yields:
+        Tuple[str, List[float]]: (文本, 向量)
+    """
+    if isinstance(embeddings, ConcurrentBedrockEmbeddings):
+        # 文本需要和向量一起返回，队列中只保存已取出、尚未返回向量的文本
+        pending = deque()
+
+        def remember(iterable):
+            for text in iterable:
+                pending.append(text)
+                yield text
+
+        for vector in embeddings.embed_stream(remember(texts)):
+            yield pending.popleft(), vector
+        return
+
+    iterator = iter(texts)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield from zip(batch, embeddings.embed_documents(batch))
@@ -0,0 +1,332 @@
+"""
+结构化抽取模块 - 一次线性扫描抽取参会人、日期、决定事项、行动项和实体
+
+规则集在导入时编译，文档按行扫描一次，每行只匹配一组预编译的正则表达式；
+可选地再用一次强制工具调用（工具输入受JSON Schema约束）补全结果，模型结果按内容哈希缓存
+"""
+
+import os
+import re
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.modules.map_reduce import SummaryCache
+from app.services.storage import split_content_header
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 是否默认使用模型补全规则抽取的结果
+EXTRACTION_USE_LLM = os.environ.get('EXTRACTION_USE_LLM', 'false').lower() == 'true'
+
+# 模型抽取结果缓存的最大条目数
+EXTRACTION_CACHE_SIZE = int(os.environ.get('EXTRACTION_CACHE_SIZE', '256'))
+
+# 交给模型的最大字符数
+EXTRACTION_MAX_INPUT_CHARS = 20000
+
+# 每一类结果保留的最大条目数
+MAX_ITEMS = 50
+
+_MONTHS = r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec)[a-z]*\.?'
+
+# 日期：ISO格式、中日文年月日、英文月份
+DATE_PATTERN = re.compile(
+    r'\d{4}[-/.]\d{1,2}[-/.]\d{1,2}'
+    r'|(?:\d{4}年)?\d{1,2}月\d{1,2}[日号]'
+    rf'|\b{_MONTHS} \d{{1,2}}(?:, \d{{4}})?\b'
+    r'|(?:下周|下週|来週|今週|本周)[一二三四五六日天]?|(?:月|火|水|木|金|土|日)曜日?'
+    r'|\bnext (?:week|Monday|Tuesday|Wednesday|Thursday|Friday)\b',
+    re.IGNORECASE
+)
+
+# 标签行：参会人、议题、决定事项、行动项、日期
+LABEL_PATTERN = re.compile(
+    r'^\s*(?:[-*•]\s*)?(?:(?P<participants>参加者|出席者|参会人员|参会者|与会者|出席|Attendees|Participants)'
+    r'|(?P<agenda>议题|議題|议程|アジェンダ|Agenda|Topics?)'
+    r'|(?P<decision>决定事项|決定事項|决议|決議|决定|決定|Decisions?)'
+    r'|(?P<action>行动项|待办事项|待办|宿題|TODO|アクションアイテム|Action items?|AI)'
+    r'|(?P<date>日期|日時|日付|时间|Date))\s*[:：]\s*(?P<value>.*)$',
+    re.IGNORECASE
+)
+
+# 没有标签的决定事项和行动项的线索词
+DECISION_PATTERN = re.compile(r'决定|決定|决议|決議|合意|批准|承認|了承|agreed|decided|approved', re.IGNORECASE)
+ACTION_PATTERN = re.compile(r'负责|負責|担当者|\bowner\b|\bassignee\b|完成|提交|対応|担当|までに|する予定|\bwill\b|\bto do\b|\bfollow up\b', re.IGNORECASE)
+
+# 负责人
+ASSIGNEE_PATTERN = re.compile(
+    r'(?:负责人|担当者?|(?i:owner|assignee))\s*[:：]?\s*(?P<label>[^\s,，、。()（）]{1,20})'
+    r'|由(?P<zh>[^\s,，、。由]{1,6}?)(?:负责|負責|完成|跟进|提交)'
+    r'|(?P<ja>[^\s,，、。]{1,8}?)さん(?:が|に|は)'
+    r'|@(?P<at>\w+)'
+    r'|^(?P<en>[A-Z][a-z]+) (?:will|needs to|should|is going to)\b'
+)
+
+# 行首的发言人（“张三：”“田中: ”）
+SPEAKER_PATTERN = re.compile(r'^\s*(?P<name>[^\s:：#\-*•\d][^\s:：]{0,9})\s*[:：]\s*\S')
+
+# 人名的敬称和职务后缀
+HONORIFIC_PATTERN = re.compile(r'([一-鿿゠-ヿ]{1,4})(?:さん|様|先生|氏|经理|經理|部長|課長|社長|总监|老师)')
+
+# 组织和地点
+ORGANIZATION_PATTERN = re.compile(
+    r'株式会社[A-Za-z0-9一-鿿゠-ヿ]{1,12}|[\w゠-ヿ]{1,12}?(?:株式会社|有限公司|股份公司|集团|銀行|银行|大学)'
+    r'|\b[A-Z][\w&]*(?: [A-Z][\w&]*)* (?:Inc|Corp|Ltd|LLC|Co)\b\.?'
+)
+LOCATION_PATTERN = re.compile(r'東京都|北海道|[一-鿿]{1,3}(?:市|県|省)(?![一-鿿]?(?:场|場|长|長|民|政))')
+
+# 中文没有分词，名称前面粘连的介词和连词在抽取后去掉
+LEADING_PARTICLES = '与和及在到从跟同对向把被由于'
+
+# 产品名：书名号、括号引用
+PRODUCT_PATTERN = re.compile(r'《([^》]{1,30})》|「([^」]{1,30})」')
+
+# 列表分隔符
+LIST_SEPARATOR = re.compile(r'\s*[,，、;；/]\s*|\s+and\s+|\s*和\s*')
+
+# 不作为发言人的标签
+NON_SPEAKER_LABELS = {'注', '备注', '備考', 'note', 'url', 'http', 'https', '文件名', '文件类型', '类别',
+                      'owner', 'assignee', '负责人', '担当', '担当者'}
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+_OPTIONAL_STRING = {"type": ["string", "null"]}
+
+# 模型抽取结果的JSON Schema，作为抽取工具的inputSchema
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string", "description": "文档标题"},
+        "date": dict(_OPTIONAL_STRING, description="文档日期"),
+        "participants": dict(_STRING_LIST, description="参会人"),
+        "agenda": dict(_STRING_LIST, description="议题"),
+        "decisions": dict(_STRING_LIST, description="决定事项"),
+        "action_items": {
+            "type": "array",
+            "description": "行动项",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "item": {"type": "string"},
+                    "assignee": _OPTIONAL_STRING,
+                    "deadline": _OPTIONAL_STRING
+                },
+                "required": ["item", "assignee", "deadline"]
+            }
+        },
+        "entities": {
+            "type": "object",
+            "properties": {
+                "people": _STRING_LIST,
+                "organizations": _STRING_LIST,
+                "locations": _STRING_LIST,
+                "dates": _STRING_LIST,
+                "products": _STRING_LIST
+            },
+            "required": ["people", "organizations", "locations", "dates", "products"]
+        }
+    },
+    "required": ["title", "date", "participants", "agenda", "decisions", "action_items", "entities"]
+}
+
+# 模型抽取使用的工具，调用时用toolChoice强制使用
+EXTRACTION_TOOL = {
+    'name': 'record_document_structure',
+    'description': '记录从文档中抽取的标题、日期、参会人、议题、决定事项、行动项和实体',
+    'input_schema': EXTRACTION_SCHEMA
+}
+
+EXTRACTION_PROMPT = """请从以下文档中抽取结构化信息，并调用record_document_structure工具记录结果。
+没有的信息使用null或空列表，不要编造。
+
+规则抽取的初步结果（可以修正和补充）:
+{draft}
+
+文档:
+{text}"""
+
+
+def _unique(values: List[str]) -> List[str]:
+    """去掉首尾的标点，按不区分大小写去重并保持顺序"""
+    seen, result = set(), []
+    for value in values:
+        value = value.strip(' \t-*•:：。.')
+        if value and value.lower() not in seen:
+            seen.add(value.lower())
+            result.append(value)
+    return result[:MAX_ITEMS]
+
+
+def _strip_particles(values: List[str]) -> List[str]:
+    return [value.lstrip(LEADING_PARTICLES) for value in values]
+
+
+def _split_list(value: str) -> List[str]:
+    return [item for item in LIST_SEPARATOR.split(value) if item.strip()]
+
+
+def _assignee(line: str) -> Optional[str]:
+    match = ASSIGNEE_PATTERN.search(line)
+    if not match:
+        return None
+    return next(value for value in match.groupdict().values() if value)
+
+
+class ExtractionEngine:
+    """基于预编译规则集的单遍结构化抽取，可选用一次模型调用补全"""
+
+    def __init__(self, cache_size: int = EXTRACTION_CACHE_SIZE):
+        self.cache = SummaryCache(cache_size)
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        """
+        一次扫描抽取文档的结构化信息
+
+        Args:
+            text: 文档内容（可以带文件元数据头）
+
+        Returns:
+            Dict[str, Any]: title、date、participants、agenda、decisions、action_items和entities
+        """
+        _, body = split_content_header(text or '')
+        title, date = None, None
+        participants, speakers, people, agenda = [], [], [], []
+        decisions, action_items = [], []
+        dates, organizations, locations, products = [], [], [], []
+
+        for line in body.splitlines():
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if title is None:
+                title = stripped.lstrip('#').strip()
+
+            line_dates = DATE_PATTERN.findall(stripped)
+            dates.extend(line_dates)
+            organizations.extend(_strip_particles(ORGANIZATION_PATTERN.findall(stripped)))
+            locations.extend(_strip_particles(LOCATION_PATTERN.findall(stripped)))
+            products.extend(group for pair in PRODUCT_PATTERN.findall(stripped) for group in pair if group)
+            people.extend(HONORIFIC_PATTERN.findall(stripped))
+
+            label = LABEL_PATTERN.match(stripped)
+            if label:
+                value = label.group('value').strip()
+                if label.group('participants'):
+                    participants.extend(_split_list(value))
+                elif label.group('agenda'):
+                    agenda.extend(_split_list(value))
+                elif label.group('decision'):
+                    decisions.append(value)
+                elif label.group('action'):
+                    action_items.append({'item': value, 'assignee': _assignee(value),
+                                         'deadline': line_dates[0] if line_dates else None})
+                elif label.group('date') and date is None:
+                    date = line_dates[0] if line_dates else value
+                continue
+
+            speaker = SPEAKER_PATTERN.match(stripped)
+            if speaker and speaker.group('name').lower() in NON_SPEAKER_LABELS:
+                speaker = None
+            if speaker:
+                speakers.append(speaker.group('name'))
+            content = stripped[speaker.end('name'):].lstrip(' :：') if speaker else stripped
+
+            assignee = _assignee(content)
+            if DECISION_PATTERN.search(content):
+                decisions.append(content)
+            elif assignee and (line_dates or ACTION_PATTERN.search(content)):
+                action_items.append({'item': content, 'assignee': assignee,
+                                     'deadline': line_dates[0] if line_dates else None})
+
+        participants = _unique(participants + speakers)
+        assignees = [item['assignee'] for item in action_items if item['assignee']]
+        return {
+            'title': title or '',
+            'date': date or (dates[0] if dates else None),
+            'participants': participants,
+            'agenda': _unique(agenda),
+            'decisions': _unique(decisions),
+            'action_items': action_items[:MAX_ITEMS],
+            'entities': {
+                'people': _unique(participants + people + assignees),
+                'organizations': _unique(organizations),
+                'locations': _unique(locations),
+                'dates': _unique(dates),
+                'products': _unique(products)
+            }
+        }
+
+    def extract_with_llm(self, text: str, invoke: Callable[[str, Dict[str, Any]], Dict[str, Any]],
+                         namespace: str = "") -> Dict[str, Any]:
+        """
+        规则抽取后用一次强制工具调用修正和补全，模型结果按内容哈希缓存，调用失败时返回规则结果
+
+        Args:
+            text: 文档内容
+            invoke: 调用模型的函数，输入完整提示词和EXTRACTION_TOOL，强制模型调用该工具并返回工具输入
+                （如converse.invoke_tool）
+            namespace: 缓存命名空间（如模型ID）
+
+        Returns:
+            Dict[str, Any]: 与extract相同结构的结果
+        """
+        draft = self.extract(text)
+        key = self.cache.make_key(text, namespace)
+        cached = self.cache.get(key)
+        if cached is None:
+            _, body = split_content_header(text or '')
+            prompt = EXTRACTION_PROMPT.format(
+                draft=json.dumps(draft, ensure_ascii=False),
+                text=body[:EXTRACTION_MAX_INPUT_CHARS]
+            )
+            try:
+                result = invoke(prompt, EXTRACTION_TOOL)
+                if not isinstance(result, dict):
+                    raise Exception("工具输入不是对象")
+                cached = json.dumps(result, ensure_ascii=False)
+                self.cache.put(key, cached)
+            except Exception as e:
+                logger.warning(f"[EXTRACTION] 模型抽取失败，使用规则抽取结果: {str(e)}")
+                return draft
+        return self._merge(draft, json.loads(cached))
+
+    @staticmethod
+    def _merge(draft: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """模型结果中非空且类型正确的字段覆盖规则结果"""
+        merged = dict(draft)
+        for key, value in result.items():
+            if key not in draft or not value:
+                continue
+            if key == 'entities' and isinstance(value, dict):
+                merged['entities'] = {
+                    name: value.get(name) if isinstance(value.get(name), list) and value.get(name) else items
+                    for name, items in draft['entities'].items()
+                }
+            elif isinstance(value, type(draft[key])) or draft[key] is None:
+                merged[key] = value
+        return merged
+
+
+def build_structure(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    从抽取结果中取出文档结构（议题以topics返回）
+
+    Args:
+        analysis: extract或extract_with_llm的结果
+
+    Returns:
+        Dict[str, Any]: 标题、日期、参会人、议题、决定事项和行动项
+    """
+    return {
+        "title": analysis["title"],
+        "date": analysis["date"],
+        "participants": analysis["participants"],
+        "topics": analysis["agenda"],
+        "decisions": analysis["decisions"],
+        "action_items": analysis["action_items"]
+    }
+
+
+# 创建引擎实例
+extraction_engine = ExtractionEngine()
@@ -0,0 +1,579 @@
+"""
+倒排索引模块 - 基于段的全文检索索引，支持BM25排序
+
+每次写入生成一个不可变的段：词表、按词排列的文档号差值（VByte压缩）和词频数组；
+段数达到合并因子时按层级合并，删除的文档在合并时被清除。编码和解码都用NumPy向量化实现
+"""
+
+import os
+import json
+import math
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.utils.tokenizer_utils import tokenize
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 同一层级的段数达到该值时合并
+SEGMENT_MERGE_FACTOR = int(os.environ.get('KEYWORD_SEGMENT_MERGE_FACTOR', '8'))
+
+# 文档元数据字段：(文档类型, 文档ID, 类别, 时间戳, 标题/片段)
+DocMeta = Tuple[str, str, str, float, str]
+
+# 预先统计的文档词频：(词 -> 词频, 文档长度)
+TermCounts = Tuple[Dict[str, int], int]
+
+
+def count_terms(pieces: Iterable[str]) -> TermCounts:
+    """
+    逐段统计词频，内存只随词表大小增长而不随文档长度增长
+
+    Args:
+        pieces: 文本片段（应在句子边界处切分，避免词被截断）
+
+    Returns:
+        TermCounts: (词 -> 词频, 文档长度)
+    """
+    counts: Dict[str, int] = {}
+    length = 0
+    for piece in pieces:
+        for token in tokenize(piece):
+            counts[token] = counts.get(token, 0) + 1
+            length += 1
+    return counts, length
+
+
+def vbyte_sizes(values: np.ndarray) -> np.ndarray:
+    """
+    计算每个整数的可变字节编码长度
+
+    Args:
+        values: 非负整数数组
+
+    Returns:
+        np.ndarray: 每个整数占用的字节数
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28, 35, 42, 49, 56):
+        nbytes += values >= (np.uint64(1) << np.uint64(shift))
+    return nbytes
+
+
+def vbyte_encode(values: np.ndarray) -> np.ndarray:
+    """
+    可变字节编码（低位在前，除最后一个字节外最高位为1）
+
+    Args:
+        values: 非负整数数组
+
+    Returns:
+        np.ndarray: uint8字节数组
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return np.zeros(0, dtype=np.uint8)
+    nbytes = vbyte_sizes(values)
+    owner = np.repeat(np.arange(len(values)), nbytes)
+    starts = np.cumsum(nbytes) - nbytes
+    position = np.arange(len(owner)) - starts[owner]
+    encoded = (values[owner] >> (np.uint64(7) * position.astype(np.uint64))) & np.uint64(0x7f)
+    continuation = position < nbytes[owner] - 1
+    return (encoded | (continuation.astype(np.uint64) << np.uint64(7))).astype(np.uint8)
+
+
+def vbyte_decode(data: np.ndarray) -> np.ndarray:
+    """
+    解码可变字节编码
+
+    Args:
+        data: uint8字节数组
+
+    Returns:
+        np.ndarray: uint64整数数组
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    last = (data & 0x80) == 0
+    ends = np.flatnonzero(last)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    position = np.arange(len(data)) - starts[group]
+    shifted = (data & 0x7f).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    return np.add.reduceat(shifted, starts)
+
+
+class Segment:
+    """不可变的索引段"""
+
+    def __init__(
+        self,
+        terms: List[str],
+        dfs: np.ndarray,
+        byte_offsets: np.ndarray,
+        postings: np.ndarray,
+        tfs: np.ndarray,
+        doc_nums: np.ndarray,
+        doc_lengths: np.ndarray,
+        doc_meta: List[DocMeta],
+        level: int = 0
+    ):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.dfs = dfs
+        self.byte_offsets = byte_offsets
+        self.tf_offsets = np.concatenate([[0], np.cumsum(dfs)]).astype(np.int64)
+        self.postings = postings
+        self.tfs = tfs
+        self.doc_nums = doc_nums
+        self.doc_lengths = doc_lengths
+        self.doc_meta = doc_meta
+        self.deleted = np.zeros(len(doc_nums), dtype=bool)
+        self.level = level
+        self.name: Optional[str] = None
+        self._filters = None
+
+    @property
+    def live_count(self) -> int:
+        return int(len(self.doc_nums) - self.deleted.sum())
+
+    @property
+    def live_length(self) -> int:
+        return int(self.doc_lengths[~self.deleted].sum())
+
+    def postings_for(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        读取一个词的倒排列表
+
+        Args:
+            term: 词
+
+        Returns:
+            tuple: (段内文档位置, 词频)
+        """
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        deltas = vbyte_decode(self.postings[self.byte_offsets[term_id]:self.byte_offsets[term_id + 1]])
+        positions = np.cumsum(deltas).astype(np.int64)
+        tfs = self.tfs[self.tf_offsets[term_id]:self.tf_offsets[term_id + 1]]
+        return positions, tfs.astype(np.int32)
+
+    def all_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        一次性解码所有倒排列表
+
+        Returns:
+            tuple: (词ID, 段内文档位置, 词频)，按词ID和文档位置排序
+        """
+        deltas = vbyte_decode(self.postings).astype(np.int64)
+        term_ids = np.repeat(np.arange(len(self.terms)), self.dfs)
+        if not len(deltas):
+            return term_ids, deltas, self.tfs.astype(np.int32)
+        starts = self.tf_offsets[:-1][self.dfs > 0]
+        cumulative = np.cumsum(deltas)
+        # 每个词的第一个差值是绝对位置，减去之前各词的累计值
+        base = np.repeat(cumulative[starts] - deltas[starts], self.dfs[self.dfs > 0])
+        return term_ids, cumulative - base, self.tfs.astype(np.int32)
+
+    def filter_arrays(self):
+        """缓存类型、类别和时间戳数组，用于向量化过滤"""
+        if self._filters is None:
+            self._filters = (
+                np.array([meta[0] for meta in self.doc_meta], dtype=object),
+                np.array([meta[2] for meta in self.doc_meta], dtype=object),
+                np.array([meta[3] for meta in self.doc_meta], dtype=np.float64)
+            )
+        return self._filters
+
+    @classmethod
+    def build(
+        cls,
+        terms: List[str],
+        term_ids: np.ndarray,
+        positions: np.ndarray,
+        tfs: np.ndarray,
+        doc_nums: np.ndarray,
+        doc_lengths: np.ndarray,
+        doc_meta: List[DocMeta],
+        level: int = 0
+    ) -> "Segment":
+        """
+        从 (词ID, 段内文档位置, 词频) 三元组构建段，未出现的词会被去掉
+
+        Args:
+            terms: 词表（term_ids指向该词表）
+            term_ids: 每条倒排记录的词ID
+            positions: 每条倒排记录的段内文档位置
+            tfs: 每条倒排记录的词频
+            doc_nums: 段内文档的全局文档号（升序）
+            doc_lengths: 段内文档的长度（词数）
+            doc_meta: 段内文档的元数据
+            level: 合并层级
+
+        Returns:
+            Segment: 新段
+        """
+        order = np.lexsort((positions, term_ids))
+        term_ids, positions, tfs = term_ids[order], positions[order], tfs[order]
+        used, dfs = np.unique(term_ids, return_counts=True)
+        # 每个词的第一条记录存绝对位置，其余存与前一条的差值
+        deltas = np.diff(positions, prepend=0)
+        starts = (np.cumsum(dfs) - dfs).astype(np.int64)
+        deltas[starts] = positions[starts]
+        byte_counts = np.add.reduceat(vbyte_sizes(deltas), starts) if len(starts) else np.zeros(0, dtype=np.int64)
+        byte_offsets = np.concatenate([[0], np.cumsum(byte_counts)]).astype(np.int64)
+        return cls(
+            [terms[i] for i in used],
+            dfs.astype(np.int32),
+            byte_offsets,
+            vbyte_encode(deltas),
+            np.minimum(tfs, np.iinfo(np.uint16).max).astype(np.uint16),
+            np.asarray(doc_nums, dtype=np.int64),
+            np.asarray(doc_lengths, dtype=np.int32),
+            list(doc_meta),
+            level
+        )
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """转换为可保存到npz的数组"""
+        return {
+            'terms': np.array(json.dumps(self.terms, ensure_ascii=False)),
+            'meta': np.array(json.dumps(self.doc_meta, ensure_ascii=False)),
+            'dfs': self.dfs,
+            'byte_offsets': self.byte_offsets,
+            'postings': self.postings,
+            'tfs': self.tfs,
+            'doc_nums': self.doc_nums,
+            'doc_lengths': self.doc_lengths,
+            'level': np.array(self.level)
+        }
+
+    @classmethod
+    def from_arrays(cls, data) -> "Segment":
+        """从npz数组恢复段"""
+        return cls(
+            json.loads(str(data['terms'])),
+            data['dfs'],
+            data['byte_offsets'],
+            data['postings'],
+            data['tfs'],
+            data['doc_nums'],
+            data['doc_lengths'],
+            [tuple(meta) for meta in json.loads(str(data['meta']))],
+            int(data['level'])
+        )
+
+
+def build_segment(documents: Sequence[Tuple[int, DocMeta, Union[str, TermCounts]]]) -> Segment:
+    """
+    为一批文档构建段
+
+    Args:
+        documents: (全局文档号, 元数据, 文本或count_terms的结果) 列表
+
+    Returns:
+        Segment: 新段
+    """
+    vocabulary: Dict[str, int] = {}
+    term_ids, positions, tfs, doc_nums, doc_lengths, doc_meta = [], [], [], [], [], []
+    for position, (doc_num, meta, text) in enumerate(sorted(documents, key=lambda item: item[0])):
+        counts, length = count_terms([text]) if isinstance(text, str) else text
+        for term, count in counts.items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            positions.append(position)
+            tfs.append(count)
+        doc_nums.append(doc_num)
+        doc_lengths.append(length)
+        doc_meta.append(meta)
+    return Segment.build(
+        list(vocabulary),
+        np.asarray(term_ids, dtype=np.int64),
+        np.asarray(positions, dtype=np.int64),
+        np.asarray(tfs, dtype=np.int64),
+        np.asarray(doc_nums, dtype=np.int64),
+        np.asarray(doc_lengths, dtype=np.int64),
+        doc_meta
+    )
+
+
+def merge_segments(segments: Sequence[Segment]) -> Segment:
+    """
+    合并多个段，清除已删除的文档
+
+    Args:
+        segments: 要合并的段
+
+    Returns:
+        Segment: 合并后的段
+    """
+    vocabulary: Dict[str, int] = {}
+    all_terms, all_positions, all_tfs = [], [], []
+    doc_nums, doc_lengths, doc_meta = [], [], []
+    ordered = sorted(segments, key=lambda segment: segment.doc_nums[0] if len(segment.doc_nums) else 0)
+    for segment in ordered:
+        live = ~segment.deleted
+        # 段内位置映射到合并后的位置，已删除的文档映射为-1
+        remap = np.full(len(segment.doc_nums), -1, dtype=np.int64)
+        remap[live] = np.arange(live.sum()) + len(doc_nums)
+        local_to_global = np.array([vocabulary.setdefault(term, len(vocabulary)) for term in segment.terms], dtype=np.int64)
+
+        term_ids, positions, tfs = segment.all_postings()
+        keep = remap[positions] >= 0
+        all_terms.append(local_to_global[term_ids[keep]])
+        all_positions.append(remap[positions[keep]])
+        all_tfs.append(tfs[keep])
+        doc_nums.extend(segment.doc_nums[live].tolist())
+        doc_lengths.extend(segment.doc_lengths[live].tolist())
+        doc_meta.extend(meta for meta, is_live in zip(segment.doc_meta, live) if is_live)
+
+    def concat(parts):
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    return Segment.build(
+        list(vocabulary),
+        concat(all_terms),
+        concat(all_positions),
+        concat(all_tfs),
+        np.asarray(doc_nums, dtype=np.int64),
+        np.asarray(doc_lengths, dtype=np.int64),
+        doc_meta,
+        level=max(segment.level for segment in segments) + 1
+    )
+
+
+class InvertedIndex:
+    """由多个段组成的倒排索引，文档以全局文档号标识，同一文档重新写入时旧版本被标记删除"""
+
+    def __init__(self, merge_factor: int = SEGMENT_MERGE_FACTOR):
+        self.merge_factor = merge_factor
+        self.segments: List[Segment] = []
+        self.next_doc = 0
+        # (文档类型, 文档ID) -> (段, 段内位置)
+        self.locations: Dict[Tuple[str, str], Tuple[Segment, int]] = {}
+
+    @property
+    def live_count(self) -> int:
+        return sum(segment.live_count for segment in self.segments)
+
+    def _register(self, segment: Segment) -> None:
+        """登记段中的文档，同一文档只保留文档号最大的版本"""
+        for position, meta in enumerate(segment.doc_meta):
+            key = (meta[0], meta[1])
+            previous = self.locations.get(key)
+            if previous and previous[0].doc_nums[previous[1]] > segment.doc_nums[position]:
+                segment.deleted[position] = True
+                continue
+            if previous:
+                previous[0].deleted[previous[1]] = True
+            if not segment.deleted[position]:
+                self.locations[key] = (segment, position)
+        if len(segment.doc_nums):
+            self.next_doc = max(self.next_doc, int(segment.doc_nums.max()) + 1)
+
+    def add_segment(self, segment: Segment) -> None:
+        """加入已有的段（从持久化数据恢复时使用）"""
+        self.segments.append(segment)
+        self._register(segment)
+
+    def add_documents(self, documents: Sequence[Tuple[DocMeta, Union[str, TermCounts]]]) -> Segment:
+        """
+        写入一批文档，生成一个新段
+
+        Args:
+            documents: (元数据, 文本或count_terms的结果) 列表
+
+        Returns:
+            Segment: 新段
+        """
+        numbered = [(self.next_doc + i, meta, text) for i, (meta, text) in enumerate(documents)]
+        self.next_doc += len(numbered)
+        segment = build_segment(numbered)
+        self.add_segment(segment)
+        return segment
+
+    def remove_document(self, doc_type: str, doc_id: str) -> Optional[int]:
+        """
+        删除文档
+
+        Returns:
+            Optional[int]: 被删除文档的全局文档号，不存在时为None
+        """
+        location = self.locations.pop((doc_type, doc_id), None)
+        if not location:
+            return None
+        segment, position = location
+        segment.deleted[position] = True
+        return int(segment.doc_nums[position])
+
+    def corpus_statistics(self, terms: Sequence[str]) -> Tuple[np.ndarray, int, int]:
+        """
+        统计未删除文档中各词的文档频率，以及文档数和总词数（供关键词打分使用）
+
+        没有删除文档的段直接使用段内的文档频率，有删除文档的段只解码这些词的倒排列表
+
+        Args:
+            terms: 词列表
+
+        Returns:
+            tuple: (文档频率数组, 文档数, 总词数)
+        """
+        frequencies = np.zeros(len(terms), dtype=np.int64)
+        for segment in self.segments:
+            if not segment.live_count:
+                continue
+            has_deleted = bool(segment.deleted.any())
+            for i, term in enumerate(terms):
+                term_id = segment.term_ids.get(term)
+                if term_id is None:
+                    continue
+                if has_deleted:
+                    positions, _ = segment.postings_for(term)
+                    frequencies[i] += int((~segment.deleted[positions]).sum())
+                else:
+                    frequencies[i] += int(segment.dfs[term_id])
+        return frequencies, self.live_count, sum(segment.live_length for segment in self.segments)
+
+    def document_terms(self, doc_type: str, doc_id: str) -> Optional[Tuple[DocMeta, TermCounts]]:
+        """
+        读取已索引文档的元数据和词频，用于不重新分词地复制文档
+
+        Returns:
+            Optional[tuple]: (元数据, 词频)，文档不存在时为None
+        """
+        location = self.locations.get((doc_type, doc_id))
+        if not location:
+            return None
+        segment, position = location
+        term_ids, positions, tfs = segment.all_postings()
+        hit = positions == position
+        counts = {segment.terms[term_id]: int(tf) for term_id, tf in zip(term_ids[hit], tfs[hit])}
+        return tuple(segment.doc_meta[position]), (counts, int(segment.doc_lengths[position]))
+
+    def delete_doc_nums(self, doc_nums: Sequence[int]) -> None:
+        """按全局文档号标记删除（从持久化的删除记录恢复时使用）"""
+        targets = np.asarray(list(doc_nums), dtype=np.int64)
+        for segment in self.segments:
+            hit = np.isin(segment.doc_nums, targets) & ~segment.deleted
+            for position in np.flatnonzero(hit):
+                meta = segment.doc_meta[position]
+                if self.locations.get((meta[0], meta[1]), (None,))[0] is segment:
+                    self.locations.pop((meta[0], meta[1]), None)
+            segment.deleted |= hit
+
+    def plan_merge(self) -> Optional[List[Segment]]:
+        """
+        找出需要合并的段：同一层级的段数达到合并因子时合并该层级
+
+        Returns:
+            Optional[List[Segment]]: 要合并的段，不需要合并时为None
+        """
+        by_level: Dict[int, List[Segment]] = {}
+        for segment in self.segments:
+            by_level.setdefault(segment.level, []).append(segment)
+        for level in sorted(by_level):
+            if len(by_level[level]) >= self.merge_factor:
+                return by_level[level]
+        return None
+
+    def merge(self, segments: Sequence[Segment]) -> Segment:
+        """
+        合并指定的段并替换它们
+
+        Args:
+            segments: 要合并的段
+
+        Returns:
+            Segment: 合并后的段
+        """
+        merged = merge_segments(segments)
+        merged_ids = {id(segment) for segment in segments}
+        self.segments = [segment for segment in self.segments if id(segment) not in merged_ids]
+        self.segments.append(merged)
+        for position, meta in enumerate(merged.doc_meta):
+            self.locations[(meta[0], meta[1])] = (merged, position)
+        logger.info(f"[KEYWORD] 已合并 {len(segments)} 个段，共 {len(merged.doc_nums)} 个文档")
+        return merged
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        category: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None
+    ) -> List[Tuple[DocMeta, float]]:
+        """
+        BM25检索
+
+        Args:
+            query: 查询文本
+            limit: 最多返回的文档数
+            category: 可选的类别过滤
+            doc_type: 可选的文档类型过滤
+            start: 可选的起始时间戳
+            end: 可选的结束时间戳
+
+        Returns:
+            List[Tuple[DocMeta, float]]: (文档元数据, BM25分数)，按分数降序
+        """
+        terms = tokenize(query)
+        if not terms or not self.segments:
+            return []
+        query_counts: Dict[str, int] = {}
+        for term in terms:
+            query_counts[term] = query_counts.get(term, 0) + 1
+
+        total_docs = self.live_count
+        if not total_docs:
+            return []
+        average_length = max(1.0, sum(segment.live_length for segment in self.segments) / total_docs)
+
+        # 文档频率在所有段上汇总（已删除的文档在合并前仍会计入，属于BM25的常见近似）
+        document_frequency = {
+            term: sum(int(segment.dfs[segment.term_ids[term]]) for segment in self.segments if term in segment.term_ids)
+            for term in query_counts
+        }
+
+        candidates = []
+        for segment in self.segments:
+            scores = np.zeros(len(segment.doc_nums), dtype=np.float64)
+            norms = BM25_K1 * (1 - BM25_B + BM25_B * segment.doc_lengths / average_length)
+            for term, query_count in query_counts.items():
+                df = document_frequency[term]
+                if not df:
+                    continue
+                positions, tfs = segment.postings_for(term)
+                if not len(positions):
+                    continue
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                scores[positions] += query_count * idf * tfs * (BM25_K1 + 1) / (tfs + norms[positions])
+
+            keep = (scores > 0) & ~segment.deleted
+            if category or doc_type or start is not None or end is not None:
+                types, categories, timestamps = segment.filter_arrays()
+                if category:
+                    keep &= categories == category
+                if doc_type:
+                    keep &= types == doc_type
+                if start is not None:
+                    keep &= timestamps >= start
+                if end is not None:
+                    keep &= timestamps <= end
+            hits = np.flatnonzero(keep)
+            if len(hits) > limit:
+                hits = hits[np.argpartition(-scores[hits], limit - 1)[:limit]]
+            candidates.extend((segment.doc_meta[i], float(scores[i])) for i in hits)
+
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return candidates[:limit]
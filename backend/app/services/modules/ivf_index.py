@@ -0,0 +1,320 @@
+"""
+IVF近似最近邻索引模块 - 基于NumPy的倒排文件索引
+
+向量数量达到训练阈值之前按暴力检索；达到后用k-means训练质心，之后新增的向量只需分配到最近的质心。
+向量数增长到上次训练时的IVF_RETRAIN_FACTOR倍后重新训练（列表数约为sqrt(向量数)），使每个倒排列表的长度
+保持在sqrt(向量数)左右。训练前向量以float16存放在一个数组中；训练后每个倒排列表的向量以float32连续存放，
+检索时只对与查询最近的nprobe个列表做矩阵乘法，不需要按行号收集和转换向量，10万级向量的检索在毫秒级完成。
+带过滤条件时，满足条件的行很少则直接暴力检索这些行，否则逐步扩大探测范围，直到过滤后有足够的结果
+"""
+
+import os
+import math
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.modules.chunk_selection import kmeans, normalize_rows
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 向量数达到该值时训练质心
+IVF_TRAIN_THRESHOLD = int(os.environ.get('IVF_TRAIN_THRESHOLD', '2048'))
+
+# 倒排列表数上限，实际数量约为sqrt(向量数)
+IVF_MAX_LISTS = 1024
+
+# 向量数超过上次训练时的该倍数后重新训练质心
+IVF_RETRAIN_FACTOR = int(os.environ.get('IVF_RETRAIN_FACTOR', '4'))
+
+# 检索时扫描的倒排列表数
+IVF_NPROBE = int(os.environ.get('IVF_NPROBE', '16'))
+
+# 过滤后剩余的行数不超过k的该倍数（或不超过一次探测扫描的行数）时，直接对这些行暴力检索
+IVF_FILTER_BRUTE_FORCE_FACTOR = 8
+
+# 训练质心时的最大采样数
+IVF_TRAIN_SAMPLE = 20000
+
+# 训练质心时k-means的迭代次数（IVF只需要粗略的划分）
+IVF_TRAIN_ITERATIONS = 10
+
+# 分配向量到质心时每批的行数
+ASSIGN_BATCH_ROWS = 16384
+
+
+class InvertedList:
+    """一个倒排列表：行号和float32向量连续存放（按倍增策略扩容），检索时直接参与矩阵乘法"""
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.size = 0
+        self.rows = np.zeros(capacity, dtype=np.int64)
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+
+    def extend(self, rows: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """追加向量，返回它们在列表中的位置"""
+        needed = self.size + len(rows)
+        if needed > len(self.rows):
+            capacity = max(needed, len(self.rows) * 2)
+            self.rows = np.resize(self.rows, capacity)
+            self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+        positions = np.arange(self.size, needed)
+        self.rows[positions] = rows
+        self.vectors[positions] = vectors
+        self.size = needed
+        return positions
+
+
+class IVFIndex:
+    """倒排文件索引，支持增量添加、删除标记、行级过滤和随规模增长重新训练"""
+
+    def __init__(self, train_threshold: int = IVF_TRAIN_THRESHOLD, nprobe: int = IVF_NPROBE,
+                 retrain_factor: int = IVF_RETRAIN_FACTOR):
+        self.train_threshold = train_threshold
+        self.nprobe = nprobe
+        self.retrain_factor = retrain_factor
+        self.size = 0
+        self.dim: Optional[int] = None
+        self.trained_size = 0
+        # 训练前的向量（float16）；训练后向量只保存在倒排列表中
+        self.vectors: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        # 每行在所属倒排列表中的位置
+        self.positions = np.zeros(0, dtype=np.int64)
+        self.deleted = np.zeros(0, dtype=bool)
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[InvertedList] = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def live_count(self) -> int:
+        return int(self.size - self.deleted[:self.size].sum())
+
+    @property
+    def needs_retrain(self) -> bool:
+        """向量数超过上次训练时的retrain_factor倍，且列表数尚未达到上限"""
+        return (self.trained and self.size > self.trained_size * self.retrain_factor
+                and len(self.centroids) < IVF_MAX_LISTS)
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """按倍增策略扩容，避免每次添加都复制整个数组"""
+        if self.dim is None:
+            self.dim = dim
+        elif self.dim != dim:
+            raise Exception(f"向量维度不一致: 索引为 {self.dim}，新增为 {dim}")
+        needed = self.size + rows
+        if needed > len(self.assignments):
+            capacity = max(needed, len(self.assignments) * 2, 1024)
+            self.assignments = _grow(self.assignments, capacity, -1)
+            self.positions = _grow(self.positions, capacity, 0)
+            self.deleted = _grow(self.deleted, capacity, False)
+        if not self.trained:
+            if self.vectors is None:
+                self.vectors = np.zeros((max(needed, 1024), dim), dtype=np.float16)
+            elif needed > len(self.vectors):
+                self.vectors = np.resize(self.vectors, (max(needed, len(self.vectors) * 2), dim))
+
+    def _assign(self, vectors: np.ndarray, centroids: Optional[np.ndarray] = None) -> np.ndarray:
+        """把向量分配到最近的质心"""
+        centroids = self.centroids if centroids is None else centroids
+        result = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_BATCH_ROWS):
+            block = np.asarray(vectors[start:start + ASSIGN_BATCH_ROWS], dtype=np.float32)
+            result[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return result
+
+    def get_vectors(self, rows) -> np.ndarray:
+        """
+        按行号取出向量（float32）
+
+        Args:
+            rows: 行号
+
+        Returns:
+            np.ndarray: 向量 (len(rows), d)
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not self.trained:
+            return np.asarray(self.vectors[rows], dtype=np.float32)
+        result = np.empty((len(rows), self.dim), dtype=np.float32)
+        assigned = self.assignments[rows]
+        for cluster in np.unique(assigned):
+            hit = np.flatnonzero(assigned == cluster)
+            result[hit] = self.lists[cluster].vectors[self.positions[rows[hit]]]
+        return result
+
+    def _iter_vector_batches(self, size: int):
+        """按批取出前size行的向量"""
+        for start in range(0, size, ASSIGN_BATCH_ROWS):
+            rows = np.arange(start, min(start + ASSIGN_BATCH_ROWS, size))
+            yield rows, self.get_vectors(rows)
+
+    @staticmethod
+    def _fill_lists(lists: List[InvertedList], positions: np.ndarray, rows: np.ndarray,
+                    vectors: np.ndarray, assigned: np.ndarray) -> None:
+        """按列表分组，把行号和向量追加到各倒排列表的连续存储中，并记录每行在列表中的位置"""
+        order = np.argsort(assigned, kind='stable')
+        clusters, starts = np.unique(assigned[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        for cluster, start, end in zip(clusters, starts, ends):
+            group = order[start:end]
+            positions[rows[group]] = lists[cluster].extend(rows[group], vectors[group])
+
+    def add(self, vectors, assignments: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        增量添加向量
+
+        Args:
+            vectors: 向量 (n, d)，会被归一化
+            assignments: 可选，已知的倒排列表分配（从持久化数据恢复时使用）
+
+        Returns:
+            np.ndarray: 新增向量的行号
+        """
+        vectors = normalize_rows(np.asarray(vectors))
+        rows = np.arange(self.size, self.size + len(vectors))
+        if not len(vectors):
+            return rows
+        self._reserve(len(vectors), vectors.shape[1])
+        self.size += len(vectors)
+
+        if self.trained:
+            assigned = np.asarray(assignments, dtype=np.int32) if assignments is not None else self._assign(vectors)
+            self.assignments[rows] = assigned
+            self._fill_lists(self.lists, self.positions, rows, vectors, assigned)
+        else:
+            self.vectors[rows] = vectors.astype(np.float16)
+            if self.size >= self.train_threshold:
+                self.train()
+        return rows
+
+    def fit(self, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        用已有的有效向量训练质心并计算所有向量的分配，不修改索引（写入线程可在持锁之外执行）
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (质心, 分配结果)
+        """
+        size = self.size
+        nlist = max(1, min(IVF_MAX_LISTS, int(math.sqrt(size))))
+        rng = np.random.default_rng(seed)
+        sample_rows = np.flatnonzero(~self.deleted[:size])
+        if len(sample_rows) > IVF_TRAIN_SAMPLE:
+            sample_rows = np.sort(rng.choice(sample_rows, IVF_TRAIN_SAMPLE, replace=False))
+        _, centroids = kmeans(self.get_vectors(sample_rows), nlist, IVF_TRAIN_ITERATIONS, seed=seed)
+        centroids = normalize_rows(centroids)
+        assigned = np.empty(size, dtype=np.int32)
+        for rows, vectors in self._iter_vector_batches(size):
+            assigned[rows] = self._assign(vectors, centroids)
+        logger.info(f"[IVF] 已用 {len(sample_rows)} 个向量训练 {len(centroids)} 个质心（共 {size} 个向量）")
+        return centroids, assigned
+
+    def train(self, seed: int = 0) -> None:
+        """训练质心，并把所有向量重新分配到倒排列表（首次达到阈值、以及规模增长后执行）"""
+        self.set_centroids(*self.fit(seed))
+
+    def set_centroids(self, centroids: np.ndarray, assignments: Optional[np.ndarray] = None) -> None:
+        """
+        设置质心并重建倒排列表
+
+        Args:
+            centroids: 质心 (nlist, d)
+            assignments: 可选，已有向量的分配结果，为空时重新计算；比行数少时其余的行按新质心分配
+        """
+        centroids = normalize_rows(centroids)
+        assigned = np.zeros(0, dtype=np.int32) if assignments is None else np.asarray(assignments, dtype=np.int32)
+        if len(assigned) < self.size:
+            missing = np.arange(len(assigned), self.size)
+            assigned = np.concatenate([assigned, self._assign(self.get_vectors(missing), centroids)])
+
+        counts = np.bincount(assigned, minlength=len(centroids))
+        lists = [InvertedList(self.dim, max(16, int(count))) for count in counts]
+        positions = np.zeros_like(self.positions)
+        # 按批从旧的存储搬到新的倒排列表，搬完后再替换
+        for rows, vectors in self._iter_vector_batches(self.size):
+            self._fill_lists(lists, positions, rows, vectors, assigned[rows])
+
+        self.centroids = centroids
+        self.lists = lists
+        self.positions = positions
+        self.assignments[:self.size] = assigned
+        self.trained_size = self.size
+        self.vectors = None
+
+    def delete(self, rows: Sequence[int]) -> None:
+        """标记删除的行，检索时跳过"""
+        self.deleted[np.asarray(rows, dtype=np.int64)] = True
+
+    def search(self, query, k: int = 10, mask: Optional[np.ndarray] = None, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        检索最相似的向量
+
+        Args:
+            query: 查询向量 (d,)
+            k: 返回的结果数
+            mask: 可选的行过滤条件 (size,)，True表示保留
+            nprobe: 扫描的倒排列表数
+
+        Returns:
+            List[Tuple[int, float]]: (行号, 余弦相似度) 列表，按相似度降序
+        """
+        if not self.size:
+            return []
+        query = normalize_rows(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+        if not self.trained:
+            candidates = np.arange(self.size)
+            scores = np.asarray(self.vectors[:self.size], dtype=np.float32) @ query
+            keep = ~self.deleted[candidates]
+            if mask is not None:
+                keep &= mask[candidates]
+            candidates, scores = candidates[keep], scores[keep]
+        else:
+            candidates, scores = self._search_trained(query, k, mask, min(nprobe or self.nprobe, len(self.centroids)))
+        if not len(candidates):
+            return []
+
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+
+    def _search_trained(self, query: np.ndarray, k: int, mask: Optional[np.ndarray],
+                        probe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        训练后的检索：过滤条件选择性高时对保留的行暴力检索；否则从最近的probe个列表开始，
+        过滤后不足k个候选时成倍扩大探测范围，避免过滤条件使结果变少
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (候选行号, 相似度)
+        """
+        if mask is not None:
+            allowed = np.flatnonzero(mask[:self.size] & ~self.deleted[:self.size])
+            scanned = probe * self.size / len(self.centroids)
+            if len(allowed) <= max(k * IVF_FILTER_BRUTE_FORCE_FACTOR, scanned):
+                return allowed, self.get_vectors(allowed) @ query
+
+        order = np.argsort(-(self.centroids @ query))
+        while True:
+            blocks = [self.lists[cluster] for cluster in order[:probe] if self.lists[cluster].size]
+            candidates = np.concatenate([block.rows[:block.size] for block in blocks] or [np.zeros(0, dtype=np.int64)])
+            keep = ~self.deleted[candidates]
+            if mask is not None:
+                keep &= mask[candidates]
+            if keep.sum() >= k or probe >= len(order):
+                break
+            probe = min(probe * 2, len(order))
+        scores = np.concatenate([block.vectors[:block.size] @ query for block in blocks] or [np.zeros(0, dtype=np.float32)])
+        return candidates[keep], scores[keep]
+
+
+def _grow(array: np.ndarray, capacity: int, fill) -> np.ndarray:
+    """把一维数组扩容到capacity，新增部分填充fill"""
+    grown = np.full(capacity, fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
@@ -0,0 +1,202 @@
+"""
+关键词引擎模块 - 基于语料库文档频率的TF-IDF/BM25关键词打分
+
+文档频率默认来自设置的语料库（检索服务持久化的倒排索引，上传文件和保存报告时写入，重启后不丢失）；
+没有设置语料库时在内存中增量维护（词表映射到NumPy数组下标，新文档只更新出现过的词）。
+打分用向量化运算完成，批量模式把多个文档的词频拼成一个稀疏三元组，一次算出所有文档的关键词
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.utils.tokenizer_utils import tokenize, ENGLISH_STOP_WORDS
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 打分方式：tfidf或bm25
+KEYWORD_SCORING = os.environ.get('KEYWORD_SCORING', 'bm25')
+SCORING_METHODS = ('tfidf', 'bm25')
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 语料库中记录的文档指纹数上限，超过后淘汰最早的指纹（文档频率保留）
+MAX_CORPUS_FINGERPRINTS = 100000
+
+# 语料库：输入词列表，返回 (文档频率数组, 文档数, 总词数)
+CorpusStatistics = Callable[[List[str]], Tuple[np.ndarray, int, int]]
+
+
+def is_keyword_candidate(term: str) -> bool:
+    """过滤停用词、单个拉丁字母和纯数字"""
+    if term in ENGLISH_STOP_WORDS or term.isdigit():
+        return False
+    return len(term) > 1 or not term.isascii()
+
+
+class KeywordEngine:
+    """维护语料库文档频率并计算关键词分数"""
+
+    def __init__(self, scoring: str = KEYWORD_SCORING, max_fingerprints: int = MAX_CORPUS_FINGERPRINTS):
+        if scoring not in SCORING_METHODS:
+            raise Exception(f"未知的关键词打分方式: {scoring}")
+        self.scoring = scoring
+        self.max_fingerprints = max_fingerprints
+        self.vocabulary: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self.document_frequency = np.zeros(1024, dtype=np.int64)
+        self.document_count = 0
+        self.total_length = 0
+        # 已计入语料库的文档指纹，同一文档重复提交不会重复计数
+        self.fingerprints: "OrderedDict[str, None]" = OrderedDict()
+        self.corpus: Optional[CorpusStatistics] = None
+        self._lock = threading.Lock()
+
+    def set_corpus(self, corpus: Optional[CorpusStatistics]) -> None:
+        """设置提供文档频率的语料库，为None时使用内存中维护的文档频率"""
+        self.corpus = corpus
+
+    @property
+    def average_length(self) -> float:
+        return self.total_length / self.document_count if self.document_count else 1.0
+
+    def _term_ids(self, terms: Sequence[str]) -> np.ndarray:
+        """把词映射到下标，新词追加到词表（调用方需持有锁）"""
+        ids = np.empty(len(terms), dtype=np.int64)
+        for i, term in enumerate(terms):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                term_id = len(self.terms)
+                self.vocabulary[term] = term_id
+                self.terms.append(term)
+            ids[i] = term_id
+        if len(self.terms) > len(self.document_frequency):
+            grown = np.zeros(max(len(self.terms), len(self.document_frequency) * 2), dtype=np.int64)
+            grown[:len(self.document_frequency)] = self.document_frequency
+            self.document_frequency = grown
+        return ids
+
+    def _count_terms(self, text: str) -> Tuple[List[str], np.ndarray, int]:
+        """分词并统计候选词的词频，返回 (词列表, 词频数组, 文档长度)；文档长度与倒排索引一样计入所有词"""
+        tokens = tokenize(text) if text else []
+        candidates = [term for term in tokens if is_keyword_candidate(term)]
+        if not candidates:
+            return [], np.zeros(0, dtype=np.int64), len(tokens)
+        terms, counts = np.unique(np.array(candidates, dtype=object), return_counts=True)
+        return list(terms), counts, len(tokens)
+
+    def add_documents(self, texts: Sequence[str]) -> int:
+        """
+        把文档计入语料库的文档频率，已计入的文档会被跳过
+
+        Args:
+            texts: 文档文本列表
+
+        Returns:
+            int: 新计入的文档数
+        """
+        added = 0
+        for text in texts:
+            fingerprint = hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+            terms, _, length = self._count_terms(text)
+            with self._lock:
+                if fingerprint in self.fingerprints:
+                    self.fingerprints.move_to_end(fingerprint)
+                    continue
+                self.fingerprints[fingerprint] = None
+                while len(self.fingerprints) > self.max_fingerprints:
+                    self.fingerprints.popitem(last=False)
+                if terms:
+                    self.document_frequency[self._term_ids(terms)] += 1
+                self.document_count += 1
+                self.total_length += length
+                added += 1
+        return added
+
+    def _corpus_statistics(self, term_ids: np.ndarray) -> Tuple[np.ndarray, int, float]:
+        """读取词的文档频率、文档数和平均文档长度，语料库不可用时使用内存中的统计"""
+        if self.corpus is not None:
+            unique_ids, inverse = np.unique(term_ids, return_inverse=True)
+            try:
+                frequencies, document_count, total_length = self.corpus([self.terms[i] for i in unique_ids])
+                average_length = total_length / document_count if document_count else 1.0
+                return np.asarray(frequencies, dtype=np.float64)[inverse], max(document_count, 1), average_length
+            except Exception as e:
+                logger.warning(f"[KEYWORDS] 读取语料库文档频率失败，使用内存中的统计: {str(e)}")
+        with self._lock:
+            return (self.document_frequency[term_ids].astype(np.float64), max(self.document_count, 1),
+                    self.average_length)
+
+    def score_batch(self, texts: Sequence[str], top_n: int = 10, update_corpus: bool = False) -> List[List[Tuple[str, float]]]:
+        """
+        批量计算关键词：所有文档的词频拼成 (文档, 词, 词频) 三元组，一次向量化打分
+
+        Args:
+            texts: 文档文本列表
+            top_n: 每个文档返回的关键词数
+            update_corpus: 是否先把这些文档计入内存中的文档频率（设置了语料库时不需要，
+                文档在写入检索索引时计入）
+
+        Returns:
+            List[List[Tuple[str, float]]]: 每个文档的 (关键词, 分数) 列表，按分数降序
+        """
+        if not texts:
+            return []
+        if update_corpus and self.corpus is None:
+            self.add_documents(texts)
+
+        counted = [self._count_terms(text) for text in texts]
+        with self._lock:
+            doc_index = np.concatenate([np.full(len(terms), i, dtype=np.int64) for i, (terms, _, _) in enumerate(counted)])
+            term_ids = self._term_ids([term for terms, _, _ in counted for term in terms])
+        if not len(term_ids):
+            return [[] for _ in texts]
+
+        frequencies = np.concatenate([counts for _, counts, _ in counted]).astype(np.float64)
+        document_frequency, document_count, average_length = self._corpus_statistics(term_ids)
+        lengths = np.array([max(length, 1) for _, _, length in counted], dtype=np.float64)
+        if self.scoring == 'bm25':
+            idf = np.log(1 + (document_count - document_frequency + 0.5) / (document_frequency + 0.5))
+            norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_index] / average_length)
+            scores = idf * frequencies * (BM25_K1 + 1) / (frequencies + norms)
+        else:
+            idf = np.log((1 + document_count) / (1 + document_frequency)) + 1
+            scores = idf * frequencies / np.maximum(lengths[doc_index], 1)
+
+        # 按 (文档, 分数降序) 排序后，取每个文档的前top_n项
+        order = np.lexsort((-scores, doc_index))
+        sorted_docs = doc_index[order]
+        starts = np.searchsorted(sorted_docs, np.arange(len(texts)))
+        rank = np.arange(len(order)) - starts[sorted_docs]
+        selected = order[rank < top_n]
+
+        results: List[List[Tuple[str, float]]] = [[] for _ in texts]
+        for position in selected:
+            results[doc_index[position]].append((self.terms[term_ids[position]], round(float(scores[position]), 4)))
+        return results
+
+    def extract_keywords(self, text: str, top_n: int = 10, update_corpus: bool = False) -> List[Tuple[str, float]]:
+        """
+        计算单个文档的关键词
+
+        Args:
+            text: 文档文本
+            top_n: 返回的关键词数
+            update_corpus: 是否先把文档计入内存中的文档频率
+
+        Returns:
+            List[Tuple[str, float]]: (关键词, 分数) 列表，按分数降序
+        """
+        return self.score_batch([text], top_n, update_corpus)[0]
+
+
+# 创建引擎实例
+keyword_engine = KeywordEngine()
@@ -0,0 +1,328 @@
+"""
+Map-Reduce摘要模块 - 处理超出模型上下文窗口的长文档
+
+文档被切分为块，各块并发生成部分摘要（并发数有上限），部分摘要按块内容哈希缓存，
+然后分层归约，直到能放入一次最终生成调用
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Sized, Union
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.utils.chunk_utils import iter_chunks
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 每个块的最大字符数
+MAP_REDUCE_CHUNK_SIZE = int(os.environ.get('MAP_REDUCE_CHUNK_SIZE', '12000'))
+
+# 相邻块之间的重叠字符数
+MAP_REDUCE_CHUNK_OVERLAP = int(os.environ.get('MAP_REDUCE_CHUNK_OVERLAP', '500'))
+
+# 并发调用模型的最大线程数
+MAP_REDUCE_MAX_WORKERS = int(os.environ.get('MAP_REDUCE_MAX_WORKERS', '4'))
+
+# 部分摘要缓存的最大条目数
+MAP_SUMMARY_CACHE_SIZE = int(os.environ.get('MAP_SUMMARY_CACHE_SIZE', '1024'))
+
+# 部分摘要的分隔符
+SUMMARY_SEPARATOR = "\n\n---\n\n"
+
+# 默认的分块提示词
+DEFAULT_MAP_PROMPT = """以下是一份长文档的第 {index}/{total} 部分。
+请提取这一部分的要点，包括讨论的主题、关键数据、决策、行动项（负责人和期限）以及未解决的问题。
+只输出要点，不要添加开场白。
+
+{text}"""
+
+# 流式输入时的分块提示词（总块数未知）
+DEFAULT_STREAM_MAP_PROMPT = """以下是一份长文档的第 {index} 部分。
+请提取这一部分的要点，包括讨论的主题、关键数据、决策、行动项（负责人和期限）以及未解决的问题。
+只输出要点，不要添加开场白。
+
+{text}"""
+
+# 默认的中间归约提示词
+DEFAULT_COMBINE_PROMPT = """以下是同一份长文档连续几个部分的要点摘要。
+请将它们合并为一份不重复的要点摘要，保留所有决策、行动项和关键数据，按原文顺序组织。
+
+{text}"""
+
+
+class SummaryCache:
+    """按块内容哈希缓存部分摘要的线程安全LRU缓存"""
+
+    def __init__(self, max_entries: int = MAP_SUMMARY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text: str, namespace: str = "") -> str:
+        """
+        计算缓存键
+
+        Args:
+            text: 块文本
+            namespace: 命名空间（模型ID和提示词等会影响摘要结果的参数）
+
+        Returns:
+            str: 缓存键
+        """
+        digest = hashlib.sha256()
+        digest.update(namespace.encode('utf-8'))
+        digest.update(b'\x00')
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# 全局部分摘要缓存
+summary_cache = SummaryCache()
+
+
+def split_document(
+    document: str,
+    chunk_size: int = MAP_REDUCE_CHUNK_SIZE,
+    chunk_overlap: int = MAP_REDUCE_CHUNK_OVERLAP
+) -> List[str]:
+    """
+    按段落边界将文档切分为块
+
+    Args:
+        document: 文档内容
+        chunk_size: 每个块的最大字符数
+        chunk_overlap: 相邻块之间的重叠字符数
+
+    Returns:
+        List[str]: 块列表
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=min(chunk_overlap, chunk_size // 4),
+        separators=["\n\n", "\n", "。", ". ", " ", ""]
+    )
+    return splitter.split_text(document)
+
+
+def bounded_map(func: Callable, items: Iterable, max_workers: int) -> Iterator:
+    """
+    并发执行func并按输入顺序返回结果，同时只从items中取出有限个元素，输入可以是惰性的生成器
+
+    Args:
+        func: 处理函数
+        items: 输入（列表或生成器）
+        max_workers: 最大并发数
+
+    Yields:
+        与输入顺序一致的结果
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def map_chunks(
+    chunks: Iterable[str],
+    summarize: Callable[[str], str],
+    prompt_template: str = DEFAULT_MAP_PROMPT,
+    namespace: str = "",
+    max_workers: int = MAP_REDUCE_MAX_WORKERS,
+    cache: Optional[SummaryCache] = None
+) -> List[str]:
+    """
+    并发生成各块的部分摘要，命中缓存的块不再调用模型；chunks为生成器时按需取块，不会一次读入全部块
+
+    Args:
+        chunks: 块列表或块的生成器
+        summarize: 调用模型的函数，输入完整提示词，返回生成文本
+        prompt_template: 分块提示词模板，可使用 {index}、{total}、{text}
+        namespace: 缓存命名空间
+        max_workers: 最大并发数
+        cache: 部分摘要缓存，默认使用全局缓存
+
+    Returns:
+        List[str]: 与块顺序一致的部分摘要
+    """
+    cache = summary_cache if cache is None else cache
+    # 生成器的总块数未知
+    total = len(chunks) if isinstance(chunks, Sized) else '?'
+    # 缓存键不包含块序号，相同内容的块在不同文档中也能复用
+    namespace = f"{namespace}\x00{prompt_template}"
+
+    def summarize_chunk(item) -> str:
+        index, chunk = item
+        key = cache.make_key(chunk, namespace)
+        cached = cache.get(key)
+        if cached is not None:
+            logger.debug(f"[MAP] 第 {index + 1}/{total} 块命中缓存")
+            return cached
+        summary = summarize(prompt_template.format(index=index + 1, total=total, text=chunk)).strip()
+        cache.put(key, summary)
+        logger.debug(f"[MAP] 第 {index + 1}/{total} 块摘要完成，长度: {len(summary)}")
+        return summary
+
+    if total == 1 or max_workers <= 1:
+        return [summarize_chunk(item) for item in enumerate(chunks)]
+
+    workers = max_workers if total == '?' else max(1, min(max_workers, total))
+    return list(bounded_map(summarize_chunk, enumerate(chunks), workers))
+
+
+def group_summaries(summaries: List[str], max_chars: int) -> List[List[str]]:
+    """
+    将相邻的部分摘要分组，每组总长度不超过max_chars（单个超长摘要独占一组）
+
+    Args:
+        summaries: 部分摘要列表
+        max_chars: 每组的最大字符数
+
+    Returns:
+        List[List[str]]: 分组后的摘要
+    """
+    groups = []
+    current = []
+    current_size = 0
+    for summary in summaries:
+        size = len(summary) + len(SUMMARY_SEPARATOR)
+        if current and current_size + size > max_chars:
+            groups.append(current)
+            current, current_size = [], 0
+        current.append(summary)
+        current_size += size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def reduce_summaries(
+    summaries: List[str],
+    summarize: Callable[[str], str],
+    max_chars: int = MAP_REDUCE_CHUNK_SIZE,
+    combine_template: str = DEFAULT_COMBINE_PROMPT,
+    namespace: str = "",
+    max_workers: int = MAP_REDUCE_MAX_WORKERS,
+    cache: Optional[SummaryCache] = None
+) -> str:
+    """
+    分层归约部分摘要，直到合并后的文本不超过max_chars
+
+    每一层将相邻摘要分组后并发合并，层数随文档长度对数增长；
+    只剩一个摘要但仍超过max_chars时，把它切分后继续归约，直到不再变短为止
+
+    Args:
+        summaries: 部分摘要列表
+        summarize: 调用模型的函数
+        max_chars: 最终输入允许的最大字符数
+        combine_template: 中间归约提示词模板，可使用 {text}
+        namespace: 缓存命名空间
+        max_workers: 最大并发数
+        cache: 部分摘要缓存
+
+    Returns:
+        str: 合并后的摘要文本
+    """
+    level = 0
+    combined = SUMMARY_SEPARATOR.join(summaries)
+    single_length = None
+    while len(combined) > max_chars:
+        if len(summaries) == 1:
+            if single_length is not None and len(combined) >= single_length:
+                logger.warning(f"[REDUCE] 摘要归约后没有变短（{len(combined)} 字符），停止归约")
+                break
+            single_length = len(combined)
+            # 单个摘要仍超长：切成两两可以合并的片段，再归约一次
+            summaries = list(iter_chunks(combined, max(1, max_chars // 2), 0))
+            logger.info(f"[REDUCE] 单个摘要超过上限（{len(combined)} 字符），切分为 {len(summaries)} 段后继续归约")
+        level += 1
+        groups = group_summaries(summaries, max_chars)
+        if len(groups) == len(summaries):
+            # 每组只有一个摘要时无法继续合并，两两强制分组以保证收敛
+            groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        logger.info(f"[REDUCE] 第 {level} 层归约: {len(summaries)} 个摘要 -> {len(groups)} 组")
+        summaries = map_chunks(
+            [SUMMARY_SEPARATOR.join(group) for group in groups],
+            summarize,
+            prompt_template=combine_template,
+            namespace=namespace,
+            max_workers=max_workers,
+            cache=cache
+        )
+        combined = SUMMARY_SEPARATOR.join(summaries)
+    return combined
+
+
+def map_reduce_generate(
+    document: Union[str, Iterable[str]],
+    summarize: Callable[[str], str],
+    generate_final: Callable[[str], str],
+    namespace: str = "",
+    chunk_size: int = MAP_REDUCE_CHUNK_SIZE,
+    max_workers: int = MAP_REDUCE_MAX_WORKERS,
+    map_template: str = DEFAULT_MAP_PROMPT,
+    combine_template: str = DEFAULT_COMBINE_PROMPT,
+    cache: Optional[SummaryCache] = None
+) -> str:
+    """
+    使用分层Map-Reduce生成报告
+
+    Args:
+        document: 文档内容，或文本片段的流（如S3对象的增量解码结果），流式输入时按需切块，内存不随文档长度增长
+        summarize: 生成部分摘要的模型调用函数，输入完整提示词，返回生成文本
+        generate_final: 根据合并后的摘要生成最终报告的函数
+        namespace: 缓存命名空间（如模型ID）
+        chunk_size: 每个块的最大字符数
+        max_workers: 最大并发数
+        map_template: 分块提示词模板
+        combine_template: 中间归约提示词模板
+        cache: 部分摘要缓存
+
+    Returns:
+        str: 最终报告
+    """
+    if isinstance(document, str):
+        chunks = split_document(document, chunk_size)
+        logger.info(f"[MAP_REDUCE] 文档长度: {len(document)} 字符，切分为 {len(chunks)} 块，并发数: {max_workers}")
+    else:
+        chunks = iter_chunks(document, chunk_size, min(MAP_REDUCE_CHUNK_OVERLAP, chunk_size // 4))
+        if map_template == DEFAULT_MAP_PROMPT:
+            map_template = DEFAULT_STREAM_MAP_PROMPT
+        logger.info(f"[MAP_REDUCE] 流式输入，按需切块，并发数: {max_workers}")
+
+    summaries = map_chunks(chunks, summarize, map_template, namespace, max_workers, cache)
+    combined = reduce_summaries(summaries, summarize, chunk_size, combine_template, namespace, max_workers, cache)
+
+    logger.info(f"[MAP_REDUCE] 归约完成，最终输入长度: {len(combined)} 字符")
+    return generate_final(combined)
@@ -5,12 +5,13 @@
 import logging
 import os
 import boto3
-from typing import Optional, Dict, Any, Union
-from langchain_community.llms import Bedrock as CommunityBedrock
-from langchain_community.chat_models import BedrockChat
+from typing import Optional, Union
 from langchain_community.llms.fake import FakeListLLM
-from langchain_community.embeddings import BedrockEmbeddings, FakeEmbeddings
-from app.config.model_config import get_model_config, DEFAULT_MODEL_ID
+from langchain_community.embeddings import FakeEmbeddings
+from app.config.model_config import DEFAULT_MODEL_ID
+from app.config.aws_config import get_bedrock_client
+from app.services.modules.embeddings import ConcurrentBedrockEmbeddings
+from app.services.modules.converse import ConverseChatModel
 
 # 初始化日志
 logger = logging.getLogger(__name__)
@@ -29,10 +30,10 @@ def initialize_bedrock_client():
         
         # 尝试初始化Bedrock LLM
         logger.info(f"尝试初始化Bedrock LLM，使用区域: {region_name}...")
-        client = boto3.client(
-            service_name="bedrock-runtime",
-            region_name=region_name,
-            endpoint_url=os.environ.get("BEDROCK_ENDPOINT", f"bedrock-runtime.{region_name}.amazonaws.com")
+        client = get_bedrock_client(
+            "bedrock-runtime",
+            region_name,
+            os.environ.get("BEDROCK_ENDPOINT", f"bedrock-runtime.{region_name}.amazonaws.com")
         )
         
         # 默认使用Amazon Titan模型，而不是Claude
@@ -64,46 +65,13 @@ def create_model(client, model_id: str, use_fake: bool = False) -> tuple:
         )
         return llm, None, embeddings, True
     
-    # 获取模型配置
-    model_config = get_model_config(model_id)
-    
     try:
-        if "claude-3" in model_id:
-            # 使用BedrockChat用于Claude 3模型
-            llm = BedrockChat(
-                model_id=model_id,
-                client=client,
-                model_kwargs={
-                    "anthropic_version": model_config.get("anthropic_version", "bedrock-2023-05-31"),
-                    "max_tokens": model_config.get("max_tokens", 4096),
-                    "temperature": model_config.get("temperature", 0.7)
-                }
-            )
-            
-            # 初始化chat_model作为同样的实例
-            chat_model = llm
-        else:
-            # 对于其他模型（如Titan），使用CommunityBedrock
-            llm = CommunityBedrock(
-                model_id=model_id,
-                client=client
-            )
-            
-            # 尝试作为BedrockChat初始化chat_model
-            chat_model = BedrockChat(
-                model_id=model_id,
-                client=client,
-                model_kwargs={
-                    "temperature": model_config.get("temperature", 0.7),
-                    "max_tokens": model_config.get("max_tokens", 4096)
-                }
-            )
+        # 所有模型统一通过Converse API流式调用，llm和chat_model使用同一个实例
+        llm = ConverseChatModel(client=client, model_id=model_id)
+        chat_model = llm
         
-        # 初始化 Bedrock 嵌入模型
-        embeddings = BedrockEmbeddings(
-            model_id="amazon.titan-embed-text-v1",
-            client=client
-        )
+        # 初始化 Bedrock 嵌入模型（并发批量请求，替代逐条串行的BedrockEmbeddings）
+        embeddings = ConcurrentBedrockEmbeddings(client)
         logger.info("成功初始化 Bedrock 嵌入模型")
         
         logger.info(f"成功初始化Bedrock LLM和嵌入模型，模型: {model_id}")
@@ -121,46 +89,33 @@ def create_model(client, model_id: str, use_fake: bool = False) -> tuple:
 
 def get_model_for_generation(
     service_instance, 
-    model_id: Optional[str] = None
-) -> Union[BedrockChat, CommunityBedrock]:
+    model_id: Optional[str] = None,
+    max_tokens: Optional[int] = None
+) -> Union[ConverseChatModel, FakeListLLM]:
     """
     获取用于生成文本的模型实例
     
     Args:
         service_instance: LangChain服务实例
         model_id: 可选的模型ID
+        max_tokens: 可选的输出token上限（根据提示词大小动态计算），为空时使用模型配置
         
     Returns:
-        Union[BedrockChat, CommunityBedrock]: 适合的模型实例
+        Union[ConverseChatModel, FakeListLLM]: 适合的模型实例
     """
     # 使用传入的模型ID或默认模型ID
     used_model_id = model_id if model_id else service_instance.default_model_id
     
-    # 如果是默认模型或者请求使用假的嵌入
-    if used_model_id == service_instance.default_model_id or service_instance.use_fake_embeddings:
+    # 请求使用假的嵌入，或者默认模型且不需要调整输出长度
+    if service_instance.use_fake_embeddings:
+        return service_instance.llm
+    if used_model_id == service_instance.default_model_id and max_tokens is None:
         return service_instance.llm
     
-    # 根据模型类型使用不同的实例化方式
-    model_config = get_model_config(used_model_id)
-    
-    if "claude-3" in used_model_id:
-        logger.info(f"使用Claude 3模型: {used_model_id}")
-        return BedrockChat(
-            model_id=used_model_id,
-            client=service_instance.bedrock_client,
-            model_kwargs={
-                "anthropic_version": model_config.get("anthropic_version", "bedrock-2023-05-31"),
-                "max_tokens": model_config.get("max_tokens", 4096),
-                "temperature": model_config.get("temperature", 0.7)
-            }
-        )
-    else:
-        logger.info(f"使用标准Bedrock模型: {used_model_id}")
-        return CommunityBedrock(
-            model_id=used_model_id,
-            client=service_instance.bedrock_client,
-            model_kwargs={
-                "temperature": model_config.get("temperature", 0.7),
-                "maxTokens": model_config.get("max_tokens", 4096)
-            }
-        )
+    # 未指定输出上限时由Converse请求使用模型配置
+    logger.info(f"使用Converse调用模型: {used_model_id}")
+    return ConverseChatModel(
+        client=service_instance.bedrock_client,
+        model_id=used_model_id,
+        max_tokens=max_tokens
+    )
@@ -0,0 +1,316 @@
+"""
+NumPy向量存储模块 - 不依赖FAISS/Chroma的轻量级向量存储
+
+向量归一化后按float32、float16或int8（逐行缩放）存储，检索时分块做矩阵乘法并用argpartition取top-k；
+索引可以保存到目录中，并通过np.memmap按需加载，适合单个文档的小索引和精简的容器/Lambda环境
+"""
+
+import os
+import json
+import uuid
+import logging
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 存储精度
+STORAGE_DTYPES = ("float32", "float16", "int8")
+DEFAULT_STORAGE_DTYPE = os.environ.get('NUMPY_VECTOR_STORE_DTYPE', 'float32')
+
+# 检索时每次参与矩阵乘法的最大行数，限制临时内存
+SEARCH_BATCH_ROWS = 65536
+
+# 保存到目录中的文件名
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.bin"
+SCALES_FILE = "scales.bin"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """把向量归一化为单位长度，零向量保持不变"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    按存储精度转换归一化后的向量
+
+    Args:
+        vectors: 归一化后的向量 (n, d)
+        dtype: float32、float16或int8
+
+    Returns:
+        tuple: (存储的向量, int8时的逐行缩放系数，否则为None)
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    return vectors.astype(np.float32), None
+
+
+class NumpyVectorStore(VectorStore):
+    """基于NumPy矩阵乘法的向量存储，实现LangChain的VectorStore接口"""
+
+    def __init__(self, embedding: Embeddings, dtype: str = DEFAULT_STORAGE_DTYPE):
+        if dtype not in STORAGE_DTYPES:
+            raise Exception(f"不支持的存储精度: {dtype}，可选: {', '.join(STORAGE_DTYPES)}")
+        self._embedding = embedding
+        self.dtype = dtype
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.ids: List[str] = []
+        self.vectors: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def _select_relevance_score_fn(self):
+        # 向量已归一化，内积即余弦相似度，映射到[0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    def add_vectors(
+        self,
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        metadatas: Optional[Sequence[dict]] = None,
+        ids: Optional[Sequence[str]] = None
+    ) -> List[str]:
+        """
+        添加已经计算好的向量
+
+        Args:
+            texts: 文本列表
+            vectors: 文本向量
+            metadatas: 可选的元数据
+            ids: 可选的ID
+
+        Returns:
+            List[str]: 添加的ID
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        stored, scales = quantize(_normalize(np.asarray(vectors)), self.dtype)
+
+        if self.vectors is None:
+            self.vectors, self.scales = stored, scales
+        else:
+            # memmap加载的索引是只读的，追加时会转为内存中的数组
+            self.vectors = np.concatenate([np.asarray(self.vectors), stored])
+            if scales is not None:
+                self.scales = np.concatenate([np.asarray(self.scales), scales])
+        self.texts.extend(texts)
+        self.metadatas.extend(dict(metadata) for metadata in (metadatas or [{} for _ in texts]))
+        self.ids.extend(ids)
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        """向量化并添加文本，所有文本一次性批量向量化"""
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_vectors(texts, self._embedding.embed_documents(texts), metadatas, kwargs.get("ids"))
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """按ID删除向量"""
+        if not ids:
+            return False
+        remove = set(ids)
+        keep = [i for i, existing in enumerate(self.ids) if existing not in remove]
+        if len(keep) == len(self.ids):
+            return False
+        self.vectors = np.asarray(self.vectors)[keep]
+        if self.scales is not None:
+            self.scales = np.asarray(self.scales)[keep]
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        self.ids = [self.ids[i] for i in keep]
+        return True
+
+    def search_vectors(self, query_vectors, k: int = 4) -> List[List[Tuple[int, float]]]:
+        """
+        批量检索：多条查询共用一次分块矩阵乘法
+
+        Args:
+            query_vectors: 查询向量 (q, d) 或 (d,)
+            k: 每条查询返回的结果数
+
+        Returns:
+            List[List[Tuple[int, float]]]: 每条查询的 (行号, 余弦相似度) 列表，按相似度降序
+        """
+        queries = _normalize(np.asarray(query_vectors))
+        if self.vectors is None or not len(self.texts):
+            return [[] for _ in queries]
+        k = min(k, len(self.texts))
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.texts), SEARCH_BATCH_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BATCH_ROWS], dtype=np.float32)
+            scores = queries @ block.T
+            if self.scales is not None:
+                scores *= np.asarray(self.scales[start:start + SEARCH_BATCH_ROWS])[None, :]
+            # 合并上一块的候选后再取top-k
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(
+                np.arange(start, start + block.shape[0]), (len(queries), block.shape[0])
+            )], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [
+            [(int(row), float(score)) for row, score in zip(rows, scores)]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+    def _to_document(self, row: int) -> Document:
+        return Document(page_content=self.texts[row], metadata=self.metadatas[row])
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        """按向量检索并返回余弦相似度"""
+        return [(self._to_document(row), score) for row, score in self.search_vectors(embedding, k)[0]]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        """按向量检索"""
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        """检索并返回余弦相似度"""
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        """检索与查询最相似的文档"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def batch_similarity_search(self, queries: Sequence[str], k: int = 4) -> List[List[Document]]:
+        """
+        批量检索多条查询，查询一次性向量化，检索共用一次矩阵乘法
+
+        Args:
+            queries: 查询列表
+            k: 每条查询返回的结果数
+
+        Returns:
+            List[List[Document]]: 每条查询的检索结果
+        """
+        if not queries:
+            return []
+        results = self.search_vectors(self._embedding.embed_documents(list(queries)), k)
+        return [[self._to_document(row) for row, _ in result] for result in results]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        dtype: str = DEFAULT_STORAGE_DTYPE,
+        **kwargs: Any
+    ) -> "NumpyVectorStore":
+        """向量化文本并创建向量存储"""
+        store = cls(embedding, dtype=dtype)
+        store.add_texts(texts, metadatas, **kwargs)
+        return store
+
+    @classmethod
+    def from_embeddings(
+        cls,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        dtype: str = DEFAULT_STORAGE_DTYPE,
+        **kwargs: Any
+    ) -> "NumpyVectorStore":
+        """用已经计算好的向量创建向量存储，不再调用嵌入模型"""
+        pairs = list(text_embeddings)
+        store = cls(embedding, dtype=dtype)
+        store.add_vectors([text for text, _ in pairs], [vector for _, vector in pairs], metadatas, kwargs.get("ids"))
+        return store
+
+    def save_local(self, folder_path: str) -> None:
+        """
+        把索引保存到目录：向量和缩放系数为原始二进制文件，文本和元数据为JSON
+
+        Args:
+            folder_path: 目录路径
+        """
+        os.makedirs(folder_path, exist_ok=True)
+        vectors = np.ascontiguousarray(self.vectors) if self.vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        vectors.tofile(os.path.join(folder_path, VECTORS_FILE))
+        if self.scales is not None:
+            np.ascontiguousarray(self.scales, dtype=np.float32).tofile(os.path.join(folder_path, SCALES_FILE))
+        with open(os.path.join(folder_path, INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                'dtype': self.dtype,
+                'shape': list(vectors.shape),
+                'texts': self.texts,
+                'metadatas': self.metadatas,
+                'ids': self.ids
+            }, f, ensure_ascii=False)
+        logger.info(f"NumPy向量存储已保存到 {folder_path}，共 {len(self.texts)} 条，精度 {self.dtype}")
+
+    @classmethod
+    def load_local(cls, folder_path: str, embeddings: Embeddings, mmap: bool = True, **kwargs: Any) -> "NumpyVectorStore":
+        """
+        从目录加载索引，默认通过np.memmap按需读取向量而不是整体读入内存
+
+        Args:
+            folder_path: 目录路径
+            embeddings: 嵌入模型（用于查询向量化）
+            mmap: 是否使用内存映射
+
+        Returns:
+            NumpyVectorStore: 向量存储
+        """
+        with open(os.path.join(folder_path, INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        store = cls(embeddings, dtype=index['dtype'])
+        store.texts, store.metadatas, store.ids = index['texts'], index['metadatas'], index['ids']
+
+        shape = tuple(index['shape'])
+        if store.texts:
+            numpy_dtype = np.dtype(index['dtype'])
+            vectors_path = os.path.join(folder_path, VECTORS_FILE)
+            if mmap:
+                store.vectors = np.memmap(vectors_path, dtype=numpy_dtype, mode='r', shape=shape)
+            else:
+                store.vectors = np.fromfile(vectors_path, dtype=numpy_dtype).reshape(shape)
+            if index['dtype'] == 'int8':
+                scales_path = os.path.join(folder_path, SCALES_FILE)
+                if mmap:
+                    store.scales = np.memmap(scales_path, dtype=np.float32, mode='r', shape=(shape[0],))
+                else:
+                    store.scales = np.fromfile(scales_path, dtype=np.float32)
+        return store
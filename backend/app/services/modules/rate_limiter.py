@@ -0,0 +1,240 @@
+"""
+限流模块 - 进程内按模型自适应调整并发的Bedrock调用限流器
+
+每个模型（或Agent）一个AIMD限流器：调用成功时并发上限缓慢增加（每轮约加1），
+遇到限流时减半，冷却期内的多次限流只减一次；超过上限的调用排队等待并记录等待时间。
+限流错误按带抖动的指数退避重试，突发请求下吞吐稳定在配额附近而不是大量失败
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 每个模型的初始、最小和最大并发数
+BEDROCK_INITIAL_CONCURRENCY = int(os.environ.get('BEDROCK_INITIAL_CONCURRENCY', '8'))
+BEDROCK_MIN_CONCURRENCY = 1
+BEDROCK_MAX_CONCURRENCY = int(os.environ.get('BEDROCK_MAX_CONCURRENCY', '32'))
+
+# 限流后并发上限的缩减比例，以及两次缩减之间的冷却时间（秒）
+AIMD_DECREASE_FACTOR = 0.5
+AIMD_DECREASE_COOLDOWN = 1.0
+
+# 限流时的最大重试次数、初始退避时间和最大退避时间（秒）
+BEDROCK_MAX_RETRIES = int(os.environ.get('BEDROCK_MAX_RETRIES', '6'))
+BEDROCK_RETRY_BASE_DELAY = 0.5
+BEDROCK_RETRY_MAX_DELAY = 20.0
+
+# 排队等待并发槽的超时（秒）
+BEDROCK_QUEUE_TIMEOUT = float(os.environ.get('BEDROCK_QUEUE_TIMEOUT', '300'))
+
+# 表示限流的错误码
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+}
+
+# 需要重试的错误码
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | {
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+}
+
+
+def get_error_code(error: Exception) -> Optional[str]:
+    """取出botocore错误的错误码"""
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return None
+
+
+def is_throttling_error(error: Exception) -> bool:
+    return get_error_code(error) in THROTTLING_ERROR_CODES
+
+
+def is_retryable_error(error: Exception) -> bool:
+    return get_error_code(error) in RETRYABLE_ERROR_CODES
+
+
+class AimdLimiter:
+    """加性增、乘性减地调整并发上限的限流器"""
+
+    def __init__(
+        self,
+        initial_limit: int = BEDROCK_INITIAL_CONCURRENCY,
+        min_limit: int = BEDROCK_MIN_CONCURRENCY,
+        max_limit: int = BEDROCK_MAX_CONCURRENCY,
+        decrease_factor: float = AIMD_DECREASE_FACTOR,
+        cooldown: float = AIMD_DECREASE_COOLDOWN
+    ):
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.waiting = 0
+        self.requests = 0
+        self.throttles = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._last_decrease = float('-inf')
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: float = BEDROCK_QUEUE_TIMEOUT) -> float:
+        """
+        等待并占用一个并发槽
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            float: 排队等待的时间（秒）
+        """
+        started = time.monotonic()
+        with self._condition:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    remaining = timeout - (time.monotonic() - started)
+                    if remaining <= 0 or not self._condition.wait(remaining):
+                        raise Exception(f"等待模型调用并发槽超时（{timeout} 秒）")
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            wait = time.monotonic() - started
+            self.requests += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return wait
+
+    def release(self, throttled: bool = False) -> None:
+        """
+        释放并发槽并调整并发上限
+
+        Args:
+            throttled: 这次调用是否被限流
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttles += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            else:
+                # 每完成约limit次调用上限加1
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前状态和排队统计"""
+        with self._condition:
+            return {
+                'limit': round(self.limit, 2),
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'requests': self.requests,
+                'throttles': self.throttles,
+                'avg_queue_wait_ms': round(self.total_wait / self.requests * 1000, 1) if self.requests else 0.0,
+                'max_queue_wait_ms': round(self.max_wait * 1000, 1)
+            }
+
+
+class BedrockLimiter:
+    """按模型ID（或Agent ID）维护AIMD限流器，并对限流错误退避重试"""
+
+    def __init__(
+        self,
+        max_retries: int = BEDROCK_MAX_RETRIES,
+        base_delay: float = BEDROCK_RETRY_BASE_DELAY,
+        max_delay: float = BEDROCK_RETRY_MAX_DELAY,
+        **limiter_kwargs
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter_kwargs = limiter_kwargs
+        self._limiters: Dict[str, AimdLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> AimdLimiter:
+        """获取某个模型的限流器"""
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = AimdLimiter(**self.limiter_kwargs)
+            return limiter
+
+    def backoff_delay(self, attempt: int) -> float:
+        """全抖动的指数退避时间"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def start(self, key: str, func: Callable, *args, **kwargs) -> Tuple[Any, float]:
+        """
+        占用并发槽后调用func，可重试的错误退避后重试；成功后槽位保持占用，
+        流式响应读完后需要调用finish释放
+
+        Args:
+            key: 模型ID或Agent ID
+            func: 发起请求的函数
+
+        Returns:
+            Tuple[Any, float]: (func的返回值, 累计排队等待时间（秒）)
+        """
+        limiter = self.get(key)
+        queue_wait = 0.0
+        for attempt in range(self.max_retries + 1):
+            queue_wait += limiter.acquire()
+            try:
+                return func(*args, **kwargs), queue_wait
+            except Exception as e:
+                limiter.release(throttled=is_throttling_error(e))
+                if not is_retryable_error(e) or attempt == self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"[LIMITER] {key} 请求被限流 ({get_error_code(e)})，{delay:.2f} 秒后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+
+    def finish(self, key: str, throttled: bool = False) -> None:
+        """释放start占用的并发槽"""
+        self.get(key).release(throttled)
+
+    def call(self, key: str, func: Callable, *args, **kwargs) -> Any:
+        """限流并重试地调用func，返回后立即释放并发槽"""
+        result, _ = self.start(key, func, *args, **kwargs)
+        self.finish(key)
+        return result
+
+    @contextmanager
+    def slot(self, key: str):
+        """在with块内占用一个并发槽（不重试），块内抛出限流错误时缩减并发上限"""
+        limiter = self.get(key)
+        limiter.acquire()
+        throttled = False
+        try:
+            yield
+        except Exception as e:
+            throttled = is_throttling_error(e)
+            raise
+        finally:
+            limiter.release(throttled)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """所有限流器的状态"""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {key: limiter.snapshot() for key, limiter in limiters.items()}
+
+
+# 创建进程内共享的限流器
+bedrock_limiter = BedrockLimiter()
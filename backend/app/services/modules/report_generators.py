@@ -11,6 +11,20 @@ from langchain.schema.messages import HumanMessage
 from app.config.model_config import get_model_config
 from app.services.modules.vector_store import create_vector_store
 from app.services.modules.model_handlers import get_model_for_generation
+from app.services.modules.converse import ConverseChatModel
+from app.services.modules.map_reduce import map_reduce_generate, MAP_REDUCE_CHUNK_SIZE
+from app.services.modules.sectioned_report import generate_sectioned_report
+from app.services.modules.chat_sessions import ChatSession
+from app.services.modules.chunk_selection import select_chunks, SELECTION_STRATEGIES, DEFAULT_SELECTION_STRATEGY
+from app.services.storage import split_content_header
+from app.utils.token_utils import (
+    pack_prompt,
+    fit_prompt,
+    estimate_tokens,
+    get_input_budget,
+    get_chunk_size_chars,
+    REPORT_MIN_OUTPUT_TOKENS
+)
 
 # 初始化日志
 logger = logging.getLogger(__name__)
@@ -98,28 +112,24 @@ def generate_report_with_rag(
             final_prompt = default_prompt
             logger.info("使用默认提示词")
         
-        # 分割文档
-        texts = service_instance.text_splitter.split_text(document)
-        
-        # 创建向量存储
-        try:
-            vectorstore = create_vector_store(texts, service_instance.embeddings)
-        except Exception as e:
-            # 如果创建向量存储失败，返回错误信息
-            logger.error(f"创建向量存储失败: {str(e)}")
-            return f"创建向量存储失败: {str(e)}"
-        
-        # 创建检索器
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
-        
         # 使用传入的模型ID或默认模型ID
         used_model_id = model_id if model_id else service_instance.default_model_id
         logger.info(f"使用模型ID: {used_model_id} 生成报告")
         
+        # 检索相关上下文，并按模型的token预算打包提示词
+        try:
+            retriever, context, vectorstore, max_tokens = prepare_context(
+                service_instance, document, final_prompt, used_model_id
+            )
+        except Exception as e:
+            # 如果创建向量存储或打包提示词失败，返回错误信息
+            logger.error(f"准备上下文失败: {str(e)}")
+            return f"准备上下文失败: {str(e)}"
+        
         # 创建指定模型的LLM实例
         try:
-            # 获取适合的模型
-            llm = get_model_for_generation(service_instance, used_model_id)
+            # 获取适合的模型，输出长度根据提示词大小动态设置
+            llm = get_model_for_generation(service_instance, used_model_id, max_tokens)
             
             # 创建提示模板
             prompt_template = PromptTemplate(
@@ -127,10 +137,6 @@ def generate_report_with_rag(
                 input_variables=["context"]
             )
             
-            # 获取相关上下文
-            docs = retriever.get_relevant_documents(document[:1000])  # 使用文档开头作为查询
-            context = "\n\n".join([doc.page_content for doc in docs])
-            
             # 添加调试日志，显示文档内容的前200个字符
             if context:
                 logger.info(f"成功检索到文档内容，长度: {len(context)} 字符，前200字符预览: {context[:200]}...")
@@ -140,8 +146,8 @@ def generate_report_with_rag(
             # 格式化提示词以便于直接传递给模型
             formatted_prompt = prompt_template.format(context=context)
             
-            # 如果是ChatModel类型模型
-            if "claude-3" in used_model_id and hasattr(llm, "invoke"):
+            # Converse聊天模型（所有Bedrock模型）
+            if isinstance(llm, ConverseChatModel):
                 messages = [HumanMessage(content=formatted_prompt)]
                 response = llm.invoke(messages)
                 report = response.content
@@ -182,28 +188,188 @@ def generate_report_with_rag(
         """
 
 
-def prepare_context(service_instance, document: str) -> tuple:
+def prepare_context(
+    service_instance,
+    document: str,
+    prompt_template: str = "{context}",
+    model_id: Optional[str] = None,
+    strategy: Optional[str] = None
+) -> tuple:
     """
     准备上下文内容
     
+    默认按块向量聚类挑选覆盖整篇文档的代表性块（kmeans或mmr），retrieval策略则以文档开头为查询检索；
+    选中的块装入模型的token预算，元数据头始终保留，超出预算的块被截断或丢弃
+    
     Args:
         service_instance: LangChain服务实例
         document: 文档内容
+        prompt_template: 包含{context}占位符的提示词模板
+        model_id: 可选的模型ID
+        strategy: 可选的块选择策略，默认使用DEFAULT_SELECTION_STRATEGY
         
     Returns:
-        tuple: (检索器, 上下文文本, 向量存储)
+        tuple: (检索器, 上下文文本, 向量存储, 输出token上限)
     """
-    # 分割文档
-    texts = service_instance.text_splitter.split_text(document)
+    used_model_id = model_id if model_id else service_instance.default_model_id
+    strategy = strategy or DEFAULT_SELECTION_STRATEGY
+    if strategy not in SELECTION_STRATEGIES:
+        raise Exception(f"未知的块选择策略: {strategy}，可选: {', '.join(SELECTION_STRATEGIES)}")
+    header, body = split_content_header(document)
     
-    # 创建向量存储
-    vectorstore = create_vector_store(texts, service_instance.embeddings)
+    # 分割文档
+    texts = service_instance.text_splitter.split_text(body)
     
-    # 创建检索器
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
+    if strategy == "retrieval":
+        # 创建向量存储
+        vectorstore = create_vector_store(texts, service_instance.embeddings)
+        retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
+        
+        # 获取相关上下文
+        docs = retriever.get_relevant_documents(body[:1000])  # 使用文档开头作为查询
+        chunks = [doc.page_content for doc in docs]
+    else:
+        # 每个块只向量化一次，向量同时用于聚类和创建向量存储
+        vectors = service_instance.embeddings.embed_documents(texts)
+        vectorstore = create_vector_store(texts, service_instance.embeddings, vectors)
+        retriever = vectorstore.as_retriever(search_kwargs={"k": 5})
+        
+        budget = get_input_budget(used_model_id, REPORT_MIN_OUTPUT_TOKENS) - estimate_tokens(
+            prompt_template.replace("{context}", "") + header, used_model_id
+        )
+        chunks = select_chunks(texts, vectors, budget, used_model_id, strategy)
     
-    # 获取相关上下文
-    docs = retriever.get_relevant_documents(document[:1000])  # 使用文档开头作为查询
-    context = "\n\n".join([doc.page_content for doc in docs])
+    packed = pack_prompt(
+        prompt_template,
+        chunks,
+        used_model_id,
+        header=header,
+        min_output_tokens=REPORT_MIN_OUTPUT_TOKENS
+    )
+    logger.info(f"提示词约 {packed.prompt_tokens} tokens，输出上限 {packed.max_tokens} tokens")
     
-    return retriever, context, vectorstore
+    return retriever, packed.context, vectorstore, packed.max_tokens
+
+
+def generate_report_with_map_reduce(
+    service_instance,
+    document: str,
+    prompt: Optional[str] = None,
+    model_id: Optional[str] = None
+) -> str:
+    """
+    使用分层Map-Reduce生成报告，覆盖整篇文档而不是只保留检索到的前几个块
+
+    Args:
+        service_instance: LangChain服务实例
+        document: 文档内容
+        prompt: 可选的自定义提示词
+        model_id: 可选的模型ID
+
+    Returns:
+        str: 生成的报告内容
+    """
+    # 假的LLM无法生成有意义的摘要，沿用RAG的示例报告
+    if service_instance.use_fake_embeddings:
+        return generate_report_with_rag(service_instance, document, prompt, model_id)
+
+    used_model_id = model_id if model_id else service_instance.default_model_id
+
+    def summarize(text: str) -> str:
+        # 每次调用前按提示词大小设置输出上限，超出预算的输入在发送前截断
+        return invoke_with_budget(service_instance, used_model_id, text)[0]
+
+    def generate_final(combined: str) -> str:
+        # 归约后的摘要已能放入上下文窗口，一次调用生成最终报告
+        final_prompt = prompt or "请根据以下长文档各部分的要点摘要，生成一份结构化的报告。"
+        return summarize(f"{final_prompt}\n\n{combined}")
+
+    chunk_size = min(MAP_REDUCE_CHUNK_SIZE, get_chunk_size_chars(used_model_id))
+    return map_reduce_generate(document, summarize, generate_final, namespace=used_model_id, chunk_size=chunk_size)
+
+
+def invoke_with_budget(service_instance, model_id: str, text: str) -> tuple:
+    """
+    按提示词大小设置输出上限后调用模型
+
+    Args:
+        service_instance: LangChain服务实例
+        model_id: 模型ID
+        text: 完整提示词
+
+    Returns:
+        tuple: (生成文本, 停止原因)，无法获取停止原因时为None
+    """
+    packed = fit_prompt(text, model_id)
+    llm = get_model_for_generation(service_instance, model_id, packed.max_tokens)
+    if isinstance(llm, ConverseChatModel):
+        response = llm.invoke([HumanMessage(content=packed.text)])
+        return response.content, response.response_metadata.get("stop_reason")
+    output = llm.invoke(packed.text) if hasattr(llm, "invoke") else llm(packed.text)
+    return output, None
+
+
+def generate_report_with_sections(
+    service_instance,
+    document: str,
+    prompt: Optional[str] = None,
+    model_id: Optional[str] = None
+) -> str:
+    """
+    先生成大纲，再基于同一份检索上下文并发生成各章节
+
+    Args:
+        service_instance: LangChain服务实例
+        document: 文档内容
+        prompt: 可选的自定义提示词
+        model_id: 可选的模型ID
+
+    Returns:
+        str: 生成的报告内容
+    """
+    # 假的LLM无法生成大纲，沿用RAG的示例报告
+    if service_instance.use_fake_embeddings:
+        return generate_report_with_rag(service_instance, document, prompt, model_id)
+
+    used_model_id = model_id if model_id else service_instance.default_model_id
+    retriever, context, vectorstore, max_tokens = prepare_context(service_instance, document, "{context}", used_model_id)
+
+    return generate_sectioned_report(
+        context,
+        lambda text: invoke_with_budget(service_instance, used_model_id, text),
+        instruction=prompt or ""
+    )
+
+
+def create_chat_session(
+    service_instance,
+    document: str,
+    report_id: str,
+    model_id: Optional[str] = None
+) -> ChatSession:
+    """
+    创建文档问答会话，文档只在此处分块并建立一次向量索引
+
+    Args:
+        service_instance: LangChain服务实例
+        document: 文档内容
+        report_id: 会话所属的报告ID
+        model_id: 可选的模型ID
+
+    Returns:
+        ChatSession: 会话，后续每个问题只需一次检索和一次模型调用
+    """
+    used_model_id = model_id if model_id else service_instance.default_model_id
+    _, body = split_content_header(document)
+
+    texts = service_instance.text_splitter.split_text(body)
+    vectorstore = create_vector_store(texts, service_instance.embeddings)
+    retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
+    logger.info(f"[CHAT] 为报告 {report_id} 建立问答索引，共 {len(texts)} 个块")
+
+    return ChatSession(
+        report_id,
+        lambda query: [doc.page_content for doc in retriever.get_relevant_documents(query)],
+        lambda text: invoke_with_budget(service_instance, used_model_id, text),
+        model_id=used_model_id
+    )
@@ -0,0 +1,271 @@
+"""
+分章节报告生成模块 - 先生成大纲，再并发生成各章节并按顺序拼接
+
+所有章节共享同一份检索/归约后的上下文，墙钟时间约等于最长章节的生成时间；
+章节因输出上限被截断时自动续写
+"""
+
+import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from app.utils.markdown_utils import (
+    parse_section_index,
+    resolve_sections,
+    get_section_body,
+    replace_section_bodies
+)
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 默认章节（与generate_report_with_rag的默认提示词一致）
+DEFAULT_SECTIONS = ["会议摘要", "主要讨论点", "决策和行动项", "后续步骤"]
+
+# 大纲允许的最大章节数
+MAX_SECTIONS = int(os.environ.get('MAX_REPORT_SECTIONS', '8'))
+
+# 并发生成章节的最大线程数
+SECTION_MAX_WORKERS = int(os.environ.get('SECTION_MAX_WORKERS', '4'))
+
+# 单个章节被截断后最多续写的次数
+MAX_SECTION_CONTINUATIONS = int(os.environ.get('MAX_SECTION_CONTINUATIONS', '3'))
+
+# 模型调用函数：输入完整提示词，返回 (生成文本, 停止原因)
+GenerateFn = Callable[[str], Tuple[str, Optional[str]]]
+
+OUTLINE_PROMPT = """请为以下内容规划一份结构化报告的大纲。
+{instruction}
+除非上面的要求另有指定，请使用以下章节：{sections}。
+每个章节输出一行，格式为“章节标题: 本章要点（不超过60字）”，不要输出其他内容。
+
+内容：
+{context}"""
+
+SECTION_PROMPT = """你正在撰写一份结构化报告中的一个章节。
+{instruction}
+完整大纲：
+{outline}
+
+请只撰写章节“{title}”，本章要点：{notes}
+直接输出正文，不要输出章节标题，不要重复其他章节的内容。
+
+内容：
+{context}"""
+
+REGENERATE_SECTION_PROMPT = """你正在修改一份已有报告中的一个章节。
+报告的章节结构：
+{outline}
+
+需要修改的章节“{title}”当前内容：
+{current}
+
+修改要求：{instruction}
+请只输出修改后的章节正文，不要输出章节标题，不要改动其他章节。{heading_rule}
+
+原始内容：
+{context}"""
+
+SUBSECTION_HEADING_RULE = """
+正文中包含以下子章节标题，请按原来的顺序原样保留（包括#号），不要增加、删除或改写标题：
+{headings}"""
+
+# 含子章节的章节重新生成后子章节标题不一致时最多重试的次数
+MAX_HEADING_RETRIES = 1
+
+CONTINUE_PROMPT = """{prompt}
+
+以下是你已经写出的部分，输出因长度限制被截断。请从中断处继续写，不要重复已写的内容：
+
+{written}"""
+
+_OUTLINE_LINE = re.compile(r'^\s*(?:[-*#\d.、)\s]+)?\s*([^:：]{1,40})\s*[:：]\s*(.*)$')
+
+
+def parse_outline(outline_text: str) -> List[Tuple[str, str]]:
+    """
+    解析大纲文本
+
+    Args:
+        outline_text: 模型返回的大纲
+
+    Returns:
+        List[Tuple[str, str]]: (章节标题, 要点) 列表
+    """
+    sections = []
+    seen = set()
+    for line in outline_text.splitlines():
+        match = _OUTLINE_LINE.match(line)
+        if not match:
+            continue
+        title = match.group(1).strip().strip('*').strip()
+        if not title or title in seen:
+            continue
+        seen.add(title)
+        sections.append((title, match.group(2).strip()))
+        if len(sections) >= MAX_SECTIONS:
+            break
+    return sections
+
+
+def generate_outline(
+    generate: GenerateFn,
+    context: str,
+    instruction: str = "",
+    sections: Optional[List[str]] = None
+) -> List[Tuple[str, str]]:
+    """
+    生成报告大纲，解析失败时回退到默认章节
+
+    Args:
+        generate: 模型调用函数
+        context: 共享上下文
+        instruction: 用户的自定义提示词
+        sections: 建议的章节标题
+
+    Returns:
+        List[Tuple[str, str]]: (章节标题, 要点) 列表
+    """
+    sections = sections or DEFAULT_SECTIONS
+    outline_text, _ = generate(OUTLINE_PROMPT.format(
+        instruction=instruction,
+        sections="、".join(sections),
+        context=context
+    ))
+    outline = parse_outline(outline_text)
+    if not outline:
+        logger.warning("[SECTIONS] 无法解析大纲，使用默认章节")
+        outline = [(title, "") for title in sections]
+    return outline
+
+
+def generate_section(
+    generate: GenerateFn,
+    prompt: str,
+    max_continuations: int = MAX_SECTION_CONTINUATIONS
+) -> str:
+    """
+    生成单个章节，输出因max_tokens被截断时自动续写
+
+    Args:
+        generate: 模型调用函数
+        prompt: 章节提示词
+        max_continuations: 最多续写次数
+
+    Returns:
+        str: 章节正文
+    """
+    text, stop_reason = generate(prompt)
+    continuations = 0
+    while stop_reason == 'max_tokens' and continuations < max_continuations:
+        continuations += 1
+        logger.info(f"[SECTIONS] 章节输出被截断，第 {continuations} 次续写")
+        more, stop_reason = generate(CONTINUE_PROMPT.format(prompt=prompt, written=text))
+        text += more
+    return text.strip()
+
+
+def generate_sectioned_report(
+    context: str,
+    generate: GenerateFn,
+    instruction: str = "",
+    sections: Optional[List[str]] = None,
+    max_workers: int = SECTION_MAX_WORKERS,
+    title: str = "报告"
+) -> str:
+    """
+    先生成大纲，再并发生成各章节并按大纲顺序拼接
+
+    Args:
+        context: 所有章节共享的上下文
+        generate: 模型调用函数，返回 (生成文本, 停止原因)
+        instruction: 用户的自定义提示词
+        sections: 建议的章节标题，默认使用DEFAULT_SECTIONS
+        max_workers: 最大并发数
+        title: 报告标题
+
+    Returns:
+        str: Markdown格式的完整报告
+    """
+    outline = generate_outline(generate, context, instruction, sections)
+    outline_text = "\n".join(f"- {name}: {notes}" for name, notes in outline)
+    logger.info(f"[SECTIONS] 大纲包含 {len(outline)} 个章节，开始并发生成，并发数: {max_workers}")
+
+    def build(item: Tuple[str, str]) -> str:
+        name, notes = item
+        return generate_section(generate, SECTION_PROMPT.format(
+            instruction=instruction,
+            outline=outline_text,
+            title=name,
+            notes=notes or "（无）",
+            context=context
+        ))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(outline)))) as executor:
+        bodies = list(executor.map(build, outline))
+
+    parts = [f"# {title}"]
+    for (name, _), body in zip(outline, bodies):
+        parts.append(f"## {name}\n\n{body}")
+    return "\n\n".join(parts) + "\n"
+
+
+def regenerate_sections(
+    report_content: str,
+    context: str,
+    generate: GenerateFn,
+    selectors: Sequence[Union[int, str]],
+    instruction: str = "",
+    max_workers: int = SECTION_MAX_WORKERS
+) -> Tuple[str, List[dict]]:
+    """
+    只重新生成选中的章节，其余内容原样保留
+
+    Args:
+        report_content: 现有报告（Markdown）
+        context: 原始内容（共享上下文）
+        generate: 模型调用函数，返回 (生成文本, 停止原因)
+        selectors: 章节序号或标题
+        instruction: 新的提示词
+        max_workers: 最大并发数
+
+    Returns:
+        Tuple[str, List[dict]]: (更新后的报告, 重新生成的章节)
+    """
+    sections = parse_section_index(report_content)
+    selected = resolve_sections(sections, selectors)
+    outline_text = "\n".join(f"{'  ' * (section['level'] - 1)}- {section['title']}" for section in sections)
+    logger.info(f"[SECTIONS] 重新生成 {len(selected)}/{len(sections)} 个章节")
+
+    def build(section: dict) -> str:
+        current = get_section_body(report_content, section)
+        # 父章节的正文包含子章节，子章节标题必须原样保留，否则章节索引会改变
+        headings = _subsection_headings(current)
+        heading_rule = SUBSECTION_HEADING_RULE.format(headings="\n".join(headings)) if headings else ""
+        prompt = REGENERATE_SECTION_PROMPT.format(
+            outline=outline_text,
+            title=section['title'],
+            current=current or "（空）",
+            instruction=instruction or "改进本章节的内容和表达",
+            heading_rule=heading_rule,
+            context=context
+        )
+        for attempt in range(MAX_HEADING_RETRIES + 1):
+            body = generate_section(generate, prompt)
+            if _subsection_headings(body) == headings:
+                return body
+            logger.warning(f"[SECTIONS] 章节“{section['title']}”的子章节标题发生变化，第 {attempt + 1} 次生成")
+        raise Exception(f"章节“{section['title']}”重新生成后子章节标题发生变化，报告未修改")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(selected)))) as executor:
+        bodies = list(executor.map(build, selected))
+
+    replacements = {section['index']: body for section, body in zip(selected, bodies)}
+    return replace_section_bodies(report_content, replacements, sections), selected
+
+
+def _subsection_headings(body: str) -> List[str]:
+    """章节正文中的子章节标题行（级别和标题），用于校验重新生成后的结构"""
+    return [f"{'#' * section['level']} {section['title']}" for section in parse_section_index(body)]
@@ -2,25 +2,34 @@
 向量存储和嵌入处理模块
 """
 
+import os
 import logging
 import traceback
-from typing import List, Any
+from typing import List, Any, Optional, Sequence
 from langchain.vectorstores import VectorStore
 
 # 初始化日志
 logger = logging.getLogger(__name__)
 
-# 定义向量存储类和其实现
+# 定义向量存储类和其实现（requires为实际运行所需的依赖包，类本身可导入不代表依赖已安装）
 vector_store_options = [
-    {"name": "FAISS", "import_path": "langchain_community.vectorstores.faiss.FAISS"},
-    {"name": "Chroma", "import_path": "langchain_community.vectorstores.chroma.Chroma"},
-    {"name": "DocArray", "import_path": "langchain_community.vectorstores.docarray.DocArrayInMemorySearch"}
+    {"name": "FAISS", "import_path": "langchain_community.vectorstores.faiss.FAISS", "requires": "faiss"},
+    {"name": "Chroma", "import_path": "langchain_community.vectorstores.chroma.Chroma", "requires": "chromadb"},
+    {"name": "DocArray", "import_path": "langchain_community.vectorstores.docarray.DocArrayInMemorySearch", "requires": "docarray"},
+    {"name": "NumPy", "import_path": "app.services.modules.numpy_vector_store.NumpyVectorStore", "requires": None}
 ]
 
+# 可以通过环境变量指定优先使用的实现，例如 VECTOR_STORE_BACKEND=NumPy
+preferred_backend = os.environ.get('VECTOR_STORE_BACKEND')
+if preferred_backend:
+    vector_store_options.sort(key=lambda option: option["name"].lower() != preferred_backend.lower())
+
 # 尝试导入各种向量存储实现
 vector_store_cls = None
 for option in vector_store_options:
     try:
+        if option["requires"]:
+            __import__(option["requires"])
         module_path, class_name = option["import_path"].rsplit('.', 1)
         module = __import__(module_path, fromlist=[class_name])
         vector_store_cls = getattr(module, class_name)
@@ -33,13 +42,14 @@ if vector_store_cls is None:
     logger.error("所有向量存储导入失败，系统将无法正常运行")
 
 
-def create_vector_store(texts: List[str], embeddings: Any) -> VectorStore:
+def create_vector_store(texts: List[str], embeddings: Any, vectors: Optional[Sequence[Sequence[float]]] = None) -> VectorStore:
     """
     创建向量存储
     
     Args:
         texts: 文本列表
         embeddings: 嵌入模型
+        vectors: 可选，已经计算好的文本向量，支持的实现会直接复用而不再调用嵌入模型
         
     Returns:
         VectorStore: 向量存储实例
@@ -52,7 +62,10 @@ def create_vector_store(texts: List[str], embeddings: Any) -> VectorStore:
             raise ImportError("未能找到可用的向量存储实现")
         
         # 使用选定的向量存储类
-        vectorstore = vector_store_cls.from_texts(texts, embeddings)
+        if vectors is not None and hasattr(vector_store_cls, "from_embeddings"):
+            vectorstore = vector_store_cls.from_embeddings(list(zip(texts, vectors)), embeddings)
+        else:
+            vectorstore = vector_store_cls.from_texts(texts, embeddings)
         logger.info(f"成功使用 {vector_store_cls.__name__} 创建向量存储")
         return vectorstore
     except Exception as e:
@@ -3,6 +3,7 @@ import logging
 from typing import Dict, Any, Optional, List
 from app.services.langchain_service import langchain_service
 from app.services.haystack_service import haystack_service
+from app.services.modules.extraction import build_structure
 from app.services.storage import save_report as save_report_to_db
 from app.config.model_config import get_model_config, DEFAULT_MODEL_ID
 
@@ -75,20 +76,16 @@ class ReportGenerator:
         
         構造化データでレポートを強化する
         """
-        # Analyze meeting structure
-        # 会議構造を分析
-        structure = haystack_service.analyze_meeting_structure(content)
-        
-        # Extract entities
-        # エンティティを抽出
-        entities = haystack_service.extract_entities(content)
+        # Analyze structure and entities in one pass
+        # 構造とエンティティを1回の走査で分析
+        analysis = haystack_service.analyze_document(content)
         
         # Return enhanced report
         # 強化されたレポートを返す
         return {
             "report": report,
-            "structure": structure,
-            "entities": entities
+            "structure": build_structure(analysis),
+            "entities": analysis["entities"]
         }
     
     def generate_complete_report(self, content: str, prompt: Optional[str] = None, model_id: Optional[str] = None, use_tools: bool = False) -> Dict[str, Any]:
@@ -100,25 +97,17 @@ class ReportGenerator:
         # 基本レポートを生成
         base_report = self.generate_report(content, prompt, model_id, use_tools)
         
-        # Extract keywords
-        # キーワードを抽出
-        keywords = haystack_service.extract_keywords(content, top_n=15)
-        
-        # Analyze meeting structure
-        # 会議構造を分析
-        structure = haystack_service.analyze_meeting_structure(content)
-        
-        # Extract entities
-        # エンティティを抽出
-        entities = haystack_service.extract_entities(content)
+        # Extract keywords, structure and entities in one pass
+        # キーワード・構造・エンティティを1回の走査で抽出
+        analysis = haystack_service.analyze_document(content, top_n=15, model_id=model_id or self.default_model_id)
         
         # Return complete report
         # 完全なレポートを返す
         return {
             "report": base_report,
-            "keywords": keywords,
-            "structure": structure,
-            "entities": entities,
+            "keywords": analysis["keywords"],
+            "structure": build_structure(analysis),
+            "entities": analysis["entities"],
             "model_id": model_id if model_id else self.default_model_id,
             "prompt": prompt,
             "tools_used": use_tools
@@ -0,0 +1,635 @@
+"""
+跨文档检索服务 - 为所有上传文件和报告维护持久化的IVF近似最近邻索引（语义检索）和倒排索引（BM25关键词检索）
+
+文件和报告保存时在后台增量写入索引：每次写入只追加段文件（向量、倒排分配和元数据；关键词段），
+不需要重建索引；段文件保存在本地目录，并可同步到S3，启动时从段文件恢复索引
+"""
+
+import os
+import json
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+from app.services.langchain_service import langchain_service
+from app.services.modules.ivf_index import IVFIndex
+from app.services.modules.inverted_index import InvertedIndex, Segment, count_terms
+from app.services.modules.embeddings import iter_embeddings
+from app.services.storage import get_s3_client, get_metadata_from_dynamodb, S3_BUCKET_NAME
+from app.utils.chunk_utils import iter_chunks, iter_sentences
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 本地索引目录
+SEARCH_INDEX_DIR = os.environ.get('SEARCH_INDEX_DIR', os.path.join(tempfile.gettempdir(), 'report_search_index'))
+
+# S3同步前缀，为空时只保存在本地
+SEARCH_INDEX_S3_PREFIX = os.environ.get('SEARCH_INDEX_S3_PREFIX', '')
+
+# 段文件数超过该值时合并为一个段
+SEARCH_SEGMENT_COMPACT_THRESHOLD = int(os.environ.get('SEARCH_SEGMENT_COMPACT_THRESHOLD', '256'))
+
+# 索引块的大小和重叠（字符）
+SEARCH_CHUNK_SIZE = 1000
+SEARCH_CHUNK_OVERLAP = 200
+
+# 结果中保存的文本片段长度
+SNIPPET_LENGTH = 200
+
+# 文档类型
+DOCUMENT_TYPES = ('file', 'report')
+
+# 检索模式：semantic（向量）、keyword（BM25）
+SEARCH_MODES = ('semantic', 'keyword')
+
+SEGMENTS_DIR = 'segments'
+KEYWORD_DIR = 'keyword'
+IVF_FILE = 'ivf.npz'
+REMOVED_FILE = 'removed.json'
+KEYWORD_DELETED_FILE = os.path.join(KEYWORD_DIR, 'deleted.json')
+
+
+def parse_timestamp(value: Any, end_of_day: bool = False) -> Optional[float]:
+    """
+    把ISO格式的日期或时间转换为时间戳
+
+    Args:
+        value: 日期字符串（如2024-01-31或2024-01-31T10:00:00），或datetime
+        end_of_day: 只有日期时是否取当天结束时刻（用于date_to）
+
+    Returns:
+        Optional[float]: 时间戳，无法解析时为None
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if end_of_day and len(str(value)) == 10:
+        parsed += timedelta(days=1) - timedelta(microseconds=1)
+    return parsed.timestamp()
+
+
+class _SentenceTap:
+    """把句子流转发给切块器，同时保留文档开头的片段并统计词频（不保留句子本身）"""
+
+    def __init__(self, sentences: Iterator[str]):
+        self._sentences = sentences
+        self.head = ''
+        self.counts: Dict[str, int] = {}
+        self.length = 0
+
+    def __iter__(self) -> Iterator[str]:
+        for sentence in self._sentences:
+            if len(self.head) < SNIPPET_LENGTH:
+                self.head = f"{self.head}\n{sentence}".lstrip('\n')[:SNIPPET_LENGTH]
+            counts, length = count_terms([sentence])
+            for term, count in counts.items():
+                self.counts[term] = self.counts.get(term, 0) + count
+            self.length += length
+            # 换行是句子边界，切块器会按原来的句子重新切分
+            yield sentence + '\n'
+
+
+class SearchService:
+    """跨文档语义检索服务"""
+
+    def __init__(self, index_dir: str = SEARCH_INDEX_DIR, s3_prefix: str = SEARCH_INDEX_S3_PREFIX, embeddings=None):
+        self.index_dir = index_dir
+        self.s3_prefix = s3_prefix.strip('/')
+        self._embeddings = embeddings
+        self.index = IVFIndex()
+        self.keyword_index = InvertedIndex()
+        self.keyword_deleted: List[int] = []
+        self.next_keyword_segment = 0
+        # 每行的元数据: (文档类型, 文档ID, 类别, 时间戳, 文本片段)
+        self.rows: List[tuple] = []
+        self.doc_rows: Dict[tuple, List[int]] = {}
+        self.next_segment = 0
+        self.segment_count = 0
+        self.removed: Dict[str, int] = {}
+        self._filter_arrays = None
+        self._loaded = False
+        self._lock = threading.RLock()
+        # 写入在单线程中串行执行，保证段文件顺序与行号一致
+        self._writer = ThreadPoolExecutor(max_workers=1)
+
+    @property
+    def embeddings(self):
+        return self._embeddings or langchain_service.embeddings
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.index_dir, *parts)
+
+    def _s3_key(self, relative_path: str) -> str:
+        return f"{self.s3_prefix}/{relative_path.replace(os.sep, '/')}"
+
+    def _sync_up(self, relative_path: str) -> None:
+        """把索引文件上传到S3"""
+        if not self.s3_prefix:
+            return
+        try:
+            get_s3_client().upload_file(self._path(relative_path), S3_BUCKET_NAME, self._s3_key(relative_path))
+        except Exception as e:
+            logger.warning(f"[SEARCH] 上传索引文件到S3失败: {relative_path}: {str(e)}")
+
+    def _sync_down(self) -> None:
+        """从S3下载本地缺少的索引文件"""
+        if not self.s3_prefix:
+            return
+        try:
+            s3_client = get_s3_client()
+            paginator = s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=f"{self.s3_prefix}/"):
+                for item in page.get('Contents', []):
+                    relative_path = item['Key'][len(self.s3_prefix) + 1:]
+                    local_path = self._path(*relative_path.split('/'))
+                    if not os.path.exists(local_path) or relative_path == REMOVED_FILE:
+                        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                        s3_client.download_file(S3_BUCKET_NAME, item['Key'], local_path)
+        except Exception as e:
+            logger.warning(f"[SEARCH] 从S3同步索引失败，使用本地索引: {str(e)}")
+
+    def _delete_files(self, relative_paths: List[str]) -> None:
+        """删除本地和S3上的索引文件"""
+        for relative_path in relative_paths:
+            try:
+                os.remove(self._path(relative_path))
+            except OSError:
+                pass
+        if self.s3_prefix and relative_paths:
+            try:
+                get_s3_client().delete_objects(Bucket=S3_BUCKET_NAME, Delete={
+                    'Objects': [{'Key': self._s3_key(path)} for path in relative_paths]
+                })
+            except Exception as e:
+                logger.warning(f"[SEARCH] 删除S3上的索引文件失败: {str(e)}")
+
+    def _segment_files(self, directory_name: str = SEGMENTS_DIR) -> List[str]:
+        directory = self._path(directory_name)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name for name in os.listdir(directory) if name.endswith('.npz'))
+
+    def _ensure_loaded(self) -> None:
+        """首次使用时从段文件恢复索引"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._load()
+            self._loaded = True
+
+    def _load(self) -> None:
+        """从段文件恢复索引（调用方需持有锁）"""
+        self._sync_down()
+        self.index = IVFIndex()
+        self.rows, self.doc_rows = [], {}
+        self._filter_arrays = None
+        if os.path.exists(self._path(REMOVED_FILE)):
+            with open(self._path(REMOVED_FILE), 'r', encoding='utf-8') as f:
+                self.removed = json.load(f)
+
+        segments = self._segment_files()
+        # 恢复期间暂不训练，质心从ivf.npz读取
+        train_threshold = self.index.train_threshold
+        self.index.train_threshold = float('inf')
+        assignments = []
+        for name in segments:
+            segment = int(name.split('.')[0])
+            with np.load(self._path(SEGMENTS_DIR, name)) as data:
+                meta = json.loads(str(data['meta']))
+                self._append_rows(data['vectors'], meta, segment)
+                assignments.append(data['assignments'])
+            self.next_segment = max(self.next_segment, segment + 1)
+        self.segment_count = len(segments)
+        self.index.train_threshold = train_threshold
+
+        if os.path.exists(self._path(IVF_FILE)):
+            with np.load(self._path(IVF_FILE)) as data:
+                centroids, trained = data['centroids'], data['assignments']
+                trained_size = int(data['trained_size']) if 'trained_size' in data else None
+            assigned = np.concatenate(assignments) if assignments else np.zeros(0, dtype=np.int32)
+            # ivf.npz记录的是最近一次训练后的分配，覆盖段文件中按旧质心（或训练前）记录的分配
+            assigned[:len(trained)] = trained[:len(assigned)]
+            if (assigned < 0).any():
+                # 训练前写入、但未记录在ivf.npz中的行重新分配
+                missing = np.flatnonzero(assigned < 0)
+                assigned[missing] = self.index._assign(self.index.get_vectors(missing), centroids)
+            self.index.set_centroids(centroids, assigned)
+            self.index.trained_size = trained_size or self.index.size
+            if self.index.needs_retrain:
+                self.index.train()
+                self._save_ivf()
+        elif self.index.size >= self.index.train_threshold:
+            self._train()
+
+        self._load_keyword_index()
+        logger.info(
+            f"[SEARCH] 已加载检索索引: {len(segments)} 个段，{self.index.live_count} 个有效块，"
+            f"{self.keyword_index.live_count} 个关键词文档"
+        )
+
+    def _load_keyword_index(self) -> None:
+        """从关键词段文件恢复倒排索引（调用方需持有锁）"""
+        self.keyword_index = InvertedIndex()
+        for name in self._segment_files(KEYWORD_DIR):
+            with np.load(self._path(KEYWORD_DIR, name)) as data:
+                segment = Segment.from_arrays(data)
+            segment.name = name
+            self.keyword_index.add_segment(segment)
+            self.next_keyword_segment = max(self.next_keyword_segment, int(name.split('.')[0]) + 1)
+        self.keyword_deleted = []
+        if os.path.exists(self._path(KEYWORD_DELETED_FILE)):
+            with open(self._path(KEYWORD_DELETED_FILE), 'r', encoding='utf-8') as f:
+                self.keyword_deleted = json.load(f)
+            self.keyword_index.delete_doc_nums(self.keyword_deleted)
+
+    def _append_rows(self, vectors: np.ndarray, meta: List[list], segment: int) -> None:
+        """把一个段的向量和元数据加入内存索引，同一文档只保留最新的段"""
+        for doc_type, doc_id in {(row[0], row[1]) for row in meta}:
+            previous = self.doc_rows.pop((doc_type, doc_id), None)
+            if previous:
+                self.index.delete(previous)
+        rows = self.index.add(vectors)
+        for row, item in zip(rows, meta):
+            doc_type, doc_id = item[0], item[1]
+            self.rows.append(tuple(item))
+            self.doc_rows.setdefault((doc_type, doc_id), []).append(int(row))
+            if self.removed.get(f"{doc_type}:{doc_id}", -1) >= segment:
+                self.index.delete([row])
+        self._filter_arrays = None
+
+    def _train(self) -> None:
+        """训练质心并保存，之后新增的段直接记录分配结果"""
+        self.index.train()
+        self._save_ivf()
+
+    def _save_ivf(self, assignments: Optional[np.ndarray] = None) -> None:
+        """保存质心、训练时的向量数和已有行的分配（分配结果优先于段文件中按旧质心记录的分配）"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        if assignments is None:
+            assignments = self.index.assignments[:self.index.size]
+        np.savez(self._path(IVF_FILE), centroids=self.index.centroids, assignments=assignments,
+                 trained_size=np.array(self.index.trained_size))
+        self._sync_up(IVF_FILE)
+
+    def _save_removed(self) -> None:
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self._path(REMOVED_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.removed, f)
+        self._sync_up(REMOVED_FILE)
+
+    def _write_segment(self, segment: int, vectors: np.ndarray, assignments: np.ndarray, meta: List[list]) -> None:
+        relative_path = os.path.join(SEGMENTS_DIR, f"{segment:08d}.npz")
+        os.makedirs(self._path(SEGMENTS_DIR), exist_ok=True)
+        np.savez(self._path(relative_path), vectors=vectors.astype(np.float16),
+                 assignments=assignments.astype(np.int32), meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        self._sync_up(relative_path)
+
+    def _write_keyword_segment(self, segment: Segment) -> None:
+        segment.name = f"{self.next_keyword_segment:08d}.npz"
+        self.next_keyword_segment += 1
+        relative_path = os.path.join(KEYWORD_DIR, segment.name)
+        os.makedirs(self._path(KEYWORD_DIR), exist_ok=True)
+        np.savez(self._path(relative_path), **segment.to_arrays())
+        self._sync_up(relative_path)
+
+    def _save_keyword_deleted(self) -> None:
+        os.makedirs(self._path(KEYWORD_DIR), exist_ok=True)
+        with open(self._path(KEYWORD_DELETED_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.keyword_deleted, f)
+        self._sync_up(KEYWORD_DELETED_FILE)
+
+    def _index_keywords(self, meta: tuple, text: Union[str, tuple]) -> None:
+        """把文档写入倒排索引，并按层级合并关键词段（调用方需持有锁）"""
+        self._write_keyword_segment(self.keyword_index.add_documents([(meta, text)]))
+        merge = self.keyword_index.plan_merge()
+        while merge:
+            merged = self.keyword_index.merge(merge)
+            self._write_keyword_segment(merged)
+            self._delete_files([os.path.join(KEYWORD_DIR, segment.name) for segment in merge])
+            # 合并时已清除的文档不再需要删除记录
+            present = set()
+            for segment in self.keyword_index.segments:
+                present.update(segment.doc_nums.tolist())
+            self.keyword_deleted = [doc_num for doc_num in self.keyword_deleted if doc_num in present]
+            self._save_keyword_deleted()
+            merge = self.keyword_index.plan_merge()
+
+    def index_document(
+        self,
+        doc_type: str,
+        doc_id: str,
+        text: Union[str, Iterable[str]],
+        category: Optional[str] = None,
+        created_at: Any = None,
+        file_id: Optional[str] = None
+    ) -> int:
+        """
+        把文件或报告写入索引，已存在的同一文档会被替换
+
+        文本可以是文本片段的流（如iter_file_text），切块、向量化和词频统计都在一次遍历中按句完成，
+        内存不随文档长度增长
+
+        Args:
+            doc_type: file或report
+            doc_id: 文件ID或报告ID
+            text: 文档文本，或文本片段的流
+            category: 类别，报告为空时沿用源文件的类别
+            created_at: 创建时间（ISO字符串或datetime）
+            file_id: 报告的源文件ID
+
+        Returns:
+            int: 写入的块数
+        """
+        if doc_type not in DOCUMENT_TYPES:
+            raise Exception(f"未知的文档类型: {doc_type}")
+        if isinstance(text, str) and not text.strip():
+            return 0
+        if category is None and file_id:
+            category = (get_metadata_from_dynamodb(file_id) or {}).get('category')
+
+        # 按句遍历一次：句子同时用于统计词频和按需切块向量化，块文本在向量化后只保留片段
+        timestamp = parse_timestamp(created_at) or datetime.now().timestamp()
+        sentences = _SentenceTap(iter_sentences(text))
+        vectors, meta = [], []
+        for chunk, vector in iter_embeddings(self.embeddings, iter_chunks(sentences, SEARCH_CHUNK_SIZE, SEARCH_CHUNK_OVERLAP)):
+            vectors.append(vector)
+            meta.append([doc_type, doc_id, category or '', timestamp, chunk[:SNIPPET_LENGTH]])
+        if not meta:
+            return 0
+        vectors = np.asarray(vectors, dtype=np.float32)
+        term_counts = (sentences.counts, sentences.length)
+
+        self._ensure_loaded()
+        with self._lock:
+            self._store_document(vectors, meta, (doc_type, doc_id, category or '', timestamp, sentences.head), term_counts)
+        self._retrain_if_needed()
+        logger.info(f"[SEARCH] 已索引 {doc_type} {doc_id}: {len(meta)} 个块")
+        return len(meta)
+
+    def _store_document(self, vectors: np.ndarray, meta: List[list], keyword_meta: tuple, term_counts: tuple) -> None:
+        """把一个文档的向量写成新段，并写入倒排索引（调用方需持有锁）"""
+        segment = self.next_segment
+        self.next_segment += 1
+        trained_size = self.index.trained_size
+        self._append_rows(vectors, meta, segment)
+        rows = self.doc_rows[(keyword_meta[0], keyword_meta[1])]
+        if self.index.trained_size != trained_size:
+            self._save_ivf()
+        self._write_segment(segment, vectors, self.index.assignments[rows], meta)
+        self.segment_count += 1
+        self._index_keywords(keyword_meta, term_counts)
+        if self.segment_count > SEARCH_SEGMENT_COMPACT_THRESHOLD:
+            self.compact()
+
+    def alias_document(
+        self,
+        doc_type: str,
+        source_id: str,
+        doc_id: str,
+        category: Optional[str] = None,
+        created_at: Any = None
+    ) -> int:
+        """
+        以新的文档ID复制已索引文档的向量、片段和词频，不重新向量化（用于复用近似重复文件的报告）
+
+        Args:
+            doc_type: file或report
+            source_id: 已索引的文档ID
+            doc_id: 新文档ID
+            category: 类别，为空时沿用源文档的类别
+            created_at: 创建时间（ISO字符串或datetime）
+
+        Returns:
+            int: 复制的块数，源文档不在索引中时为0
+        """
+        self._ensure_loaded()
+        with self._lock:
+            rows = self.doc_rows.get((doc_type, source_id))
+            terms = self.keyword_index.document_terms(doc_type, source_id)
+            if not rows or not terms:
+                logger.info(f"[SEARCH] 源文档 {doc_type} {source_id} 不在索引中，无法复制")
+                return 0
+            source_meta, term_counts = terms
+            category = source_meta[2] if category is None else category
+            timestamp = parse_timestamp(created_at) or datetime.now().timestamp()
+            vectors = self.index.get_vectors(np.asarray(rows))
+            meta = [[doc_type, doc_id, category, timestamp, self.rows[row][4]] for row in rows]
+            self._store_document(vectors, meta, (doc_type, doc_id, category, timestamp, source_meta[4]), term_counts)
+        self._retrain_if_needed()
+        logger.info(f"[SEARCH] 已复制 {doc_type} {source_id} 的索引到 {doc_id}: {len(meta)} 个块")
+        return len(meta)
+
+    def _retrain_if_needed(self) -> None:
+        """
+        索引规模增长到上次训练时的IVF_RETRAIN_FACTOR倍后重新训练质心，避免倒排列表无限变长
+
+        只有写入线程修改索引，训练和重新分配在锁外计算，只在替换倒排列表时持锁，不阻塞检索
+        """
+        if not self.index.needs_retrain:
+            return
+        centroids, assigned = self.index.fit()
+        with self._lock:
+            self.index.set_centroids(centroids, assigned)
+            self._save_ivf()
+
+    def index_document_async(self, *args, **kwargs) -> Future:
+        """在后台写入索引，失败只记录日志，不影响上传或报告生成"""
+        return self._submit(self.index_document, *args, **kwargs)
+
+    def alias_document_async(self, *args, **kwargs) -> Future:
+        """在后台复制已索引文档，失败只记录日志"""
+        return self._submit(self.alias_document, *args, **kwargs)
+
+    def _submit(self, func, *args, **kwargs) -> Future:
+        """在写入线程中执行，保证段文件顺序与行号一致"""
+        def run():
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                logger.warning(f"[SEARCH] 后台索引失败: {str(e)}")
+                return 0
+        return self._writer.submit(run)
+
+    def remove_document(self, doc_type: str, doc_id: str) -> bool:
+        """
+        从索引中删除文档
+
+        Args:
+            doc_type: file或report
+            doc_id: 文档ID
+
+        Returns:
+            bool: 文档是否存在
+        """
+        self._ensure_loaded()
+        with self._lock:
+            doc_num = self.keyword_index.remove_document(doc_type, doc_id)
+            if doc_num is not None:
+                self.keyword_deleted.append(doc_num)
+                self._save_keyword_deleted()
+            rows = self.doc_rows.pop((doc_type, doc_id), None)
+            if not rows:
+                return doc_num is not None
+            self.index.delete(rows)
+            self.removed[f"{doc_type}:{doc_id}"] = self.next_segment - 1
+            self._save_removed()
+            return True
+
+    def compact(self) -> None:
+        """把所有段中的有效行合并为一个段，删除旧段（调用方需持有锁或在写入线程中调用）"""
+        with self._lock:
+            old_segments = self._segment_files()
+            live = np.flatnonzero(~self.index.deleted[:self.index.size])
+            segment = self.next_segment
+            self.next_segment += 1
+            self._write_segment(
+                segment,
+                self.index.get_vectors(live),
+                self.index.assignments[live],
+                [list(self.rows[row]) for row in live]
+            )
+            self._delete_files([os.path.join(SEGMENTS_DIR, name) for name in old_segments])
+            self.removed = {}
+            self._save_removed()
+            # 行号在合并后重新编号，质心不变，只需按新的段重新加载
+            if self.index.trained:
+                self._save_ivf(np.zeros(0, dtype=np.int32))
+            self._load()
+            logger.info(f"[SEARCH] 已合并 {len(old_segments)} 个段，保留 {len(live)} 个块")
+
+    def keyword_statistics(self, terms: List[str]):
+        """
+        从持久化的倒排索引读取各词的文档频率、文档数和总词数，作为关键词打分的语料库
+
+        Args:
+            terms: 词列表
+
+        Returns:
+            tuple: (文档频率数组, 文档数, 总词数)
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return self.keyword_index.corpus_statistics(terms)
+
+    def _get_filter_arrays(self):
+        """缓存类别、类型和时间戳的NumPy数组，用于向量化过滤"""
+        if self._filter_arrays is None or len(self._filter_arrays[0]) != len(self.rows):
+            self._filter_arrays = (
+                np.array([row[0] for row in self.rows], dtype=object),
+                np.array([row[2] for row in self.rows], dtype=object),
+                np.array([row[3] for row in self.rows], dtype=np.float64)
+            )
+        return self._filter_arrays
+
+    def _format_result(self, doc_type, doc_id, category, timestamp, score, snippet) -> Dict[str, Any]:
+        return {
+            'doc_type': doc_type,
+            'doc_id': doc_id,
+            'category': category or None,
+            'created_at': datetime.fromtimestamp(timestamp).isoformat(),
+            'score': round(score, 4),
+            'snippet': snippet
+        }
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        category: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        mode: str = 'semantic'
+    ) -> List[Dict[str, Any]]:
+        """
+        语义检索（每个文档只返回最相关的块）或BM25关键词检索
+
+        Args:
+            query: 查询文本
+            limit: 最多返回的文档数
+            category: 可选的类别过滤
+            doc_type: 可选的文档类型过滤（file或report）
+            date_from: 可选的起始日期（含）
+            date_to: 可选的结束日期（含）
+            mode: semantic或keyword
+
+        Returns:
+            List[Dict[str, Any]]: 检索结果，按相似度（或BM25分数）降序
+        """
+        if mode not in SEARCH_MODES:
+            raise Exception(f"未知的检索模式: {mode}")
+        self._ensure_loaded()
+        start, end = parse_timestamp(date_from), parse_timestamp(date_to, end_of_day=True)
+        if mode == 'keyword':
+            with self._lock:
+                hits = self.keyword_index.search(query, limit, category, doc_type, start, end)
+            return [
+                self._format_result(doc_type_value, doc_id, category_value, timestamp, score, snippet)
+                for (doc_type_value, doc_id, category_value, timestamp, snippet), score in hits
+            ]
+
+        query_vector = self.embeddings.embed_query(query)
+        with self._lock:
+            if not self.rows:
+                return []
+            types, categories, timestamps = self._get_filter_arrays()
+            mask = np.ones(len(self.rows), dtype=bool)
+            if category:
+                mask &= categories == category
+            if doc_type:
+                mask &= types == doc_type
+            if start is not None:
+                mask &= timestamps >= start
+            if end is not None:
+                mask &= timestamps <= end
+
+            # 多取一些块，按文档去重后仍能返回limit个文档
+            hits = self.index.search(query_vector, k=limit * 4, mask=mask)
+            results, seen = [], set()
+            for row, score in hits:
+                doc_type_value, doc_id, category_value, timestamp, snippet = self.rows[row]
+                if (doc_type_value, doc_id) in seen:
+                    continue
+                seen.add((doc_type_value, doc_id))
+                results.append(self._format_result(doc_type_value, doc_id, category_value, timestamp, score, snippet))
+                if len(results) >= limit:
+                    break
+            return results
+
+
+# 创建服务实例
+search_service = SearchService()
+
+
+# 导出函数
+def index_document_async(doc_type, doc_id, text, category=None, created_at=None, file_id=None):
+    """在后台把文件或报告写入检索索引"""
+    return search_service.index_document_async(doc_type, doc_id, text, category, created_at, file_id)
+
+
+def alias_document_async(doc_type, source_id, doc_id, category=None, created_at=None):
+    """在后台以新的文档ID复制已索引文档的向量和词频，不重新向量化"""
+    return search_service.alias_document_async(doc_type, source_id, doc_id, category, created_at)
+
+
+def remove_document_from_index(doc_type, doc_id):
+    """从检索索引中删除文件或报告"""
+    return search_service.remove_document(doc_type, doc_id)
+
+
+def search_documents(query, limit=10, category=None, doc_type=None, date_from=None, date_to=None, mode='semantic'):
+    """跨文档检索（语义或关键词）"""
+    return search_service.search(query, limit, category, doc_type, date_from, date_to, mode)
@@ -1,11 +1,16 @@
 import os
+import time
 import boto3
+from boto3.dynamodb.conditions import Attr, Key
 from botocore.exceptions import ClientError
 from typing import Dict, Any, Optional, List
 import json
 from datetime import datetime
 import logging
 import uuid
+from app.utils.minhash_utils import estimate_similarity
+from app.utils.encoding_utils import decode_stream
+from app.services.text_extraction import extract_text, get_extracted_text_key, is_plain_text, normalize_text
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -15,6 +20,19 @@ S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME', 'report-langchain-haystack-fil
 DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'report')
 AWS_REGION = os.environ.get('AWS_DEFAULT_REGION', 'ap-northeast-1')
 
+# 近似重复文件的相似度阈值（MinHash估算的Jaccard相似度）
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get('NEAR_DUPLICATE_THRESHOLD', '0.8'))
+
+# BatchGetItem单次请求的最大键数
+DYNAMODB_BATCH_GET_LIMIT = 100
+
+# BatchGetItem返回未处理的键时的最大重试次数和退避基数（秒）
+DYNAMODB_BATCH_GET_RETRIES = 5
+DYNAMODB_BATCH_GET_BASE_DELAY = 0.05
+
+# 近似重复检测只需要的元数据字段
+NEAR_DUPLICATE_ATTRIBUTES = ('file_id', 'minhash_signature', 'report_id', 'original_filename')
+
 
 # 本地存储（用于测试）
 local_files = {}
@@ -44,6 +62,10 @@ def get_dynamodb_resource():
     return boto3.resource('dynamodb', region_name=AWS_REGION)
 
 # S3操作函数
+def get_s3_url(s3_key):
+    """获取S3对象的URL"""
+    return f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
+
 def upload_file_to_s3(file, s3_key):
     """上传文件到S3"""
     logger.info(f"S3_BUCKET_NAME环境变量: {S3_BUCKET_NAME}")
@@ -75,24 +97,127 @@ def upload_file_to_s3(file, s3_key):
     try:
         file.seek(0)  # 重置文件指针
         s3_client.upload_fileobj(file, S3_BUCKET_NAME, s3_key)
-        s3_url = f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{s3_key}"
-        return s3_url
+        return get_s3_url(s3_key)
     except ClientError as e:
         logger.error(f"上传文件到S3时出错: {str(e)}")
         raise Exception(f"Error uploading file to S3: {str(e)}")
 
-def get_file_from_s3(s3_key):
+def read_text_from_s3(s3_key, encoding=None):
+    """从S3流式读取文本文件，返回 (文本, 编码)
+
+    未指定编码时只根据开头的样本检测编码，对象只读取一次并增量解码
+    """
+
+    s3_client = get_s3_client()
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
+        detected, pieces = decode_stream(response['Body'].iter_chunks(), encoding)
+        return ''.join(pieces), detected
+    except ClientError as e:
+        logger.error(f"从S3获取文件时出错: {str(e)}")
+        raise Exception(f"Error getting file from S3: {str(e)}")
+
+def get_file_from_s3(s3_key, encoding=None):
     """从S3获取文件内容"""
 
-    
+    text, _ = read_text_from_s3(s3_key, encoding)
+    return text
+
+def get_file_bytes_from_s3(s3_key):
+    """从S3获取文件原始字节"""
+
     s3_client = get_s3_client()
     try:
         response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=s3_key)
-        return response['Body'].read().decode('utf-8')
+        return response['Body'].read()
     except ClientError as e:
         logger.error(f"从S3获取文件时出错: {str(e)}")
         raise Exception(f"Error getting file from S3: {str(e)}")
 
+def save_extracted_text(file_id, text):
+    """保存抽取出的规范化文本到S3旁路对象，返回S3键"""
+
+    s3_client = get_s3_client()
+    s3_key = get_extracted_text_key(file_id)
+    try:
+        s3_client.put_object(
+            Bucket=S3_BUCKET_NAME,
+            Key=s3_key,
+            Body=text.encode('utf-8'),
+            ContentType='text/plain; charset=utf-8'
+        )
+        return s3_key
+    except ClientError as e:
+        logger.error(f"保存抽取文本到S3时出错: {str(e)}")
+        raise Exception(f"Error saving extracted text to S3: {str(e)}")
+
+def iter_file_text(metadata):
+    """流式读取文件的规范化文本，返回文本片段的迭代器
+
+    有旁路文本对象时边下载边解码，不在内存中保存整个文件；没有时退回get_file_text。
+    S3请求在第一次迭代时才发出，可以交给后台线程消费
+    """
+    extracted_key = metadata.get('extracted_s3_key')
+    if not extracted_key:
+        yield get_file_text(metadata)
+        return
+
+    s3_client = get_s3_client()
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=extracted_key)
+    except ClientError as e:
+        logger.error(f"从S3获取文件时出错: {str(e)}")
+        raise Exception(f"Error getting file from S3: {str(e)}")
+    _, pieces = decode_stream(response['Body'].iter_chunks(), 'utf-8')
+    try:
+        yield from pieces
+    finally:
+        response['Body'].close()
+
+def read_text_prefix(metadata, max_chars):
+    """只读取文件规范化文本的前max_chars个字符，读够后立即关闭流"""
+    pieces, total = [], 0
+    stream = iter_file_text(metadata)
+    try:
+        for piece in stream:
+            pieces.append(piece[:max_chars - total])
+            total += len(pieces[-1])
+            if total >= max_chars:
+                break
+    finally:
+        stream.close()
+    return ''.join(pieces)
+
+def get_file_text(metadata):
+    """获取文件的规范化文本
+
+    优先读取上传时生成的旁路文本对象；旧文件没有旁路对象时，
+    抽取一次并回写旁路对象和元数据，之后的读取不再重复抽取
+    """
+    extracted_key = metadata.get('extracted_s3_key')
+    if extracted_key:
+        return get_file_from_s3(extracted_key, 'utf-8')
+
+    file_id = metadata['file_id']
+    filename = metadata.get('original_filename', '')
+    logger.info(f"[获取文件内容] 文件 {file_id} 没有旁路文本，开始抽取")
+    if is_plain_text(filename):
+        # 纯文本直接流式解码，并缓存检测到的编码
+        content, encoding = read_text_from_s3(metadata['s3_key'], metadata.get('encoding'))
+        content = normalize_text(content)
+        metadata['encoding'] = encoding
+    else:
+        content = extract_text(get_file_bytes_from_s3(metadata['s3_key']), filename)
+
+    try:
+        metadata['extracted_s3_key'] = save_extracted_text(file_id, content)
+        metadata['text_length'] = len(content)
+        update_metadata_in_dynamodb(metadata)
+    except Exception as e:
+        logger.warning(f"[获取文件内容] 回写旁路文本失败: {str(e)}")
+
+    return content
+
 def delete_file_from_s3(s3_key):
     """从S3删除文件"""
 
@@ -159,6 +284,37 @@ def get_metadata_from_dynamodb(file_id):
         logger.error(f"从DynamoDB获取元数据时出错: {str(e)}")
         raise Exception(f"Error getting metadata from DynamoDB: {str(e)}")
 
+def batch_get_metadata_from_dynamodb(file_ids, attributes=None):
+    """用BatchGetItem批量获取元数据，返回 file_id -> 元数据；attributes为空时返回所有字段"""
+
+    dynamodb = get_dynamodb_resource()
+    table_name = "report_files"  # 与get_metadata_from_dynamodb使用同一张表
+    file_ids = list(dict.fromkeys(file_ids))
+    items = {}
+
+    try:
+        for start in range(0, len(file_ids), DYNAMODB_BATCH_GET_LIMIT):
+            keys_and_attributes = {'Keys': [{'file_id': file_id} for file_id in file_ids[start:start + DYNAMODB_BATCH_GET_LIMIT]]}
+            if attributes:
+                # 用占位符引用字段名，避免与DynamoDB保留字冲突
+                names = {f"#a{i}": attribute for i, attribute in enumerate(attributes)}
+                keys_and_attributes.update(ProjectionExpression=', '.join(names), ExpressionAttributeNames=names)
+            request_items = {table_name: keys_and_attributes}
+            for attempt in range(DYNAMODB_BATCH_GET_RETRIES + 1):
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(table_name, []):
+                    items[item['file_id']] = item
+                request_items = response.get('UnprocessedKeys')
+                if not request_items:
+                    break
+                if attempt == DYNAMODB_BATCH_GET_RETRIES:
+                    raise Exception(f"BatchGetItem still has unprocessed keys after {DYNAMODB_BATCH_GET_RETRIES} retries")
+                time.sleep(DYNAMODB_BATCH_GET_BASE_DELAY * (2 ** attempt))
+        return items
+    except ClientError as e:
+        logger.error(f"从DynamoDB批量获取元数据时出错: {str(e)}")
+        raise Exception(f"Error batch getting metadata from DynamoDB: {str(e)}")
+
 def update_metadata_in_dynamodb(metadata):
     """更新DynamoDB中的元数据"""
 
@@ -196,7 +352,7 @@ def list_files_from_dynamodb(category=None, limit=50, last_evaluated_key=None):
     }
     
     if category:
-        scan_kwargs['FilterExpression'] = boto3.dynamodb.conditions.Attr('category').eq(category)
+        scan_kwargs['FilterExpression'] = Attr('category').eq(category)
     
     if last_evaluated_key:
         scan_kwargs['ExclusiveStartKey'] = {'file_id': last_evaluated_key}
@@ -208,6 +364,104 @@ def list_files_from_dynamodb(category=None, limit=50, last_evaluated_key=None):
         logger.error(f"从DynamoDB列出文件时出错: {str(e)}")
         raise Exception(f"Error listing files from DynamoDB: {str(e)}")
 
+def save_lsh_index_entries(file_id, band_keys):
+    """保存文件的LSH分桶键到近似重复索引表"""
+
+    dynamodb = get_dynamodb_resource()
+    table_name = f"{DYNAMODB_TABLE}_lsh_index"
+
+    # 检查表是否存在，如果不存在则创建
+    try:
+        dynamodb_client = get_dynamodb_client()
+        dynamodb_client.describe_table(TableName=table_name)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceNotFoundException':
+            logger.info(f"DynamoDB表 {table_name} 不存在，正在创建...")
+            try:
+                dynamodb_client.create_table(
+                    TableName=table_name,
+                    KeySchema=[
+                        {'AttributeName': 'band_key', 'KeyType': 'HASH'},
+                        {'AttributeName': 'file_id', 'KeyType': 'RANGE'}
+                    ],
+                    AttributeDefinitions=[
+                        {'AttributeName': 'band_key', 'AttributeType': 'S'},
+                        {'AttributeName': 'file_id', 'AttributeType': 'S'}
+                    ],
+                    ProvisionedThroughput={'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5}
+                )
+                waiter = dynamodb_client.get_waiter('table_exists')
+                waiter.wait(TableName=table_name)
+                logger.info(f"DynamoDB表 {table_name} 创建成功")
+            except ClientError as create_error:
+                logger.error(f"创建DynamoDB表失败: {str(create_error)}")
+                raise Exception(f"Error creating DynamoDB table: {str(create_error)}")
+        else:
+            logger.error(f"检查DynamoDB表时出错: {str(e)}")
+            raise Exception(f"Error checking DynamoDB table: {str(e)}")
+
+    table = dynamodb.Table(table_name)
+
+    try:
+        with table.batch_writer() as batch:
+            for band_key in band_keys:
+                batch.put_item(Item={'band_key': band_key, 'file_id': file_id})
+        return True
+    except ClientError as e:
+        logger.error(f"保存LSH索引时出错: {str(e)}")
+        raise Exception(f"Error saving LSH index to DynamoDB: {str(e)}")
+
+def find_near_duplicate_files(file_metadata, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """查找与指定文件近似重复的已上传文件
+
+    通过LSH分桶键查询候选文件（分页读取每个分桶），再批量读取候选的MinHash签名估算相似度，
+    返回相似度不低于阈值的文件列表（按相似度降序）
+    """
+    signature = file_metadata.get('minhash_signature')
+    band_keys = file_metadata.get('lsh_bands')
+    file_id = file_metadata.get('file_id')
+    if not signature or not band_keys:
+        return []
+
+    dynamodb = get_dynamodb_resource()
+    table = dynamodb.Table(f"{DYNAMODB_TABLE}_lsh_index")
+
+    # 收集候选文件
+    candidate_ids = set()
+    try:
+        for band_key in band_keys:
+            query_kwargs = {'KeyConditionExpression': Key('band_key').eq(band_key), 'ProjectionExpression': 'file_id'}
+            while True:
+                response = table.query(**query_kwargs)
+                for item in response.get('Items', []):
+                    if item['file_id'] != file_id:
+                        candidate_ids.add(item['file_id'])
+                if 'LastEvaluatedKey' not in response:
+                    break
+                query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except ClientError as e:
+        logger.error(f"查询LSH索引时出错: {str(e)}")
+        raise Exception(f"Error querying LSH index: {str(e)}")
+
+    # 用签名估算相似度，过滤掉LSH误报
+    candidates = batch_get_metadata_from_dynamodb(sorted(candidate_ids), NEAR_DUPLICATE_ATTRIBUTES)
+    duplicates = []
+    for candidate_id, candidate in candidates.items():
+        if not candidate.get('minhash_signature'):
+            continue
+        similarity = estimate_similarity(signature, candidate['minhash_signature'])
+        if similarity >= threshold:
+            duplicates.append({
+                'file_id': candidate_id,
+                'similarity': round(similarity, 4),
+                'report_id': candidate.get('report_id'),
+                'original_filename': candidate.get('original_filename')
+            })
+
+    duplicates.sort(key=lambda d: d['similarity'], reverse=True)
+    logger.info(f"文件 {file_id} 找到 {len(duplicates)} 个近似重复文件")
+    return duplicates
+
 def save_report(file_id: str, report_content: str) -> Dict[str, Any]:
     """保存报告到S3和DynamoDB"""
     try:
@@ -351,6 +605,40 @@ def delete_report_from_dynamodb(report_id):
         logger.error(f"从DynamoDB删除报告时出错: {str(e)}")
         raise Exception(f"Error deleting report from DynamoDB: {str(e)}")
 
+# 元数据头与文件正文之间的分隔标记
+CONTENT_HEADER_MARKER = "# 文件内容\n"
+
+def split_content_header(content):
+    """将带元数据头的文件内容拆分为 (元数据头, 正文)，没有元数据头时元数据头为空字符串"""
+    if content and content.startswith("# 文件元数据"):
+        index = content.find(CONTENT_HEADER_MARKER)
+        if index != -1:
+            index += len(CONTENT_HEADER_MARKER)
+            return content[:index], content[index:]
+    return "", content
+
+def build_content_with_header(file_id, metadata, content):
+    """为文件内容添加元数据头，帮助模型识别这是一个文件"""
+    original_filename = metadata.get('original_filename', '未知文件名')
+    file_type = metadata.get('file_type', '未知文件类型')
+    category = metadata.get('category', '未分类')
+    
+    # 去除文件内容开头的可能的UTF-8 BOM
+    if content and content.startswith('\ufeff'):
+        content = content[1:]
+        
+    # 添加文件元数据头
+    metadata_header = f"""# 文件元数据
+文件名: {original_filename}
+文件类型: {file_type}
+分类: {category}
+文件ID: {file_id}
+
+{CONTENT_HEADER_MARKER}"""
+    
+    # 将元数据头添加到内容开头
+    return metadata_header + content
+
 def get_file_content_by_id(file_id):
     """通过文件ID获取文件内容"""
     try:
@@ -370,38 +658,15 @@ def get_file_content_by_id(file_id):
             logger.error(f"[获取文件内容] 元数据中找不到S3键，文件ID: {file_id}")
             return None
             
-        logger.info(f"[获取文件内容] 正在从S3获取文件: {s3_key}")
+        logger.info(f"[获取文件内容] 正在从S3获取文件: {metadata.get('extracted_s3_key', s3_key)}")
         
-        # 从S3获取文件内容
+        # 从S3获取文件的规范化文本
         try:
-            content = get_file_from_s3(s3_key)
+            content = get_file_text(metadata)
             content_length = len(content) if content else 0
             logger.info(f"[获取文件内容] 成功从S3获取文件内容，长度: {content_length} 字节")
             
-            # 添加设置上下文表示这是从文件脚加载的内容
-            # 创建一个内容的标记头，帮助模型识别这是一个文件
-            original_filename = metadata.get('original_filename', '未知文件名')
-            file_type = metadata.get('file_type', '未知文件类型')
-            category = metadata.get('category', '未分类')
-            
-            # 去除文件内容开头的可能的UTF-8 BOM
-            if content and content.startswith('\ufeff'):
-                content = content[1:]
-                
-            # 添加文件元数据头
-            metadata_header = f"""# 文件元数据
-文件名: {original_filename}
-文件类型: {file_type}
-分类: {category}
-文件ID: {file_id}
-
-# 文件内容
-"""
-            
-            # 将元数据头添加到内容开头
-            content_with_header = metadata_header + content
-            
-            return content_with_header
+            return build_content_with_header(file_id, metadata, content)
         except Exception as s3_error:
             logger.error(f"[获取文件内容] 从S3获取文件内容时出错: {str(s3_error)}")
             return None
@@ -0,0 +1,426 @@
+"""
+文本抽取模块 - 在上传时将PDF/DOCX/DOC等文件转换为规范化文本
+
+抽取在进程池中执行，结果作为旁路（sidecar）文本对象保存到S3，
+之后所有读取方都直接使用该文本，抽取成本每个文件只需支付一次
+"""
+
+import io
+import os
+import re
+import struct
+import logging
+import time
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from typing import Optional, Iterator, List
+
+from app.utils.encoding_utils import detect_encoding, DETECTION_SAMPLE_SIZE
+
+# 初始化日志
+logger = logging.getLogger(__name__)
+
+# 抽取进程池的工作进程数
+EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# 等待抽取结果的超时时间（秒）
+EXTRACTION_TIMEOUT = int(os.environ.get('EXTRACTION_TIMEOUT', '300'))
+
+# 旁路文本对象的S3前缀
+EXTRACTED_TEXT_PREFIX = 'extracted/'
+
+# PDF并行抽取时每个任务处理的最大页数
+PDF_PAGES_PER_TASK = int(os.environ.get('PDF_PAGES_PER_TASK', '16'))
+
+# DOC文件FIB中ccpText在FibRgLw里的序号、fcClx/lcbClx在FibRgFcLcb里的序号，以及Word 97的最小nFib
+DOC_CCP_TEXT_INDEX = 3
+DOC_CLX_INDEX = 33
+DOC_MIN_FIB_VERSION = 0x00C1
+
+# DOC正文中的控制字符：段落、单元格、换行、分页和特殊连字符转换为普通文本，对象占位符删除
+DOC_CONTROL_CHARS = {
+    0x07: '\t', 0x0B: '\n', 0x0C: '\n', 0x0D: '\n',
+    0x1E: '-', 0x1F: None, 0x01: None, 0x08: None, 0x05: None
+}
+
+# 单页PDF抽取结果：页码（从1开始）、文本、耗时（秒）
+PageText = namedtuple('PageText', ['page_number', 'text', 'seconds'])
+
+_extraction_pool = None
+_dispatch_executor = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """
+    获取（按需创建）抽取进程池
+
+    Returns:
+        ProcessPoolExecutor: 进程池实例
+    """
+    global _extraction_pool
+    if _extraction_pool is None:
+        with _pool_lock:
+            if _extraction_pool is None:
+                _extraction_pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS)
+                logger.info(f"创建文本抽取进程池，工作进程数: {EXTRACTION_WORKERS}")
+    return _extraction_pool
+
+
+def get_dispatch_executor() -> ThreadPoolExecutor:
+    """
+    获取（按需创建）用于调度PDF分页任务的线程池
+
+    PDF的分页任务由父进程调度到进程池，避免在工作进程中嵌套创建进程池
+
+    Returns:
+        ThreadPoolExecutor: 线程池实例
+    """
+    global _dispatch_executor
+    if _dispatch_executor is None:
+        with _pool_lock:
+            if _dispatch_executor is None:
+                _dispatch_executor = ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS)
+    return _dispatch_executor
+
+
+def get_extracted_text_key(file_id: str) -> str:
+    """
+    获取文件旁路文本对象的S3键
+
+    Args:
+        file_id: 文件ID
+
+    Returns:
+        str: S3键
+    """
+    return f"{EXTRACTED_TEXT_PREFIX}{file_id}.txt"
+
+
+def normalize_text(text: str) -> str:
+    """
+    规范化抽取出的文本：去除BOM和NUL字符、统一换行符、压缩多余空行
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        str: 规范化后的文本
+    """
+    if not text:
+        return ""
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    text = text.replace('\r\n', '\n').replace('\r', '\n').replace('\x00', '')
+    text = re.sub(r'[ \t]+\n', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def _extract_pdf(data: bytes) -> str:
+    """在当前进程中顺序抽取PDF文本"""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    pages = [page.extract_text() or '' for page in reader.pages]
+    return '\n\n'.join(pages)
+
+
+def _extract_pdf_page_range(path: str, start: int, end: int) -> List[PageText]:
+    """
+    抽取PDF指定页码范围的文本（在工作进程中执行）
+
+    Args:
+        path: PDF临时文件路径
+        start: 起始页索引（包含）
+        end: 结束页索引（不包含）
+
+    Returns:
+        List[PageText]: 各页的文本和耗时
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    results = []
+    for index in range(start, end):
+        started = time.perf_counter()
+        text = reader.pages[index].extract_text() or ''
+        results.append(PageText(index + 1, text, time.perf_counter() - started))
+    return results
+
+
+def iter_pdf_pages(data: bytes) -> Iterator[PageText]:
+    """
+    按页码范围将PDF抽取任务分发到进程池，并按页码顺序流式返回各页文本
+
+    Args:
+        data: PDF文件字节
+
+    Yields:
+        PageText: 单页的页码、文本和耗时
+    """
+    from PyPDF2 import PdfReader
+
+    page_count = len(PdfReader(io.BytesIO(data)).pages)
+    if page_count == 0:
+        return
+
+    # 每个工作进程分到约两个任务，兼顾负载均衡和调度开销
+    pages_per_task = max(1, min(PDF_PAGES_PER_TASK, -(-page_count // (EXTRACTION_WORKERS * 2))))
+
+    # 写入临时文件，避免向每个任务重复传输整个PDF
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+        pool = get_extraction_pool()
+        futures = [
+            pool.submit(_extract_pdf_page_range, path, start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)
+        ]
+        try:
+            for future in futures:
+                yield from future.result(timeout=EXTRACTION_TIMEOUT)
+        finally:
+            for future in futures:
+                future.cancel()
+    finally:
+        os.unlink(path)
+
+
+def extract_pdf_text(data: bytes) -> str:
+    """
+    并行抽取PDF文本，并记录每页耗时
+
+    Args:
+        data: PDF文件字节
+
+    Returns:
+        str: 规范化后的文本
+    """
+    started = time.perf_counter()
+    pages = []
+    slowest = None
+    total_seconds = 0.0
+    for page in iter_pdf_pages(data):
+        logger.debug(f"PDF第 {page.page_number} 页抽取耗时: {page.seconds:.3f} 秒")
+        pages.append(page.text)
+        total_seconds += page.seconds
+        if slowest is None or page.seconds > slowest.seconds:
+            slowest = page
+
+    if slowest:
+        logger.info(
+            f"PDF抽取完成，共 {len(pages)} 页，墙钟耗时: {time.perf_counter() - started:.2f} 秒，"
+            f"累计页耗时: {total_seconds:.2f} 秒，最慢页: 第 {slowest.page_number} 页 ({slowest.seconds:.3f} 秒)"
+        )
+    return normalize_text('\n\n'.join(pages))
+
+
+def _extract_docx(data: bytes) -> str:
+    """抽取DOCX文本"""
+    import docx2txt
+
+    return docx2txt.process(io.BytesIO(data))
+
+
+def _read_doc_piece_table(word_document: bytes, table: bytes) -> List[tuple]:
+    """
+    读取Word 97以后二进制格式的片段表（Clx中的PlcPcd）
+
+    Returns:
+        List[tuple]: 各片段的 (起始CP, 结束CP, 文件偏移, 是否为8位压缩编码)
+    """
+    fc_clx, lcb_clx = struct.unpack_from('<II', word_document, _doc_fc_lcb_offset(word_document) + DOC_CLX_INDEX * 8)
+    clx = table[fc_clx:fc_clx + lcb_clx]
+    position = 0
+    # 跳过Prc（格式属性），找到Pcdt
+    while position < len(clx) and clx[position] == 0x01:
+        position += 3 + struct.unpack_from('<h', clx, position + 1)[0]
+    if position >= len(clx) or clx[position] != 0x02:
+        raise Exception("DOC文件的片段表格式无效")
+    lcb = struct.unpack_from('<I', clx, position + 1)[0]
+    plc = clx[position + 5:position + 5 + lcb]
+
+    count = (len(plc) - 4) // 12
+    cps = struct.unpack_from(f'<{count + 1}I', plc, 0)
+    pieces = []
+    for index in range(count):
+        fc = struct.unpack_from('<I', plc, (count + 1) * 4 + index * 8 + 2)[0]
+        compressed = bool(fc & 0x40000000)
+        fc &= 0x3FFFFFFF
+        pieces.append((cps[index], cps[index + 1], fc // 2 if compressed else fc, compressed))
+    return pieces
+
+
+def _doc_fib_rg_lw_offset(word_document: bytes) -> int:
+    """FIB中FibRgLw97的偏移（FibBase之后是长度可变的FibRgW97）"""
+    csw = struct.unpack_from('<H', word_document, 32)[0]
+    return 34 + csw * 2 + 2
+
+
+def _doc_fc_lcb_offset(word_document: bytes) -> int:
+    """FIB中FibRgFcLcb的偏移"""
+    fib_rg_lw = _doc_fib_rg_lw_offset(word_document)
+    cslw = struct.unpack_from('<H', word_document, fib_rg_lw - 2)[0]
+    return fib_rg_lw + cslw * 4 + 2
+
+
+def _strip_doc_fields(text: str) -> str:
+    """只保留域的显示结果（域代码位于0x13和0x14之间，结果位于0x14和0x15之间）"""
+    output = []
+    # 栈中记录各层域当前是否处于代码部分
+    in_code = []
+    for char in text:
+        if char == '\x13':
+            in_code.append(True)
+        elif char == '\x14':
+            if in_code:
+                in_code[-1] = False
+        elif char == '\x15':
+            if in_code:
+                in_code.pop()
+        elif not any(in_code):
+            output.append(char)
+    return ''.join(output)
+
+
+def _extract_doc(data: bytes) -> str:
+    """
+    抽取旧版Word二进制（.doc，Word 97及以后）正文文本
+
+    通过olefile读取WordDocument和表格流，按片段表拼接正文，
+    加密文件和Word 95以前的格式直接报错
+    """
+    import olefile
+
+    if not olefile.isOleFile(data=data):
+        raise Exception("不是有效的DOC文件（非OLE复合文档）")
+    with olefile.OleFileIO(io.BytesIO(data)) as ole:
+        if not ole.exists('WordDocument'):
+            raise Exception("不是有效的DOC文件（缺少WordDocument流）")
+        word_document = ole.openstream('WordDocument').read()
+        ident, n_fib = struct.unpack_from('<HH', word_document, 0)
+        flags = struct.unpack_from('<H', word_document, 10)[0]
+        if ident != 0xA5EC or n_fib < DOC_MIN_FIB_VERSION:
+            raise Exception("不支持Word 97之前的DOC格式，请另存为DOCX后上传")
+        if flags & 0x0100:
+            raise Exception("不支持加密的DOC文件")
+        table_name = '1Table' if flags & 0x0200 else '0Table'
+        if not ole.exists(table_name):
+            raise Exception(f"DOC文件缺少{table_name}流")
+        table = ole.openstream(table_name).read()
+
+    return _decode_doc_text(word_document, table)
+
+
+def _decode_doc_text(word_document: bytes, table: bytes) -> str:
+    """按片段表拼接正文（不含脚注、页眉等），去除域代码和控制字符"""
+    ccp_text = struct.unpack_from('<i', word_document, _doc_fib_rg_lw_offset(word_document) + DOC_CCP_TEXT_INDEX * 4)[0]
+    parts = []
+    for start_cp, end_cp, offset, compressed in _read_doc_piece_table(word_document, table):
+        if start_cp >= ccp_text:
+            break
+        length = min(end_cp, ccp_text) - start_cp
+        if compressed:
+            parts.append(word_document[offset:offset + length].decode('cp1252', errors='replace'))
+        else:
+            parts.append(word_document[offset:offset + length * 2].decode('utf-16-le', errors='replace'))
+    return _strip_doc_fields(''.join(parts)).translate(DOC_CONTROL_CHARS)
+
+
+def _decode_text(data: bytes, encoding: Optional[str] = None) -> str:
+    """
+    解码纯文本文件
+
+    未指定编码时仅根据文件开头的样本检测编码（Shift-JIS、GBK、UTF-16等）
+    """
+    encoding = encoding or detect_encoding(data[:DETECTION_SAMPLE_SIZE])
+    return data.decode(encoding, errors='replace')
+
+
+_EXTRACTORS = {
+    'pdf': _extract_pdf,
+    'docx': _extract_docx,
+    'doc': _extract_doc,
+}
+
+
+def _get_extension(filename: str) -> str:
+    """获取小写的文件扩展名（不含点）"""
+    return filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+
+
+def is_plain_text(filename: str) -> bool:
+    """判断文件是否按纯文本解码（没有专用抽取器的类型）"""
+    return _get_extension(filename) not in _EXTRACTORS
+
+
+def detect_file_encoding(data: bytes, filename: str) -> Optional[str]:
+    """
+    检测纯文本文件的编码，只读取开头的样本
+
+    Args:
+        data: 文件字节
+        filename: 文件名
+
+    Returns:
+        Optional[str]: 编码名称，非纯文本文件返回None
+    """
+    if not is_plain_text(filename):
+        return None
+    return detect_encoding(data[:DETECTION_SAMPLE_SIZE])
+
+
+def extract_text_from_bytes(data: bytes, filename: str, encoding: Optional[str] = None) -> str:
+    """
+    根据文件扩展名从文件字节中抽取规范化文本（在工作进程中执行）
+
+    Args:
+        data: 文件字节
+        filename: 文件名（用于判断文件类型）
+        encoding: 纯文本文件的编码，为空时自动检测
+
+    Returns:
+        str: 规范化后的文本
+    """
+    extension = _get_extension(filename)
+    if extension in _EXTRACTORS:
+        return normalize_text(_EXTRACTORS[extension](data))
+    return normalize_text(_decode_text(data, encoding))
+
+
+def submit_extraction(data: bytes, filename: str, encoding: Optional[str] = None) -> Future:
+    """
+    提交抽取任务到进程池
+
+    Args:
+        data: 文件字节
+        filename: 文件名
+        encoding: 纯文本文件的编码，为空时自动检测
+
+    Returns:
+        Future: 抽取结果的Future
+    """
+    if _get_extension(filename) == 'pdf':
+        return get_dispatch_executor().submit(extract_pdf_text, data)
+    return get_extraction_pool().submit(extract_text_from_bytes, data, filename, encoding)
+
+
+def extract_text(data: bytes, filename: str, timeout: Optional[int] = None, encoding: Optional[str] = None) -> str:
+    """
+    在进程池中抽取文本并等待结果
+
+    Args:
+        data: 文件字节
+        filename: 文件名
+        timeout: 超时时间（秒），默认使用EXTRACTION_TIMEOUT
+        encoding: 纯文本文件的编码，为空时自动检测
+
+    Returns:
+        str: 规范化后的文本
+    """
+    return submit_extraction(data, filename, encoding).result(timeout=timeout or EXTRACTION_TIMEOUT)
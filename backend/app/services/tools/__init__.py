@@ -4,5 +4,6 @@
 
 from .report_generator import generate_report_with_tools
 from .tool_definitions import get_tool_definitions
+from .tool_executor import execute_tool_calls
 
-__all__ = ['generate_report_with_tools', 'get_tool_definitions']
+__all__ = ['generate_report_with_tools', 'get_tool_definitions', 'execute_tool_calls']
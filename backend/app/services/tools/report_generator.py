@@ -8,14 +8,11 @@ from typing import Optional, List, Dict, Any
 
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from langchain.schema.messages import HumanMessage
-from langchain_community.chat_models import BedrockChat
-from langchain_community.llms import Bedrock as CommunityBedrock
 
-from app.config.model_config import get_model_config
 from app.services.modules.report_generators import prepare_context
-from app.services.modules.model_handlers import get_model_for_generation
-from .tool_definitions import get_tool_definitions
+from app.services.modules.converse import ConverseChatModel, ConverseStream, build_request, user_message
+from .tool_definitions import get_tool_definitions, to_converse_tool_config
+from .tool_executor import execute_tool_calls, TOOL_MAX_ROUNDS, TOOL_FINAL_INSTRUCTION
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -66,8 +63,12 @@ def generate_report_with_tools(
             final_prompt = default_prompt
             logger.info("使用默认提示词")
         
-        # 向量化和检索
-        retriever, context, vectorstore = prepare_context(service, document)
+        # 设置模型和配置
+        used_model_id = model_id if model_id else service.default_model_id
+        logger.info(f"使用模型ID: {used_model_id} 生成报告")
+        
+        # 向量化和检索，并按模型的token预算打包提示词
+        retriever, context, vectorstore, max_tokens = prepare_context(service, document, final_prompt, used_model_id)
         
         # 添加调试日志，显示文档内容的前200个字符
         if context:
@@ -75,10 +76,6 @@ def generate_report_with_tools(
         else:
             logger.warning("检索到的文档内容为空")
         
-        # 设置模型和配置
-        used_model_id = model_id if model_id else service.default_model_id
-        logger.info(f"使用模型ID: {used_model_id} 生成报告")
-        
         # 准备工具和提示
         tools = get_tool_definitions()
         
@@ -94,11 +91,11 @@ def generate_report_with_tools(
         # 根据模型类型选择合适的方法生成报告
         if "claude-3" in used_model_id and service.chat_model:
             return _generate_with_claude(
-                service, used_model_id, formatted_prompt, tools
+                service, used_model_id, formatted_prompt, tools, max_tokens, source_text=context
             )
         else:
             return _generate_with_standard_model(
-                service, used_model_id, prompt_template, context
+                service, used_model_id, prompt_template, context, max_tokens
             )
                 
     except Exception as e:
@@ -120,43 +117,59 @@ def generate_report_with_tools(
         """
 
 
-def _generate_with_claude(service, model_id: str, formatted_prompt: str, tools: List[dict]) -> str:
+def _generate_with_claude(service, model_id: str, formatted_prompt: str, tools: List[dict], max_tokens: int = 4096,
+                          source_text: str = "") -> str:
     """
-    使用 Claude 模型生成报告
+    使用 Claude 模型生成报告，模型请求的工具在本地执行
+    
+    每轮把模型返回的所有 toolUse 在本地执行，结果放在同一条消息中返回给模型，
+    直到模型不再请求工具。第 TOOL_MAX_ROUNDS 轮的工具结果后追加要求直接输出报告的指令，
+    再调用一次模型；模型仍请求工具时抛出异常，由调用方回退
     
     Args:
         service: LangChain 服务实例
         model_id: 模型 ID
         formatted_prompt: 格式化后的提示词
         tools: 工具定义列表
+        max_tokens: 输出的最大 token 数
+        source_text: 工具使用的源文本
         
     Returns:
         str: 生成的报告
     """
     try:
-        # 使用BedrockChat调用工具
-        bedrock_chat = BedrockChat(
-            model_id=model_id,
-            client=service.bedrock_client,
-            model_kwargs={
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 4096,
-                "temperature": 0.7,
-                "tools": tools
-            }
-        )
+        messages = [user_message(formatted_prompt)]
+        tool_config = to_converse_tool_config(tools)
         
-        # 发送消息
-        messages = [HumanMessage(content=formatted_prompt)]
-        response = bedrock_chat.invoke(messages)
-        return response.content
+        for round_index in range(TOOL_MAX_ROUNDS + 1):
+            stream = ConverseStream(
+                service.bedrock_client,
+                build_request(model_id, messages, max_tokens, tool_config=tool_config)
+            )
+            text = stream.read()
+            
+            if stream.stop_reason != "tool_use" or not stream.tool_uses:
+                return text
+            if round_index == TOOL_MAX_ROUNDS:
+                raise Exception(f"工具调用超过最大轮数 {TOOL_MAX_ROUNDS}，模型未输出报告")
+            
+            logger.info(f"第 {round_index + 1} 轮执行工具: {[tool_use.get('name') for tool_use in stream.tool_uses]}")
+            messages.append({"role": "assistant", "content": stream.content})
+            tool_results = execute_tool_calls(stream.tool_uses, source_text)
+            if round_index == TOOL_MAX_ROUNDS - 1:
+                # 最后一轮工具结果之后要求模型直接输出报告（含 toolUse 的对话仍需带上 toolConfig）
+                logger.warning(f"工具调用达到最大轮数 {TOOL_MAX_ROUNDS}，要求模型直接输出报告")
+                tool_results.append({"text": TOOL_FINAL_INSTRUCTION})
+            messages.append({"role": "user", "content": tool_results})
+        return text
     except Exception as e:
         logger.error(f"使用Claude模型生成报告失败: {str(e)}")
         logger.warning("回退到标准方法生成报告")
         raise e
 
 
-def _generate_with_standard_model(service, model_id: str, prompt_template: PromptTemplate, context: str) -> str:
+def _generate_with_standard_model(service, model_id: str, prompt_template: PromptTemplate, context: str,
+                                  max_tokens: Optional[int] = None) -> str:
     """
     使用标准模型生成报告
     
@@ -165,22 +178,17 @@ def _generate_with_standard_model(service, model_id: str, prompt_template: Promp
         model_id: 模型 ID
         prompt_template: 提示模板
         context: 上下文内容
+        max_tokens: 输出的最大 token 数，为空时使用模型配置
         
     Returns:
         str: 生成的报告
     """
     try:
-        # 获取模型配置
-        model_config = get_model_config(model_id)
-        
-        # 创建LLM实例
-        llm = CommunityBedrock(
+        # 创建Converse聊天模型，未指定输出上限时使用模型配置
+        llm = ConverseChatModel(
             model_id=model_id,
             client=service.bedrock_client,
-            model_kwargs={
-                "temperature": model_config.get("temperature", 0.7),
-                "maxTokens": model_config.get("max_tokens", 4096)
-            }
+            max_tokens=max_tokens
         )
         
         # 创建LLM链
@@ -55,3 +55,27 @@ def get_tool_definitions():
     ]
     
     return tools
+
+
+def to_converse_tool_config(tools):
+    """
+    把工具定义转换为 Converse API 的 toolConfig
+    
+    Args:
+        tools: get_tool_definitions 返回的工具定义列表
+        
+    Returns:
+        dict: 包含 toolSpec（name、description、inputSchema）列表的工具配置
+    """
+    return {
+        "tools": [
+            {
+                "toolSpec": {
+                    "name": tool["function"]["name"],
+                    "description": tool["function"]["description"],
+                    "inputSchema": {"json": tool["function"]["parameters"]}
+                }
+            }
+            for tool in tools
+        ]
+    }
@@ -0,0 +1,180 @@
+"""
+在本地确定性地执行 LLM 请求的工具，对源文本做快速抽取
+"""
+
+import os
+import re
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.modules.extraction import extraction_engine, DATE_PATTERN, MAX_ITEMS
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 工具调用的最大轮数，超过后不再执行工具
+TOOL_MAX_ROUNDS = int(os.environ.get('TOOL_MAX_ROUNDS', '3'))
+
+# 达到最大轮数后追加在工具结果之后的指令
+TOOL_FINAL_INSTRUCTION = "已达到工具调用次数上限。请根据以上工具结果直接输出完整报告，不要再调用工具。"
+
+# 数值和单位（金额、百分比、数量）
+NUMBER_PATTERN = re.compile(
+    r'(?P<prefix>[$¥￥€£])?\s?(?P<value>-?\d[\d,]*(?:\.\d+)?)\s?'
+    r'(?P<unit>%|％|万亿|亿元|万元|万円|億円|亿|億|万|元|円|ドル|美元|USD|JPY|CNY|人|名|件|个|個|台|k\b|K\b|M\b|B\b)?'
+)
+
+# 没有年份的日期（“5月20日”）
+_MONTH_DAY = re.compile(r'(?:(\d{4})年)?(\d{1,2})月(\d{1,2})[日号]')
+_ISO_DATE = re.compile(r'(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})')
+
+_PREFIX_UNITS = {'$': 'USD', '¥': 'JPY', '￥': 'CNY', '€': 'EUR', '£': 'GBP'}
+
+
+def _context(text: str, start: int, end: int, width: int = 20) -> str:
+    """取数值前后width个字符作为上下文，不跨行"""
+    line_start = text.rfind('\n', 0, start) + 1
+    line_end = text.find('\n', end)
+    line_end = len(text) if line_end == -1 else line_end
+    return text[max(line_start, start - width):min(line_end, end + width)].strip()
+
+
+def analyze_data(text: str) -> Dict[str, Any]:
+    """
+    抽取文本中的数值（金额、百分比、数量）并按单位统计
+
+    Args:
+        text: 包含数据的文本
+
+    Returns:
+        Dict[str, Any]: metrics（数值、单位、上下文）和按单位汇总的 count/sum/min/max/mean
+    """
+    # 日期中的数字不是数据，先用空格覆盖
+    masked = DATE_PATTERN.sub(lambda m: ' ' * len(m.group()), text)
+    metrics = []
+    for match in NUMBER_PATTERN.finditer(masked):
+        try:
+            value = float(match.group('value').replace(',', ''))
+        except ValueError:
+            continue
+        unit = match.group('unit') or _PREFIX_UNITS.get(match.group('prefix') or '', '')
+        metrics.append({'value': value, 'unit': unit.replace('％', '%'),
+                        'context': _context(text, match.start(), match.end())})
+        if len(metrics) >= MAX_ITEMS:
+            break
+
+    grouped = defaultdict(list)
+    for metric in metrics:
+        grouped[metric['unit']].append(metric['value'])
+    summary = {
+        unit: {'count': len(values), 'sum': round(sum(values), 4), 'min': min(values),
+               'max': max(values), 'mean': round(sum(values) / len(values), 4)}
+        for unit, values in grouped.items()
+    }
+    return {'count': len(metrics), 'metrics': metrics, 'summary': summary}
+
+
+def extract_tasks(text: str) -> Dict[str, Any]:
+    """
+    抽取行动项及其负责人和截止日期
+
+    Args:
+        text: 包含任务和行动项的文本
+
+    Returns:
+        Dict[str, Any]: tasks 列表和数量
+    """
+    tasks = extraction_engine.extract(text)['action_items']
+    return {'count': len(tasks), 'tasks': tasks}
+
+
+def _date_key(date: str, default_year: int) -> Optional[tuple]:
+    """把日期转为 (年, 月, 日)，无法解析的相对日期返回None"""
+    match = _ISO_DATE.search(date)
+    if match:
+        return tuple(int(part) for part in match.groups())
+    match = _MONTH_DAY.search(date)
+    if match:
+        year, month, day = match.groups()
+        return int(year) if year else default_year, int(month), int(day)
+    return None
+
+
+def generate_timeline(text: str) -> Dict[str, Any]:
+    """
+    按日期生成时间表，可解析的日期按时间排序，相对日期（“下周”等）按出现顺序排在后面
+
+    Args:
+        text: 包含时间信息的文本
+
+    Returns:
+        Dict[str, Any]: events 列表（date、event）
+    """
+    events = []
+    for line in text.splitlines():
+        stripped = line.strip().lstrip('#-*• ').strip()
+        for date in DATE_PATTERN.findall(stripped):
+            events.append({'date': date, 'event': stripped})
+        if len(events) >= MAX_ITEMS:
+            break
+
+    # 没有年份的日期沿用文档中第一个带年份的日期
+    years = [key[0] for key in (_date_key(event['date'], 0) for event in events) if key and key[0]]
+    default_year = years[0] if years else 0
+    keys = [_date_key(event['date'], default_year) for event in events]
+    order = sorted(range(len(events)), key=lambda i: (keys[i] is None, keys[i] or (0, 0, 0), i))
+    return {'count': len(events), 'events': [events[i] for i in order[:MAX_ITEMS]]}
+
+
+# 工具名称到本地实现的映射
+TOOL_HANDLERS: Dict[str, Callable[[str], Dict[str, Any]]] = {
+    'analyze_data': analyze_data,
+    'extract_tasks': extract_tasks,
+    'generate_timeline': generate_timeline,
+}
+
+
+def execute_tool(name: str, tool_input: Optional[Dict[str, Any]], source_text: str = "") -> Dict[str, Any]:
+    """
+    执行一个工具
+
+    Args:
+        name: 工具名称
+        tool_input: 模型给出的参数，没有text参数时使用源文本
+        source_text: 报告的源文本
+
+    Returns:
+        Dict[str, Any]: 工具结果
+    """
+    handler = TOOL_HANDLERS.get(name)
+    if handler is None:
+        raise Exception(f"未知的工具: {name}")
+    text = (tool_input or {}).get('text') or source_text
+    return handler(text)
+
+
+def execute_tool_calls(tool_uses: List[Dict[str, Any]], source_text: str = "") -> List[Dict[str, Any]]:
+    """
+    依次执行一轮中的所有工具调用，结果作为同一条用户消息的 toolResult 内容块返回
+
+    工具都是纯 Python 的正则抽取，受 GIL 限制，线程池无法并行，因此直接在当前线程执行
+
+    Args:
+        tool_uses: 模型请求的工具调用（Converse 格式的 toolUseId、name、input）
+        source_text: 报告的源文本
+
+    Returns:
+        List[Dict[str, Any]]: 与输入顺序一致的 toolResult 内容块
+    """
+    def run(tool_use: Dict[str, Any]) -> Dict[str, Any]:
+        result = {'toolUseId': tool_use.get('toolUseId')}
+        try:
+            output = execute_tool(tool_use.get('name'), tool_use.get('input'), source_text)
+            result.update(content=[{'json': output}], status='success')
+        except Exception as e:
+            logger.warning(f"[TOOLS] 工具 {tool_use.get('name')} 执行失败: {str(e)}")
+            result.update(content=[{'text': str(e)}], status='error')
+        return {'toolResult': result}
+
+    return [run(tool_use) for tool_use in tool_uses]
@@ -0,0 +1,157 @@
+"""
+Streaming chunk utility functions for the report generation system.
+This module splits text streams into overlapping chunks lazily, so memory use does not grow with the input size.
+"""
+
+import re
+from collections import deque
+from functools import partial
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union
+
+from .token_utils import estimate_tokens
+
+# Sentence boundaries: whitespace after Latin terminators, right after CJK terminators, and line breaks
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|(?<=[。！？])|\n+')
+
+# Default chunk size and overlap, in the unit of the length function
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+
+TextStream = Union[str, Iterable[str]]
+
+
+def token_length(model_id: Optional[str] = None) -> Callable[[str], int]:
+    """
+    Get a length function that measures text in estimated tokens for a model.
+
+    Args:
+        model_id: Bedrock model ID
+
+    Returns:
+        Function mapping text to its estimated token count
+    """
+    return partial(estimate_tokens, model_id=model_id)
+
+
+def iter_sentences(stream: TextStream, max_sentence_chars: int = 4000) -> Iterator[str]:
+    """
+    Yield sentences from a text stream, holding at most one partial sentence in memory.
+
+    Args:
+        stream: A string or an iterable of text pieces (e.g. decoded S3 body chunks)
+        max_sentence_chars: Text without a boundary is cut at this length
+
+    Yields:
+        Sentences in order, including their terminators
+    """
+    for sentence, _ in _iter_segments(stream, max_sentence_chars):
+        yield sentence
+
+
+def _iter_segments(stream: TextStream, max_sentence_chars: int) -> Iterator[Tuple[str, bool]]:
+    """Yield (sentence, cut) pairs; cut is True when text without a boundary continues in the next sentence."""
+    pieces = [stream] if isinstance(stream, str) else stream
+    buffer = ''
+    for piece in pieces:
+        buffer += piece
+        start = 0
+        for match in _SENTENCE_BOUNDARY.finditer(buffer):
+            # A boundary at the very end may continue into the next piece (e.g. more whitespace)
+            if match.end() == len(buffer):
+                break
+            sentence = buffer[start:match.start()].strip()
+            if sentence:
+                yield sentence, False
+            start = match.end()
+        buffer = buffer[start:]
+        while len(buffer) > max_sentence_chars:
+            yield buffer[:max_sentence_chars], True
+            buffer = buffer[max_sentence_chars:]
+    for sentence in _SENTENCE_BOUNDARY.split(buffer):
+        if sentence and sentence.strip():
+            yield sentence.strip(), False
+
+
+def _join(sentences: Iterable[str]) -> str:
+    joined = ''
+    for sentence in sentences:
+        if joined and sentence[:1].isascii() and joined[-1:].isascii():
+            joined += ' '
+        joined += sentence
+    return joined
+
+
+def _join_items(items) -> str:
+    return _join(sentence for sentence, _ in items)
+
+
+def iter_chunks(
+    stream: TextStream,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    length_function: Callable[[str], int] = len
+) -> Iterator[str]:
+    """
+    Lazily split a text stream into chunks at sentence boundaries, with overlap between neighbours.
+
+    Only the current chunk's sentences are kept in memory. A sentence longer than chunk_size
+    (e.g. text without any boundary) is emitted on its own, cut into pieces of about chunk_size
+    that start chunk_size - chunk_overlap apart, so the overlap is kept inside it as well.
+
+    Args:
+        stream: A string or an iterable of text pieces
+        chunk_size: Maximum chunk size, measured with length_function
+        chunk_overlap: Approximate size of the trailing sentences repeated at the start of the next chunk
+        length_function: len for characters, or token_length(model_id) for estimated tokens
+
+    Yields:
+        Chunks in document order
+    """
+    chunk_overlap = min(chunk_overlap, chunk_size // 2)
+    current = deque()
+    current_size = 0
+    fresh = False
+    # Unemitted tail of an over-long sentence that continues in the next segment
+    carry = ''
+    for sentence, cut in _iter_segments(stream, max(chunk_size, 1) * 4):
+        sentence, carry = carry + sentence, ''
+        size = length_function(sentence) + 1
+        if size > chunk_size:
+            if fresh:
+                yield _join_items(current)
+            piece_chars = max(1, len(sentence) * chunk_size // size)
+            overlap_chars = piece_chars * chunk_overlap // chunk_size
+            step = max(1, piece_chars - overlap_chars)
+            start = 0
+            while start + piece_chars < len(sentence):
+                yield sentence[start:start + piece_chars]
+                start += step
+            current.clear()
+            current_size, fresh = 0, False
+            if cut:
+                carry = sentence[start:]
+                continue
+            yield sentence[start:]
+            # The end of the sentence is the overlap for the next chunk
+            tail = sentence[len(sentence) - overlap_chars:] if overlap_chars else ''
+            if tail:
+                current.append((tail, length_function(tail) + 1))
+                current_size = current[0][1]
+            continue
+        if current_size + size > chunk_size and fresh:
+            yield _join_items(current)
+            # Keep trailing sentences as the overlap for the next chunk
+            kept, kept_size = deque(), 0
+            while current and kept_size + current[-1][1] <= chunk_overlap:
+                item = current.pop()
+                kept.appendleft(item)
+                kept_size += item[1]
+            current, current_size = kept, kept_size
+            fresh = False
+        while current and current_size + size > chunk_size:
+            current_size -= current.popleft()[1]
+        current.append((sentence, size))
+        current_size += size
+        fresh = True
+    if fresh:
+        yield _join_items(current)
@@ -0,0 +1,166 @@
+"""
+Encoding utility functions for the report generation system.
+This module detects text encodings from a byte prefix and decodes byte streams incrementally.
+"""
+
+import codecs
+import logging
+from typing import Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Number of leading bytes sampled for encoding detection
+DETECTION_SAMPLE_SIZE = 64 * 1024
+
+# Candidate encodings tried when the sample is not valid UTF-8, in tie-break order
+CANDIDATE_ENCODINGS = ['cp932', 'gb18030', 'euc-jp', 'big5', 'euc-kr', 'utf-16-le', 'utf-16-be']
+
+# Japanese encodings; kana in their decoding is strong evidence for them
+JAPANESE_ENCODINGS = {'cp932', 'euc-jp'}
+
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def _is_common_char(ch: str) -> bool:
+    """Check whether a character is typical of real text (ASCII, CJK, kana, Hangul, CJK punctuation)."""
+    code = ord(ch)
+    return (
+        0x20 <= code < 0x7f or ch in '\t\r\n'
+        or 0x3000 <= code <= 0x30ff      # CJK punctuation, hiragana, katakana
+        or 0x4e00 <= code <= 0x9fff      # CJK unified ideographs
+        or 0xac00 <= code <= 0xd7a3      # Hangul syllables
+        or 0xff01 <= code <= 0xff60      # fullwidth forms
+    )
+
+
+def _decode_prefix(sample: bytes, encoding: str) -> Optional[str]:
+    """Strictly decode a sample, tolerating a multi-byte sequence cut off at the end."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='strict')
+    try:
+        return decoder.decode(sample, final=False)
+    except UnicodeDecodeError:
+        return None
+
+
+def _score(text: str) -> float:
+    """Score decoded text by the share of common characters."""
+    if not text:
+        return 0.0
+    return sum(1 for ch in text if _is_common_char(ch)) / len(text)
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Detect the encoding of a text file from a prefix of its bytes.
+
+    Args:
+        sample: Leading bytes of the file (DETECTION_SAMPLE_SIZE is enough)
+
+    Returns:
+        Python codec name suitable for decoding the whole file
+    """
+    if not sample:
+        return 'utf-8'
+
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    # UTF-16 without BOM: ASCII-range text leaves NUL bytes in every other position
+    even_nuls = sample[0::2].count(0)
+    odd_nuls = sample[1::2].count(0)
+    half = max(len(sample) // 2, 1)
+    if odd_nuls / half > 0.3 and even_nuls / half < 0.05:
+        return 'utf-16-le'
+    if even_nuls / half > 0.3 and odd_nuls / half < 0.05:
+        return 'utf-16-be'
+
+    if _decode_prefix(sample, 'utf-8') is not None:
+        return 'utf-8'
+
+    best_encoding = None
+    best_score = -1.0
+    for encoding in CANDIDATE_ENCODINGS:
+        text = _decode_prefix(sample, encoding)
+        if text is None:
+            continue
+        score = _score(text)
+        # Japanese text almost always contains kana; Chinese text rarely does
+        if encoding in JAPANESE_ENCODINGS:
+            non_ascii = sum(1 for ch in text if ord(ch) > 0x7f) or 1
+            kana = sum(1 for ch in text if 0x3040 <= ord(ch) <= 0x30ff)
+            if kana / non_ascii > 0.05:
+                score += 0.1
+        if score > best_score:
+            best_encoding, best_score = encoding, score
+
+    if best_encoding is None:
+        logger.warning("Could not detect encoding, falling back to UTF-8 with replacement")
+        return 'utf-8'
+    return best_encoding
+
+
+def iter_decode(chunks: Iterable[bytes], encoding: str) -> Iterator[str]:
+    """
+    Decode a stream of byte chunks incrementally.
+
+    Multi-byte sequences split across chunk boundaries are handled by the incremental decoder.
+
+    Args:
+        chunks: Iterable of byte chunks
+        encoding: Codec name
+
+    Yields:
+        Decoded text pieces
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def decode_stream(
+    chunks: Iterable[bytes],
+    encoding: Optional[str] = None,
+    sample_size: int = DETECTION_SAMPLE_SIZE
+) -> Tuple[str, Iterator[str]]:
+    """
+    Detect the encoding from the head of a byte stream and decode the whole stream incrementally.
+
+    Only the first sample_size bytes are buffered for detection; they are replayed into
+    the decoder, so the stream is read exactly once.
+
+    Args:
+        chunks: Iterable of byte chunks (e.g. an S3 body's iter_chunks())
+        encoding: Known encoding; detection is skipped when provided
+        sample_size: Number of leading bytes used for detection
+
+    Returns:
+        Tuple of (encoding, iterator of decoded text pieces)
+    """
+    iterator = iter(chunks)
+    head = []
+    head_size = 0
+    if encoding is None:
+        for chunk in iterator:
+            head.append(chunk)
+            head_size += len(chunk)
+            if head_size >= sample_size:
+                break
+        encoding = detect_encoding(b''.join(head)[:sample_size])
+
+    def replay():
+        yield from head
+        yield from iterator
+
+    return encoding, iter_decode(replay(), encoding)
@@ -0,0 +1,130 @@
+"""
+Markdown utility functions for the report generation system.
+This module builds a section index from Markdown headings and replaces section bodies in place.
+"""
+
+import re
+import logging
+from typing import Dict, List, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+_HEADING_PATTERN = re.compile(r'^(#{1,6})[ \t]+(.+?)[ \t#]*$', re.MULTILINE)
+_FENCE_PATTERN = re.compile(r'^(```|~~~).*?^\1[ \t]*$', re.MULTILINE | re.DOTALL)
+
+
+def parse_section_index(markdown: str) -> List[Dict[str, Union[int, str]]]:
+    """
+    Build a section index from the Markdown headings of a report.
+
+    A section spans from its heading to the next heading of the same or a higher level,
+    so it includes its subsections. Headings inside fenced code blocks are ignored.
+
+    Args:
+        markdown: Report content
+
+    Returns:
+        List of sections in document order, each with index, title, level,
+        start (offset of the heading line), body_start (offset after the heading line) and end
+    """
+    if not markdown:
+        return []
+
+    fenced = [(m.start(), m.end()) for m in _FENCE_PATTERN.finditer(markdown)]
+    headings = []
+    for match in _HEADING_PATTERN.finditer(markdown):
+        if any(start <= match.start() < end for start, end in fenced):
+            continue
+        body_start = match.end() + 1 if match.end() < len(markdown) else match.end()
+        headings.append((match.start(), body_start, len(match.group(1)), match.group(2).strip()))
+
+    sections = []
+    for position, (start, body_start, level, title) in enumerate(headings):
+        end = len(markdown)
+        for next_start, _, next_level, _ in headings[position + 1:]:
+            if next_level <= level:
+                end = next_start
+                break
+        sections.append({
+            'index': position,
+            'title': title,
+            'level': level,
+            'start': start,
+            'body_start': body_start,
+            'end': end
+        })
+    return sections
+
+
+def resolve_sections(sections: Sequence[Dict], selectors: Sequence[Union[int, str]]) -> List[Dict]:
+    """
+    Resolve section selectors (indexes or titles) to sections, dropping sections nested in another selected one.
+
+    Args:
+        sections: Section index from parse_section_index
+        selectors: Section indexes or titles
+
+    Returns:
+        Selected sections in document order
+
+    Raises:
+        Exception: If a selector does not match any section
+    """
+    selected = {}
+    for selector in selectors:
+        if isinstance(selector, int) or (isinstance(selector, str) and selector.isdigit()):
+            position = int(selector)
+            if not 0 <= position < len(sections):
+                raise Exception(f"Section index out of range: {selector}")
+            selected[position] = sections[position]
+            continue
+        matches = [section for section in sections if section['title'] == selector]
+        if not matches:
+            raise Exception(f"Section not found: {selector}")
+        selected[matches[0]['index']] = matches[0]
+
+    ordered = [selected[key] for key in sorted(selected)]
+    outermost = []
+    for section in ordered:
+        if outermost and section['start'] < outermost[-1]['end']:
+            continue
+        outermost.append(section)
+    return outermost
+
+
+def get_section_body(markdown: str, section: Dict) -> str:
+    """
+    Get the body of a section (without its heading line).
+
+    Args:
+        markdown: Report content
+        section: Section from parse_section_index
+
+    Returns:
+        Section body text
+    """
+    return markdown[section['body_start']:section['end']].strip()
+
+
+def replace_section_bodies(markdown: str, replacements: Dict[int, str], sections: Sequence[Dict]) -> str:
+    """
+    Replace the bodies of the given sections and keep everything else verbatim.
+
+    Args:
+        markdown: Report content
+        replacements: New body text by section index
+        sections: Section index from parse_section_index (for the same markdown)
+
+    Returns:
+        Updated report content
+    """
+    by_index = {section['index']: section for section in sections}
+    parts = []
+    cursor = 0
+    for position in sorted(replacements, key=lambda key: by_index[key]['start']):
+        section = by_index[position]
+        parts.append(markdown[cursor:section['body_start']])
+        parts.append(f"\n{replacements[position].strip()}\n\n")
+        cursor = section['end']
+    parts.append(markdown[cursor:])
+    return ''.join(parts)
@@ -0,0 +1,135 @@
+"""
+MinHash utility functions for the report generation system.
+This module provides MinHash signatures and LSH band keys for near-duplicate document detection.
+"""
+
+import re
+import zlib
+import hashlib
+import logging
+from typing import List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Number of hash permutations in a signature
+NUM_PERM = 128
+
+# LSH banding: NUM_BANDS * ROWS_PER_BAND must equal NUM_PERM.
+# With 16 bands of 8 rows, documents become candidates at roughly 0.7 Jaccard similarity.
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+
+# Character shingle size (character n-grams also work for CJK text without word segmentation)
+SHINGLE_SIZE = 5
+
+# Number of shingles hashed per vectorized block, bounds peak memory for large documents
+_BLOCK_SIZE = 8192
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Fixed seed so signatures are comparable across processes and deployments
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def _normalize(text: str) -> str:
+    """
+    Normalize text before shingling so whitespace and case edits do not change the signature.
+
+    Args:
+        text: Input text
+
+    Returns:
+        Normalized text
+    """
+    return re.sub(r'\s+', ' ', text.lower()).strip()
+
+
+def get_shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """
+    Get the set of character shingles of a text.
+
+    Args:
+        text: Input text
+        size: Shingle size in characters
+
+    Returns:
+        Set of shingle strings
+    """
+    normalized = _normalize(text or "")
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def compute_minhash(text: str) -> List[int]:
+    """
+    Compute the MinHash signature of a text.
+
+    Args:
+        text: Input text
+
+    Returns:
+        List of NUM_PERM 32-bit integers (empty if the text has no shingles)
+    """
+    shingles = get_shingles(text)
+    if not shingles:
+        return []
+
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode('utf-8')) for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles)
+    )
+
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(hashes), _BLOCK_SIZE):
+        block = hashes[start:start + _BLOCK_SIZE, np.newaxis]
+        permuted = ((block * _PERM_A + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+
+    return [int(v) for v in signature]
+
+
+def get_lsh_band_keys(signature: Sequence[int]) -> List[str]:
+    """
+    Split a MinHash signature into LSH band keys.
+
+    Args:
+        signature: MinHash signature
+
+    Returns:
+        List of band keys of the form "<band index>:<band hash>"
+    """
+    if len(signature) != NUM_PERM:
+        return []
+
+    values = np.asarray(signature, dtype=np.uint32)
+    keys = []
+    for band in range(NUM_BANDS):
+        rows = values[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(rows.tobytes(), digest_size=8).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+def estimate_similarity(signature_a: Sequence[int], signature_b: Sequence[int]) -> float:
+    """
+    Estimate the Jaccard similarity of two documents from their MinHash signatures.
+
+    Args:
+        signature_a: First signature
+        signature_b: Second signature
+
+    Returns:
+        Estimated similarity between 0 and 1
+    """
+    if not signature_a or len(signature_a) != len(signature_b):
+        return 0.0
+    a = np.asarray(signature_a, dtype=np.uint64)
+    b = np.asarray(signature_b, dtype=np.uint64)
+    return float(np.mean(a == b))
@@ -3,34 +3,154 @@ Text utility functions for the report generation system.
 This module provides functions for text processing and analysis.
 """
 
+import os
 import re
+import zlib
 import logging
+from functools import lru_cache
 from typing import List, Dict, Any, Optional, Tuple
-import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+
+import numpy as np
+
+from .tokenizer_utils import ENGLISH_STOP_WORDS, tokenize
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
-# Download required NLTK resources
-try:
-    nltk.download('punkt', quiet=True)
-    nltk.download('stopwords', quiet=True)
-    nltk.download('wordnet', quiet=True)
-except Exception as e:
-    logger.warning(f"Failed to download NLTK resources: {e}")
+# NLTK resources are looked up locally (NLTK_DATA or the default data paths) on first use.
+# Downloading at runtime is opt-in so worker start never blocks on the network; images bundle the data.
+NLTK_AUTO_DOWNLOAD = os.environ.get('NLTK_AUTO_DOWNLOAD', 'false').lower() == 'true'
+
+# Fallback tokenizers used when the NLTK data is not available
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?\u3002\uff01\uff1f])\s+|(?<=[\u3002\uff01\uff1f])|\n{2,}')
+_WORD_PATTERN = re.compile(r'\w+')
 
-# Initialize lemmatizer
-lemmatizer = WordNetLemmatizer()
+# Sentence terminators punkt does not split on
+_CJK_SENTENCE_END = re.compile(r'(?<=[\u3002\uff01\uff1f])')
+_CJK_CHAR = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
 
-# Get stopwords
-try:
-    stop_words = set(stopwords.words('english'))
-except Exception as e:
-    logger.warning(f"Failed to load stopwords: {e}")
-    stop_words = set()
+# TextRank settings; longer documents are scored against the centroid to avoid the quadratic similarity matrix
+TEXTRANK_MAX_SENTENCES = 1500
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_ITERATIONS = 50
+SENTENCE_VECTOR_DIMS = 1024
+
+
+@lru_cache(maxsize=None)
+def _has_nltk_resource(resource_path: str, package: str) -> bool:
+    """
+    Check whether an NLTK resource is available locally, downloading it only when NLTK_AUTO_DOWNLOAD is set.
+
+    Args:
+        resource_path: Resource path for nltk.data.find (e.g. 'corpora/stopwords')
+        package: Package name for nltk.download
+
+    Returns:
+        True if the resource can be loaded
+    """
+    try:
+        import nltk
+    except ImportError:
+        return False
+    try:
+        nltk.data.find(resource_path)
+        return True
+    except LookupError:
+        pass
+    if NLTK_AUTO_DOWNLOAD:
+        try:
+            if nltk.download(package, quiet=True):
+                nltk.data.find(resource_path)
+                return True
+        except Exception as e:
+            logger.warning(f"Failed to download NLTK resource {package}: {e}")
+    logger.info(f"NLTK resource {package} is not available, using the built-in fallback")
+    return False
+
+
+def _has_punkt() -> bool:
+    # NLTK >= 3.8.2 reads punkt_tab; older releases read the pickled punkt models
+    return _has_nltk_resource('tokenizers/punkt_tab/english/', 'punkt_tab') or \
+        _has_nltk_resource('tokenizers/punkt', 'punkt')
+
+
+@lru_cache(maxsize=None)
+def get_stop_words() -> frozenset:
+    """
+    Get the English stopword set, loaded on first use.
+
+    Returns:
+        NLTK stopwords, or the built-in list when the corpus is unavailable
+    """
+    if _has_nltk_resource('corpora/stopwords', 'stopwords'):
+        try:
+            from nltk.corpus import stopwords
+            return frozenset(stopwords.words('english'))
+        except Exception as e:
+            logger.warning(f"Failed to load stopwords: {e}")
+    return ENGLISH_STOP_WORDS
+
+
+@lru_cache(maxsize=None)
+def get_lemmatizer():
+    """
+    Get the WordNet lemmatizer, loaded on first use.
+
+    Returns:
+        Object with a lemmatize(word) method; words are returned unchanged when WordNet is unavailable
+    """
+    if _has_nltk_resource('corpora/wordnet', 'wordnet'):
+        try:
+            from nltk.stem import WordNetLemmatizer
+            lemmatizer = WordNetLemmatizer()
+            lemmatizer.lemmatize('warmup')
+            return lemmatizer
+        except Exception as e:
+            logger.warning(f"Failed to load WordNet lemmatizer: {e}")
+    return _IdentityLemmatizer()
+
+
+class _IdentityLemmatizer:
+    def lemmatize(self, word: str) -> str:
+        return word
+
+
+def sent_tokenize(text: str) -> List[str]:
+    """
+    Split text into sentences with NLTK punkt, or a punctuation-based fallback.
+
+    Args:
+        text: Input text
+
+    Returns:
+        List of sentences
+    """
+    if _has_punkt():
+        try:
+            from nltk.tokenize import sent_tokenize as nltk_sent_tokenize
+            return nltk_sent_tokenize(text)
+        except LookupError:
+            pass
+    return [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text) if sentence and sentence.strip()]
+
+
+def word_tokenize(text: str) -> List[str]:
+    """
+    Split text into words with NLTK, or a regex fallback.
+
+    Args:
+        text: Input text
+
+    Returns:
+        List of words
+    """
+    if _has_punkt():
+        try:
+            from nltk.tokenize import word_tokenize as nltk_word_tokenize
+            return nltk_word_tokenize(text)
+        except LookupError:
+            pass
+    return _WORD_PATTERN.findall(text)
 
 def clean_text(text: str) -> str:
     """
@@ -128,6 +248,8 @@ def extract_keywords(text: str, top_n: int = 10) -> List[Dict[str, Any]]:
     words = word_tokenize(cleaned_text)
     
     # Remove stopwords and lemmatize
+    stop_words = get_stop_words()
+    lemmatizer = get_lemmatizer()
     filtered_words = []
     for word in words:
         if word not in stop_words and len(word) > 2:
@@ -156,55 +278,136 @@ def extract_keywords(text: str, top_n: int = 10) -> List[Dict[str, Any]]:
     
     return keywords
 
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text into sentences, handling line breaks and CJK sentence terminators as boundaries.
+
+    Args:
+        text: Input text
+
+    Returns:
+        List of non-empty sentences in document order
+    """
+    sentences = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        for sentence in sent_tokenize(line):
+            sentences.extend(part.strip() for part in _CJK_SENTENCE_END.split(sentence) if part.strip())
+    return sentences
+
+
+def _sentence_vectors(sentences: List[str]) -> np.ndarray:
+    """Build L2-normalized TF-IDF sentence vectors with hashed term features (CJK bigrams and words)."""
+    matrix = np.zeros((len(sentences), SENTENCE_VECTOR_DIMS), dtype=np.float32)
+    for row, sentence in enumerate(sentences):
+        features = [zlib.crc32(term.encode('utf-8')) % SENTENCE_VECTOR_DIMS for term in tokenize(sentence)]
+        if features:
+            np.add.at(matrix[row], features, 1.0)
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    matrix *= np.log((len(sentences) + 1) / (document_frequency + 1)) + 1
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def score_sentences(sentences: List[str]) -> np.ndarray:
+    """
+    Score sentences by TextRank over a cosine-similarity matrix.
+
+    Documents with more than TEXTRANK_MAX_SENTENCES sentences are scored by similarity to the
+    document centroid instead, which is linear rather than quadratic in the sentence count.
+
+    Args:
+        sentences: List of sentences
+
+    Returns:
+        Array of scores, one per sentence
+    """
+    if not sentences:
+        return np.zeros(0, dtype=np.float32)
+    vectors = _sentence_vectors(sentences)
+    count = len(sentences)
+    if count > TEXTRANK_MAX_SENTENCES:
+        return vectors @ vectors.mean(axis=0)
+
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0)
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    # Sentences without any similar sentence link uniformly to all others
+    transition = np.where(row_sums > 0, similarity / np.where(row_sums == 0, 1, row_sums), 1.0 / count).astype(np.float32)
+    transition = np.ascontiguousarray(transition.T)
+    scores = np.full(count, 1.0 / count, dtype=np.float32)
+    for _ in range(TEXTRANK_ITERATIONS):
+        updated = (1 - TEXTRANK_DAMPING) / count + TEXTRANK_DAMPING * (transition @ scores)
+        if np.abs(updated - scores).sum() < 1e-6:
+            return updated
+        scores = updated
+    return scores
+
+
+def _join_sentences(sentences: List[str]) -> str:
+    """Join sentences, without spaces after CJK sentences."""
+    joined = ''
+    for sentence in sentences:
+        if joined and not _CJK_CHAR.match(joined[-1]):
+            joined += ' '
+        joined += sentence
+    return joined
+
+
 def summarize_text(text: str, max_sentences: int = 5) -> str:
     """
-    Create a simple extractive summary of the text.
+    Create an extractive summary of the text with TextRank, without any model call.
     
     Args:
         text: Input text to summarize
         max_sentences: Maximum number of sentences in the summary
         
     Returns:
-        Summarized text
+        Summarized text, with the selected sentences in their original order
     """
     if not text:
         return ""
     
-    # Split into sentences
-    sentences = sent_tokenize(text)
+    sentences = split_sentences(text)
     
     # If there are fewer sentences than max_sentences, return the original text
     if len(sentences) <= max_sentences:
         return text
     
-    # Simple scoring: prefer sentences at the beginning and end of the document
-    scores = {}
-    for i, sentence in enumerate(sentences):
-        # Score based on position (higher for first and last few sentences)
-        position_score = 1.0
-        if i < 3:  # First three sentences
-            position_score = 1.0 - (i * 0.1)
-        elif i >= len(sentences) - 3:  # Last three sentences
-            position_score = 0.8 + ((i - (len(sentences) - 3)) * 0.1)
-        else:
-            position_score = 0.5
-        
-        # Score based on length (prefer medium-length sentences)
-        length = len(sentence.split())
-        length_score = 0.5
-        if 5 <= length <= 25:
-            length_score = 1.0
-        elif length < 5:
-            length_score = 0.3
-        
-        # Final score
-        scores[i] = position_score * 0.7 + length_score * 0.3
-    
-    # Get indices of top-scoring sentences
-    top_indices = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:max_sentences]
-    top_indices = [idx for idx, _ in sorted(top_indices)]
-    
-    # Construct summary from selected sentences in original order
-    summary_sentences = [sentences[i] for i in sorted(top_indices)]
-    
-    return ' '.join(summary_sentences) 
\ No newline at end of file
+    scores = score_sentences(sentences)
+    top_indices = np.sort(np.argsort(-scores, kind='stable')[:max_sentences])
+    return _join_sentences([sentences[i] for i in top_indices])
+
+
+def shrink_text(text: str, max_chars: int) -> str:
+    """
+    Shrink text to at most max_chars by keeping its highest-ranked sentences in original order.
+
+    Used as a pre-filter before sending long transcripts to a model.
+
+    Args:
+        text: Input text
+        max_chars: Maximum length of the result in characters
+
+    Returns:
+        The original text if it already fits, otherwise the selected sentences; when no
+        sentence fits (e.g. unpunctuated transcripts), the top-ranked sentence cut to max_chars
+    """
+    if len(text) <= max_chars:
+        return text
+    sentences = split_sentences(text)
+    if not sentences:
+        return text[:max_chars]
+    scores = score_sentences(sentences)
+    order = np.argsort(-scores, kind='stable')
+    selected, used = [], 0
+    for index in order:
+        size = len(sentences[index]) + 1
+        if used + size > max_chars:
+            continue
+        selected.append(index)
+        used += size
+    if not selected:
+        return sentences[order[0]][:max_chars]
+    return _join_sentences([sentences[i] for i in sorted(selected)])
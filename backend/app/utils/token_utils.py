@@ -0,0 +1,266 @@
+"""
+Token utility functions for the report generation system.
+This module estimates prompt sizes per model family and packs prompts into a model's context budget.
+"""
+
+import re
+import logging
+from collections import namedtuple
+from typing import Optional, Sequence
+
+from app.config.model_config import MODEL_CONFIGS, get_model_config, DEFAULT_MAX_TOKENS, DEFAULT_CONTEXT_WINDOW
+
+logger = logging.getLogger(__name__)
+
+# Per-family heuristics: (non-CJK characters per token, tokens per CJK character).
+# BPE vocabularies encode most CJK characters as one or more tokens each, so they are counted separately.
+FAMILY_TOKEN_RATIOS = {
+    'anthropic': (3.5, 1.0),
+    'amazon': (4.0, 1.2),
+    'meta': (4.0, 1.5),
+    'unknown': (3.5, 1.5),
+}
+
+# Context windows and output limits for model IDs that are not listed in MODEL_CONFIGS, by ID prefix
+FAMILY_DEFAULTS = [
+    ('anthropic.claude-3', 200000, 4096),
+    ('anthropic.claude', 100000, 4096),
+    ('amazon.titan', 8192, DEFAULT_MAX_TOKENS),
+    ('meta.llama3', 8192, 2048),
+]
+
+# Fraction of the context window kept free to absorb estimation error
+SAFETY_MARGIN = 0.1
+
+# Smallest output allowance worth sending a request for
+MIN_OUTPUT_TOKENS = 256
+
+# Output allowance reserved when packing a prompt for a full report
+REPORT_MIN_OUTPUT_TOKENS = 1024
+
+_CJK_PATTERN = re.compile(r'[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+# Result of packing: the prompt text, its context part, the chunks that made it in, and the token budget
+PackedPrompt = namedtuple('PackedPrompt', ['text', 'context', 'chunks', 'dropped', 'prompt_tokens', 'max_tokens'])
+
+
+def get_model_family(model_id: Optional[str]) -> str:
+    """
+    Get the model family (provider) used to pick token heuristics.
+
+    Args:
+        model_id: Bedrock model ID
+
+    Returns:
+        Family name, e.g. 'anthropic', 'amazon', 'meta' or 'unknown'
+    """
+    if not model_id:
+        return 'unknown'
+    provider = MODEL_CONFIGS.get(model_id, {}).get('provider')
+    if provider:
+        return provider
+    prefix = model_id.split('.', 1)[0]
+    return prefix if prefix in FAMILY_TOKEN_RATIOS else 'unknown'
+
+
+def estimate_tokens(text: str, model_id: Optional[str] = None) -> int:
+    """
+    Estimate the number of tokens a text will use for a model.
+
+    Args:
+        text: Input text
+        model_id: Bedrock model ID
+
+    Returns:
+        Estimated token count (rounded up)
+    """
+    if not text:
+        return 0
+    chars_per_token, tokens_per_cjk = FAMILY_TOKEN_RATIOS[get_model_family(model_id)]
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return int(cjk * tokens_per_cjk + other / chars_per_token) + 1
+
+
+def get_token_limits(model_id: Optional[str]):
+    """
+    Get the context window and the maximum output allowance of a model.
+
+    Args:
+        model_id: Bedrock model ID
+
+    Returns:
+        Tuple of (context_window, max_output_tokens)
+    """
+    if model_id and model_id not in MODEL_CONFIGS:
+        for prefix, context_window, max_output in FAMILY_DEFAULTS:
+            if model_id.startswith(prefix):
+                return context_window, max_output
+    config = get_model_config(model_id)
+    return config.get('context_window', DEFAULT_CONTEXT_WINDOW), config.get('max_tokens', DEFAULT_MAX_TOKENS)
+
+
+def get_input_budget(model_id: Optional[str], min_output_tokens: int = MIN_OUTPUT_TOKENS) -> int:
+    """
+    Get the number of prompt tokens that can be sent while leaving room for the output.
+
+    Args:
+        model_id: Bedrock model ID
+        min_output_tokens: Output allowance that must remain available
+
+    Returns:
+        Prompt token budget
+    """
+    context_window, _ = get_token_limits(model_id)
+    return int(context_window * (1 - SAFETY_MARGIN)) - min_output_tokens
+
+
+def get_output_allowance(prompt_tokens: int, model_id: Optional[str]) -> int:
+    """
+    Get the output allowance (max_tokens) for a prompt of the given size.
+
+    Args:
+        prompt_tokens: Estimated prompt tokens
+        model_id: Bedrock model ID
+
+    Returns:
+        max_tokens to request, never more than the model's configured output limit
+
+    Raises:
+        Exception: If the prompt leaves less than MIN_OUTPUT_TOKENS for the output
+    """
+    context_window, max_output = get_token_limits(model_id)
+    remaining = int(context_window * (1 - SAFETY_MARGIN)) - prompt_tokens
+    if remaining < MIN_OUTPUT_TOKENS:
+        raise Exception(
+            f"Prompt too large for model {model_id}: ~{prompt_tokens} tokens, context window {context_window}"
+        )
+    return min(max_output, remaining)
+
+
+def get_chunk_size_chars(model_id: Optional[str], min_output_tokens: int = REPORT_MIN_OUTPUT_TOKENS, fill: float = 0.8) -> int:
+    """
+    Get a chunk size in characters that fits in a model's prompt budget even for all-CJK text.
+
+    Args:
+        model_id: Bedrock model ID
+        min_output_tokens: Output allowance that must remain available
+        fill: Share of the budget given to the chunk, the rest is left for the prompt around it
+
+    Returns:
+        Chunk size in characters
+    """
+    chars_per_token, tokens_per_cjk = FAMILY_TOKEN_RATIOS[get_model_family(model_id)]
+    worst_tokens_per_char = max(tokens_per_cjk, 1 / chars_per_token)
+    return max(1000, int(get_input_budget(model_id, min_output_tokens) * fill / worst_tokens_per_char))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model_id: Optional[str] = None) -> str:
+    """
+    Truncate a text so that its estimated size fits in max_tokens, cutting at a line break when possible.
+
+    Args:
+        text: Input text
+        max_tokens: Token budget
+        model_id: Bedrock model ID
+
+    Returns:
+        Truncated text
+    """
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text, model_id) <= max_tokens:
+        return text
+
+    # Binary search on the character length, the estimate is monotonic in the prefix length
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle], model_id) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+
+    truncated = text[:low]
+    cut = truncated.rfind('\n')
+    if cut > low * 0.8:
+        truncated = truncated[:cut]
+    return truncated
+
+
+def pack_prompt(
+    template: str,
+    chunks: Sequence[str],
+    model_id: Optional[str],
+    header: str = "",
+    min_output_tokens: int = MIN_OUTPUT_TOKENS,
+    separator: str = "\n\n"
+) -> PackedPrompt:
+    """
+    Pack a prompt template, a metadata header and context chunks into a model's token budget.
+
+    Chunks are added in the given order (most important first); the first chunk that does not fit
+    is truncated and the rest are dropped. The output allowance is set from what remains.
+
+    Args:
+        template: Prompt template containing a {context} placeholder
+        chunks: Context chunks in priority order
+        model_id: Bedrock model ID
+        header: Metadata header placed before the chunks (always kept)
+        min_output_tokens: Output allowance that must remain available
+        separator: Separator between chunks
+
+    Returns:
+        PackedPrompt with the formatted text, the context that replaced {context}, the included chunks,
+        the number of dropped chunks, the estimated prompt tokens and the max_tokens to request
+
+    Raises:
+        Exception: If the template and header alone do not fit
+    """
+    budget = get_input_budget(model_id, min_output_tokens)
+    fixed_tokens = estimate_tokens(template.replace("{context}", "") + header, model_id)
+    if fixed_tokens > budget:
+        raise Exception(f"Prompt template and header exceed the token budget of model {model_id}")
+
+    remaining = budget - fixed_tokens
+    separator_tokens = estimate_tokens(separator, model_id)
+    included = []
+    truncated = False
+    for chunk in chunks:
+        chunk_tokens = estimate_tokens(chunk, model_id) + separator_tokens
+        if chunk_tokens <= remaining:
+            included.append(chunk)
+            remaining -= chunk_tokens
+            continue
+        partial = truncate_to_tokens(chunk, remaining - separator_tokens, model_id)
+        if partial:
+            included.append(partial)
+            truncated = True
+        break
+
+    dropped = len(chunks) - len(included)
+    context = separator.join(([header] if header else []) + included)
+    text = template.replace("{context}", context)
+    prompt_tokens = estimate_tokens(text, model_id)
+    if dropped or truncated:
+        logger.warning(
+            f"Packed prompt for {model_id}: kept {len(included)}/{len(chunks)} chunks (~{prompt_tokens} tokens)"
+        )
+    return PackedPrompt(
+        text, context, included, dropped, prompt_tokens, get_output_allowance(prompt_tokens, model_id)
+    )
+
+
+def fit_prompt(text: str, model_id: Optional[str], min_output_tokens: int = MIN_OUTPUT_TOKENS) -> PackedPrompt:
+    """
+    Fit a single prompt text into a model's budget, truncating its tail if needed.
+
+    Args:
+        text: Full prompt text
+        model_id: Bedrock model ID
+        min_output_tokens: Output allowance that must remain available
+
+    Returns:
+        PackedPrompt for the (possibly truncated) text
+    """
+    return pack_prompt("{context}", [text], model_id, min_output_tokens=min_output_tokens)
@@ -0,0 +1,75 @@
+"""
+Tokenizer utility functions for the report generation system.
+This module splits mixed CJK/Latin text into search terms: character bigrams for CJK runs and lowercased words for Latin scripts.
+"""
+
+import re
+import unicodedata
+from collections import Counter
+from typing import List
+
+# CJK ideographs, kana (including the prolonged sound mark) and Hangul are tokenized as character bigrams
+_CJK_CHARS = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_PATTERN = re.compile(f'([{_CJK_CHARS}]+)|([^\\W_{_CJK_CHARS}]+)')
+
+# Common English words, used where the NLTK stopword corpus is not available
+ENGLISH_STOP_WORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both but by
+can could did do does doing down during each few for from further had has have having he her here hers him his how
+i if in into is it its itself just me more most my no nor not of off on once only or other our ours out over own
+same she should so some such than that the their theirs them then there these they this those through to too under
+until up very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+
+def cjk_bigrams(run: str) -> List[str]:
+    """
+    Split a run of CJK characters into overlapping character bigrams.
+
+    Args:
+        run: A run of CJK characters
+
+    Returns:
+        List of bigrams, or the single character for one-character runs
+    """
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenize text for indexing and search.
+
+    Text is NFKC-normalized first so full-width Latin letters and digits match their ASCII forms.
+
+    Args:
+        text: Input text
+
+    Returns:
+        List of terms in document order
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', text)
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        cjk, word = match.groups()
+        if cjk:
+            tokens.extend(cjk_bigrams(cjk))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+
+def term_frequencies(text: str) -> Counter:
+    """
+    Count term frequencies of a text.
+
+    Args:
+        text: Input text
+
+    Returns:
+        Counter of term -> frequency
+    """
+    return Counter(tokenize(text))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+IVF索引检索延迟基准 - 模拟索引逐批增长（写入线程按需重新训练），测量单次检索耗时
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, project_root)
+
+from app.services.modules.ivf_index import IVFIndex
+
+
+def run_benchmark(count, dim, nprobe, batch, queries, seed=0):
+    """逐批添加向量后测量检索耗时，返回结果字典"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(count // 200, 1), dim)).astype(np.float32)
+    index = IVFIndex(nprobe=nprobe)
+
+    started = time.perf_counter()
+    train_seconds = 0.0
+    for start in range(0, count, batch):
+        rows = min(batch, count - start)
+        index.add(centers[rng.integers(len(centers), size=rows)] + rng.normal(0, 0.5, (rows, dim)).astype(np.float32))
+        if index.needs_retrain:
+            train_started = time.perf_counter()
+            index.train()
+            train_seconds += time.perf_counter() - train_started
+    build_seconds = time.perf_counter() - started
+
+    samples = centers[rng.integers(len(centers), size=queries)] + rng.normal(0, 0.5, (queries, dim)).astype(np.float32)
+    index.search(samples[0], k=40)
+    latencies = []
+    for query in samples:
+        query_started = time.perf_counter()
+        index.search(query, k=40)
+        latencies.append((time.perf_counter() - query_started) * 1000)
+
+    sizes = [block.size for block in index.lists]
+    return {
+        'vectors': index.size,
+        'lists': len(index.lists),
+        'max_list': max(sizes) if sizes else 0,
+        'build_seconds': build_seconds,
+        'train_seconds': train_seconds,
+        'median_ms': statistics.median(latencies),
+        'p95_ms': sorted(latencies)[int(len(latencies) * 0.95) - 1]
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='IVF索引检索延迟基准')
+    parser.add_argument('--count', type=int, default=100000, help='向量数')
+    parser.add_argument('--dim', type=int, default=1024, help='向量维度')
+    parser.add_argument('--nprobe', type=int, default=16, help='扫描的倒排列表数')
+    parser.add_argument('--batch', type=int, default=2000, help='每次添加的向量数')
+    parser.add_argument('--queries', type=int, default=100, help='检索次数')
+    args = parser.parse_args()
+
+    result = run_benchmark(args.count, args.dim, args.nprobe, args.batch, args.queries)
+    print("\n=== IVF检索基准 ===")
+    print(f"向量数: {result['vectors']} | 维度: {args.dim} | nprobe: {args.nprobe}")
+    print(f"倒排列表数: {result['lists']} | 最长列表: {result['max_list']}")
+    print(f"构建耗时: {result['build_seconds']:.1f} 秒（其中训练 {result['train_seconds']:.1f} 秒）")
+    print(f"单次检索: 中位数 {result['median_ms']:.2f} ms | P95 {result['p95_ms']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -135,20 +135,17 @@ def test_model_call():
     original_runtime = service.bedrock_runtime
     mock_runtime = MagicMock()
     
-    # 模拟模型响应
+    # 模拟模型的流式响应
+    report_text = '# 会议摘要报告\n\n## 基本信息\n\n- 会议日期：2025年3月15日\n- 参会人员：张三、李四、王五\n- 会议主题：项目进度讨论\n\n## 主要内容\n\n1. 项目A进度已达80%，预计下周完成\n2. 项目B存在技术问题，需要团队协作解决\n3. 产品策略需要根据市场反馈调整'
     mock_response = {
-        'body': MagicMock()
-    }
-    mock_response['body'].read.return_value = json.dumps({
-        'content': [
-            {
-                'text': '# 会议摘要报告\n\n## 基本信息\n\n- 会议日期：2025年3月15日\n- 参会人员：张三、李四、王五\n- 会议主题：项目进度讨论\n\n## 主要内容\n\n1. 项目A进度已达80%，预计下周完成\n2. 项目B存在技术问题，需要团队协作解决\n3. 产品策略需要根据市场反馈调整'
-            }
+        'stream': [
+            {'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'text': report_text}}},
+            {'messageStop': {'stopReason': 'end_turn'}}
         ]
-    }).encode('utf-8')
+    }
     
     # 设置模拟返回值
-    mock_runtime.invoke_model.return_value = mock_response
+    mock_runtime.converse_stream.return_value = mock_response
     logger.info("设置模拟返回值成功")
     
     # 替换为模拟对象
@@ -165,7 +162,8 @@ def test_model_call():
         logger.info(f"报告前 100 字符: {result[:100]}")
         
         # 验证模拟对象被正确调用
-        assert mock_runtime.invoke_model.called, "invoke_model方法未被调用"
+        assert mock_runtime.converse_stream.called, "converse_stream方法未被调用"
+        assert result == report_text
         logger.info("验证模拟对象被正确调用成功")
         
         return result
@@ -0,0 +1,90 @@
+import time
+import pytest
+from unittest.mock import patch
+from app.services.modules.chat_sessions import ChatSession, ChatSessionStore, CHAT_KEEP_RECENT_TURNS
+
+
+class FakeChatModel:
+    """记录调用次数的假模型"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        if prompt.startswith("请把以下对话压缩"):
+            return "之前讨论了预算", "end_turn"
+        return f"回答{len(self.prompts)}", "end_turn"
+
+
+def make_session(model=None, queries=None):
+    """创建使用假检索和假模型的会话"""
+    def retrieve(query):
+        if queries is not None:
+            queries.append(query)
+        return ["文档片段"]
+    return ChatSession("report-1", retrieve, model or FakeChatModel())
+
+
+class TestChatSession:
+    """测试问答会话"""
+
+    def test_follow_up_costs_one_retrieval_and_one_call(self):
+        """测试每个追问只检索一次、调用一次模型，并带上一轮问题作为检索上下文"""
+        model = FakeChatModel()
+        queries = []
+        session = make_session(model, queries)
+
+        session.ask("预算是多少？")
+        result = session.ask("谁批准的？")
+
+        assert len(model.prompts) == 2 and len(queries) == 2
+        assert queries[1] == "预算是多少？\n谁批准的？"
+        assert "用户: 预算是多少？" in model.prompts[1]
+        assert result['sources'] == ["文档片段"]
+
+    def test_long_history_is_summarized(self):
+        """测试历史过长时较早的轮次被压缩为摘要"""
+        model = FakeChatModel()
+        session = make_session(model)
+
+        with patch('app.services.modules.chat_sessions.CHAT_HISTORY_MAX_TOKENS', 10):
+            for i in range(CHAT_KEEP_RECENT_TURNS + 1):
+                session.ask(f"问题{i}")
+
+        assert session.summary == "之前讨论了预算"
+        assert len(session.turns) == CHAT_KEEP_RECENT_TURNS
+        assert session.turn_count == CHAT_KEEP_RECENT_TURNS + 1
+
+
+class TestChatSessionStore:
+    """测试会话存储的LRU和空闲淘汰"""
+
+    def test_lru_eviction(self):
+        """测试超过上限时淘汰最久未使用的会话"""
+        store = ChatSessionStore(max_sessions=2)
+        first, second, third = make_session(), make_session(), make_session()
+        store.add(first)
+        store.add(second)
+        store.get(first.session_id)
+        store.add(third)
+
+        assert store.get(second.session_id) is None
+        assert store.get(first.session_id) is first
+        assert len(store) == 2
+
+    def test_idle_eviction(self):
+        """测试空闲超时的会话被淘汰"""
+        store = ChatSessionStore(idle_ttl=60)
+        session = store.add(make_session())
+        session.last_used = time.monotonic() - 120
+
+        assert store.get(session.session_id) is None
+        assert len(store) == 0
+
+    def test_session_bound_to_report(self):
+        """测试会话不能被其他报告使用"""
+        store = ChatSessionStore()
+        session = store.add(make_session())
+        assert store.get(session.session_id, "other-report") is None
+        assert store.get(session.session_id, "report-1") is session
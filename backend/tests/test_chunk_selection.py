@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, patch
+from app.utils.token_utils import estimate_tokens
+from app.services.modules.chunk_selection import kmeans, normalize_rows, select_by_mmr, select_chunks
+
+TOPICS = ["预算", "营销", "招聘"]
+
+
+def make_document(repeats=6):
+    """生成三个主题交替出现的块及其向量，同一主题的块向量几乎相同"""
+    rng = np.random.default_rng(1)
+    chunks, vectors = [], []
+    for i in range(repeats * len(TOPICS)):
+        topic = i % len(TOPICS)
+        chunks.append(f"第{i}块讨论{TOPICS[topic]}。" * 20)
+        vector = np.zeros(8)
+        vector[topic] = 1.0
+        vectors.append(vector + rng.normal(0, 0.01, 8))
+    return chunks, np.array(vectors)
+
+
+class TestChunkSelection:
+    """测试基于覆盖度的块选择"""
+
+    def test_kmeans_separates_topics(self):
+        """测试k-means把不同主题的块分到不同的簇"""
+        _, vectors = make_document()
+        labels, _ = kmeans(normalize_rows(vectors), 3)
+        assert len(set(labels[0::3])) == 1
+        assert len({labels[0], labels[1], labels[2]}) == 3
+
+    @pytest.mark.parametrize("strategy", ["kmeans", "mmr"])
+    def test_selection_covers_every_topic_within_budget(self, strategy):
+        """测试选中的块覆盖所有主题、不超过预算，并保持原文顺序"""
+        chunks, vectors = make_document()
+        budget = 3 * max(estimate_tokens(chunk) for chunk in chunks) + 10
+        selected = select_chunks(chunks, vectors, budget, strategy=strategy)
+
+        assert {topic for topic in TOPICS if any(topic in chunk for chunk in selected)} == set(TOPICS)
+        assert len(selected) == 3
+        assert [chunks.index(chunk) for chunk in selected] == sorted(chunks.index(chunk) for chunk in selected)
+
+    def test_small_document_kept_whole(self):
+        """测试整篇文档能放入预算时不做选择"""
+        chunks, vectors = make_document(repeats=1)
+        assert select_chunks(chunks, vectors, 100000) == chunks
+
+    def test_mmr_avoids_redundant_chunks(self):
+        """测试MMR不会连续选择重复的块"""
+        _, vectors = make_document()
+        order = select_by_mmr(normalize_rows(vectors), 3)
+        assert len({index % 3 for index in order}) == 3
+
+    def test_prepare_context_does_not_query_document_start(self):
+        """测试prepare_context默认按聚类选择块，而不是以文档开头为查询检索"""
+        from app.services.modules.report_generators import prepare_context
+
+        chunks, vectors = make_document()
+        service = MagicMock()
+        service.default_model_id = "amazon.titan-text-express-v1"
+        service.text_splitter.split_text.return_value = chunks
+        service.embeddings.embed_documents.return_value = vectors.tolist()
+
+        with patch('app.services.modules.report_generators.create_vector_store') as mock_store:
+            _, context, _, max_tokens = prepare_context(service, "文档", "{context}", strategy="kmeans")
+
+        mock_store.return_value.as_retriever.return_value.get_relevant_documents.assert_not_called()
+        assert mock_store.call_args[0][2] == vectors.tolist()
+        service.embeddings.embed_documents.assert_called_once()
+        assert all(topic in context for topic in TOPICS)
+        assert max_tokens > 0
@@ -0,0 +1,60 @@
+import tracemalloc
+from app.utils.chunk_utils import iter_chunks, iter_sentences, token_length
+
+
+def pieces(text, size=7):
+    """把文本切成固定大小的片段，模拟S3流式读取"""
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+class TestStreamingChunker:
+    """测试流式分块"""
+
+    def test_sentences_across_piece_boundaries(self):
+        """测试句子跨片段时正确拼接，中日文句号和换行作为边界"""
+        text = "会议开始。预算需要增加！\nThe budget was approved. Next item?\n\n下一项"
+        expected = ['会议开始。', '预算需要增加！', 'The budget was approved.', 'Next item?', '下一项']
+        assert list(iter_sentences(pieces(text, 3))) == expected
+        assert list(iter_sentences(text)) == expected
+
+    def test_chunks_respect_size_and_overlap(self):
+        """测试块不超过上限，相邻块之间有重叠，且覆盖全部句子"""
+        sentences = [f"第{i}项讨论了模块{i}的进度。" for i in range(100)]
+        chunks = list(iter_chunks(pieces("".join(sentences)), chunk_size=60, chunk_overlap=20))
+        assert all(len(chunk) <= 60 for chunk in chunks)
+        assert all(any(sentence in chunk for chunk in chunks) for sentence in sentences)
+        assert any(chunks[i].split("。")[-2] in chunks[i + 1] for i in range(len(chunks) - 1))
+
+    def test_long_sentence_and_token_length(self):
+        """测试超长句子被切开，按token估算块大小"""
+        chunks = list(iter_chunks("x" * 250 + "。短句。", chunk_size=100, chunk_overlap=10))
+        assert all(len(chunk) <= 100 for chunk in chunks)
+        assert chunks[0] == "x" * 99 and chunks[-1].endswith("x。短句。")
+        length = token_length('anthropic.claude-3-haiku-20240307-v1:0')
+        assert all(length(chunk) <= 50 for chunk in iter_chunks("预算需要增加。" * 100, 50, 10, length))
+
+    def test_overlap_without_boundaries(self):
+        """测试没有句子边界的文本按chunk_size - chunk_overlap的步长切分，相邻块保留重叠"""
+        assert [len(chunk) for chunk in iter_chunks("x" * 400, chunk_size=100, chunk_overlap=20)] == [99, 99, 99, 99, 80]
+
+        text = "".join(chr(0x4e00 + i % 500) for i in range(1000))
+        chunks = list(iter_chunks(pieces(text), chunk_size=100, chunk_overlap=20))
+        assert all(len(chunk) <= 100 for chunk in chunks)
+        # 跨过iter_sentences的硬切分位置时仍有重叠，且首尾相接覆盖全文
+        assert all(chunks[i][-19:] == chunks[i + 1][:19] for i in range(len(chunks) - 1))
+        assert chunks[0] + "".join(chunk[19:] for chunk in chunks[1:]) == text
+
+    def test_memory_stays_flat(self):
+        """测试处理大输入时内存不随输入长度增长"""
+        def stream():
+            for i in range(20000):
+                yield f"第{i}项：项目组讨论了模块{i}的进度。The budget item {i} was approved. "
+
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in iter_chunks(stream(), chunk_size=1000, chunk_overlap=200))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert count > 200
+        assert peak < 1024 * 1024
@@ -0,0 +1,110 @@
+import threading
+import time
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.llms.fake import FakeListLLM
+from app.services.modules.compression import (
+    split_sentences,
+    EmbeddingSentenceCompressor,
+    ConcurrentLLMChainExtractor,
+    create_document_compressor
+)
+
+VOCABULARY = "预算营销招聘午餐天气"
+
+
+class CharEmbeddings(Embeddings):
+    """按关键字出现次数生成向量的假嵌入模型，并记录调用次数"""
+
+    def __init__(self):
+        self.document_calls = 0
+        self.embedded = 0
+
+    def _embed(self, text):
+        return [float(text.count(char)) for char in VOCABULARY]
+
+    def embed_documents(self, texts):
+        self.document_calls += 1
+        self.embedded += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class TestEmbeddingCompression:
+    """测试基于向量相似度的本地压缩"""
+
+    def test_split_sentences(self):
+        """测试中英文混合的句子分割"""
+        assert split_sentences("预算已批准。营销下周开始！Lunch was fine. Next item") == [
+            "预算已批准。", "营销下周开始！", "Lunch was fine.", "Next item"
+        ]
+
+    def test_keeps_relevant_sentences_and_drops_irrelevant_documents(self):
+        """测试只保留相关句子，丢弃无关的块，并且只批量向量化一次"""
+        embeddings = CharEmbeddings()
+        compressor = EmbeddingSentenceCompressor(embeddings=embeddings)
+        documents = [
+            Document(page_content="今天的天气很好。午餐吃了面条。"),
+            Document(page_content="预算增加了百分之十。午餐很好吃。预算由财务批准。")
+        ]
+
+        compressed = compressor.compress_documents(documents, "预算")
+
+        assert len(compressed) == 1
+        assert compressed[0].page_content == "预算增加了百分之十。 预算由财务批准。"
+        assert embeddings.document_calls == 1
+
+    def test_sentence_embeddings_are_cached(self):
+        """测试相同的句子在后续查询中不再重复向量化"""
+        embeddings = CharEmbeddings()
+        compressor = EmbeddingSentenceCompressor(embeddings=embeddings)
+        documents = [Document(page_content="预算增加了。营销费用减少了。")]
+
+        compressor.compress_documents(documents, "预算")
+        compressor.compress_documents(documents, "营销")
+
+        assert embeddings.embedded == 2
+
+    def test_falls_back_to_best_document(self):
+        """测试没有句子超过阈值时保留最相关的块"""
+        compressor = EmbeddingSentenceCompressor(embeddings=CharEmbeddings(), similarity_threshold=0.99)
+        documents = [Document(page_content="天气很好"), Document(page_content="预算和营销")]
+        compressed = compressor.compress_documents(documents, "预算")
+        assert [doc.page_content for doc in compressed] == ["预算和营销"]
+
+
+class TestLLMCompression:
+    """测试并发的LLM压缩模式"""
+
+    def test_llm_mode_runs_concurrently(self):
+        """测试llm模式并发调用模型并保持顺序"""
+        active = {'now': 0, 'max': 0}
+        lock = threading.Lock()
+
+        class SlowLLM(FakeListLLM):
+            def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+                with lock:
+                    active['now'] += 1
+                    active['max'] = max(active['max'], active['now'])
+                time.sleep(0.05)
+                with lock:
+                    active['now'] -= 1
+                return prompt.split(">>>", 1)[1].split(">>>", 1)[0].strip()
+
+        compressor = create_document_compressor("llm", llm=SlowLLM(responses=["x"]))
+        assert isinstance(compressor, ConcurrentLLMChainExtractor)
+
+        documents = [Document(page_content=f"第{i}块") for i in range(4)]
+        compressed = compressor.compress_documents(documents, "问题")
+
+        assert [doc.page_content for doc in compressed] == [f"第{i}块" for i in range(4)]
+        assert active['max'] > 1
+
+    def test_unknown_mode(self):
+        """测试未知的压缩模式报错"""
+        assert create_document_compressor("none") is None
+        with pytest.raises(Exception):
+            create_document_compressor("rerank")
@@ -0,0 +1,159 @@
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from langchain.schema.messages import HumanMessage, SystemMessage
+from app import create_app
+from app.services.modules.converse import (
+    ConverseChatModel, ConverseStream, build_request, invoke_text, invoke_tool, stream_text
+)
+
+
+def _events(*texts, stop_reason='end_turn'):
+    events = [{'messageStart': {'role': 'assistant'}}]
+    events += [{'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'text': text}}} for text in texts]
+    events += [
+        {'contentBlockStop': {'contentBlockIndex': 0}},
+        {'messageStop': {'stopReason': stop_reason}},
+        {'metadata': {'usage': {'inputTokens': 10, 'outputTokens': len(texts), 'totalTokens': 10 + len(texts)},
+                      'metrics': {'latencyMs': 42}}}
+    ]
+    return events
+
+
+def _client(*texts, stop_reason='end_turn'):
+    client = MagicMock()
+    client.converse_stream.side_effect = lambda **request: {'stream': iter(_events(*texts, stop_reason=stop_reason))}
+    return client
+
+
+class TestConverseStream:
+    """测试基于ConverseStream的统一模型调用"""
+
+    def test_build_request_uses_model_config(self):
+        """测试未指定的推理参数使用模型配置，所有模型使用同一种请求格式"""
+        request = build_request('amazon.titan-text-express-v1', [{'role': 'user', 'content': [{'text': 'hi'}]}],
+                                system='规则', stop_sequences=['END'])
+
+        assert request['inferenceConfig'] == {'maxTokens': 2000, 'temperature': 0.2, 'stopSequences': ['END']}
+        assert request['system'] == [{'text': '规则'}]
+        assert 'toolConfig' not in request
+
+    def test_tokens_yielded_before_stream_ends(self):
+        """测试第一段文本在流结束前就能取到"""
+        consumed = []
+
+        def events():
+            for event in _events('第一段', '第二段'):
+                consumed.append(event)
+                yield event
+
+        client = MagicMock()
+        client.converse_stream.return_value = {'stream': events()}
+        stream = stream_text(client, 'anthropic.claude-3-haiku-20240307-v1:0', '生成报告')
+
+        assert next(iter(stream)) == '第一段'
+        assert len(consumed) == 2
+        assert stream.stop_reason is None
+
+    def test_usage_and_latency_metrics(self):
+        """测试流结束后记录停止原因、用量和延迟"""
+        stream = stream_text(_client('a', 'b', stop_reason='max_tokens'), 'amazon.titan-text-express-v1', 'x', 100)
+
+        assert stream.read() == 'ab'
+        assert stream.stop_reason == 'max_tokens'
+        assert stream.usage['outputTokens'] == 2
+        assert stream.metrics['latency_ms'] == 42
+        assert stream.metrics['time_to_first_token_ms'] is not None
+        assert stream.metrics['total_ms'] >= stream.metrics['time_to_first_token_ms']
+
+    def test_invoke_text_callback(self):
+        """测试invoke_text逐段回调并返回 (文本, 停止原因)"""
+        tokens = []
+        text, stop_reason = invoke_text(_client('报', '告'), 'amazon.titan-text-express-v1', 'x', on_token=tokens.append)
+
+        assert (text, stop_reason) == ('报告', 'end_turn')
+        assert tokens == ['报', '告']
+
+    def test_stream_error_event_raises(self):
+        """测试流中的错误事件抛出异常"""
+        client = MagicMock()
+        client.converse_stream.return_value = {'stream': [
+            {'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'text': '部分'}}},
+            {'throttlingException': {'message': 'Too many requests'}}
+        ]}
+
+        with pytest.raises(Exception, match='throttlingException'):
+            ConverseStream(client, build_request('amazon.titan-text-express-v1', [])).read()
+
+
+    def test_invoke_tool_forces_tool_and_returns_input(self):
+        """测试用toolChoice强制调用指定工具，返回解析后的工具输入；模型不调用工具时报错"""
+        client = MagicMock()
+        client.converse_stream.return_value = {'stream': [
+            {'contentBlockStart': {'contentBlockIndex': 0, 'start': {'toolUse': {'toolUseId': 't1', 'name': 'record'}}}},
+            {'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'toolUse': {'input': '{"title": '}}}},
+            {'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'toolUse': {'input': '"周会"}'}}}},
+            {'contentBlockStop': {'contentBlockIndex': 0}},
+            {'messageStop': {'stopReason': 'tool_use'}}
+        ]}
+        schema = {'type': 'object', 'properties': {'title': {'type': 'string'}}}
+
+        result = invoke_tool(client, 'anthropic.claude-3-haiku-20240307-v1:0', '抽取', 'record', '记录结果', schema)
+
+        assert result == {'title': '周会'}
+        tool_config = client.converse_stream.call_args.kwargs['toolConfig']
+        assert tool_config['toolChoice'] == {'tool': {'name': 'record'}}
+        assert tool_config['tools'][0]['toolSpec']['inputSchema'] == {'json': schema}
+        with pytest.raises(Exception, match='record'):
+            invoke_tool(_client('{"title": "周会"}'), 'anthropic.claude-3-haiku-20240307-v1:0', '抽取', 'record', '', schema)
+
+
+class TestConverseChatModel:
+    """测试LangChain聊天模型封装"""
+
+    def test_invoke_merges_messages(self):
+        """测试系统消息放入system，相邻的用户消息合并，响应元数据包含停止原因和用量"""
+        client = _client('你好')
+        model = ConverseChatModel(client=client, model_id='meta.llama3-70b-instruct-v1:0', max_tokens=256)
+
+        response = model.invoke([SystemMessage(content='简洁回答'), HumanMessage(content='a'), HumanMessage(content='b')])
+
+        request = client.converse_stream.call_args.kwargs
+        assert request['system'] == [{'text': '简洁回答'}]
+        assert request['messages'] == [{'role': 'user', 'content': [{'text': 'a'}, {'text': 'b'}]}]
+        assert request['inferenceConfig']['maxTokens'] == 256
+        assert response.content == '你好'
+        assert response.response_metadata['stop_reason'] == 'end_turn'
+        assert response.response_metadata['usage']['inputTokens'] == 10
+
+    def test_stream_yields_chunks(self):
+        """测试stream逐段返回文本"""
+        model = ConverseChatModel(client=_client('一', '二'), model_id='amazon.titan-text-express-v1')
+        assert ''.join(chunk.content for chunk in model.stream('x')) == '一二'
+
+
+class TestReportStreamAPI:
+    """测试流式生成报告API"""
+
+    @patch('app.api.report.update_metadata_in_dynamodb')
+    @patch('app.api.report.index_document_async')
+    @patch('app.api.report.boto3')
+    @patch('app.api.report.store_report_content', return_value='reports/r.md')
+    @patch('app.api.report.get_file_content_by_id', return_value='会议内容')
+    @patch('app.api.report.get_metadata_from_dynamodb', return_value={'file_id': 'f1'})
+    @patch('app.api.report.stream_report')
+    def test_generate_stream(self, mock_stream, mock_metadata, mock_content, mock_store, mock_boto3,
+                             mock_index, mock_update):
+        """测试文本以SSE逐段推送，结束后保存报告并返回用量和延迟"""
+        mock_stream.side_effect = lambda *args: stream_text(_client('# 报告', '正文'), 'amazon.titan-text-express-v1', 'x')
+        client = create_app({'TESTING': True}).test_client()
+
+        response = client.post('/api/report/generate/stream', json={'file_id': 'f1'})
+        events = [chunk for chunk in response.get_data(as_text=True).split('\n\n') if chunk]
+
+        assert response.mimetype == 'text/event-stream'
+        assert [event.split('\n')[0] for event in events] == ['event: token', 'event: token', 'event: done']
+        done = json.loads(events[-1].split('data: ', 1)[1])
+        assert done['usage']['outputTokens'] == 2
+        mock_store.assert_called_once_with(done['report_id'], '# 报告正文')
+        assert client.post('/api/report/generate/stream', json={}).status_code == 400
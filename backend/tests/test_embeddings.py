@@ -0,0 +1,109 @@
+import io
+import json
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+from app.services.modules.embeddings import ConcurrentBedrockEmbeddings, iter_embeddings
+from app.services.modules.rate_limiter import bedrock_limiter
+
+
+class FakeBedrockClient:
+    """返回文本长度作为向量的假Bedrock客户端，记录并发数并可模拟限流"""
+
+    def __init__(self, delay=0.0, throttle_first=0):
+        self.delay = delay
+        self.throttle_first = throttle_first
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body, contentType, accept):
+        request = json.loads(body)
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.throttle_first:
+                raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'InvokeModel')
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        if "texts" in request:
+            payload = {"embeddings": [[float(len(text))] for text in request["texts"]]}
+        else:
+            payload = {"embedding": [float(len(request["inputText"]))]}
+        return {"body": io.BytesIO(json.dumps(payload).encode('utf-8'))}
+
+
+TEXTS = ["a" * (i + 1) for i in range(20)]
+
+
+class TestConcurrentEmbeddings:
+    """测试并发批量嵌入"""
+
+    def test_concurrent_and_ordered(self):
+        """测试单条输入的模型并发请求，结果保持输入顺序"""
+        client = FakeBedrockClient(delay=0.02)
+        embeddings = ConcurrentBedrockEmbeddings(client, max_workers=5)
+
+        vectors = embeddings.embed_documents(TEXTS)
+
+        assert vectors == [[float(i + 1)] for i in range(20)]
+        assert client.calls == 20
+        assert client.max_active > 1
+
+    def test_batch_model_uses_batch_requests(self):
+        """测试支持批量输入的模型按批发送"""
+        client = FakeBedrockClient()
+        embeddings = ConcurrentBedrockEmbeddings(client, model_id="cohere.embed-multilingual-v3")
+
+        vectors = embeddings.embed_documents(TEXTS * 10)
+
+        assert client.calls == 3
+        assert vectors[:20] == [[float(i + 1)] for i in range(20)]
+
+    @patch('app.services.modules.rate_limiter.time.sleep')
+    def test_retries_on_throttling(self, mock_sleep):
+        """测试限流时由共享的限流器退避重试，并缩减该模型的并发上限"""
+        client = FakeBedrockClient(throttle_first=2)
+        embeddings = ConcurrentBedrockEmbeddings(client, model_id="test.embed-retry")
+
+        assert embeddings.embed_query("abc") == [3.0]
+        assert mock_sleep.call_count == 2
+        stats = bedrock_limiter.stats()["test.embed-retry"]
+        assert stats['throttles'] == 2
+        assert stats['in_flight'] == 0
+
+    @patch('app.services.modules.rate_limiter.time.sleep')
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        """测试超过限流器的重试次数后报错"""
+        client = FakeBedrockClient(throttle_first=bedrock_limiter.max_retries + 1)
+        embeddings = ConcurrentBedrockEmbeddings(client, model_id="test.embed-give-up")
+        with pytest.raises(Exception, match="嵌入请求失败"):
+            embeddings.embed_query("abc")
+        assert client.calls == bedrock_limiter.max_retries + 1
+
+
+class TestStreamingEmbeddings:
+    """测试流式向量化"""
+
+    def test_stream_consumes_input_lazily(self):
+        """测试按需从生成器取文本，结果与输入顺序一致"""
+        client = FakeBedrockClient()
+        embeddings = ConcurrentBedrockEmbeddings(client, max_workers=2)
+        consumed = []
+
+        def texts():
+            for text in TEXTS:
+                consumed.append(text)
+                yield text
+
+        stream = iter_embeddings(embeddings, texts())
+        first = next(stream)
+        assert first == ("a", [1.0])
+        assert len(consumed) < len(TEXTS)
+        assert [vector for _, vector in stream] == [[float(i + 1)] for i in range(1, 20)]
@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from app.utils.encoding_utils import detect_encoding, decode_stream
+
+JAPANESE_NOTES = "本日の会議では、新製品のロードマップと予算について議論しました。次回は来週の月曜日です。\n" * 30
+CHINESE_NOTES = "今天的会议讨论了新产品路线图和预算问题。下次会议定于下周一举行。\n" * 30
+TRADITIONAL_NOTES = "今天的會議討論了新產品路線圖和預算問題。下次會議定於下週一舉行。\n" * 30
+
+
+def _chunks(data, size=7):
+    """按固定大小切分字节，模拟S3流式读取（多字节字符会被切断）"""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestEncodingDetection:
+    """测试编码检测与增量解码"""
+
+    @pytest.mark.parametrize('text, encoding, expected', [
+        (JAPANESE_NOTES, 'cp932', 'cp932'),
+        (JAPANESE_NOTES, 'euc-jp', 'euc-jp'),
+        (CHINESE_NOTES, 'gbk', 'gb18030'),
+        (TRADITIONAL_NOTES, 'big5', 'big5'),
+        (JAPANESE_NOTES, 'utf-16', 'utf-16'),
+        (CHINESE_NOTES, 'utf-16-le', 'utf-16-le'),
+        (CHINESE_NOTES, 'utf-8', 'utf-8'),
+        (CHINESE_NOTES, 'utf-8-sig', 'utf-8-sig'),
+    ])
+    def test_detect_encoding(self, text, encoding, expected):
+        """测试从样本前缀检测常见的CJK编码"""
+        assert detect_encoding(text.encode(encoding)[:1001]) == expected
+
+    def test_decode_stream_split_chunks(self):
+        """测试多字节字符跨块切断时仍能正确解码"""
+        encoding, pieces = decode_stream(_chunks(JAPANESE_NOTES.encode('cp932')))
+        assert encoding == 'cp932'
+        assert ''.join(pieces) == JAPANESE_NOTES
+
+    def test_decode_stream_reads_once(self):
+        """测试检测只缓冲开头的样本，整个流只读取一次"""
+        data = CHINESE_NOTES.encode('gbk')
+        consumed = []
+
+        def source():
+            for chunk in _chunks(data, 64):
+                consumed.append(chunk)
+                yield chunk
+
+        encoding, pieces = decode_stream(source(), sample_size=256)
+        assert len(consumed) == 4
+        assert ''.join(pieces) == CHINESE_NOTES
+        assert b''.join(consumed) == data
+
+    def test_decode_stream_known_encoding(self):
+        """测试指定编码时跳过检测"""
+        with patch('app.utils.encoding_utils.detect_encoding') as mock_detect:
+            encoding, pieces = decode_stream(_chunks(CHINESE_NOTES.encode('gbk')), encoding='gbk')
+            assert ''.join(pieces) == CHINESE_NOTES
+            mock_detect.assert_not_called()
+
+
+class TestStorageDecoding:
+    """测试S3文本读取时的编码处理"""
+
+    @patch('app.services.storage.update_metadata_in_dynamodb')
+    @patch('app.services.storage.save_extracted_text')
+    @patch('app.services.storage.get_s3_client')
+    def test_get_file_text_caches_encoding(self, mock_get_s3_client, mock_save_extracted_text,
+                                           mock_update_metadata):
+        """测试旧的Shift-JIS文件被流式解码，并将检测到的编码缓存到元数据"""
+        from app.services.storage import get_file_text
+
+        body = MagicMock()
+        body.iter_chunks.return_value = iter(_chunks(JAPANESE_NOTES.encode('cp932'), 1024))
+        mock_get_s3_client.return_value.get_object.return_value = {'Body': body}
+        mock_save_extracted_text.return_value = 'extracted/test-file-id.txt'
+
+        metadata = {'file_id': 'test-file-id', 's3_key': 'uploads/notes.txt', 'original_filename': 'notes.txt'}
+        content = get_file_text(metadata)
+
+        assert content == JAPANESE_NOTES.strip()
+        assert metadata['encoding'] == 'cp932'
+        assert metadata['extracted_s3_key'] == 'extracted/test-file-id.txt'
+        mock_update_metadata.assert_called_once_with(metadata)
@@ -0,0 +1,154 @@
+from unittest.mock import MagicMock, patch
+from app.services.modules.extraction import ExtractionEngine, EXTRACTION_TOOL
+
+
+ZH_MINUTES = """# 产品周会
+日期: 2024-05-10
+参会人员: 张三、李四、王五
+议题: 预算审批、招聘计划
+张三: 决定下季度预算增加10%
+李四: 由王五负责在5月20日前提交招聘方案
+与华为有限公司的合作在上海市推进，讨论了《智能助手》
+"""
+
+JA_MINUTES = """定例会議
+日時: 2024年5月10日
+出席者: 田中、佐藤
+田中: 新機能のリリースを承認しました
+佐藤さんが来週までに資料を対応する予定です
+株式会社サンプルとの打ち合わせは東京都で行う
+"""
+
+EN_MINUTES = """Weekly sync
+Date: May 10, 2024
+Attendees: Alice, Bob
+Decision: ship the beta next week
+Bob will update the roadmap by May 17
+Owner: dave update the docs
+Meeting with Acme Corp about the launch
+"""
+
+
+class TestRuleExtraction:
+    """测试规则集的单遍抽取"""
+
+    def test_chinese_minutes(self):
+        """测试中文会议记录的参会人、议题、决定事项、行动项和实体"""
+        result = ExtractionEngine().extract(ZH_MINUTES)
+
+        assert result['title'] == '产品周会'
+        assert result['date'] == '2024-05-10'
+        assert result['participants'] == ['张三', '李四', '王五']
+        assert result['agenda'] == ['预算审批', '招聘计划']
+        assert result['decisions'] == ['决定下季度预算增加10%']
+        assert result['action_items'] == [{'item': '由王五负责在5月20日前提交招聘方案',
+                                           'assignee': '王五', 'deadline': '5月20日'}]
+        assert result['entities']['organizations'] == ['华为有限公司']
+        assert result['entities']['locations'] == ['上海市']
+        assert result['entities']['products'] == ['智能助手']
+
+    def test_japanese_minutes(self):
+        """测试日文会议记录的日期、决定事项、负责人和实体"""
+        result = ExtractionEngine().extract(JA_MINUTES)
+
+        assert result['date'] == '2024年5月10日'
+        assert result['participants'] == ['田中', '佐藤']
+        assert result['decisions'] == ['新機能のリリースを承認しました']
+        assert result['action_items'][0]['assignee'] == '佐藤'
+        assert result['action_items'][0]['deadline'] == '来週'
+        assert '株式会社サンプル' in result['entities']['organizations']
+        assert '東京都' in result['entities']['locations']
+
+    def test_english_minutes(self):
+        """测试英文会议记录，Owner标签不被当作发言人"""
+        result = ExtractionEngine().extract(EN_MINUTES)
+
+        assert result['date'] == 'May 10, 2024'
+        assert result['participants'] == ['Alice', 'Bob']
+        assert result['decisions'] == ['ship the beta next week']
+        assignees = [item['assignee'] for item in result['action_items']]
+        assert assignees == ['Bob', 'dave']
+        assert result['action_items'][0]['deadline'] == 'May 17'
+        assert 'Owner' not in result['entities']['people']
+        assert 'Acme Corp' in result['entities']['organizations']
+
+    def test_empty_text(self):
+        """测试空文本返回空结构"""
+        result = ExtractionEngine().extract('')
+        assert result['title'] == ''
+        assert result['date'] is None
+        assert result['action_items'] == []
+        assert result['entities']['people'] == []
+
+
+class TestModelExtraction:
+    """测试可选的模型抽取和缓存"""
+
+    def test_model_result_cached_per_content(self):
+        """测试相同内容只调用一次模型，模型结果覆盖规则结果"""
+        engine = ExtractionEngine()
+        invoke = MagicMock(return_value={
+            'title': '产品周会（第12次）',
+            'decisions': [],
+            'entities': {'people': ['张三', '李四', '王五', '赵六']}
+        })
+
+        first = engine.extract_with_llm(ZH_MINUTES, invoke, namespace='model-a')
+        second = engine.extract_with_llm(ZH_MINUTES, invoke, namespace='model-a')
+
+        invoke.assert_called_once()
+        prompt, tool = invoke.call_args[0]
+        assert tool == EXTRACTION_TOOL and '张三' in prompt
+        assert first == second
+        assert first['title'] == '产品周会（第12次）'
+        # 空字段保留规则结果
+        assert first['decisions'] == ['决定下季度预算增加10%']
+        assert first['entities']['people'] == ['张三', '李四', '王五', '赵六']
+        assert first['entities']['locations'] == ['上海市']
+
+    def test_invalid_model_output_falls_back(self):
+        """测试模型没有调用抽取工具时返回规则结果且不缓存"""
+        engine = ExtractionEngine()
+        invoke = MagicMock(side_effect=Exception("模型没有调用工具 record_document_structure"))
+
+        result = engine.extract_with_llm(EN_MINUTES, invoke)
+
+        assert result == engine.extract(EN_MINUTES)
+        engine.extract_with_llm(EN_MINUTES, invoke)
+        assert invoke.call_count == 2
+
+
+class TestSinglePassAnalysis:
+    """测试报告生成只做一次文档分析"""
+
+    @patch('app.services.haystack_service.extraction_engine')
+    def test_analyze_document_scans_once(self, mock_engine):
+        """测试analyze_document只调用一次规则抽取并附带关键词"""
+        from app.services.haystack_service import haystack_service
+        mock_engine.extract.return_value = ExtractionEngine().extract(EN_MINUTES)
+
+        result = haystack_service.analyze_document(EN_MINUTES, top_n=5, use_llm=False)
+
+        mock_engine.extract.assert_called_once_with(EN_MINUTES)
+        mock_engine.extract_with_llm.assert_not_called()
+        assert len(result['keywords']) <= 5
+        assert result['participants'] == ['Alice', 'Bob']
+
+    @patch('app.services.report_generator.haystack_service')
+    def test_complete_report_uses_single_analysis(self, mock_haystack):
+        """测试完整报告的关键词、结构和实体来自同一次分析"""
+        from app.services.report_generator import ReportGenerator
+        analysis = ExtractionEngine().extract(ZH_MINUTES)
+        analysis['keywords'] = [('预算', 1.0)]
+        mock_haystack.analyze_document.return_value = analysis
+        generator = ReportGenerator()
+
+        with patch.object(generator, 'generate_report', return_value='报告'):
+            result = generator.generate_complete_report(ZH_MINUTES, model_id='model-a')
+
+        mock_haystack.analyze_document.assert_called_once_with(ZH_MINUTES, top_n=15, model_id='model-a')
+        mock_haystack.extract_keywords.assert_not_called()
+        mock_haystack.extract_entities.assert_not_called()
+        assert result['keywords'] == [('预算', 1.0)]
+        assert result['structure']['topics'] == ['预算审批', '招聘计划']
+        assert result['entities']['products'] == ['智能助手']
@@ -0,0 +1,121 @@
+import numpy as np
+from unittest.mock import patch
+from langchain_core.embeddings import Embeddings
+from app import create_app
+from app.utils.tokenizer_utils import tokenize
+from app.services.modules.inverted_index import (
+    InvertedIndex, Segment, build_segment, vbyte_encode, vbyte_decode
+)
+from app.services.search_service import SearchService
+
+
+class ConstantEmbeddings(Embeddings):
+    """返回固定向量的假嵌入模型（关键词检索不使用向量）"""
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+def meta(doc_id, category='general', doc_type='file', timestamp=0.0):
+    return (doc_type, doc_id, category, timestamp, doc_id)
+
+
+class TestTokenizer:
+    """测试CJK n-gram分词"""
+
+    def test_cjk_bigrams_and_words(self):
+        """测试中日文按二元组切分，拉丁文字按单词切分并转为小写"""
+        assert tokenize("AI予算を承認") == ['ai', '予算', '算を', 'を承', '承認']
+        assert tokenize("预算 Budget，２０２４年") == ['预算', 'budget', '2024', '年']
+        assert tokenize("") == []
+
+
+class TestInvertedIndex:
+    """测试倒排索引"""
+
+    def test_vbyte_round_trip(self):
+        """测试可变字节编码的往返一致"""
+        values = np.array([0, 1, 127, 128, 16383, 16384, 2 ** 31], dtype=np.int64)
+        encoded = vbyte_encode(values)
+        assert encoded.dtype == np.uint8
+        assert np.array_equal(vbyte_decode(encoded), values)
+
+    def test_bm25_ranking_and_filters(self):
+        """测试BM25按词频排序，并支持类别、类型和时间过滤"""
+        index = InvertedIndex()
+        index.add_documents([
+            (meta('f1', 'meeting', timestamp=100.0), "预算增加了。预算由财务批准。"),
+            (meta('f2', 'contract', timestamp=200.0), "合同条款和预算附件。"),
+            (meta('r1', 'report', 'report', 300.0), "营销报告：营销活动下周开始。"),
+        ])
+
+        assert [hit[0][1] for hit in index.search("预算")] == ['f1', 'f2']
+        assert [hit[0][1] for hit in index.search("预算", category='contract')] == ['f2']
+        assert [hit[0][1] for hit in index.search("营销", doc_type='report')] == ['r1']
+        assert [hit[0][1] for hit in index.search("预算", start=150.0, end=250.0)] == ['f2']
+        assert index.search("天气") == []
+
+    def test_merge_purges_deleted_documents(self):
+        """测试同一层级段数达到合并因子时合并，合并后清除已删除和被替换的文档"""
+        index = InvertedIndex(merge_factor=3)
+        index.add_documents([(meta('f1'), "午餐很好吃")])
+        index.add_documents([(meta('f2'), "午餐和晚餐")])
+        assert index.plan_merge() is None
+        index.add_documents([(meta('f1'), "招聘工程师")])
+        index.remove_document('file', 'f2')
+
+        merged = index.merge(index.plan_merge())
+        assert len(index.segments) == 1
+        assert merged.level == 1
+        assert [item[1] for item in merged.doc_meta] == ['f1']
+        assert index.search("午餐") == []
+        assert index.search("招聘")[0][0][1] == 'f1'
+
+    def test_segment_arrays_round_trip(self):
+        """测试段的序列化和反序列化"""
+        segment = build_segment([(0, meta('f1'), "预算增加了"), (1, meta('f2'), "budget approved")])
+        restored = Segment.from_arrays(segment.to_arrays())
+        assert restored.terms == segment.terms
+        assert [tuple(item) for item in restored.doc_meta] == [tuple(item) for item in segment.doc_meta]
+        positions, tfs = restored.postings_for('budget')
+        assert positions.tolist() == [1] and tfs.tolist() == [1]
+
+
+class TestKeywordSearchService:
+    """测试检索服务的关键词模式"""
+
+    def test_keyword_search_persists_and_merges(self, tmp_path):
+        """测试关键词索引在合并和重新加载后保持，删除的文档不会被检索到"""
+        with patch('app.services.modules.inverted_index.SEGMENT_MERGE_FACTOR', 2):
+            service = SearchService(index_dir=str(tmp_path), s3_prefix='', embeddings=ConstantEmbeddings())
+            service.keyword_index = InvertedIndex(merge_factor=2)
+            service._loaded = True
+            service.index_document('file', 'f1', "預算の承認について", 'meeting', '2024-01-10')
+            service.index_document('report', 'r1', "营销活动下周开始", 'report', '2024-03-01')
+            service.index_document('file', 'f2', "天气晴朗", 'general', '2024-02-01')
+            service.remove_document('file', 'f2')
+
+            reloaded = SearchService(index_dir=str(tmp_path), s3_prefix='', embeddings=ConstantEmbeddings())
+            assert [r['doc_id'] for r in reloaded.search("承認", mode='keyword')] == ['f1']
+            assert [r['doc_id'] for r in reloaded.search("营销", mode='keyword', doc_type='report')] == ['r1']
+            assert reloaded.search("天气", mode='keyword') == []
+            assert len(reloaded._segment_files('keyword')) < 3
+
+
+class TestKeywordSearchAPI:
+    """测试关键词检索API"""
+
+    @patch('app.api.search.search_documents')
+    def test_keyword_mode(self, mock_search):
+        """测试mode参数传递和校验"""
+        mock_search.return_value = []
+        client = create_app({'TESTING': True}).test_client()
+
+        response = client.get('/api/search?q=预算&mode=keyword')
+        assert response.status_code == 200
+        assert response.get_json()['mode'] == 'keyword'
+        assert mock_search.call_args.kwargs['mode'] == 'keyword'
+        assert client.get('/api/search?q=预算&mode=fuzzy').status_code == 400
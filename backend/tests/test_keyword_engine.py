@@ -0,0 +1,106 @@
+from unittest.mock import patch
+from app import create_app
+from app.services.modules.inverted_index import InvertedIndex
+from app.services.modules.keyword_engine import KeywordEngine
+
+
+class TestKeywordEngine:
+    """测试基于语料库文档频率的关键词引擎"""
+
+    def test_corpus_idf_demotes_common_terms(self):
+        """测试在语料库中普遍出现的词排名低于文档特有的词"""
+        engine = KeywordEngine(scoring='tfidf')
+        engine.add_documents([f"meeting notes agenda item {i}" for i in range(20)])
+
+        keywords = engine.extract_keywords("meeting meeting meeting budget budget", top_n=2)
+        assert keywords[0][0] == 'budget'
+        assert 'the' not in [term for term, _ in engine.extract_keywords("the the the budget")]
+
+    def test_duplicate_documents_counted_once(self):
+        """测试同一文档重复提交时文档频率不重复增加"""
+        engine = KeywordEngine()
+        engine.add_documents(["预算审批", "预算审批"])
+        engine.extract_keywords("预算审批")
+        assert engine.document_count == 1
+        assert engine.document_frequency[engine.vocabulary['预算']] == 1
+
+    def test_batch_matches_single_document_scoring(self):
+        """测试批量模式与逐个打分结果一致，空文档返回空列表"""
+        texts = ["招聘两名工程师，招聘预算已批准", "营销活动下周开始", "", "budget review for marketing"]
+        engine = KeywordEngine()
+        engine.add_documents(texts)
+
+        batch = engine.score_batch(texts, top_n=3, update_corpus=False)
+        assert batch[2] == []
+        for text, keywords in zip(texts, batch):
+            assert keywords == engine.extract_keywords(text, top_n=3, update_corpus=False)
+            assert len(keywords) <= 3
+            assert [score for _, score in keywords] == sorted((score for _, score in keywords), reverse=True)
+        assert batch[0][0][0] == '招聘'
+
+
+class TestKeywordCorpus:
+    """测试以持久化的倒排索引作为语料库"""
+
+    def test_document_frequencies_from_inverted_index(self):
+        """测试文档频率来自倒排索引（已删除的文档不计入），打分不修改语料库"""
+        index = InvertedIndex()
+        index.add_documents([(('file', f"f{i}", '', 0.0, ''), f"meeting notes agenda item {i}") for i in range(20)])
+        index.add_documents([(('file', 'budget-doc', '', 0.0, ''), "budget budget review")])
+        engine = KeywordEngine(scoring='tfidf')
+        engine.set_corpus(index.corpus_statistics)
+
+        keywords = engine.extract_keywords("meeting meeting meeting budget budget", top_n=2)
+        assert keywords[0][0] == 'budget'
+        assert engine.document_count == 0
+
+        frequencies, document_count, _ = index.corpus_statistics(['budget', 'meeting'])
+        assert list(frequencies) == [1, 20] and document_count == 21
+        index.remove_document('file', 'budget-doc')
+        frequencies, document_count, _ = index.corpus_statistics(['budget', 'meeting'])
+        assert list(frequencies) == [0, 20] and document_count == 20
+
+    def test_falls_back_when_corpus_unavailable(self):
+        """测试语料库读取失败时使用内存中的文档频率"""
+        def broken(terms):
+            raise Exception("index unavailable")
+
+        engine = KeywordEngine()
+        engine.add_documents(["预算审批", "招聘计划"])
+        expected = engine.extract_keywords("预算审批")
+        engine.set_corpus(broken)
+        assert engine.extract_keywords("预算审批") == expected
+
+
+class TestKeywordAPI:
+    """测试关键词抽取API的批量模式"""
+
+    @patch('app.api.model.haystack_service.extract_keywords_batch')
+    def test_batch_keywords(self, mock_batch):
+        """测试texts参数一次抽取多个文档的关键词"""
+        mock_batch.return_value = [['budget'], ['hiring']]
+        client = create_app({'TESTING': True}).test_client()
+
+        response = client.post('/api/model/semantic/keywords', json={'texts': ['a', 'b'], 'top_n': 1})
+
+        assert response.status_code == 200
+        assert response.get_json()['results'] == [{'keywords': ['budget']}, {'keywords': ['hiring']}]
+        mock_batch.assert_called_once_with(['a', 'b'], top_n=1)
+        assert client.post('/api/model/semantic/keywords', json={'texts': 'a'}).status_code == 400
+
+    @patch('app.services.storage.get_file_content_by_id')
+    def test_file_keywords_ignore_header_and_missing_files(self, mock_get_content):
+        """测试文件内容的元数据头不参与关键词打分，找不到的文件返回错误"""
+        from app.services.storage import build_content_with_header
+        content = build_content_with_header('abc123', {'original_filename': 'notes.txt'}, "预算 预算 审批 招聘")
+        mock_get_content.side_effect = lambda file_id: content if file_id == 'abc123' else None
+        client = create_app({'TESTING': True}).test_client()
+
+        response = client.post('/api/model/semantic/keywords', json={'file_ids': ['abc123', 'missing'], 'top_n': 3})
+
+        results = response.get_json()['results']
+        assert response.status_code == 200
+        assert results[0]['file_id'] == 'abc123'
+        assert results[0]['keywords'] and all(term in "预算 审批 招聘" for term in results[0]['keywords'])
+        assert results[1] == {'file_id': 'missing', 'error': 'File with ID missing not found'}
+        assert client.post('/api/model/semantic/keywords', json={'file_id': 'missing'}).status_code == 404
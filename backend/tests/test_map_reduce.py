@@ -0,0 +1,222 @@
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from app.services.modules.map_reduce import (
+    SummaryCache,
+    split_document,
+    map_chunks,
+    reduce_summaries,
+    map_reduce_generate
+)
+
+TRANSCRIPT = "\n\n".join(
+    f"第{i}段：项目组讨论了模块{i}的进度，决定由成员{i % 7}在下周完成测试。" * 5 for i in range(200)
+)
+
+
+class FakeModel:
+    """记录调用次数和最大并发数的假模型"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return f"摘要({len(prompt)})"
+
+
+class TestMapReduce:
+    """测试分层Map-Reduce摘要"""
+
+    def test_split_document(self):
+        """测试切分后的块不超过上限且覆盖全文"""
+        chunks = split_document(TRANSCRIPT, chunk_size=2000, chunk_overlap=0)
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 2000 for chunk in chunks)
+        assert "第199段" in chunks[-1]
+
+    def test_map_bounded_concurrency(self):
+        """测试各块并发摘要且并发数不超过上限"""
+        model = FakeModel(delay=0.02)
+        chunks = [f"块{i}" for i in range(12)]
+        summaries = map_chunks(chunks, model, max_workers=3, cache=SummaryCache())
+        assert len(summaries) == 12
+        assert model.calls == 12
+        assert 1 < model.max_active <= 3
+
+    def test_map_uses_chunk_cache(self):
+        """测试相同内容的块命中缓存，不再调用模型"""
+        cache = SummaryCache()
+        model = FakeModel()
+        map_chunks(["甲", "乙"], model, namespace="model-a", cache=cache)
+        map_chunks(["甲", "乙", "丙"], model, namespace="model-a", cache=cache)
+        assert model.calls == 3
+
+        # 不同的模型（命名空间）不共享缓存
+        map_chunks(["甲"], model, namespace="model-b", cache=cache)
+        assert model.calls == 4
+
+    def test_cache_eviction(self):
+        """测试缓存超过上限时淘汰最久未使用的条目"""
+        cache = SummaryCache(max_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert len(cache) == 2
+
+    def test_reduce_is_hierarchical(self):
+        """测试摘要过长时分层合并，直到能放入最终输入"""
+        model = FakeModel()
+        summaries = ["要点" * 100] * 16
+        combined = reduce_summaries(summaries, model, max_chars=1000, cache=SummaryCache())
+        assert len(combined) <= 1000
+        assert model.calls > 0
+
+    def test_reduce_single_oversized_summary(self):
+        """测试只剩一个超长摘要时切分后继续归约，模型输出不再变短时停止"""
+        model = FakeModel()
+        combined = reduce_summaries(["要点。" * 500], model, max_chars=1000, cache=SummaryCache())
+        assert combined.startswith("摘要(") and len(combined) <= 1000
+
+        combined = reduce_summaries(["要点。" * 500], lambda prompt: "要点。" * 500, max_chars=1000, cache=SummaryCache())
+        assert len(combined) == 1500
+
+    def test_map_reduce_generate(self):
+        """测试完整流程：最终报告基于归约后的摘要生成"""
+        model = FakeModel()
+        final_inputs = []
+
+        def generate_final(combined):
+            final_inputs.append(combined)
+            return "最终报告"
+
+        report = map_reduce_generate(TRANSCRIPT, model, generate_final, chunk_size=2000, cache=SummaryCache())
+        assert report == "最终报告"
+        assert len(final_inputs) == 1
+        assert len(final_inputs[0]) <= 2000
+        assert model.calls >= len(split_document(TRANSCRIPT, chunk_size=2000))
+
+
+class TestStreamingMapReduce:
+    """测试流式输入的Map-Reduce"""
+
+    def test_stream_input(self):
+        """测试文本流按需切块并生成摘要，提示词不包含总块数"""
+        prompts = []
+
+        def summarize(prompt):
+            prompts.append(prompt)
+            return "要点"
+
+        stream = (TRANSCRIPT[i:i + 4096] for i in range(0, len(TRANSCRIPT), 4096))
+        result = map_reduce_generate(stream, summarize, lambda combined: combined, chunk_size=2000,
+                                     max_workers=2, cache=SummaryCache())
+        assert "要点" in result
+        assert len(prompts) >= len(TRANSCRIPT) // 2000
+        assert any("第 1 部分" in prompt for prompt in prompts)
+
+
+class TestAgentGenerationMode:
+    """测试BedrockAgentService的生成模式选择"""
+
+    def test_auto_mode_uses_map_reduce_for_long_documents(self):
+        """测试长文档自动使用Map-Reduce，各块直接调用模型，最终报告由Agent生成"""
+        from app.services.agent_service import bedrock_agent_service, MAX_AGENT_INPUT_CHARS
+
+        document = TRANSCRIPT * (MAX_AGENT_INPUT_CHARS // len(TRANSCRIPT) + 1)
+        with patch.object(bedrock_agent_service, '_invoke_model', return_value=("要点", "end_turn")) as mock_invoke, \
+                patch.object(bedrock_agent_service, '_generate_report_with_agent', return_value="报告") as mock_agent:
+            assert bedrock_agent_service.generate_report(document, "生成周报", "model-x") == "报告"
+            assert mock_invoke.call_count > 1
+            combined = mock_agent.call_args[0][0]
+            assert len(combined) < MAX_AGENT_INPUT_CHARS
+
+    def test_auto_mode_prefilters_slightly_long_documents(self):
+        """测试开启抽取式预过滤时，略超上限的文档缩短后直接交给Agent"""
+        from app.services.agent_service import bedrock_agent_service, MAX_AGENT_INPUT_CHARS
+
+        document = TRANSCRIPT * (MAX_AGENT_INPUT_CHARS // len(TRANSCRIPT) + 1)
+        document = document[:int(MAX_AGENT_INPUT_CHARS * 1.2)]
+        with patch('app.services.agent_service.EXTRACTIVE_PREFILTER_RATIO', 1.5), \
+                patch.object(bedrock_agent_service, '_invoke_model') as mock_invoke, \
+                patch.object(bedrock_agent_service, '_generate_report_with_agent', return_value="报告") as mock_agent:
+            assert bedrock_agent_service.generate_report(document, None, None) == "报告"
+            mock_invoke.assert_not_called()
+            assert len(mock_agent.call_args[0][0]) <= MAX_AGENT_INPUT_CHARS
+
+    def test_auto_mode_uses_agent_for_short_documents(self):
+        """测试短文档仍然一次性交给Agent"""
+        from app.services.agent_service import bedrock_agent_service
+
+        with patch.object(bedrock_agent_service, '_invoke_model') as mock_invoke, \
+                patch.object(bedrock_agent_service, '_generate_report_with_agent', return_value="报告") as mock_agent:
+            assert bedrock_agent_service.generate_report("短文档", None, None) == "报告"
+            mock_invoke.assert_not_called()
+            mock_agent.assert_called_once()
+            assert mock_agent.call_args[0][:3] == ("短文档", None, None)
+
+    def test_long_file_streams_from_sidecar(self):
+        """测试长文件按元数据判断后直接流式Map-Reduce，不把整个文件读入内存"""
+        from app.services.agent_service import bedrock_agent_service, MAX_AGENT_INPUT_CHARS
+
+        document = TRANSCRIPT * (MAX_AGENT_INPUT_CHARS // len(TRANSCRIPT) + 1)
+        metadata = {'file_id': 'f1', 'extracted_s3_key': 'extracted/f1.txt', 'text_length': len(document)}
+        pieces = [document[i:i + 4096] for i in range(0, len(document), 4096)]
+        with patch('app.services.agent_service.iter_file_text', return_value=iter(pieces)), \
+                patch('app.services.agent_service.get_file_text') as mock_get_text, \
+                patch.object(bedrock_agent_service, '_invoke_model', return_value=("要点", "end_turn")) as mock_invoke, \
+                patch.object(bedrock_agent_service, '_generate_report_with_agent', return_value="报告"):
+            report, session_id = bedrock_agent_service.generate_report_for_file(metadata, None, "model-x")
+            assert report == "报告" and session_id
+            mock_get_text.assert_not_called()
+            assert "文件ID: f1" in mock_invoke.call_args_list[0][0][0]
+            assert bedrock_agent_service.uses_streamed_input(dict(metadata, text_length=100), 'map_reduce')
+            assert not bedrock_agent_service.uses_streamed_input(dict(metadata, text_length=100))
+            assert not bedrock_agent_service.uses_streamed_input(metadata, 'agent')
+
+    def test_agent_input_budget_uses_final_input(self):
+        """测试按含自定义提示的最终输入估算：auto模式改用Map-Reduce，agent模式在调用前报错"""
+        from app.services.agent_service import bedrock_agent_service, AGENT_INPUT_TEXT_LIMIT
+
+        prompt = "请按以下要求生成周报。" * (AGENT_INPUT_TEXT_LIMIT // 10)
+        with patch.object(bedrock_agent_service, '_invoke_model', return_value=("要点", "end_turn")) as mock_invoke, \
+                patch.object(bedrock_agent_service, '_generate_report_with_agent', return_value="报告") as mock_agent:
+            bedrock_agent_service.generate_report("短文档", prompt, None)
+            mock_invoke.assert_called()
+            assert mock_agent.call_args[0][0] != "短文档"
+
+        with patch.object(bedrock_agent_service.bedrock_agent_runtime, 'invoke_agent') as mock_invoke_agent:
+            with pytest.raises(Exception, match="inputText"):
+                bedrock_agent_service.generate_report("短文档", prompt, None, mode='agent')
+            with pytest.raises(Exception, match="inputText"):
+                bedrock_agent_service.refine_report("report-session-1", prompt)
+            mock_invoke_agent.assert_not_called()
+
+    def test_agent_input_token_budget(self):
+        """测试输入在字符上限以内、但超过Agent模型的token预算时同样拒绝"""
+        from app.services.agent_service import bedrock_agent_service
+
+        with patch('app.services.agent_service.get_input_budget', return_value=5000):
+            assert "tokens" in bedrock_agent_service._check_agent_input("测" * 2000)
+        assert bedrock_agent_service._check_agent_input("测" * 2000) is None
+
+    def test_invalid_mode(self):
+        """测试不支持的生成模式"""
+        from app.services.agent_service import bedrock_agent_service
+
+        with pytest.raises(Exception):
+            bedrock_agent_service.generate_report("短文档", mode="unknown")
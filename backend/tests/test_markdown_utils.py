@@ -0,0 +1,94 @@
+import pytest
+from app.utils.markdown_utils import (
+    parse_section_index,
+    resolve_sections,
+    get_section_body,
+    replace_section_bodies
+)
+from app.services.modules.sectioned_report import regenerate_sections
+
+REPORT = """# 会议报告
+
+## 会议摘要
+
+讨论了产品进度。
+
+## 决策和行动项
+
+### 决策
+
+批准预算。
+
+### 行动项
+
+```
+# 这不是标题
+```
+
+## 后续步骤
+
+下周用户测试。
+"""
+
+
+class TestSectionIndex:
+    """测试Markdown章节索引"""
+
+    def test_parse_section_index(self):
+        """测试解析标题层级，忽略代码块中的#号"""
+        sections = parse_section_index(REPORT)
+        assert [(s['title'], s['level']) for s in sections] == [
+            ('会议报告', 1), ('会议摘要', 2), ('决策和行动项', 2), ('决策', 3), ('行动项', 3), ('后续步骤', 2)
+        ]
+        assert get_section_body(REPORT, sections[1]) == "讨论了产品进度。"
+        # 章节包含其子章节
+        assert "批准预算。" in get_section_body(REPORT, sections[2])
+
+    def test_resolve_sections(self):
+        """测试按序号或标题选择章节，并去掉嵌套在已选章节中的子章节"""
+        sections = parse_section_index(REPORT)
+        selected = resolve_sections(sections, ['决策', '决策和行动项', 5])
+        assert [s['title'] for s in selected] == ['决策和行动项', '后续步骤']
+        with pytest.raises(Exception):
+            resolve_sections(sections, ['不存在的章节'])
+
+    def test_replace_keeps_other_sections_verbatim(self):
+        """测试替换章节正文时其余内容原样保留"""
+        sections = parse_section_index(REPORT)
+        updated = replace_section_bodies(REPORT, {1: "新的摘要。"}, sections)
+        assert "## 会议摘要\n\n新的摘要。\n\n## 决策和行动项" in updated
+        assert updated.split("## 决策和行动项")[1] == REPORT.split("## 决策和行动项")[1]
+
+    def test_regenerate_only_selected_sections(self):
+        """测试只为选中的章节调用模型"""
+        prompts = []
+
+        def generate(prompt):
+            prompts.append(prompt)
+            return "改写后的内容。", "end_turn"
+
+        updated, regenerated = regenerate_sections(REPORT, "会议记录", generate, ['后续步骤'], "更具体")
+        assert len(prompts) == 1
+        assert "下周用户测试。" in prompts[0] and "更具体" in prompts[0]
+        assert [s['title'] for s in regenerated] == ['后续步骤']
+        assert updated.startswith(REPORT.split("## 后续步骤")[0])
+        assert "## 后续步骤\n\n改写后的内容。" in updated
+
+    def test_regenerate_parent_section_keeps_subsections(self):
+        """测试重新生成含子章节的章节时要求保留子章节标题，标题被改动时重试，仍不一致则报错"""
+        outputs = ["合并后的内容。", "### 决策\n\n批准新预算。\n\n### 行动项\n\n安排测试。"]
+        prompts = []
+
+        def generate(prompt):
+            prompts.append(prompt)
+            return outputs.pop(0), "end_turn"
+
+        updated, _ = regenerate_sections(REPORT, "会议记录", generate, ['决策和行动项'])
+        assert len(prompts) == 2 and "### 决策\n### 行动项" in prompts[0]
+        assert [(s['title'], s['level']) for s in parse_section_index(updated)] == [
+            (s['title'], s['level']) for s in parse_section_index(REPORT)
+        ]
+        assert "批准新预算。" in updated
+
+        with pytest.raises(Exception):
+            regenerate_sections(REPORT, "会议记录", lambda prompt: ("没有子章节。", "end_turn"), ['决策和行动项'])
@@ -0,0 +1,79 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from app.services.storage import find_near_duplicate_files
+from app.utils.minhash_utils import (
+    NUM_PERM,
+    NUM_BANDS,
+    compute_minhash,
+    get_lsh_band_keys,
+    estimate_similarity
+)
+
+MEETING_NOTES = (
+    "会议记录：今天讨论了产品路线图、市场预算和客户反馈。\n"
+    "Action item: Alice will prepare the Q3 budget proposal by Friday.\n"
+) * 20
+
+
+class TestMinHash:
+    """测试MinHash签名与LSH分桶"""
+
+    def test_signature_shape(self):
+        """测试签名长度和分桶数量"""
+        signature = compute_minhash(MEETING_NOTES)
+        assert len(signature) == NUM_PERM
+        assert len(get_lsh_band_keys(signature)) == NUM_BANDS
+
+    def test_signature_is_deterministic(self):
+        """测试相同内容的签名一致，且不受空白和大小写影响"""
+        assert compute_minhash(MEETING_NOTES) == compute_minhash(MEETING_NOTES.upper().replace('\n', '  \n'))
+
+    def test_near_duplicate_shares_bands(self):
+        """测试小幅修改后的文档仍被识别为近似重复"""
+        edited = MEETING_NOTES.replace('Friday', 'Monday', 2)
+        sig_a = compute_minhash(MEETING_NOTES)
+        sig_b = compute_minhash(edited)
+        assert estimate_similarity(sig_a, sig_b) > 0.8
+        assert set(get_lsh_band_keys(sig_a)) & set(get_lsh_band_keys(sig_b))
+
+    def test_different_documents(self):
+        """测试不同文档的相似度很低"""
+        other = "Quarterly infrastructure review covering database migrations and on-call rotations." * 5
+        assert estimate_similarity(compute_minhash(MEETING_NOTES), compute_minhash(other)) < 0.2
+
+    def test_empty_text(self):
+        """测试空文本"""
+        assert compute_minhash("") == []
+        assert get_lsh_band_keys([]) == []
+        assert estimate_similarity([], []) == 0.0
+
+
+class TestNearDuplicateLookup:
+    """测试通过LSH索引查找近似重复文件"""
+
+    @patch('app.services.storage.get_dynamodb_resource')
+    def test_paginates_bands_and_batches_metadata(self, mock_resource):
+        """测试分桶查询读取所有分页，候选的签名用一次BatchGetItem读取并重试未处理的键"""
+        signature = compute_minhash(MEETING_NOTES)
+        edited = compute_minhash(MEETING_NOTES.replace('Friday', 'Monday', 2))
+        other = compute_minhash("Quarterly infrastructure review covering database migrations." * 5)
+        dynamodb = mock_resource.return_value
+        dynamodb.Table.return_value.query.side_effect = lambda **kwargs: (
+            {'Items': [{'file_id': 'page2'}]} if 'ExclusiveStartKey' in kwargs
+            else {'Items': [{'file_id': 'self'}, {'file_id': 'page1'}], 'LastEvaluatedKey': {'file_id': 'page1'}}
+        )
+        dynamodb.batch_get_item.side_effect = [
+            {'Responses': {'report_files': [{'file_id': 'page1', 'minhash_signature': other}]},
+             'UnprocessedKeys': {'report_files': {'Keys': [{'file_id': 'page2'}]}}},
+            {'Responses': {'report_files': [{'file_id': 'page2', 'minhash_signature': edited, 'report_id': 'r1'}]}}
+        ]
+        metadata = {'file_id': 'self', 'minhash_signature': signature, 'lsh_bands': get_lsh_band_keys(signature)[:2]}
+
+        with patch('app.services.storage.time.sleep'):
+            duplicates = find_near_duplicate_files(metadata)
+
+        assert [(d['file_id'], d['report_id']) for d in duplicates] == [('page2', 'r1')]
+        request = dynamodb.batch_get_item.call_args_list[0].kwargs['RequestItems']['report_files']
+        assert request['Keys'] == [{'file_id': 'page1'}, {'file_id': 'page2'}]
+        assert 'minhash_signature' in request['ExpressionAttributeNames'].values()
+        assert dynamodb.Table.return_value.query.call_count == 4
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from app.services.modules.numpy_vector_store import NumpyVectorStore
+
+VOCABULARY = "预算营销招聘午餐天气会议"
+
+
+class CharEmbeddings(Embeddings):
+    """按关键字出现次数生成向量的假嵌入模型"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _embed(self, text):
+        return [float(text.count(char)) + 0.01 for char in VOCABULARY]
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+TEXTS = ["预算增加了", "营销活动下周开始", "招聘两名工程师", "午餐很好吃", "天气晴朗"]
+
+
+class TestNumpyVectorStore:
+    """测试NumPy向量存储"""
+
+    @pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+    def test_similarity_search(self, dtype):
+        """测试各种存储精度下都能检索到最相关的文档"""
+        store = NumpyVectorStore.from_texts(TEXTS, CharEmbeddings(), dtype=dtype)
+        assert store.similarity_search("营销", k=1)[0].page_content == "营销活动下周开始"
+        results = store.similarity_search_with_score("招聘", k=3)
+        assert len(results) == 3
+        assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+    def test_int8_storage_is_smaller(self):
+        """测试int8存储占用的内存是float32的四分之一"""
+        full = NumpyVectorStore.from_texts(TEXTS, CharEmbeddings(), dtype="float32")
+        small = NumpyVectorStore.from_texts(TEXTS, CharEmbeddings(), dtype="int8")
+        assert small.vectors.nbytes * 4 == full.vectors.nbytes
+
+    def test_blocked_search_matches_full_search(self):
+        """测试分块矩阵乘法与一次性计算的top-k一致"""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(50, 16))
+        store = NumpyVectorStore.from_embeddings([(str(i), v) for i, v in enumerate(vectors)], CharEmbeddings())
+        query = rng.normal(size=16)
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr('app.services.modules.numpy_vector_store.SEARCH_BATCH_ROWS', 7)
+            blocked = [row for row, _ in store.search_vectors(query, k=5)[0]]
+        assert blocked == [row for row, _ in store.search_vectors(query, k=5)[0]]
+
+    def test_batch_search_embeds_once(self):
+        """测试批量检索只调用一次嵌入模型"""
+        embeddings = CharEmbeddings()
+        store = NumpyVectorStore.from_texts(TEXTS, embeddings)
+        results = store.batch_similarity_search(["预算", "天气"], k=1)
+        assert [docs[0].page_content for docs in results] == ["预算增加了", "天气晴朗"]
+        assert embeddings.calls == 2
+
+    @pytest.mark.parametrize("dtype", ["float16", "int8"])
+    def test_save_and_load_with_memmap(self, tmp_path, dtype):
+        """测试保存后通过memmap加载，检索结果不变"""
+        store = NumpyVectorStore.from_texts(TEXTS, CharEmbeddings(), metadatas=[{'i': i} for i in range(5)], dtype=dtype)
+        store.save_local(str(tmp_path))
+
+        loaded = NumpyVectorStore.load_local(str(tmp_path), CharEmbeddings())
+        assert isinstance(loaded.vectors, np.memmap)
+        doc = loaded.similarity_search("午餐", k=1)[0]
+        assert doc.page_content == "午餐很好吃" and doc.metadata == {'i': 3}
+
+    def test_delete_and_retriever(self):
+        """测试删除文档，并可作为LangChain检索器使用"""
+        store = NumpyVectorStore(CharEmbeddings())
+        ids = store.add_texts(TEXTS)
+        assert store.delete([ids[0]])
+        docs = store.as_retriever(search_kwargs={"k": 5}).invoke("预算")
+        assert len(docs) == 4 and "预算增加了" not in [doc.page_content for doc in docs]
@@ -0,0 +1,167 @@
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+from app import create_app
+from app.config.aws_config import get_bedrock_client, BEDROCK_READ_TIMEOUT
+from app.services.modules.converse import stream_text
+from app.services.modules.rate_limiter import AimdLimiter, BedrockLimiter, bedrock_limiter
+
+
+def _throttle():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'ConverseStream')
+
+
+class TestAimdLimiter:
+    """测试加性增、乘性减的并发限流器"""
+
+    def test_blocks_at_limit(self):
+        """测试达到并发上限后排队，超时报错"""
+        limiter = AimdLimiter(initial_limit=2)
+        limiter.acquire()
+        limiter.acquire()
+
+        with pytest.raises(Exception):
+            limiter.acquire(timeout=0.05)
+        assert limiter.snapshot()['in_flight'] == 2
+
+    def test_throttle_halves_once_per_cooldown(self):
+        """测试限流时并发上限减半，冷却期内的多次限流只减一次"""
+        limiter = AimdLimiter(initial_limit=8, cooldown=60)
+        for _ in range(3):
+            limiter.acquire()
+        for _ in range(3):
+            limiter.release(throttled=True)
+
+        snapshot = limiter.snapshot()
+        assert snapshot['limit'] == 4
+        assert snapshot['throttles'] == 3
+        assert snapshot['in_flight'] == 0
+
+    def test_success_increases_additively(self):
+        """测试成功时上限约每limit次调用加1，且不超过最大值"""
+        limiter = AimdLimiter(initial_limit=4, max_limit=5)
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release()
+        assert 4.9 < limiter.limit <= 5
+
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release()
+        assert limiter.limit == 5
+
+    def test_records_queue_wait(self):
+        """测试记录排队等待时间"""
+        limiter = AimdLimiter(initial_limit=1)
+        limiter.acquire()
+        threading.Timer(0.05, limiter.release).start()
+
+        wait = limiter.acquire()
+
+        assert wait >= 0.04
+        assert limiter.snapshot()['max_queue_wait_ms'] >= 40
+
+
+class TestBedrockLimiter:
+    """测试按模型的限流和退避重试"""
+
+    @patch('app.services.modules.rate_limiter.time.sleep')
+    def test_retries_throttling_with_jitter(self, mock_sleep):
+        """测试限流错误退避重试后成功，退避时间不超过指数上限"""
+        limiter = BedrockLimiter(max_retries=3, base_delay=1.0)
+        func = MagicMock(side_effect=[_throttle(), _throttle(), 'ok'])
+
+        assert limiter.call('model-a', func, prompt='x') == 'ok'
+
+        assert func.call_count == 3
+        delays = [call.args[0] for call in mock_sleep.call_args_list]
+        assert 0 <= delays[0] <= 1.0 and 0 <= delays[1] <= 2.0
+        stats = limiter.stats()['model-a']
+        assert stats['throttles'] == 2
+        assert stats['in_flight'] == 0
+
+    def test_non_retryable_error_raises(self):
+        """测试不可重试的错误直接抛出并释放并发槽"""
+        limiter = BedrockLimiter()
+        error = ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad'}}, 'ConverseStream')
+
+        with pytest.raises(ClientError):
+            limiter.call('model-a', MagicMock(side_effect=error))
+        assert limiter.stats()['model-a']['in_flight'] == 0
+
+    def test_burst_settles_at_quota(self):
+        """测试突发请求下所有调用最终成功，并发上限收敛到配额附近"""
+        quota = 3
+        limiter = BedrockLimiter(max_retries=50, base_delay=0.001, max_delay=0.01, initial_limit=16, cooldown=0.0)
+        state = {'active': 0}
+        lock = threading.Lock()
+
+        def invoke():
+            with lock:
+                state['active'] += 1
+                over_quota = state['active'] > quota
+            try:
+                if over_quota:
+                    raise _throttle()
+                time.sleep(0.005)
+                return 'ok'
+            finally:
+                with lock:
+                    state['active'] -= 1
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(limiter.call('model-b', invoke))) for _ in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == ['ok'] * 40
+        stats = limiter.stats()['model-b']
+        assert stats['throttles'] > 0
+        assert stats['limit'] < 8
+
+
+class TestLimiterIntegration:
+    """测试限流器与模型调用、客户端配置的集成"""
+
+    def test_stream_holds_slot_until_read(self):
+        """测试流读完之前占用并发槽，流中的限流错误缩减并发上限"""
+        client = MagicMock()
+        client.converse_stream.return_value = {'stream': [
+            {'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'text': 'a'}}},
+            {'messageStop': {'stopReason': 'end_turn'}}
+        ]}
+        stream = stream_text(client, 'test.limiter-model', 'x')
+        assert bedrock_limiter.stats()['test.limiter-model']['in_flight'] == 1
+        assert stream.read() == 'a'
+        assert bedrock_limiter.stats()['test.limiter-model']['in_flight'] == 0
+        assert stream.metrics['queue_wait_ms'] is not None
+
+        client.converse_stream.return_value = {'stream': [{'throttlingException': {'message': 'slow down'}}]}
+        limit = bedrock_limiter.stats()['test.limiter-model']['limit']
+        with pytest.raises(Exception):
+            stream_text(client, 'test.limiter-model', 'x').read()
+        stats = bedrock_limiter.stats()['test.limiter-model']
+        assert stats['in_flight'] == 0
+        assert stats['limit'] < limit
+
+    def test_shared_client_config(self):
+        """测试同一服务和区域复用同一个客户端，并使用共享的超时配置"""
+        client = get_bedrock_client('bedrock-runtime', 'us-east-1')
+
+        assert client is get_bedrock_client('bedrock-runtime', 'us-east-1')
+        assert client.meta.config.read_timeout == BEDROCK_READ_TIMEOUT
+        assert client.meta.config.retries['total_max_attempts'] == 1
+
+    def test_limits_api(self):
+        """测试限流状态API"""
+        bedrock_limiter.get('test.api-model')
+        client = create_app({'TESTING': True}).test_client()
+
+        response = client.get('/api/model/limits')
+
+        assert response.status_code == 200
+        assert 'avg_queue_wait_ms' in response.get_json()['limits']['test.api-model']
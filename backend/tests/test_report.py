@@ -1,5 +1,7 @@
 import pytest
 import json
+import io
+import threading
 from unittest.mock import patch, MagicMock
 from app import create_app
 
@@ -208,4 +210,246 @@ class TestReportAPI:
         mock_get_report.assert_called_once_with('test-report-id')
         mock_update_report.assert_called_once()
         # 验证更新的内容
-        assert mock_update_report.call_args[0][0]['content'] == '# Updated Report\n\nThis is an updated report.' 
\ No newline at end of file
+        assert mock_update_report.call_args[0][0]['content'] == '# Updated Report\n\nThis is an updated report.'
+
+    @patch('app.api.report.boto3')
+    @patch('app.api.report.save_extracted_text')
+    @patch('app.api.report.store_report_content')
+    @patch('app.api.report.update_metadata_in_dynamodb')
+    @patch('app.api.report.save_lsh_index_entries')
+    @patch('app.api.report.save_metadata_to_dynamodb')
+    @patch('app.api.report.upload_file_to_s3')
+    @patch('app.api.report.generate_report_with_session')
+    def test_upload_and_generate_success(self, mock_generate_report, mock_upload, mock_save_metadata,
+                                         mock_save_lsh, mock_update_metadata, mock_store_report,
+                                         mock_save_extracted, mock_boto3, client):
+        """测试上传并直接生成报告，不从S3重新读取文件"""
+        mock_generate_report.return_value = ("# Test Report\n\nThis is a generated report.", 'report-session-1')
+        mock_store_report.return_value = 'reports/test.txt'
+        
+        data = dict(
+            file=(io.BytesIO('会议记录：讨论了预算。'.encode('utf-8')), 'notes.txt'),
+            prompt='Generate a test report',
+            category='meeting'
+        )
+        
+        with patch('app.api.report.get_file_content_by_id') as mock_get_content:
+            response = client.post('/api/report/upload-and-generate', data=data,
+                                   content_type='multipart/form-data')
+            mock_get_content.assert_not_called()
+        
+        assert response.status_code == 201
+        json_data = json.loads(response.data)
+        assert 'file_id' in json_data and 'report_id' in json_data
+        
+        # 验证生成使用了内存中的文件内容
+        file_content = mock_generate_report.call_args[0][0]
+        assert '会议记录：讨论了预算。' in file_content
+        assert json_data['file_id'] in file_content
+        
+        mock_upload.assert_called_once()
+        mock_save_metadata.assert_called_once()
+        mock_save_extracted.assert_called_once_with(json_data['file_id'], '会议记录：讨论了预算。')
+        mock_store_report.assert_called_once_with(json_data['report_id'], mock_generate_report.return_value[0])
+        assert mock_update_metadata.call_args[0][0]['report_id'] == json_data['report_id']
+
+    @patch('app.api.report.index_document_async')
+    @patch('app.api.report.boto3')
+    @patch('app.api.report.save_extracted_text')
+    @patch('app.api.report.store_report_content', return_value='reports/test.txt')
+    @patch('app.api.report.update_metadata_in_dynamodb')
+    @patch('app.api.report.save_lsh_index_entries')
+    @patch('app.api.report.save_metadata_to_dynamodb')
+    @patch('app.api.report.upload_file_to_s3')
+    @patch('app.api.report.stream_report')
+    def test_upload_and_generate_stream(self, mock_stream, mock_upload, mock_save_metadata, mock_save_lsh,
+                                        mock_update_metadata, mock_store_report, mock_save_extracted,
+                                        mock_boto3, mock_index, client):
+        """测试上传并流式生成时，首个token不等待S3上传完成，最后一个token之后才保存报告"""
+        released, uploaded = threading.Event(), threading.Event()
+        mock_upload.side_effect = lambda *args: released.wait(5) and uploaded.set()
+        stream = MagicMock(text='# 报告正文', stop_reason='end_turn', usage={}, metrics={})
+        stream.__iter__.return_value = iter(['# 报告', '正文'])
+        mock_stream.return_value = stream
+        data = dict(file=(io.BytesIO('会议记录：讨论了预算。'.encode('utf-8')), 'notes.txt'), category='meeting')
+
+        response = client.post('/api/report/upload-and-generate/stream', data=data,
+                               content_type='multipart/form-data', buffered=False)
+        events = []
+        for chunk in response.response:
+            events.extend(event for event in chunk.decode('utf-8').split('\n\n') if event)
+            if events[-1].startswith('event: token'):
+                # 首个token已推送时S3上传仍未完成
+                assert not uploaded.is_set() and not mock_store_report.called
+                released.set()
+
+        assert [event.split('\n')[0] for event in events] == ['event: start', 'event: token', 'event: token', 'event: done']
+        start = json.loads(events[0].split('data: ', 1)[1])
+        assert '会议记录：讨论了预算。' in mock_stream.call_args[0][0]
+        mock_store_report.assert_called_once_with(start['report_id'], '# 报告正文')
+        assert mock_update_metadata.call_args[0][0]['report_id'] == start['report_id']
+        assert [call.args[0] for call in mock_index.call_args_list] == ['file', 'report']
+
+    @patch('app.api.report.index_document_async')
+    @patch('app.api.report.boto3')
+    @patch('app.api.report.save_extracted_text')
+    @patch('app.api.report.store_report_content')
+    @patch('app.api.report.update_metadata_in_dynamodb')
+    @patch('app.api.report.save_lsh_index_entries')
+    @patch('app.api.report.save_metadata_to_dynamodb')
+    @patch('app.api.report.upload_file_to_s3')
+    @patch('app.api.report.stream_report')
+    def test_upload_and_generate_stream_disconnect(self, mock_stream, mock_upload, mock_save_metadata, mock_save_lsh,
+                                                   mock_update_metadata, mock_store_report, mock_save_extracted,
+                                                   mock_boto3, mock_index, client):
+        """测试客户端在报告保存前断开连接时，报告记录在processing之后被标记为失败"""
+        stream = MagicMock(text='# 报告', stop_reason='end_turn', usage={}, metrics={})
+        stream.__iter__.return_value = iter(['# 报告', '正文'])
+        mock_stream.return_value = stream
+        data = dict(file=(io.BytesIO('会议记录'.encode('utf-8')), 'notes.txt'))
+
+        response = client.post('/api/report/upload-and-generate/stream', data=data,
+                               content_type='multipart/form-data', buffered=False)
+        chunks = iter(response.response)
+        next(chunks)
+        next(chunks)
+        response.close()
+
+        statuses = [call.kwargs['Item']['status'] for call in mock_boto3.resource.return_value.Table.return_value.put_item.call_args_list]
+        assert statuses == ['processing', 'failed']
+        mock_store_report.assert_not_called()
+
+    def test_upload_and_generate_invalid_type(self, client):
+        """测试上传并生成时不允许的文件类型"""
+        data = dict(file=(io.BytesIO(b'Test content'), 'test.exe'))
+        response = client.post('/api/report/upload-and-generate', data=data,
+                               content_type='multipart/form-data')
+        assert response.status_code == 400
+        assert 'File type not allowed' in json.loads(response.data)['error']
+
+    @patch('app.api.report.boto3')
+    @patch('app.api.report.update_report_in_dynamodb')
+    @patch('app.api.report.store_report_content')
+    @patch('app.api.report.regenerate_report_sections')
+    @patch('app.api.report.get_file_content_by_id')
+    @patch('app.api.report.get_report_from_dynamodb')
+    def test_regenerate_sections(self, mock_get_report, mock_get_content, mock_regenerate,
+                                 mock_store_report, mock_update_report, mock_boto3, client):
+        """测试只重新生成选中的章节"""
+        report_content = "# 报告\n\n## 会议摘要\n\n旧摘要\n\n## 后续步骤\n\n旧步骤\n"
+        new_content = "# 报告\n\n## 会议摘要\n\n旧摘要\n\n## 后续步骤\n\n新步骤\n"
+        mock_get_report.return_value = {'Item': {
+            'report_id': 'test-report-id', 'file_id': 'test-file-id',
+            'report_s3_key': 'reports/test-report-id.txt', 'model_id': 'test-model'
+        }}
+        mock_boto3.client.return_value.get_object.return_value = {
+            'Body': MagicMock(read=MagicMock(return_value=report_content.encode('utf-8')))
+        }
+        mock_get_content.return_value = "会议记录"
+        mock_regenerate.return_value = (new_content, [{'index': 2, 'title': '后续步骤'}])
+
+        response = client.post('/api/report/test-report-id/sections/regenerate',
+                               json={'sections': ['后续步骤'], 'prompt': '更具体一些'})
+
+        assert response.status_code == 200
+        json_data = json.loads(response.data)
+        assert json_data['regenerated_sections'] == ['后续步骤']
+        mock_regenerate.assert_called_once_with("会议记录", report_content, ['后续步骤'], '更具体一些', 'test-model')
+        mock_store_report.assert_called_once_with('test-report-id', new_content)
+        saved = mock_update_report.call_args[0][0]
+        assert [section['title'] for section in saved['sections']] == ['报告', '会议摘要', '后续步骤']
+
+    @patch('app.api.report.boto3')
+    @patch('app.api.report.regenerate_report_sections')
+    @patch('app.api.report.get_report_from_dynamodb')
+    def test_regenerate_sections_unknown_section(self, mock_get_report, mock_regenerate, mock_boto3, client):
+        """测试选择不存在的章节时返回400且不调用模型"""
+        mock_get_report.return_value = {'Item': {
+            'report_id': 'test-report-id', 'file_id': 'test-file-id', 'report_s3_key': 'reports/test-report-id.txt'
+        }}
+        mock_boto3.client.return_value.get_object.return_value = {
+            'Body': MagicMock(read=MagicMock(return_value="# 报告\n\n## 会议摘要\n\n内容\n".encode('utf-8')))
+        }
+
+        response = client.post('/api/report/test-report-id/sections/regenerate', json={'sections': ['不存在']})
+
+        assert response.status_code == 400
+        mock_regenerate.assert_not_called()
+
+    @patch('app.api.report.update_report_in_dynamodb')
+    @patch('app.api.report.store_report_content')
+    @patch('app.api.report.generate_report_with_session')
+    @patch('app.api.report.refine_report')
+    @patch('app.api.report.get_file_content_by_id')
+    @patch('app.api.report.get_report_from_dynamodb')
+    def test_regenerate_follow_up_in_session(self, mock_get_report, mock_get_content, mock_refine,
+                                             mock_generate, mock_store_report, mock_update_report, client):
+        """测试会话有效时只发送修改要求，不重新读取和发送文档"""
+        from app.services.agent_service import get_session_expiry
+        mock_get_report.return_value = {'Item': {
+            'report_id': 'test-report-id', 'file_id': 'test-file-id', 'model_id': 'test-model',
+            'agent_session_id': 'report-session-1', 'agent_session_expires_at': get_session_expiry()
+        }}
+        mock_refine.return_value = "# 修改后的报告"
+
+        response = client.post('/api/report/test-report-id/regenerate', json={'prompt': '语气更正式'})
+
+        assert response.status_code == 200
+        mock_refine.assert_called_once_with('report-session-1', '语气更正式')
+        mock_get_content.assert_not_called()
+        mock_generate.assert_not_called()
+        saved = mock_update_report.call_args[0][0]
+        assert saved['agent_session_id'] == 'report-session-1'
+        mock_store_report.assert_called_once_with('test-report-id', "# 修改后的报告")
+
+    @patch('app.api.report.update_report_in_dynamodb')
+    @patch('app.api.report.store_report_content')
+    @patch('app.api.report.generate_report_with_session')
+    @patch('app.api.report.refine_report')
+    @patch('app.api.report.get_file_content_by_id')
+    @patch('app.api.report.get_report_from_dynamodb')
+    def test_regenerate_expired_session_falls_back(self, mock_get_report, mock_get_content, mock_refine,
+                                                   mock_generate, mock_store_report, mock_update_report, client):
+        """测试会话过期时回退到新会话并重新发送完整文档"""
+        mock_get_report.return_value = {'Item': {
+            'report_id': 'test-report-id', 'file_id': 'test-file-id', 'model_id': 'test-model',
+            'agent_session_id': 'report-session-1', 'agent_session_expires_at': 1
+        }}
+        mock_get_content.return_value = "会议记录"
+        mock_generate.return_value = ("# 新报告", 'report-session-2')
+
+        response = client.post('/api/report/test-report-id/regenerate', json={'prompt': '语气更正式'})
+
+        assert response.status_code == 200
+        mock_refine.assert_not_called()
+        mock_generate.assert_called_once_with("会议记录", '语气更正式', 'test-model', mode=None)
+        assert mock_update_report.call_args[0][0]['agent_session_id'] == 'report-session-2'
+
+    @patch('app.api.report.langchain_service')
+    @patch('app.api.report.get_file_content_by_id')
+    @patch('app.api.report.get_report_from_dynamodb')
+    def test_chat_reuses_session(self, mock_get_report, mock_get_content, mock_langchain, client):
+        """测试追问复用同一会话，文档只建立一次索引"""
+        from app.services.modules.chat_sessions import ChatSession
+
+        mock_get_report.return_value = {'Item': {'report_id': 'chat-report-id', 'file_id': 'test-file-id', 'model_id': 'test-model'}}
+        mock_get_content.return_value = "会议记录"
+        mock_langchain.create_chat_session.side_effect = lambda document, report_id, model_id: ChatSession(
+            report_id, lambda query: ["预算为100万"], lambda prompt: ("预算是100万", "end_turn"), model_id
+        )
+
+        first = client.post('/api/report/chat-report-id/chat', json={'question': '预算是多少？'}).get_json()
+        second = client.post('/api/report/chat-report-id/chat', json={
+            'question': '谁批准的？', 'session_id': first['session_id']
+        }).get_json()
+
+        assert first['answer'] == "预算是100万"
+        assert second['session_id'] == first['session_id']
+        assert second['turn'] == 2
+        mock_langchain.create_chat_session.assert_called_once_with("会议记录", 'chat-report-id', 'test-model')
+        mock_get_report.assert_called_once()
+
+    def test_chat_missing_question(self, client):
+        """测试缺少问题时返回400"""
+        response = client.post('/api/report/test-report-id/chat', json={})
+        assert response.status_code == 400
@@ -0,0 +1,230 @@
+import time
+import numpy as np
+import pytest
+from unittest.mock import patch
+from langchain_core.embeddings import Embeddings
+from app import create_app
+from app.services.modules.ivf_index import IVFIndex
+from app.services.search_service import SearchService
+
+VOCABULARY = "预算营销招聘午餐天气合同"
+
+
+class CharEmbeddings(Embeddings):
+    """按关键字出现次数生成向量的假嵌入模型"""
+
+    def _embed(self, text):
+        return [float(text.count(char)) + 0.01 for char in VOCABULARY]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture
+def service(tmp_path):
+    """使用临时目录和假嵌入模型的检索服务"""
+    return SearchService(index_dir=str(tmp_path), s3_prefix='', embeddings=CharEmbeddings())
+
+
+class TestIVFIndex:
+    """测试IVF近似最近邻索引"""
+
+    def test_ivf_recall_matches_brute_force(self):
+        """测试训练后的IVF检索与暴力检索的top-1基本一致，且增量添加无需重建"""
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(20, 32))
+        vectors = centers[rng.integers(20, size=3000)] + rng.normal(0, 0.05, (3000, 32))
+        index = IVFIndex(train_threshold=1000, nprobe=4)
+        index.add(vectors[:2000])
+        assert index.trained
+        centroids = index.centroids.copy()
+        index.add(vectors[2000:])
+        assert np.array_equal(index.centroids, centroids)
+
+        brute = IVFIndex(train_threshold=10 ** 9)
+        brute.add(vectors)
+        queries = vectors[rng.integers(3000, size=50)] + rng.normal(0, 0.01, (50, 32))
+        hits = sum(index.search(q, k=1)[0][0] == brute.search(q, k=1)[0][0] for q in queries)
+        assert hits >= 45
+
+    def test_mask_and_delete(self):
+        """测试行过滤和删除标记"""
+        index = IVFIndex()
+        index.add(np.eye(4))
+        index.delete([0])
+        assert index.search(np.array([1.0, 0, 0, 0]), k=4)[0][0] != 0
+        mask = np.array([False, False, True, False])
+        assert [row for row, _ in index.search(np.array([0, 1.0, 0, 0]), k=4, mask=mask)] == [2]
+
+    def test_filtered_search_keeps_recall(self):
+        """测试训练后过滤条件选择性高或中等时，仍能返回k个满足条件的结果"""
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(40, 16))
+        vectors = centers[rng.integers(40, size=4000)] + rng.normal(0, 0.05, (4000, 16))
+        index = IVFIndex(train_threshold=1000, nprobe=1)
+        index.add(vectors)
+        query = centers[0]
+
+        # 选择性高：满足条件的行远离查询所在的列表
+        far = np.argsort(vectors @ query)[:5]
+        mask = np.zeros(4000, dtype=bool)
+        mask[far] = True
+        assert {row for row, _ in index.search(query, k=10, mask=mask)} == set(far.tolist())
+
+        # 选择性中等：扩大探测范围直到得到k个结果
+        mask = np.arange(4000) % 5 == 0
+        hits = index.search(query, k=200, mask=mask)
+        assert len(hits) == 200 and all(row % 5 == 0 for row, _ in hits)
+
+
+class TestSearchService:
+    """测试跨文档检索服务"""
+
+    def test_search_with_filters(self, service):
+        """测试按类别、类型和日期过滤，每个文档只返回一次"""
+        service.index_document('file', 'f1', "预算增加了。预算由财务批准。", 'meeting', '2024-01-10 09:00:00')
+        service.index_document('report', 'r1', "营销报告：营销活动下周开始。", 'report', '2024-03-01T10:00:00')
+        service.index_document('file', 'f2', "合同条款和预算附件。", 'contract', '2024-02-15 09:00:00')
+
+        results = service.search("预算")
+        assert results[0]['doc_id'] == 'f1'
+        assert len({result['doc_id'] for result in results}) == len(results)
+        assert [r['doc_id'] for r in service.search("预算", category='contract')] == ['f2']
+        assert [r['doc_id'] for r in service.search("营销", doc_type='report')] == ['r1']
+        assert {r['doc_id'] for r in service.search("预算", date_from='2024-02-01', date_to='2024-02-15')} == {'f2'}
+
+    def test_index_text_stream(self, service):
+        """测试文本片段流（片段在句子中间断开）与整段文本的索引结果一致"""
+        text = "预算增加了。预算由财务批准。" * 50 + "合同下周签署。"
+        service.index_document('file', 'whole', text)
+        stream = (text[i:i + 7] for i in range(0, len(text), 7))
+        assert service.index_document('file', 'streamed', stream) == service.index_document('file', 'copy', text)
+
+        results = {r['doc_id']: r for r in service.search("合同", mode='keyword')}
+        assert results['streamed']['score'] == pytest.approx(results['whole']['score'])
+        assert results['streamed']['snippet'].startswith("预算增加了。")
+        assert service.index_document('file', 'empty', iter([])) == 0
+
+    def test_alias_document_reuses_vectors(self, service, tmp_path):
+        """测试复用报告时复制向量和词频，不重新向量化，重新加载后仍能检索"""
+        service.index_document('report', 'r1', "营销报告：营销活动下周开始。", 'report', '2024-03-01T10:00:00')
+
+        with patch.object(CharEmbeddings, 'embed_documents') as mock_embed:
+            assert service.alias_document('report', 'r1', 'r2', 'meeting', '2024-04-01T10:00:00') == 1
+            mock_embed.assert_not_called()
+        assert service.alias_document('report', 'missing', 'r3') == 0
+
+        reloaded = SearchService(index_dir=str(tmp_path), s3_prefix='', embeddings=CharEmbeddings())
+        for mode in ('semantic', 'keyword'):
+            results = {r['doc_id']: r for r in reloaded.search("营销", mode=mode)}
+            assert set(results) == {'r1', 'r2'}
+            assert results['r2']['category'] == 'meeting'
+            assert results['r2']['score'] == pytest.approx(results['r1']['score'])
+        assert [r['doc_id'] for r in reloaded.search("营销", date_from='2024-03-15')] == ['r2']
+
+    def test_keyword_statistics_survive_restart(self, service, tmp_path):
+        """测试关键词引擎使用的文档频率来自持久化的倒排索引，重新加载后保持"""
+        service.index_document('file', 'f1', "预算增加了。预算由财务批准。", 'meeting')
+        service.index_document('report', 'r1', "营销报告：营销活动下周开始。", 'report')
+        service.remove_document('report', 'r1')
+
+        reloaded = SearchService(index_dir=str(tmp_path), s3_prefix='', embeddings=CharEmbeddings())
+        frequencies, document_count, total_length = reloaded.keyword_statistics(['预算', '营销'])
+        assert list(frequencies) == [1, 0]
+        assert document_count == 1 and total_length > 0
+
+    def test_reindex_replaces_and_persists(self, service, tmp_path):
+        """测试重新索引替换旧内容，删除和索引在重新加载后保持"""
+        service.index_document('report', 'r1', "午餐很好吃。", 'meeting')
+        service.index_document('report', 'r1', "招聘两名工程师。", 'meeting')
+        service.index_document('file', 'f1', "天气晴朗。", 'general')
+        service.remove_document('file', 'f1')
+
+        reloaded = SearchService(index_dir=str(tmp_path), s3_prefix='', embeddings=CharEmbeddings())
+        results = reloaded.search("午餐", limit=10)
+        assert [r['doc_id'] for r in results] == ['r1']
+        assert "招聘" in results[0]['snippet']
+
+    def test_persisted_ivf_reloads_without_retraining(self, service, tmp_path):
+        """测试达到训练阈值后保存质心，重新加载和合并段后仍能检索"""
+        with patch('app.services.modules.ivf_index.IVF_TRAIN_THRESHOLD', 4):
+            service.index = IVFIndex(train_threshold=4)
+            service._loaded = True
+            for i, text in enumerate(["预算", "营销", "招聘", "午餐", "天气", "合同"]):
+                service.index_document('file', f"f{i}", f"{text}。" * 3, 'general')
+            assert service.index.trained
+            service.compact()
+
+            reloaded = SearchService(index_dir=str(tmp_path), s3_prefix='', embeddings=CharEmbeddings())
+            assert reloaded.search("招聘", limit=1)[0]['doc_id'] == 'f2'
+            assert reloaded.index.trained
+
+    def test_retrain_keeps_lists_short(self):
+        """测试索引增长后重新训练，倒排列表数随规模增加，列表长度不会无限增长"""
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(200, 64))
+        index = IVFIndex(train_threshold=1000, nprobe=8)
+        for _ in range(40):
+            index.add(centers[rng.integers(200, size=1000)] + rng.normal(0, 0.1, (1000, 64)))
+            if index.needs_retrain:
+                index.train()
+        assert index.trained_size > 4 * 1000
+        assert len(index.lists) == int(np.sqrt(index.trained_size))
+        assert max(block.size for block in index.lists) < 10 * np.sqrt(index.size)
+
+        query = centers[3] + rng.normal(0, 0.1, 64)
+        brute = np.argmax(np.vstack([index.get_vectors([row]) for row in range(index.size)]) @ query)
+        assert index.search(query, k=1)[0][0] == brute
+
+    def test_retrained_ivf_persists(self, service, tmp_path):
+        """测试写入线程重新训练后保存新的质心和分配，重新加载后不需要再次训练"""
+        service.index = IVFIndex(train_threshold=4, retrain_factor=2)
+        service._loaded = True
+        for i in range(12):
+            service.index_document('file', f"f{i}", f"{VOCABULARY[i]}。" * 3, 'general')
+        assert service.index.trained_size > 4
+
+        with patch('app.services.search_service.IVFIndex', lambda: IVFIndex(train_threshold=4, retrain_factor=2)):
+            reloaded = SearchService(index_dir=str(tmp_path), s3_prefix='', embeddings=CharEmbeddings())
+            assert reloaded.search(VOCABULARY[7], limit=1)[0]['doc_id'] == 'f7'
+        assert reloaded.index.trained_size == service.index.trained_size
+        assert np.array_equal(reloaded.index.centroids, service.index.centroids)
+
+    def test_search_latency_at_scale(self):
+        """测试10万个块时单次检索在毫秒级"""
+        rng = np.random.default_rng(0)
+        index = IVFIndex(train_threshold=100000, nprobe=16)
+        index.add(rng.normal(size=(100000, 128)).astype(np.float32))
+        query = rng.normal(size=128)
+        started = time.perf_counter()
+        for _ in range(10):
+            index.search(query, k=10)
+        assert (time.perf_counter() - started) / 10 < 0.05
+
+
+class TestSearchAPI:
+    """测试检索API"""
+
+    @patch('app.api.search.search_documents')
+    def test_search_endpoint(self, mock_search):
+        """测试检索接口传递过滤条件"""
+        mock_search.return_value = [{'doc_id': 'f1', 'doc_type': 'file', 'score': 0.9}]
+        client = create_app({'TESTING': True}).test_client()
+
+        response = client.get('/api/search?q=预算&category=meeting&type=file&date_from=2024-01-01&limit=5')
+
+        assert response.status_code == 200
+        assert response.get_json()['count'] == 1
+        mock_search.assert_called_once_with(
+            '预算', limit=5, category='meeting', doc_type='file', date_from='2024-01-01', date_to=None,
+            mode='semantic'
+        )
+
+    def test_search_requires_query(self):
+        """测试缺少查询参数时返回400"""
+        client = create_app({'TESTING': True}).test_client()
+        assert client.get('/api/search').status_code == 400
+        assert client.get('/api/search?q=x&type=other').status_code == 400
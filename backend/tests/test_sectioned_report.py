@@ -0,0 +1,97 @@
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from app.services.modules.sectioned_report import (
+    DEFAULT_SECTIONS,
+    parse_outline,
+    generate_section,
+    generate_sectioned_report
+)
+
+OUTLINE = """会议摘要: 概述产品进度和预算
+主要讨论点: 新功能、营销策略
+决策和行动项: 批准预算
+后续步骤: 下周用户测试"""
+
+
+class FakeSectionModel:
+    """按提示词类型返回大纲或章节内容的假模型，并记录最大并发数"""
+
+    def __init__(self, delay=0.0, outline=OUTLINE):
+        self.delay = delay
+        self.outline = outline
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        if "规划一份结构化报告的大纲" in prompt:
+            return self.outline, "end_turn"
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        title = prompt.split("请只撰写章节“", 1)[1].split("”", 1)[0]
+        return f"{title}的正文", "end_turn"
+
+
+class TestSectionedReport:
+    """测试先大纲后并发章节的报告生成"""
+
+    def test_parse_outline(self):
+        """测试解析大纲，兼容列表符号和全角冒号"""
+        outline = parse_outline("- **会议摘要**：概述\n2. 主要讨论点: 要点\n无关的行")
+        assert outline == [("会议摘要", "概述"), ("主要讨论点", "要点")]
+
+    def test_sections_generated_concurrently_in_order(self):
+        """测试章节并发生成，并按大纲顺序拼接"""
+        model = FakeSectionModel(delay=0.05)
+        report = generate_sectioned_report("会议记录", model, max_workers=4)
+
+        positions = [report.index(f"## {title}") for title in DEFAULT_SECTIONS]
+        assert positions == sorted(positions)
+        assert "## 决策和行动项\n\n决策和行动项的正文" in report
+        assert model.max_active > 1
+
+    def test_unparseable_outline_falls_back_to_default_sections(self):
+        """测试大纲无法解析时使用默认章节"""
+        report = generate_sectioned_report("会议记录", FakeSectionModel(outline="无法解析的大纲"))
+        for title in DEFAULT_SECTIONS:
+            assert f"## {title}" in report
+
+    def test_section_continues_after_max_tokens(self):
+        """测试章节输出被截断时自动续写"""
+        responses = iter([("第一段", "max_tokens"), ("第二段", "max_tokens"), ("第三段", "end_turn")])
+        prompts = []
+
+        def generate(prompt):
+            prompts.append(prompt)
+            return next(responses)
+
+        assert generate_section(generate, "写章节") == "第一段第二段第三段"
+        assert "第一段第二段" in prompts[2]
+
+    def test_continuation_limit(self):
+        """测试续写次数有上限"""
+        calls = []
+
+        def generate(prompt):
+            calls.append(prompt)
+            return "段", "max_tokens"
+
+        generate_section(generate, "写章节", max_continuations=2)
+        assert len(calls) == 3
+
+    def test_agent_service_sections_mode(self):
+        """测试BedrockAgentService的sections模式直接并发调用模型"""
+        from app.services.agent_service import bedrock_agent_service
+
+        model = FakeSectionModel()
+        with patch.object(bedrock_agent_service, '_invoke_model', side_effect=lambda text, model_id=None: model(text)), \
+                patch.object(bedrock_agent_service, '_generate_report_with_agent') as mock_agent:
+            report = bedrock_agent_service.generate_report("会议记录内容", None, None, mode="sections")
+            mock_agent.assert_not_called()
+        assert "## 后续步骤\n\n后续步骤的正文" in report
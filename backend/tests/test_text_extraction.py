@@ -0,0 +1,121 @@
+import io
+import os
+import struct
+import zipfile
+import pytest
+from app.services.text_extraction import (
+    _decode_doc_text,
+    extract_text,
+    extract_text_from_bytes,
+    iter_pdf_pages,
+    normalize_text,
+    get_extracted_text_key
+)
+
+
+def make_docx(paragraphs):
+    """构造一个最小的DOCX文件"""
+    body = ''.join(f'<w:p><w:r><w:t>{p}</w:t></w:r></w:p>' for p in paragraphs)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body>{body}</w:body></w:document>'
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr('word/document.xml', document)
+    return buffer.getvalue()
+
+
+def make_doc_streams(pieces):
+    """
+    构造WordDocument流和表格流，pieces为 (文本, 是否8位压缩) 列表
+
+    FIB使用Word 97的固定长度（csw=14、cslw=22），正文从偏移1024开始依次存放
+    """
+    word_document = bytearray(1024)
+    struct.pack_into('<HH', word_document, 0, 0xA5EC, 0x00C1)
+    struct.pack_into('<H', word_document, 32, 14)
+    struct.pack_into('<H', word_document, 62, 22)
+    cps, fcs = [0], []
+    for text, compressed in pieces:
+        offset = len(word_document)
+        word_document += text.encode('cp1252' if compressed else 'utf-16-le')
+        fcs.append(offset * 2 | 0x40000000 if compressed else offset)
+        cps.append(cps[-1] + len(text))
+    struct.pack_into('<i', word_document, 64 + 3 * 4, cps[-1])
+
+    plc = struct.pack(f'<{len(cps)}I', *cps) + b''.join(struct.pack('<HIH', 0, fc, 0) for fc in fcs)
+    table = b'\x01' + struct.pack('<h', 2) + b'\x00\x00' + b'\x02' + struct.pack('<I', len(plc)) + plc
+    struct.pack_into('<II', word_document, 154 + 33 * 8, 0, len(table))
+    return bytes(word_document), table
+
+
+def make_pdf(page_count):
+    """构造每页一行文字的PDF文件"""
+    fpdf = pytest.importorskip('fpdf')
+    pdf = fpdf.FPDF()
+    pdf.set_font('Arial', '', 12)
+    for number in range(1, page_count + 1):
+        pdf.add_page()
+        pdf.cell(0, 10, f'Page marker {number}')
+    return pdf.output(dest='S').encode('latin-1')
+
+
+class TestTextExtraction:
+    """测试上传时的文本抽取"""
+
+    def test_normalize_text(self):
+        """测试规范化会去除BOM、统一换行并压缩空行"""
+        assert normalize_text('\ufeff第一行\r\n\r\n\r\n\r\n第二行  \r\n') == '第一行\n\n第二行'
+
+    def test_plain_text_strips_bom(self):
+        """测试纯文本文件去除UTF-8 BOM"""
+        data = '\ufeff会议记录'.encode('utf-8')
+        assert extract_text_from_bytes(data, 'notes.txt') == '会议记录'
+
+    def test_docx(self):
+        """测试DOCX文本抽取"""
+        data = make_docx(['Meeting minutes', '决定：下周发布'])
+        text = extract_text_from_bytes(data, 'minutes.docx')
+        assert 'Meeting minutes' in text
+        assert '决定：下周发布' in text
+
+    def test_extract_in_process_pool(self):
+        """测试在进程池中执行抽取"""
+        assert extract_text(b'hello\r\nworld', 'a.md') == 'hello\nworld'
+
+    def test_extracted_text_key(self):
+        """测试旁路文本对象的S3键"""
+        assert get_extracted_text_key('abc') == 'extracted/abc.txt'
+
+    def test_pdf_pages_stream_in_order(self):
+        """测试PDF分页并行抽取按页码顺序返回并带有耗时"""
+        pages = list(iter_pdf_pages(make_pdf(40)))
+        assert [page.page_number for page in pages] == list(range(1, 41))
+        assert all(f'Page marker {page.page_number}' in page.text for page in pages)
+        assert all(page.seconds >= 0 for page in pages)
+
+    def test_pdf_extract_text(self):
+        """测试PDF抽取结果按页拼接"""
+        text = extract_text(make_pdf(3), 'board-pack.pdf')
+        assert text.index('Page marker 1') < text.index('Page marker 2') < text.index('Page marker 3')
+
+    def test_doc_fixture(self):
+        """测试从真实的Word 97-2003文档中抽取正文"""
+        with open(os.path.join(os.path.dirname(__file__), 'data', 'word97.doc'), 'rb') as f:
+            data = f.read()
+        assert extract_text_from_bytes(data, 'minutes.doc') == 'Test OLE file, saved as Word 97-2003 Document.'
+
+    def test_doc_piece_table(self):
+        """测试按片段表拼接UTF-16和8位压缩片段，并只保留域的显示结果"""
+        word_document, table = make_doc_streams([
+            ('会議の議事録\r', False),
+            ('See \x13 HYPERLINK "http://x" \x14the agenda\x15.\x07\r', True),
+        ])
+        assert _decode_doc_text(word_document, table) == '会議の議事録\nSee the agenda.\t\n'
+
+    def test_doc_rejects_invalid_file(self):
+        """测试非OLE文件的DOC直接报错，而不是写入乱码"""
+        with pytest.raises(Exception, match='DOC'):
+            extract_text_from_bytes('Hello'.encode('utf-16-le') * 10, 'minutes.doc')
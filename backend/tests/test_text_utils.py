@@ -0,0 +1,74 @@
+import subprocess
+import sys
+from unittest.mock import patch
+from app.utils import text_utils
+
+
+class TestLazyNLTK:
+    """测试NLTK资源的延迟加载和离线回退"""
+
+    def test_import_does_not_load_nltk(self):
+        """测试导入模块时不导入NLTK，也不下载资源"""
+        code = "import sys; import app.utils.text_utils; print('nltk' in sys.modules)"
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        assert result.stdout.strip() == 'False'
+
+    def test_offline_fallback(self):
+        """测试NLTK数据不可用时使用内置的分句、分词和停用词"""
+        text_utils._has_nltk_resource.cache_clear()
+        text_utils.get_stop_words.cache_clear()
+        text_utils.get_lemmatizer.cache_clear()
+        try:
+            with patch('nltk.data.find', side_effect=LookupError), \
+                    patch('nltk.download') as mock_download:
+                assert text_utils.sent_tokenize("First one. Second one! 会议结束。下一项。") == [
+                    'First one.', 'Second one!', '会议结束。', '下一项。'
+                ]
+                assert text_utils.word_tokenize("budget, review") == ['budget', 'review']
+                assert 'the' in text_utils.get_stop_words()
+                assert text_utils.get_lemmatizer().lemmatize('cats') == 'cats'
+                keywords = text_utils.extract_keywords("the budget and the budget review", top_n=2)
+                assert keywords[0] == {'text': 'budget', 'score': 1.0}
+                mock_download.assert_not_called()
+        finally:
+            text_utils._has_nltk_resource.cache_clear()
+            text_utils.get_stop_words.cache_clear()
+            text_utils.get_lemmatizer.cache_clear()
+
+
+class TestTextRankSummary:
+    """测试TextRank抽取式摘要"""
+
+    TEXT = (
+        "预算会议开始。预算需要增加，预算由财务审批。今天天气很好。\n"
+        "招聘预算用于招聘两名工程师。午餐吃了寿司。\n"
+        "The budget was approved by finance. We had lunch. The budget review happens next week."
+    )
+
+    def test_split_sentences_handles_cjk(self):
+        """测试中日文句号和换行作为句子边界"""
+        sentences = text_utils.split_sentences(self.TEXT)
+        assert sentences[:3] == ['预算会议开始。', '预算需要增加，预算由财务审批。', '今天天气很好。']
+        assert 'We had lunch.' in sentences
+
+    def test_summary_prefers_central_sentences(self):
+        """测试摘要选择与全文最相关的句子，并保持原文顺序"""
+        summary = text_utils.summarize_text(self.TEXT, max_sentences=3)
+        assert '天气' not in summary and '午餐' not in summary
+        assert summary.index('预算需要增加') < summary.index('The budget')
+        assert text_utils.summarize_text("只有一句。", max_sentences=3) == "只有一句。"
+
+    def test_shrink_text_fits_budget(self):
+        """测试按字符预算缩短文本，长文档使用质心打分"""
+        assert text_utils.shrink_text(self.TEXT, 1000) == self.TEXT
+        shrunk = text_utils.shrink_text(self.TEXT, 40)
+        assert 0 < len(shrunk) <= 40
+        long_text = " ".join(f"Item {i} covers the budget plan." for i in range(text_utils.TEXTRANK_MAX_SENTENCES + 10))
+        assert len(text_utils.summarize_text(long_text, max_sentences=2)) < 100
+
+    def test_shrink_text_without_sentence_boundaries(self):
+        """测试没有任何句子能放进预算时（无标点的长文本），截断而不是返回空字符串"""
+        transcript = "预算需要增加并且市场部下周开始招聘" * 20
+        shrunk = text_utils.shrink_text(transcript, 50)
+        assert shrunk == transcript[:50]
+        assert text_utils.shrink_text("很长的一句话。" * 3 + "短句。", 5)
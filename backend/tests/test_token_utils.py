@@ -0,0 +1,72 @@
+import pytest
+from app.utils.token_utils import (
+    estimate_tokens,
+    get_token_limits,
+    get_output_allowance,
+    get_chunk_size_chars,
+    pack_prompt,
+    fit_prompt
+)
+from app.services.storage import split_content_header, build_content_with_header
+
+CLAUDE = "anthropic.claude-3-haiku-20240307-v1:0"
+TITAN = "amazon.titan-text-express-v1"
+
+
+class TestTokenEstimation:
+    """测试按模型族估算token数"""
+
+    def test_cjk_counts_more_than_latin(self):
+        """测试同样字符数时CJK文本估算的token数更多"""
+        assert estimate_tokens("会议纪要" * 100, CLAUDE) > estimate_tokens("meet" * 100, CLAUDE)
+
+    def test_family_ratios_differ(self):
+        """测试不同模型族使用不同的估算比例"""
+        text = "今天的会议讨论了预算。" * 50
+        assert estimate_tokens(text, TITAN) > estimate_tokens(text, CLAUDE)
+
+    def test_unlisted_model_uses_family_defaults(self):
+        """测试未在MODEL_CONFIGS中的模型按ID前缀推断上下文窗口"""
+        assert get_token_limits("anthropic.claude-3-5-sonnet-20240620-v1:0") == (200000, 4096)
+
+    def test_output_allowance_shrinks_near_limit(self):
+        """测试提示词接近上限时输出上限随之减小，超出时在发送前报错"""
+        assert get_output_allowance(100, TITAN) == 2000
+        assert get_output_allowance(7000, TITAN) < 2000
+        with pytest.raises(Exception):
+            get_output_allowance(8000, TITAN)
+
+
+class TestPromptPacking:
+    """测试提示词打包"""
+
+    def test_pack_keeps_header_and_drops_overflow(self):
+        """测试元数据头始终保留，超出预算的块被截断或丢弃"""
+        chunks = [f"第{i}块内容。" * 400 for i in range(4)]
+        packed = pack_prompt("总结以下内容：\n{context}", chunks, TITAN, header="# 文件元数据\n文件名: a.txt\n")
+
+        assert packed.context.startswith("# 文件元数据")
+        assert packed.chunks[0] == chunks[0]
+        assert packed.dropped >= 1
+        assert packed.prompt_tokens + packed.max_tokens <= 8192
+        assert packed.text == "总结以下内容：\n" + packed.context
+
+    def test_pack_small_prompt_untouched(self):
+        """测试小提示词原样保留并使用模型的输出上限"""
+        packed = fit_prompt("请总结：今天讨论了预算。", CLAUDE)
+        assert packed.text == "请总结：今天讨论了预算。"
+        assert packed.dropped == 0
+        assert packed.max_tokens == 4096
+
+    def test_chunk_size_fits_budget(self):
+        """测试按模型预算计算的块大小即使全是CJK字符也能放入提示词"""
+        chunk = "会" * get_chunk_size_chars(TITAN)
+        assert fit_prompt(chunk, TITAN).text == chunk
+
+    def test_split_content_header(self):
+        """测试拆分文件内容的元数据头"""
+        content = build_content_with_header("file-1", {'original_filename': 'a.txt'}, "正文")
+        header, body = split_content_header(content)
+        assert header.startswith("# 文件元数据") and "a.txt" in header
+        assert body == "正文"
+        assert split_content_header("没有元数据头") == ("", "没有元数据头")
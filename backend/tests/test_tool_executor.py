@@ -0,0 +1,137 @@
+import copy
+import pytest
+from unittest.mock import MagicMock
+from app.services.tools.tool_executor import (
+    analyze_data, extract_tasks, generate_timeline, execute_tool_calls
+)
+from app.services.tools.report_generator import _generate_with_claude
+from app.services.tools.tool_definitions import get_tool_definitions
+
+
+SOURCE = """# 周会 2024-05-10
+销售额增长15%，达到1,200万元，广告成本$3.5
+由王五负责在5月20日前提交招聘方案
+5月12日 完成评审
+下周 发布
+"""
+
+
+class TestLocalTools:
+    """测试在本地执行的报告工具"""
+
+    def test_analyze_data(self):
+        """测试抽取数值和单位，日期中的数字不计入"""
+        result = analyze_data(SOURCE)
+
+        assert [(m['value'], m['unit']) for m in result['metrics']] == [(15.0, '%'), (1200.0, '万元'), (3.5, 'USD')]
+        assert result['summary']['万元']['sum'] == 1200.0
+        assert '\n' not in result['metrics'][0]['context']
+
+    def test_extract_tasks(self):
+        """测试抽取行动项、负责人和截止日期"""
+        result = extract_tasks(SOURCE)
+        assert result['tasks'] == [{'item': '由王五负责在5月20日前提交招聘方案', 'assignee': '王五', 'deadline': '5月20日'}]
+
+    def test_generate_timeline(self):
+        """测试时间表按日期排序，相对日期排在最后"""
+        result = generate_timeline(SOURCE)
+        assert [event['date'] for event in result['events']] == ['2024-05-10', '5月12日', '5月20日', '下周']
+
+    def test_execute_tool_calls(self):
+        """测试一轮的工具结果按调用顺序返回，缺少text时使用源文本，未知工具返回错误"""
+        blocks = execute_tool_calls([
+            {'toolUseId': 't1', 'name': 'generate_timeline', 'input': {}},
+            {'toolUseId': 't2', 'name': 'extract_tasks', 'input': {'text': '由李四负责提交预算'}},
+            {'toolUseId': 't3', 'name': 'unknown', 'input': {}},
+        ], SOURCE)
+
+        results = [block['toolResult'] for block in blocks]
+        assert [result['toolUseId'] for result in results] == ['t1', 't2', 't3']
+        assert results[0]['content'][0]['json']['count'] == 4
+        assert results[1]['content'][0]['json']['tasks'][0]['assignee'] == '李四'
+        assert results[2]['status'] == 'error'
+
+
+def _tool_use_stream(*tool_uses, text=""):
+    """构建请求工具的ConverseStream响应，工具参数分成两段JSON片段"""
+    events = [{'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'text': text}}}] if text else []
+    for index, (tool_use_id, name) in enumerate(tool_uses, start=1):
+        events += [
+            {'contentBlockStart': {'contentBlockIndex': index, 'start': {'toolUse': {'toolUseId': tool_use_id, 'name': name}}}},
+            {'contentBlockDelta': {'contentBlockIndex': index, 'delta': {'toolUse': {'input': '{"te'}}}},
+            {'contentBlockDelta': {'contentBlockIndex': index, 'delta': {'toolUse': {'input': 'xt": ""}'}}}},
+            {'contentBlockStop': {'contentBlockIndex': index}},
+        ]
+    return {'stream': events + [{'messageStop': {'stopReason': 'tool_use'}}]}
+
+
+class TestToolLoop:
+    """测试报告生成的工具执行循环"""
+
+    def test_tool_results_returned_in_one_turn(self):
+        """测试模型请求的多个工具在本地执行，结果在一条消息中返回给模型"""
+        service = MagicMock()
+        requests = []
+
+        def converse_stream(**request):
+            requests.append(copy.deepcopy(request))
+            if len(requests) == 1:
+                return _tool_use_stream(('a', 'analyze_data'), ('b', 'extract_tasks'), text="先分析。")
+            return {'stream': [
+                {'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'text': '# 报告'}}},
+                {'messageStop': {'stopReason': 'end_turn'}}
+            ]}
+
+        service.bedrock_client.converse_stream.side_effect = converse_stream
+
+        report = _generate_with_claude(service, "anthropic.claude-3-haiku", "生成报告", get_tool_definitions(),
+                                       1024, source_text=SOURCE)
+
+        assert report == "# 报告"
+        assert len(requests) == 2
+        tool_spec = requests[0]["toolConfig"]["tools"][0]["toolSpec"]
+        assert tool_spec["name"] == "analyze_data"
+        assert "json" in tool_spec["inputSchema"]
+        assistant, tool_results = requests[1]["messages"][-2:]
+        assert assistant["content"][1]["toolUse"]["input"] == {"text": ""}
+        assert tool_results["role"] == "user"
+        assert [block["toolResult"]["toolUseId"] for block in tool_results["content"]] == ["a", "b"]
+
+    def test_round_limit(self):
+        """测试达到最大轮数后执行待处理的工具，并追加指令要求模型直接输出报告"""
+        from app.services.tools.tool_executor import TOOL_MAX_ROUNDS, TOOL_FINAL_INSTRUCTION
+        service = MagicMock()
+        requests = []
+
+        def converse_stream(**request):
+            requests.append(copy.deepcopy(request))
+            if len(requests) <= TOOL_MAX_ROUNDS:
+                return _tool_use_stream(('x', 'generate_timeline'), text="先查看时间。")
+            return {'stream': [
+                {'contentBlockDelta': {'contentBlockIndex': 0, 'delta': {'text': '# 最终报告'}}},
+                {'messageStop': {'stopReason': 'end_turn'}}
+            ]}
+
+        service.bedrock_client.converse_stream.side_effect = converse_stream
+
+        report = _generate_with_claude(service, "anthropic.claude-3-haiku", "生成报告", get_tool_definitions(),
+                                       source_text=SOURCE)
+
+        assert report == "# 最终报告"
+        assert len(requests) == TOOL_MAX_ROUNDS + 1
+        final_turn = requests[-1]["messages"][-1]["content"]
+        assert "toolResult" in final_turn[0]
+        assert final_turn[-1] == {"text": TOOL_FINAL_INSTRUCTION}
+        assert "toolConfig" in requests[-1]
+
+    def test_round_limit_raises_when_model_keeps_calling_tools(self):
+        """测试最终一次调用仍请求工具时抛出异常，而不是把前言当作报告返回"""
+        from app.services.tools.tool_executor import TOOL_MAX_ROUNDS
+        service = MagicMock()
+        service.bedrock_client.converse_stream.side_effect = lambda **request: _tool_use_stream(
+            ('x', 'generate_timeline'), text="先查看时间。")
+
+        with pytest.raises(Exception, match="最大轮数"):
+            _generate_with_claude(service, "anthropic.claude-3-haiku", "生成报告", get_tool_definitions(),
+                                  source_text=SOURCE)
+        assert service.bedrock_client.converse_stream.call_count == TOOL_MAX_ROUNDS + 1
@@ -37,17 +37,21 @@ class TestUploadAPI:
             assert allowed_file('test.js') == False
             assert allowed_file('test') == False
 
+    @patch('app.api.upload.save_extracted_text')
+    @patch('app.api.upload.save_lsh_index_entries')
     @patch('app.api.upload.upload_file_to_s3')
     @patch('app.api.upload.save_metadata_to_dynamodb')
-    def test_upload_file_success(self, mock_save_metadata, mock_upload, client):
+    def test_upload_file_success(self, mock_save_metadata, mock_upload, mock_save_lsh,
+                                 mock_save_extracted, client):
         """测试文件上传成功的情况"""
         # 模拟S3上传返回URL
         mock_upload.return_value = 'https://test-bucket.s3.amazonaws.com/test/file.txt'
         mock_save_metadata.return_value = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+        mock_save_extracted.return_value = 'extracted/test.txt'
         
         # 创建测试文件
         data = dict(
-            file=(io.BytesIO(b'This is a test file content'), 'test.txt'),
+            file=(io.BytesIO(b'\xef\xbb\xbfThis is a test file content'), 'test.txt'),
             category='meeting'
         )
         
@@ -64,6 +68,15 @@ class TestUploadAPI:
         # 验证模拟函数被调用
         mock_upload.assert_called_once()
         mock_save_metadata.assert_called_once()
+        
+        # 验证近似重复检测的签名已保存
+        saved_metadata = mock_save_metadata.call_args[0][0]
+        assert len(saved_metadata['minhash_signature']) > 0
+        mock_save_lsh.assert_called_once_with(json_data['file_id'], saved_metadata['lsh_bands'])
+        
+        # 验证抽取的文本（已去除BOM）作为旁路对象保存
+        mock_save_extracted.assert_called_once_with(json_data['file_id'], 'This is a test file content')
+        assert saved_metadata['extracted_s3_key'] == 'extracted/test.txt'
 
     def test_upload_file_no_file(self, client):
         """测试没有文件的情况"""